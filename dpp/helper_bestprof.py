@@ -5,6 +5,7 @@ from os.path import join
 
 from dpp.helper_config import from_yaml, dump_to_yaml
 from dpp.helper_files import glob_pfds
+from mwa_search.bestprof import read_bestprof
 from vcstools.prof_utils import subprocess_pdv, get_from_ascii
 from vcstools.gfit import gfit
 
@@ -48,25 +49,17 @@ def bestprof_info(filename):
         period_error: float
             The error in the pulsar's period measurement
     """
-    #open the file and read the info into a dictionary
+    header, profile = read_bestprof(filename)
     info_dict = {}
-    f = open(filename, "r")
-    lines = f.read()
-    f.close()
-    lines = lines.split("\n")
-    #info:
-    #info_dict["obsid"] = int(lines[0].split()[4].split("_")[0])
-    #info_dict["pulsar"] = lines[1].split()[3].split("_")[1]
-    info_dict["nbins"] = int(lines[9].split()[4])
-    info_dict["chi"] = float(lines[12].split()[4])
-    info_dict["sn"] = float(lines[13].split()[4][2:])
-    info_dict["dm"] = float(lines[14].split()[4])
-    info_dict["period"] = float(lines[15].split()[4])/1e3 #in seconds
-    info_dict["period_error"] = float(lines[15].split()[6])/1e3
-    info_dict["pdot"] = float(lines[16].split()[4])/1e3
-    info_dict["pdot_error"] = float(lines[16].split()[6])/1e3
-    info_dict["profile"] = list(np.genfromtxt(filename)[:,1])
-    f.close()
+    info_dict["nbins"] = header["nbins"]
+    info_dict["chi"] = header["chi"]
+    info_dict["sn"] = header["sn"]
+    info_dict["dm"] = header["dm"]
+    info_dict["period"] = header["p_topo"]/1e3 #in seconds
+    info_dict["period_error"] = header["p_topo_err"]/1e3
+    info_dict["pdot"] = header["pd_topo"]/1e3
+    info_dict["pdot_error"] = header["pd_topo_err"]/1e3
+    info_dict["profile"] = list(profile)
     return info_dict
 
 
@@ -1,6 +1,4 @@
 import logging
-from astropy.coordinates import SkyCoord
-import astropy.units as u
 import numpy as np
 import os
 import glob
@@ -18,8 +16,10 @@ from vcstools.beam_calc import find_sources_in_obs, source_beam_coverage_and_tim
 from vcstools.config import load_config_file
 
 # mwa_search imports
-from mwa_search.grid_tools import get_grid
+from mwa_search.grid_tools import get_grids
 from mwa_search.obs_tools import calc_ta_fwhm
+from mwa_search.sky_index import SkyIndex
+from mwa_search.pointings import parse_ra_dec, parse_pointings, format_ra, format_dec, format_pointings, offset_by
 
 logger = logging.getLogger(__name__)
 def _argcheck_find_fold_times(pulsar, obsid, beg, end, min_z_power):
@@ -237,10 +237,39 @@ def get_pointings_required(source_ra, source_dec, fwhm, search_radius):
         A list of pointings where each pointing contains an RA and a Dec in the format 'hh:mm:ss.ss'
         [[RA, Dec]]
     """
+    pointing_list_list, _ = get_pointings_required_many([source_ra], [source_dec], fwhm, search_radius)
+    return pointing_list_list
+
+
+def get_pointings_required_many(source_ras, source_decs, fwhm, search_radius):
+    """
+    Gets the grid pointings required to cover the search radius around several sources at once
+
+    Parameters
+    ----------
+    source_ras, source_decs: list of strings
+        Lists of the RA and dec of each source.
+        Expected format is 'hh:mm[:ss.s]'
+    fwhm: float
+        FWHM of the tied-array beam in degrees.
+        Can be calculated in the calc_ta_fwhm function
+    search_radius: float
+        The radius of the circle that you would like to search
+
+    Returns
+    -------
+    pointing_list_list: list of lists
+        A list of pointings where each pointing contains an RA and a Dec in the format 'hh:mm:ss.ss'
+        [[RA, Dec]]
+    source_index: numpy.array
+        The index of the source (in source_ras and source_decs) each pointing belongs to
+    """
+    if len(source_ras) == 0:
+        return [], np.empty(0, dtype=int)
     #convert to radians
-    coord = SkyCoord(source_ra, source_dec, unit=(u.hourangle,u.deg))
-    rar = coord.ra.radian #in radians
-    decr = coord.dec.radian
+    rads, decds = parse_ra_dec(source_ras, source_decs)
+    rar = np.radians(rads)
+    decr = np.radians(decds)
 
     #make a grid around each pulsar
     grid_sep = fwhm * 0.6
@@ -249,17 +278,12 @@ def get_pointings_required(source_ra, source_dec, fwhm, search_radius):
     if loops < 0:
         loops = 0
     logger.debug("loops: {}".format(loops))
-    rads, decds = get_grid(rar, decr, np.radians(grid_sep), loops, verbose=False)
+    pointings, source_index = get_grids(rar, decr, np.radians(grid_sep), loops)
 
     #convert back to sexidecimals
-    coord = SkyCoord(rads,decds,unit=(u.deg,u.deg))
-    rajs = coord.ra.to_string(unit=u.hour, sep=':')
-    decjs = coord.dec.to_string(unit=u.degree, sep=':')
-    temp = []
-    for raj, decj in zip(rajs, decjs):
-        temp.append([raj, decj])
-    pointing_list_list = format_ra_dec(temp, ra_col = 0, dec_col = 1)
-    return pointing_list_list
+    pointing_list_list = [[raj, decj] for raj, decj in
+                          zip(format_ra(pointings[:, 0]), format_dec(pointings[:, 1]))]
+    return pointing_list_list, source_index
 
 
 def get_sources_in_fov(obsid, source_type, fwhm):
@@ -288,23 +312,77 @@ def get_sources_in_fov(obsid, source_type, fwhm):
     if len(names_ra_dec) == 0 :
         return [[],[]]
     obs_data, _ = find_sources_in_obs([obsid], names_ra_dec, dt_input=100)
+    name_ra_dec_dict = {line[0]: line for line in names_ra_dec}
+    source_lines = [name_ra_dec_dict[pulsar_line[0]] for pulsar_line in obs_data[obsid]]
+
+    # grid the pointings of all sources to fill the position uncertaint (given in arcminutes)
+    pointing_list_list, source_index = get_pointings_required_many(
+        [line[1] for line in source_lines],
+        [line[2] for line in source_lines],
+        fwhm, 1./60.)
+
+    # sort the pointings into the right groups
     name_list = []
     pointing_list = []
-    for pulsar_line in obs_data[obsid]:
-        jname = pulsar_line[0]
-        for line in names_ra_dec:
-            if jname == line[0]:
-                jname, raj, decj = line
-        jname_temp_list = [jname]
+    for si, prd in zip(source_index, pointing_list_list):
+        name_list.append([source_lines[si][0]])
+        pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
+    return [name_list, pointing_list]
 
-        # grid the pointings to fill the position uncertaint (given in arcminutes)
-        pointing_list_list = get_pointings_required(raj, decj, fwhm, 1./60.)
 
-        # sort the pointings into the right groups
-        for prd in pointing_list_list:
-            name_list.append(jname_temp_list)
-            pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
-    return [name_list, pointing_list]
+def merge_pointings(name_list, pointing_list, fwhm, merge_fraction):
+    """
+    Merges pointings that are within a fraction of the tied-array beam FWHM of each other so each
+    group of overlapping pointings (e.g. globular cluster pulsars or sources listed in several
+    catalogues) is only beamformed once.
+
+    The pointings are merged in order: each pointing not yet merged becomes the shared pointing for
+    itself and all the unmerged pointings within the merge radius of it. So every source is within
+    merge_fraction * fwhm of the pointing it is assigned to.
+
+    Parameters
+    ----------
+    name_list: list of lists
+        The names of the sources for each pointing in pointing_list
+    pointing_list: list
+        A list of pointings where each pointing contains an RA and a Dec in the format 'hh:mm:ss.ss_dd:mm:ss.ss'
+    fwhm: float
+        FWHM of the tied-array beam in degrees.
+        Can be calculated in the calc_ta_fwhm function
+    merge_fraction: float
+        The fraction of the FWHM within which pointings are merged. 0 only merges identical pointings
+
+    Returns
+    -------
+    merged_name_list: list of lists
+        The names of all the sources each merged pointing serves
+    merged_pointing_list: list
+        The merged pointings in the format 'hh:mm:ss.ss_dd:mm:ss.ss'
+    """
+    if len(pointing_list) == 0:
+        return [], []
+    pointing_index = SkyIndex.from_pointing_strings(pointing_list)
+    idx1, idx2, _ = pointing_index.search_around(pointing_index.ras, pointing_index.decs,
+                                                 merge_fraction * fwhm)
+    # The pairs are sorted by idx1 so split them into the neighbours of each pointing
+    neighbours = np.split(idx2, np.searchsorted(idx1, np.arange(1, len(pointing_list))))
+
+    merged_into = np.full(len(pointing_list), -1)
+    merged_name_list = []
+    merged_pointing_list = []
+    for pi in range(len(pointing_list)):
+        if merged_into[pi] >= 0:
+            continue
+        members = neighbours[pi][merged_into[neighbours[pi]] < 0]
+        merged_into[members] = len(merged_pointing_list)
+        names = []
+        for mi in members:
+            for name in name_list[mi]:
+                if name not in names:
+                    names.append(name)
+        merged_name_list.append(names)
+        merged_pointing_list.append(pointing_list[pi])
+    return merged_name_list, merged_pointing_list
 
 
 def apply_offset(pointing_list, offset, angle_offset):
@@ -325,27 +403,15 @@ def apply_offset(pointing_list, offset, angle_offset):
     offset_pointing_list: list
         A list of pointings where each pointing contains an RA and a Dec in the format 'hh:mm:ss.ss_dd:mm:ss.ss'
     """
-    # Create astropy SkyCoords
-    rajs  = []
-    decjs = []
-    for p in pointing_list:
-        rajs.append(p.split("_")[0])
-        decjs.append(p.split("_")[1])
-    orig_pos = SkyCoord(rajs, decjs, frame='icrs', unit=(u.hourangle,u.deg))
+    if len(pointing_list) == 0:
+        return []
+    rads, decds = parse_pointings(pointing_list)
 
     # Apply offset
-    offset_pos = orig_pos.directional_offset_by(angle_offset*u.deg, offset*u.arcsec)
+    rads, decds = offset_by(rads, decds, offset / 3600., angle_offset)
 
     # Convert back to pointing list
-    rajs = offset_pos.ra.to_string(unit=u.hour, sep=':')
-    decjs = offset_pos.dec.to_string(unit=u.degree, sep=':')
-    temp = []
-    for raj, decj in zip(rajs, decjs):
-        temp.append([raj, decj])
-    temp_formated = format_ra_dec(temp, ra_col = 0, dec_col = 1)
-    offset_pointing_list = []
-    for raj, decj in temp_formated:
-        offset_pointing_list.append("{}_{}".format(raj, decj))
+    offset_pointing_list = format_pointings(rads, decds)
     return offset_pointing_list
 
 
@@ -353,7 +419,7 @@ def find_pulsars_in_fov(obsid, psrbeg, psrend,
                         fwhm=None, search_radius=0.02,
                         meta_data=None, full_meta=None,
                         no_known_pulsars=False, no_search_cands=False,
-                        offset=0, angle_offset=0):
+                        offset=0, angle_offset=0, merge_fraction=0.1):
     """
     Find all pulsars in the field of view and return all the pointings sorted into vdif and normal lists:
 
@@ -384,6 +450,13 @@ def find_pulsars_in_fov(obsid, psrbeg, psrend,
     no_search_cands: bool
         OPTIONAL - Will return no search candidates
         Default: False
+    offset: float
+        OPTIONAL - The offset to apply to all pointings in arcseconds. Default: 0
+    angle_offset: float
+        OPTIONAL - The angle of the offset to apply to all pointings in degrees where zero is north. Default: 0
+    merge_fraction: float
+        OPTIONAL - Pointings of the same type within this fraction of the FWHM are merged into one
+        shared pointing (see merge_pointings). 0 only merges identical pointings. Default: 0.1
 
     Returns
     -------
@@ -445,6 +518,8 @@ def find_pulsars_in_fov(obsid, psrbeg, psrend,
     sp_pointing_list = []
     sp_name_list = []
 
+    # [raj, decj, jname_temp_list, vdif_check, sp_check] of each pulsar to grid
+    grid_sources = []
     for pi, pulsar_line in enumerate(obs_psrs):
         vdif_check = False
         sp_check = False
@@ -485,20 +560,26 @@ def find_pulsars_in_fov(obsid, psrbeg, psrend,
         else:
             jname_temp_list.append(jname)
 
-        # grid the pointings to fill 2 arcminute raduis to account for ionosphere shift
-        pointing_list_list = get_pointings_required(raj, decj, fwhm, search_radius)
-
-        # sort the pointings into the right groups
-        for prd in pointing_list_list:
-            if vdif_check:
-                vdif_name_list.append(jname_temp_list)
-                vdif_pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
-            elif sp_check:
-                sp_name_list.append(jname_temp_list)
-                sp_pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
-            else:
-                pulsar_name_list.append(jname_temp_list)
-                pulsar_pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
+        grid_sources.append([raj, decj, jname_temp_list, vdif_check, sp_check])
+
+    # grid the pointings of all pulsars to fill 2 arcminute raduis to account for ionosphere shift
+    pointing_list_list, source_index = get_pointings_required_many(
+        [gs[0] for gs in grid_sources],
+        [gs[1] for gs in grid_sources],
+        fwhm, search_radius)
+
+    # sort the pointings into the right groups
+    for si, prd in zip(source_index, pointing_list_list):
+        _, _, jname_temp_list, vdif_check, sp_check = grid_sources[si]
+        if vdif_check:
+            vdif_name_list.append(jname_temp_list)
+            vdif_pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
+        elif sp_check:
+            sp_name_list.append(jname_temp_list)
+            sp_pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
+        else:
+            pulsar_name_list.append(jname_temp_list)
+            pulsar_pointing_list.append("{0}_{1}".format(prd[0], prd[1]))
 
 
     #Get the rest of the singple pulse search canidates
@@ -527,14 +608,28 @@ def find_pulsars_in_fov(obsid, psrbeg, psrend,
     pulsar_search_name_list = pulsar_search_name_list + poi_list[0]
     pulsar_search_pointing_list = pulsar_search_pointing_list + poi_list[1]
 
-    # Sometimes we get redundant RRATs that are found in RRAT and ANTF catalogues so they need to be removed
-    sp_name_list     = list(dict.fromkeys([ ":".join(s) for s in sp_name_list]))
-    sp_pointing_list = list(dict.fromkeys(sp_pointing_list))
+    # Merge overlapping pointings of each type so they are only beamformed once. This also removes
+    # the redundant RRATs that are found in RRAT and ANTF catalogues
+    n_before = len(pulsar_pointing_list) + len(vdif_pointing_list) + \
+               len(pulsar_search_pointing_list) + len(sp_pointing_list)
+    pulsar_name_list, pulsar_pointing_list = merge_pointings(pulsar_name_list, pulsar_pointing_list,
+                                                             fwhm, merge_fraction)
+    vdif_name_list, vdif_pointing_list = merge_pointings(vdif_name_list, vdif_pointing_list,
+                                                         fwhm, merge_fraction)
+    pulsar_search_name_list, pulsar_search_pointing_list = merge_pointings(pulsar_search_name_list,
+                                                                           pulsar_search_pointing_list,
+                                                                           fwhm, merge_fraction)
+    sp_name_list, sp_pointing_list = merge_pointings(sp_name_list, sp_pointing_list, fwhm, merge_fraction)
+    n_after = len(pulsar_pointing_list) + len(vdif_pointing_list) + \
+              len(pulsar_search_pointing_list) + len(sp_pointing_list)
+    logger.info("{0} merged {1} pointings into {2} beams within {3} FWHM, saving {4} beams".format(
+                obsid, n_before, n_after, merge_fraction, n_before - n_after))
 
     # Changing the format of the names list to make it easier to format
     pulsar_name_list        = [ ":".join(s) for s in pulsar_name_list]
     vdif_name_list          = [ ":".join(s) for s in vdif_name_list]
     pulsar_search_name_list = [ ":".join(s) for s in pulsar_search_name_list]
+    sp_name_list            = [ ":".join(s) for s in sp_name_list]
 
     if no_known_pulsars:
         # Return empty list for all known pulsar categories
@@ -581,7 +676,8 @@ def find_pulsars_in_fov_main(kwargs):
                                       no_known_pulsars=kwargs["no_known_pulsars"],
                                       no_search_cands=kwargs["no_search_cands"],
                                       offset=kwargs["offset"],
-                                      angle_offset=kwargs["angle_offset"])
+                                      angle_offset=kwargs["angle_offset"],
+                                      merge_fraction=kwargs["merge_fraction"])
     if kwargs['n_pointings'] is None:
         with open(f"{kwargs['obsid']}_fov_sources.csv", 'w', newline='') as csvfile:
             spamwriter = csv.writer(csvfile, delimiter=',')
@@ -0,0 +1,303 @@
+"""
+A single pass parser of PRESTO prepfold .bestprof files.
+
+read_bestprof reads the header fields and the profile of a file at once. load_many reads
+many files in parallel into a columnar table (a dict of numpy arrays) and can keep an
+on-disk index of parsed files (keyed by path, modification time and size) so repeated
+runs over large numbers of candidates only parse new or changed files.
+"""
+import os
+import re
+import json
+import sqlite3
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The header labels of a bestprof file and the field names they are read into
+HEADER_FIELDS = {
+    "Input file":       "input_file",
+    "Candidate":        "candidate",
+    "Telescope":        "telescope",
+    "Epoch_topo":       "epoch_topo",
+    "Epoch_bary (MJD)": "epoch_bary",
+    "T_sample":         "t_sample",
+    "Data Folded":      "data_folded",
+    "Data Avg":         "data_avg",
+    "Data StdDev":      "data_std",
+    "Profile Bins":     "nbins",
+    "Profile Avg":      "prof_avg",
+    "Profile StdDev":   "prof_std",
+    "Reduced chi-sqr":  "chi",
+    "Prob(Noise)":      "prob_noise",
+    "Best DM":          "dm",
+    "P_topo (ms)":      "p_topo",
+    "P'_topo (s/s)":    "pd_topo",
+    "P''_topo (s/s^2)": "pdd_topo",
+    "P_bary (ms)":      "p_bary",
+    "P'_bary (s/s)":    "pd_bary",
+    "P''_bary (s/s^2)": "pdd_bary",
+    "P_orb (s)":        "p_orb",
+    "asin(i)/c (s)":    "asini_c",
+    "eccentricity":     "eccentricity",
+    "w (rad)":          "w",
+    "T_peri":           "t_peri",
+}
+STRING_FIELDS = ("input_file", "candidate", "telescope", "ra", "dec")
+# The fields that are given with an uncertainty (their errors are in <field>_err)
+ERROR_FIELDS = ("p_topo", "pd_topo", "pdd_topo", "p_bary", "pd_bary", "pdd_bary")
+# All the fields of a bestprof record in column order (the profile is separate)
+FIELDS = (["input_file", "candidate", "telescope", "ra", "dec"] +
+          [field for field in HEADER_FIELDS.values() if field not in ("input_file", "candidate", "telescope")] +
+          ["sn"] + ["{}_err".format(field) for field in ERROR_FIELDS])
+
+# Missing strings (and the number of bins) are None and missing numbers are NaN
+_EMPTY_HEADER = {field: None if field in STRING_FIELDS + ("nbins",) else np.nan for field in FIELDS}
+_SIGMA_RE = re.compile(r"\(~\s*(\S+)\s*sigma\)")
+_POINTING_RE = re.compile(r"(\d{2}:\d{2}:\d{2}(?:\.\d*)?)_([+-]?\d{2}:\d{2}:\d{2}(?:\.\d*)?)")
+
+
+def _to_float(value):
+    """Converts a header value to a float with N/A (or anything else that isn't a number) as NaN"""
+    if value == "N/A":
+        return np.nan
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def _parse_header_line(line, header):
+    """Adds the field(s) of a header line to the header dict"""
+    label = line[1:19].strip()
+    field = HEADER_FIELDS.get(label)
+    if field is None:
+        return
+    value = line[20:].strip()
+    if field in STRING_FIELDS:
+        header[field] = value
+    elif field == "nbins":
+        header[field] = int(value)
+    elif field == "prob_noise":
+        # e.g. '<  0   (~32.5 sigma)' where the first character is '<' or '='
+        header[field] = _to_float(value.split()[0]) if value.split() else np.nan
+        sigma = _SIGMA_RE.search(value)
+        header["sn"] = _to_float(sigma.group(1)) if sigma else np.nan
+    elif field in ERROR_FIELDS:
+        value, _, error = value.partition("+/-")
+        header[field] = _to_float(value.strip())
+        header["{}_err".format(field)] = _to_float(error.strip())
+    else:
+        header[field] = _to_float(value)
+
+
+def read_bestprof(filename):
+    """
+    Reads the header and profile of a bestprof file in a single pass.
+
+    The fields are found by their labels instead of their line numbers. The RA and Dec
+    are read from the 'hh:mm:ss.ss_dd:mm:ss.ss' pointing in the input file name.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the bestprof file
+
+    Returns
+    -------
+    header: dict
+        The header fields (see FIELDS). The periods are in ms as in the file, the SN is the
+        sigma of Prob(Noise), fields that are missing or N/A are NaN (or None for strings)
+    profile: numpy.array
+        The profile
+    """
+    header = dict(_EMPTY_HEADER)
+    with open(filename, "r") as bestprof:
+        text = bestprof.read()
+    # The header is the lines at the start that begin with '#' and ends with a line of '#'s
+    lines = text.split("\n")
+    n_header = 0
+    for line in lines:
+        if not line.startswith("#"):
+            break
+        if not line.startswith("##"):
+            _parse_header_line(line, header)
+        n_header += 1
+    # The rest is the bin number and value of each bin
+    profile = np.fromstring(" ".join(lines[n_header:]), sep=" ").reshape(-1, 2)[:, 1]
+    if header["input_file"]:
+        pointing = _POINTING_RE.search(os.path.basename(header["input_file"]))
+        if pointing:
+            header["ra"], header["dec"] = pointing.groups()
+    if header["nbins"] is None:
+        header["nbins"] = len(profile)
+    return header, profile
+
+
+def _read_bestprof_safe(filename):
+    """read_bestprof that returns the error message instead of raising so a bulk load continues"""
+    try:
+        header, profile = read_bestprof(filename)
+        return header, profile, None
+    except (OSError, ValueError, IndexError) as e:
+        return None, None, "{}: {}".format(type(e).__name__, e)
+
+
+class BestprofIndex:
+    """
+    An on-disk (SQLite) index of parsed bestprof files keyed by path, modification time and size.
+
+    Parameters
+    ----------
+    index_file: str
+        The path of the index database. It is created if it doesn't exist.
+    """
+    def __init__(self, index_file):
+        self.index_file = index_file
+        index_dir = os.path.dirname(os.path.abspath(index_file))
+        os.makedirs(index_dir, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS bestprof "
+                               "(path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, header TEXT, profile BLOB)")
+
+    def _connect(self):
+        return sqlite3.connect(self.index_file)
+
+    def get_many(self, stats, chunk_size=500):
+        """
+        Gets the records of files that haven't changed since they were indexed.
+
+        Parameters
+        ----------
+        stats: dict
+            The (mtime in ns, size) of each path
+        chunk_size: int
+            OPTIONAL - The number of paths to query at once. Default: 500
+
+        Returns
+        -------
+        records: dict
+            The (header, profile) of each unchanged path in the index
+        """
+        records = {}
+        # The index is keyed by absolute path so it can be used from any directory
+        abs_paths = {os.path.abspath(path): path for path in stats}
+        keys = list(abs_paths.keys())
+        with closing(self._connect()) as connection:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                rows = connection.execute("SELECT path, mtime, size, header, profile FROM bestprof "
+                                          "WHERE path IN ({})".format(",".join("?" * len(chunk))), chunk)
+                for abs_path, mtime, size, header, profile in rows:
+                    path = abs_paths[abs_path]
+                    if (mtime, size) == tuple(stats[path]):
+                        records[path] = (json.loads(header), np.frombuffer(profile, dtype=np.float64).copy())
+        return records
+
+    def put_many(self, stats, records):
+        """
+        Adds (or replaces) the records of files in the index.
+
+        Parameters
+        ----------
+        stats: dict
+            The (mtime in ns, size) of each path
+        records: dict
+            The (header, profile) of each path
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO bestprof VALUES (?, ?, ?, ?, ?)",
+                                   ((os.path.abspath(path), stats[path][0], stats[path][1], json.dumps(header),
+                                     np.asarray(profile, dtype=np.float64).tobytes())
+                                    for path, (header, profile) in records.items()))
+
+
+def records_to_table(paths, records):
+    """
+    Converts the (header, profile) records of bestprof files to a columnar table.
+
+    Parameters
+    ----------
+    paths: list
+        The paths of the records in the order of the table's rows
+    records: dict
+        The (header, profile) of each path
+
+    Returns
+    -------
+    table: dict
+        A numpy array of each field in FIELDS, the 'path' of each row and the 'profile'
+        (an object array of each row's profile)
+    """
+    table = {"path": np.array(paths, dtype=str)}
+    for field in FIELDS:
+        values = [records[path][0][field] for path in paths]
+        if field in STRING_FIELDS:
+            table[field] = np.array(["" if value is None else value for value in values], dtype=str)
+        elif field == "nbins":
+            table[field] = np.array(values, dtype=int)
+        else:
+            table[field] = np.array(values, dtype=np.float64)
+    table["profile"] = np.empty(len(paths), dtype=object)
+    for i, path in enumerate(paths):
+        table["profile"][i] = records[path][1]
+    return table
+
+
+def load_many(paths, workers=None, index=None):
+    """
+    Reads many bestprof files into a columnar table.
+
+    Parameters
+    ----------
+    paths: list
+        The paths of the bestprof files
+    workers: int
+        OPTIONAL - The number of processes used to parse the files. Default: the number of CPUs
+    index: str or BestprofIndex
+        OPTIONAL - An on-disk index of parsed files. Files that haven't changed since they were
+        indexed are not parsed again and newly parsed files are added to it. Default: None
+
+    Returns
+    -------
+    table: dict
+        The columns of the files that could be read (see records_to_table) in the order of paths.
+        Files that couldn't be read are logged and left out.
+    """
+    paths = list(dict.fromkeys(paths))
+    records = {}
+    stats = {}
+    if index is not None:
+        if not isinstance(index, BestprofIndex):
+            index = BestprofIndex(index)
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning("Unable to read {}: {}".format(path, e))
+                continue
+            stats[path] = (stat.st_mtime_ns, stat.st_size)
+        records = index.get_many(stats)
+        logger.debug("{} of {} bestprof files are in the index".format(len(records), len(paths)))
+
+    todo = [path for path in paths if path not in records and (index is None or path in stats)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(todo) < 2 * workers:
+        outputs = [_read_bestprof_safe(path) for path in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_read_bestprof_safe, todo, chunksize=max(1, len(todo) // (workers * 8))))
+    new_records = {}
+    for path, (header, profile, error) in zip(todo, outputs):
+        if error is not None:
+            logger.warning("Unable to read {}: {}".format(path, error))
+            continue
+        new_records[path] = (header, profile)
+
+    if index is not None and new_records:
+        index.put_many(stats, new_records)
+    records.update(new_records)
+    return records_to_table([path for path in paths if path in records], records)
@@ -0,0 +1,556 @@
+"""
+Walltime and memory models of the PRESTO search jobs fitted from Nextflow trace files.
+
+The search processes record their features (the observation duration, number of harmonics,
+maximum acceleration and the number of DMs, downsample and number of subbands of each DM plan
+line) in their tag so each COMPLETED job of a trace file is a training sample of its realtime
+and peak RSS. The models are linear in features that follow the work done by prepsubband,
+realfft, accelsearch and single_pulse_search, are fitted per cluster (the trace files of one
+cluster) and per process and are saved as JSON so the ddplan process can pack the DM plan by
+predicted walltime and request the predicted time and memory for each job.
+"""
+import re
+import csv
+import json
+import math
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+COST_MODEL_VERSION = 1
+# The walltime features of a job. The features after the first two are sums over the plan lines
+WALLTIME_FEATURES = ("const", "dur", "dur_lines", "subband", "dedisp", "samples", "accel")
+LINE_WALLTIME_FEATURES = WALLTIME_FEATURES[2:]
+# The memory features of a job. Memory is set by the largest DM plan line as they are searched in turn
+MEMORY_FEATURES = ("const", "max_samples", "max_accel", "max_dedisp")
+
+_TAG_RE = re.compile(r"(\w+)=(\S+)")
+_DURATION_UNITS = {"d": 86400., "h": 3600., "m": 60., "s": 1., "ms": 1e-3}
+_MEMORY_UNITS = {"B": 1. / 1024**2, "KB": 1. / 1024, "MB": 1., "GB": 1024., "TB": 1024.**2}
+
+
+def search_cost_tag(dur, plan_chunk, nharm=None, zmax=None):
+    """
+    Makes the features part of a search job's tag in the format the Nextflow processes use.
+
+    Parameters
+    ----------
+    dur: float
+        The duration of the observation in seconds
+    plan_chunk: list
+        The DM plan lines of the job (in the dd_plan format)
+    nharm: int
+        OPTIONAL - The number of harmonics summed by accelsearch. Default: None (no accelsearch)
+    zmax: int
+        OPTIONAL - The maximum acceleration of accelsearch. Default: None (no accelsearch)
+
+    Returns
+    -------
+    tag: str
+        'dur=<dur> [nharm=<nharm> zmax=<zmax> ]plan=<ndm>:<downsamp>:<nsub>;...'
+    """
+    tag = "dur={} ".format(dur)
+    if nharm is not None and zmax is not None:
+        tag += "nharm={} zmax={} ".format(nharm, zmax)
+    return tag + "plan=" + ";".join("{}:{}:{}".format(int(dd_line[3]), int(dd_line[5]), int(dd_line[6]))
+                                    for dd_line in plan_chunk)
+
+
+def parse_search_cost_tag(tag):
+    """
+    Reads the features of a search job from its tag (see search_cost_tag).
+
+    Parameters
+    ----------
+    tag: str
+        The tag of the job
+
+    Returns
+    -------
+    features: dict or None
+        The dur, nharm, zmax and plan (a list of (ndm, downsamp, nsub)) of the job or None if the
+        tag doesn't contain the features
+    """
+    values = dict(_TAG_RE.findall(tag or ""))
+    if "dur" not in values or "plan" not in values:
+        return None
+    try:
+        plan = [tuple(float(value) for value in line.split(":")) for line in values["plan"].split(";") if line]
+        if not plan or any(len(line) != 3 for line in plan):
+            return None
+        return {"dur": float(values["dur"]),
+                "nharm": float(values.get("nharm", 0)),
+                "zmax": float(values.get("zmax", 0)),
+                "plan": plan}
+    except ValueError:
+        return None
+
+
+def _plan_terms(plan_chunk):
+    """The (ndm, downsamp, nsub) of each line of a DM plan in the dd_plan format or already as terms"""
+    return [(float(line[0]), float(line[1]), float(line[2])) if len(line) == 3 else
+            (float(line[3]), float(line[5]), float(line[6])) for line in plan_chunk]
+
+
+def _line_walltime_features(ndm, downsamp, nsub, dur, nharm, zmax):
+    """The walltime features of one DM plan line in the order of LINE_WALLTIME_FEATURES"""
+    samples = dur * ndm / downsamp
+    return [dur,                            # prepsubband reads all of the data for each line
+            dur * nsub,                     # forming the subbands
+            samples * nsub,                 # dedispersing the subbands
+            samples,                        # realfft, single_pulse_search and writing the time series
+            samples * (zmax + 1.) * nharm]  # accelsearch
+
+
+def walltime_features(plan_chunk, dur, nharm=0, zmax=0):
+    """
+    Calculates the walltime features (WALLTIME_FEATURES) of a search job.
+
+    Parameters
+    ----------
+    plan_chunk: list
+        The DM plan lines of the job in the dd_plan format or as (ndm, downsamp, nsub)
+    dur: float
+        The duration of the observation in seconds
+    nharm: int
+        OPTIONAL - The number of harmonics summed by accelsearch (0 if there is no accelsearch). Default: 0
+    zmax: int
+        OPTIONAL - The maximum acceleration of accelsearch. Default: 0
+
+    Returns
+    -------
+    features: numpy.array
+        The value of each feature
+    """
+    lines = np.zeros(len(LINE_WALLTIME_FEATURES))
+    for ndm, downsamp, nsub in _plan_terms(plan_chunk):
+        lines += _line_walltime_features(ndm, downsamp, nsub, dur, nharm, zmax)
+    return np.concatenate(([1., dur], lines))
+
+
+def memory_features(plan_chunk, dur, nharm=0, zmax=0):
+    """
+    Calculates the memory features (MEMORY_FEATURES) of a search job.
+
+    Parameters
+    ----------
+    plan_chunk: list
+        The DM plan lines of the job in the dd_plan format or as (ndm, downsamp, nsub)
+    dur: float
+        The duration of the observation in seconds
+    nharm: int
+        OPTIONAL - The number of harmonics summed by accelsearch (0 if there is no accelsearch). Default: 0
+    zmax: int
+        OPTIONAL - The maximum acceleration of accelsearch. Default: 0
+
+    Returns
+    -------
+    features: numpy.array
+        The value of each feature
+    """
+    terms = _plan_terms(plan_chunk)
+    max_samples = max(dur / downsamp for _, downsamp, _ in terms)
+    return np.array([1.,
+                     max_samples,
+                     max_samples * (zmax + 1.) if nharm else 0.,
+                     max(ndm * nsub for ndm, _, nsub in terms)])
+
+
+def _fit_non_negative(X, y):
+    """
+    Fits y = X @ coefficients minimising the relative error with non-negative coefficients
+    (by dropping the most negative feature and refitting until they all are).
+    """
+    # Dividing by y minimises the relative error so short jobs are fitted as well as long ones
+    A = X / y[:, None]
+    b = np.ones(len(y))
+    scale = np.abs(A).max(axis=0)
+    active = [i for i in range(X.shape[1]) if scale[i] > 0]
+    coefficients = np.zeros(X.shape[1])
+    while active:
+        solution = np.linalg.lstsq(A[:, active] / scale[active], b, rcond=None)[0] / scale[active]
+        if (solution >= 0).all():
+            coefficients[active] = solution
+            break
+        del active[int(np.argmin(solution))]
+    return coefficients
+
+
+def _fit_margin(X, y, coefficients, quantile):
+    """The factor the predictions are multiplied by so they cover the quantile of the jobs"""
+    predictions = X @ coefficients
+    if (predictions <= 0).any():
+        return 1.
+    return max(1., float(np.quantile(y / predictions, quantile)))
+
+
+class CostModel:
+    """
+    A walltime and peak memory model of a search process on one cluster.
+
+    Parameters
+    ----------
+    walltime: dict
+        The coefficient of each of WALLTIME_FEATURES (missing features are 0) in seconds
+    memory: dict
+        The coefficient of each of MEMORY_FEATURES (missing features are 0) in MB
+    walltime_margin: float
+        OPTIONAL - The factor the walltime predictions are multiplied by. Default: 1
+    memory_margin: float
+        OPTIONAL - The factor the memory predictions are multiplied by. Default: 1
+    process: str
+        OPTIONAL - The Nextflow process the model is of. Default: None
+    cluster: str
+        OPTIONAL - The cluster the model is of. Default: None
+    n_jobs: int
+        OPTIONAL - The number of jobs the model was fitted to. Default: 0
+    """
+    def __init__(self, walltime, memory, walltime_margin=1., memory_margin=1., process=None, cluster=None, n_jobs=0):
+        self.walltime = np.array([walltime.get(feature, 0.) for feature in WALLTIME_FEATURES], dtype=np.float64)
+        self.memory = np.array([memory.get(feature, 0.) for feature in MEMORY_FEATURES], dtype=np.float64)
+        self.walltime_margin = walltime_margin
+        self.memory_margin = memory_margin
+        self.process = process
+        self.cluster = cluster
+        self.n_jobs = n_jobs
+
+    @classmethod
+    def fit(cls, jobs, quantile=0.95, process=None, cluster=None):
+        """
+        Fits the model to jobs from read_trace.
+
+        Parameters
+        ----------
+        jobs: list
+            The jobs (dicts of dur, nharm, zmax, plan, walltime and memory) to fit to
+        quantile: float
+            OPTIONAL - The fraction of the jobs that the predictions (with their margins) should
+            be above their realtime and peak RSS. Default: 0.95
+        process: str
+            OPTIONAL - The Nextflow process the model is of. Default: None
+        cluster: str
+            OPTIONAL - The cluster the model is of. Default: None
+
+        Returns
+        -------
+        model: CostModel
+            The fitted model
+        """
+        if not jobs:
+            raise ValueError("No jobs to fit the cost model to")
+        X_time = np.array([walltime_features(job["plan"], job["dur"], job["nharm"], job["zmax"]) for job in jobs])
+        X_mem = np.array([memory_features(job["plan"], job["dur"], job["nharm"], job["zmax"]) for job in jobs])
+        # Zero values (such as jobs that finished within the trace resolution) can't be fitted by relative error
+        time = np.array([job["walltime"] for job in jobs], dtype=np.float64)
+        mem = np.array([job["memory"] for job in jobs], dtype=np.float64)
+        time_mask = time > 0
+        mem_mask = mem > 0
+        if not time_mask.any() or not mem_mask.any():
+            raise ValueError("No jobs with a realtime and peak RSS to fit the cost model to")
+        walltime = _fit_non_negative(X_time[time_mask], time[time_mask])
+        memory = _fit_non_negative(X_mem[mem_mask], mem[mem_mask])
+        return cls(dict(zip(WALLTIME_FEATURES, walltime)),
+                   dict(zip(MEMORY_FEATURES, memory)),
+                   walltime_margin=_fit_margin(X_time[time_mask], time[time_mask], walltime, quantile),
+                   memory_margin=_fit_margin(X_mem[mem_mask], mem[mem_mask], memory, quantile),
+                   process=process, cluster=cluster, n_jobs=len(jobs))
+
+    def predict(self, plan_chunk, dur, nharm=0, zmax=0):
+        """
+        Predicts the walltime and peak memory of a search job.
+
+        Parameters
+        ----------
+        plan_chunk: list
+            The DM plan lines of the job in the dd_plan format or as (ndm, downsamp, nsub)
+        dur: float
+            The duration of the observation in seconds
+        nharm: int
+            OPTIONAL - The number of harmonics summed by accelsearch (0 if there is no accelsearch). Default: 0
+        zmax: int
+            OPTIONAL - The maximum acceleration of accelsearch. Default: 0
+
+        Returns
+        -------
+        walltime: float
+            The predicted walltime in seconds (including the margin)
+        memory: float
+            The predicted peak memory in MB (including the margin)
+        """
+        walltime = float(walltime_features(plan_chunk, dur, nharm, zmax) @ self.walltime)
+        memory = float(memory_features(plan_chunk, dur, nharm, zmax) @ self.memory)
+        return walltime * self.walltime_margin, memory * self.memory_margin
+
+    def line_walltime(self, dd_line, dur, nharm=0, zmax=0):
+        """
+        The walltime a DM plan line adds to a job in seconds (without the margin).
+        Jobs' walltimes are the sum of their lines' walltimes and the job overhead.
+
+        Parameters
+        ----------
+        dd_line: list
+            The DM plan line in the dd_plan format or as (ndm, downsamp, nsub)
+        dur: float
+            The duration of the observation in seconds
+        nharm: int
+            OPTIONAL - The number of harmonics summed by accelsearch (0 if there is no accelsearch). Default: 0
+        zmax: int
+            OPTIONAL - The maximum acceleration of accelsearch. Default: 0
+
+        Returns
+        -------
+        walltime: float
+            The walltime of the line in seconds
+        """
+        ndm, downsamp, nsub = _plan_terms([dd_line])[0]
+        return float(np.dot(_line_walltime_features(ndm, downsamp, nsub, dur, nharm, zmax), self.walltime[2:]))
+
+    def line_budget(self, max_walltime, dur):
+        """
+        The total line walltime (see line_walltime) a job can have so its predicted walltime
+        (with the margin) is less than max_walltime. This is the max_work to pack a plan with.
+
+        Parameters
+        ----------
+        max_walltime: float
+            The maximum walltime of a job in seconds
+        dur: float
+            The duration of the observation in seconds
+
+        Returns
+        -------
+        budget: float
+            The total line walltime in seconds
+        """
+        return max_walltime / self.walltime_margin - self.walltime[0] - self.walltime[1] * dur
+
+    def to_dict(self):
+        """The JSON serialisable coefficients, margins and metadata of the model"""
+        return {"walltime": dict(zip(WALLTIME_FEATURES, self.walltime.tolist())),
+                "memory": dict(zip(MEMORY_FEATURES, self.memory.tolist())),
+                "walltime_margin": self.walltime_margin,
+                "memory_margin": self.memory_margin,
+                "process": self.process,
+                "cluster": self.cluster,
+                "n_jobs": self.n_jobs}
+
+    @classmethod
+    def from_dict(cls, model):
+        """Makes a model from the output of to_dict"""
+        return cls(model["walltime"], model["memory"],
+                   walltime_margin=model.get("walltime_margin", 1.), memory_margin=model.get("memory_margin", 1.),
+                   process=model.get("process"), cluster=model.get("cluster"), n_jobs=model.get("n_jobs", 0))
+
+
+def _parse_duration(value):
+    """Converts a Nextflow trace duration ('1h 2m 3s', '450ms' or raw milliseconds) to seconds"""
+    value = value.strip()
+    if value in ("", "-"):
+        return None
+    if re.fullmatch(r"[\d.]+", value):
+        return float(value) / 1000.
+    parts = re.findall(r"([\d.]+)\s*(ms|d|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _parse_memory(value):
+    """Converts a Nextflow trace memory ('1.2 GB' or raw bytes) to MB"""
+    value = value.strip()
+    if value in ("", "-"):
+        return None
+    if re.fullmatch(r"[\d.]+", value):
+        return float(value) / 1024**2
+    match = re.fullmatch(r"([\d.]+)\s*([KMGT]?B)", value)
+    if match is None:
+        return None
+    return float(match.group(1)) * _MEMORY_UNITS[match.group(2)]
+
+
+def read_trace(trace_file):
+    """
+    Reads the completed search jobs from a Nextflow trace file.
+
+    The trace needs the name, tag, status, realtime and peak_rss fields (see the trace scope of nextflow.config).
+
+    Parameters
+    ----------
+    trace_file: str
+        The path of the trace file
+
+    Returns
+    -------
+    jobs: list
+        A dict of each completed job with a features tag (see parse_search_cost_tag) with its
+        process, dur, nharm, zmax, plan, walltime (realtime in seconds) and memory (peak RSS in MB)
+    """
+    jobs = []
+    with open(trace_file, "r", newline="") as trace:
+        for row in csv.DictReader(trace, delimiter="\t"):
+            if row.get("status") != "COMPLETED":
+                continue
+            features = parse_search_cost_tag(row.get("tag"))
+            if features is None:
+                continue
+            walltime = _parse_duration(row.get("realtime", ""))
+            memory = _parse_memory(row.get("peak_rss", ""))
+            if walltime is None or memory is None:
+                continue
+            # Names are '<workflow>:<process> (<tag or index>)'
+            process = row.get("name", "").split(" (")[0].split(":")[-1]
+            jobs.append(dict(features, process=process, walltime=walltime, memory=memory))
+    return jobs
+
+
+def fit_cost_models(trace_files, cluster=None, quantile=0.95, min_jobs=10):
+    """
+    Fits a cost model to each search process in the trace files of a cluster.
+
+    Parameters
+    ----------
+    trace_files: list
+        The paths of the Nextflow trace files
+    cluster: str
+        OPTIONAL - The name of the cluster the traces are from. Default: None
+    quantile: float
+        OPTIONAL - The fraction of the jobs that the predictions (with their margins) should
+        be above their realtime and peak RSS. Default: 0.95
+    min_jobs: int
+        OPTIONAL - The minimum number of jobs of a process needed to fit its model. Default: 10
+
+    Returns
+    -------
+    models: dict
+        The CostModel of each process
+    """
+    process_jobs = {}
+    for trace_file in trace_files:
+        for job in read_trace(trace_file):
+            process_jobs.setdefault(job["process"], []).append(job)
+    models = {}
+    for process, jobs in sorted(process_jobs.items()):
+        if len(jobs) < min_jobs:
+            logger.warning("Only {} jobs of {} so it was not fitted".format(len(jobs), process))
+            continue
+        models[process] = CostModel.fit(jobs, quantile=quantile, process=process, cluster=cluster)
+        logger.debug("Fitted {} to {} jobs".format(process, len(jobs)))
+    return models
+
+
+def save_cost_models(models, filename):
+    """
+    Writes cost models to a JSON file.
+
+    Parameters
+    ----------
+    models: dict
+        The CostModel of each process
+    filename: str
+        The path of the JSON file
+    """
+    with open(filename, "w") as outfile:
+        json.dump({"version": COST_MODEL_VERSION,
+                   "models": {process: model.to_dict() for process, model in models.items()}},
+                  outfile, indent=4)
+
+
+def load_cost_model(filename, process="search_dd_fft_acc"):
+    """
+    Reads a cost model from a JSON file written by save_cost_models.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the JSON file
+    process: str
+        OPTIONAL - The process of the model. Default: 'search_dd_fft_acc'
+
+    Returns
+    -------
+    model: CostModel
+        The cost model of the process
+    """
+    with open(filename, "r") as infile:
+        models = json.load(infile)
+    if models.get("version") != COST_MODEL_VERSION:
+        raise ValueError("{} is a version {} cost model file but version {} is required".format(
+                         filename, models.get("version"), COST_MODEL_VERSION))
+    if process not in models["models"]:
+        raise ValueError("{} has no cost model for {}. It has: {}".format(
+                         filename, process, ", ".join(sorted(models["models"]))))
+    return CostModel.from_dict(models["models"][process])
+
+
+def _format_duration(seconds):
+    """Formats seconds like a Nextflow trace duration"""
+    if seconds < 1.:
+        return "{}ms".format(int(round(seconds * 1000)))
+    parts = []
+    for unit in ("d", "h", "m"):
+        if seconds >= _DURATION_UNITS[unit]:
+            number = int(seconds // _DURATION_UNITS[unit])
+            parts.append("{}{}".format(number, unit))
+            seconds -= number * _DURATION_UNITS[unit]
+    parts.append("{}s".format(int(seconds)) if parts else "{:.1f}s".format(seconds))
+    return " ".join(parts)
+
+
+def _format_memory(mb):
+    """Formats MB like a Nextflow trace memory"""
+    if mb >= 1024.:
+        return "{:.1f} GB".format(mb / 1024.)
+    return "{:.1f} MB".format(mb)
+
+
+def make_synthetic_trace(filename, model, n_jobs=200, noise=0.1, seed=0, process="search_dd_fft_acc"):
+    """
+    Writes a Nextflow trace file of synthetic search jobs whose realtime and peak RSS follow
+    a known model (with log-normal noise) to check fit_cost_models recovers the model
+    (see the synthetic_trace fixture in tests/conftest.py).
+
+    Parameters
+    ----------
+    filename: str
+        The path of the trace file
+    model: CostModel
+        The model of the jobs' realtime and peak RSS (its margins are ignored)
+    n_jobs: int
+        OPTIONAL - The number of jobs. Default: 200
+    noise: float
+        OPTIONAL - The standard deviation of the log of the noise factors. Default: 0.1
+    seed: int
+        OPTIONAL - The seed of the random number generator. Default: 0
+    process: str
+        OPTIONAL - The process name of the jobs. Default: 'search_dd_fft_acc'
+    """
+    rng = np.random.RandomState(seed)
+    fields = ["task_id", "hash", "native_id", "name", "tag", "status", "exit", "submit",
+              "duration", "realtime", "%cpu", "peak_rss", "peak_vmem", "rchar", "wchar"]
+    with open(filename, "w", newline="") as outfile:
+        writer = csv.writer(outfile, delimiter="\t", lineterminator="\n")
+        writer.writerow(fields)
+        for job_id in range(1, n_jobs + 1):
+            dur = float(rng.choice([600, 1200, 2400, 4800]))
+            nharm = int(rng.choice([8, 16]))
+            zmax = int(rng.choice([0, 50, 200]))
+            if process != "search_dd_fft_acc":
+                # Only search_dd_fft_acc runs accelsearch so the other processes don't tag nharm or zmax
+                nharm = zmax = None
+            plan_chunk = [(int(rng.randint(32, 2000)), int(2**rng.randint(0, 5)), int(2**rng.randint(5, 11)))
+                          for _ in range(rng.randint(1, 4))]
+            walltime = float(walltime_features(plan_chunk, dur, nharm or 0, zmax or 0) @ model.walltime)
+            memory = float(memory_features(plan_chunk, dur, nharm or 0, zmax or 0) @ model.memory)
+            walltime *= math.exp(rng.normal(0., noise))
+            memory *= math.exp(rng.normal(0., noise))
+            # Some failed jobs which should be ignored
+            status = "FAILED" if rng.uniform() < 0.05 else "COMPLETED"
+            tag = "Blind_{} {}".format(job_id, search_cost_tag(dur, [(0, 0, 0, ndm, 0, ds, nsub, 0)
+                                                                    for ndm, ds, nsub in plan_chunk],
+                                                               nharm=nharm, zmax=zmax))
+            writer.writerow([job_id, "{:02x}/{:06x}".format(job_id % 256, job_id), 1000 + job_id,
+                             "pulsar_search:{} ({})".format(process, tag), tag, status,
+                             0 if status == "COMPLETED" else 140, "2021-01-01 00:00:00.000",
+                             _format_duration(walltime + 60.), _format_duration(walltime), "95.0%",
+                             _format_memory(memory), _format_memory(memory * 1.2), "1 GB", "1 GB"])
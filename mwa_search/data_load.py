@@ -7,4 +7,12 @@ import os
 datadir = os.path.join(os.path.dirname(__file__), 'data')
 
 # Hard code the path of the MWA tile receiver temperature file
-SMART_POWER_FILE = os.path.join(datadir, 'SMART_obs_data.npy')
\ No newline at end of file
+SMART_POWER_FILE = os.path.join(datadir, 'SMART_obs_data.npy')
+
+# The default directory of the grid cache. Can be changed with the MWA_SEARCH_CACHE environment variable
+GRID_CACHE_DIR = os.environ.get("MWA_SEARCH_CACHE",
+                                os.path.join(os.path.expanduser("~"), ".cache", "mwa_search", "grids"))
+
+# The default directory of the dedispersion plan registry. Can be changed with the MWA_SEARCH_PLAN_REGISTRY environment variable
+PLAN_REGISTRY_DIR = os.environ.get("MWA_SEARCH_PLAN_REGISTRY",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "mwa_search", "dd_plans"))
@@ -0,0 +1,638 @@
+"""
+Incoherent dedispersion of search mode PSRFITS data into PRESTO time series.
+
+fdmt is a NumPy vectorised Fast Dispersion Measure Transform (Zackay & Ofek 2017) which, after
+shifting the channels to the lowest DM, makes every integer delay across the band in
+log2(nchan) steps, so narrow DM ranges (such as those of targeted searches) are cheap.
+dedisperse_brute is a shift and sum (optionally through subbands like prepsubband) reference to
+check it against. dedisperse_files dedisperses a dd_plan line of a PSRFITS observation in
+blocks of time (in parallel) and writes the .dat and .inf files that realfft, accelsearch and
+prepfold read.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from mwa_search.psrfits import PsrfitsStream
+
+import logging
+logger = logging.getLogger(__name__)
+
+# PRESTO's dispersion constant (s MHz^2 cm^3 pc^-1) so the delays are the same as prepsubband's
+DM_CONST = 1. / 0.000241
+
+DM_ENGINES = ("fdmt", "brute")
+
+# The largest range of delays (in samples) of one FDMT. Wider DM ranges are split into several
+FDMT_MAX_DELAY = 1024
+
+# The default number of input (not downsampled) samples each worker reads at once. A 3072 channel
+# block is 0.8 GB as read and a worker holds about four times that (see dedisperse_files)
+DEFAULT_BLOCK_SAMPLES = 2**16
+
+# The bytes of dedispersed blocks buffered before they are written to the .dat files
+DAT_BUFFER_BYTES = 2**28
+
+
+def dm_delays(dm, freqs, tbin, ref_freq=None):
+    """
+    The dispersion delay of each channel in samples.
+
+    Parameters
+    ----------
+    dm: float
+        The dispersion measure
+    freqs: numpy.array
+        The centre frequency of each channel in MHz
+    tbin: float
+        The sampling time in seconds
+    ref_freq: float
+        OPTIONAL - The frequency the delays are relative to in MHz. Default: the highest channel frequency
+
+    Returns
+    -------
+    delays: numpy.array
+        The delay of each channel rounded to the nearest sample
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    if ref_freq is None:
+        ref_freq = freqs.max()
+    return np.round(dm * DM_CONST * (freqs**-2 - ref_freq**-2) / tbin).astype(np.int64)
+
+
+def max_delay(freqs, tbin, dms):
+    """
+    The number of samples at the end of a block that the dedispersed samples need past the
+    block (the largest delay across the band of the DMs plus one for the rounding of the FDMT).
+
+    Parameters
+    ----------
+    freqs: numpy.array
+        The centre frequency of each channel in MHz
+    tbin: float
+        The sampling time in seconds
+    dms: numpy.array
+        The dispersion measures
+
+    Returns
+    -------
+    delay: int
+        The number of samples
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    band_delay = np.max(dms) * DM_CONST * (freqs.min()**-2 - freqs.max()**-2) / tbin
+    return int(np.ceil(band_delay)) + 1
+
+
+def ddplan_dms(ddplan_line):
+    """
+    The DMs of a dd_plan line, as prepsubband searches them (-lodm, -dmstep and -numdms).
+
+    Parameters
+    ----------
+    ddplan_line: list
+        The dd_plan line [low_DM, high_DM, DM_step, nDM_step, timeres, downsample, nsub, ...]
+
+    Returns
+    -------
+    dms: numpy.array
+        The DMs
+    """
+    return ddplan_line[0] + ddplan_line[2] * np.arange(int(ddplan_line[3]))
+
+
+def downsample(samples, factor):
+    """
+    Averages groups of factor samples (dropping any left over at the end).
+
+    Parameters
+    ----------
+    samples: numpy.array
+        The (time, channel) samples
+    factor: int
+        The number of samples to average
+
+    Returns
+    -------
+    samples: numpy.array
+        The (time // factor, channel) float32 samples
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if factor <= 1:
+        return samples
+    nsamp = samples.shape[0] // factor * factor
+    return samples[:nsamp].reshape(nsamp // factor, factor, -1).mean(axis=1, dtype=np.float32)
+
+
+def zero_dm(samples):
+    """
+    Removes the zero DM time series (the mean of the channels of each sample) like prepsubband's -zerodm.
+
+    Parameters
+    ----------
+    samples: numpy.array
+        The (time, channel) samples
+
+    Returns
+    -------
+    samples: numpy.array
+        The (time, channel) float32 samples with the zero DM signal removed
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    return samples - samples.mean(axis=1, dtype=np.float32)[:, np.newaxis]
+
+
+def _channels_high_to_low(samples, freqs):
+    """The (channel, time) samples and frequencies ordered from the highest frequency"""
+    freqs = np.asarray(freqs, dtype=np.float64)
+    order = np.argsort(freqs)[::-1]
+    return np.ascontiguousarray(np.asarray(samples, dtype=np.float32).T[order]), freqs[order]
+
+
+def dedisperse_brute(samples, freqs, tbin, dms, nsub=None, sub_dm=None):
+    """
+    Dedisperses by shifting and summing the channels, optionally through subbands like prepsubband.
+    This is the reference fdmt is checked against.
+
+    Parameters
+    ----------
+    samples: numpy.array
+        The (time, channel) samples
+    freqs: numpy.array
+        The centre frequency of each channel in MHz
+    tbin: float
+        The sampling time in seconds
+    dms: numpy.array
+        The dispersion measures
+    nsub: int
+        OPTIONAL - Dedisperse the channels to this many subbands at sub_dm first then dedisperse
+        the subbands to each DM. Default: None (dedisperse the channels to each DM)
+    sub_dm: float
+        OPTIONAL - The DM of the subbands. Default: the middle of the DMs
+
+    Returns
+    -------
+    series: numpy.array
+        The (DM, time) float32 dedispersed time series of the first len(samples) - max_delay samples
+    """
+    dms = np.atleast_1d(np.asarray(dms, dtype=np.float64))
+    channels, freqs = _channels_high_to_low(samples, freqs)
+    nout = channels.shape[1] - max_delay(freqs, tbin, dms)
+    if nout <= 0:
+        raise ValueError("There are fewer samples ({}) than the dispersion delay ({})".format(
+                         channels.shape[1], max_delay(freqs, tbin, dms)))
+    series = np.zeros((len(dms), nout), dtype=np.float32)
+
+    if nsub is None or nsub >= len(freqs):
+        for i, dm in enumerate(dms):
+            for channel, delay in zip(channels, dm_delays(dm, freqs, tbin)):
+                series[i] += channel[delay:delay + nout]
+        return series
+
+    # Dedisperse each subband to its highest channel at sub_dm
+    if sub_dm is None:
+        sub_dm = dms[len(dms) // 2]
+    subbands = np.array_split(np.arange(len(freqs)), nsub)
+    sub_freqs = np.array([freqs[sub[0]] for sub in subbands])
+    sub_delays = [dm_delays(sub_dm, freqs[sub], tbin, ref_freq=sub_freq) for sub, sub_freq in zip(subbands, sub_freqs)]
+    sub_nout = channels.shape[1] - max(delays.max() for delays in sub_delays)
+    sub_series = np.zeros((nsub, sub_nout), dtype=np.float32)
+    for sub, delays, sub_data in zip(subbands, sub_delays, sub_series):
+        for chan, delay in zip(sub, delays):
+            sub_data += channels[chan, delay:delay + sub_nout]
+    # Then dedisperse the subbands to each DM
+    for i, dm in enumerate(dms):
+        for sub_data, delay in zip(sub_series, dm_delays(dm, sub_freqs, tbin, ref_freq=freqs[0])):
+            part = sub_data[delay:delay + nout]
+            series[i, :len(part)] += part
+    return series
+
+
+def _fdmt_transform(channels, freqs, delays):
+    """
+    The Fast Dispersion Measure Transform of (channel, time) samples ordered from the highest frequency.
+
+    Each subband's state is a (delay, time) array of the sums of its channels along the dispersion
+    sweeps with integer delays (in samples) between its highest and lowest channel, starting at
+    the time of its highest channel. Adjacent subbands are combined until there is one for the band.
+    Only the delays of each subband that the requested delays of the band depend on are made.
+
+    Parameters
+    ----------
+    channels: numpy.array
+        The (channel, time) float32 samples ordered from the highest frequency
+    freqs: numpy.array
+        The centre frequency of each channel in MHz (decreasing)
+    delays: numpy.array
+        The delays across the band to make
+
+    Returns
+    -------
+    series: numpy.array
+        The (delay, time) dedispersed time series. The last max(delays) samples are incomplete.
+    """
+    ntime = channels.shape[1]
+    inv_sq = freqs**-2
+    band_delay = int(np.max(delays))
+    band_span = inv_sq[-1] - inv_sq[0]
+
+    # Make the tree of subbands from the channels up
+    nodes = [{"top": chan, "bottom": chan, "ndelay": 1} for chan in range(len(freqs))]
+    levels = []
+    while len(nodes) > 1:
+        parents = []
+        for upper, lower in zip(nodes[0::2], nodes[1::2]):
+            top, bottom = upper["top"], lower["bottom"]
+            span = inv_sq[bottom] - inv_sq[top]
+            if span > 0 and band_span > 0:
+                ndelay = min(int(np.ceil(band_delay * span / band_span)), band_delay) + 1
+                sub_delays = np.arange(ndelay)
+                # The delay across the upper subband and from the top of the band to the top of the lower subband
+                upper_delays = np.round(sub_delays * (inv_sq[upper["bottom"]] - inv_sq[top]) / span).astype(np.int64)
+                offsets = np.round(sub_delays * (inv_sq[lower["top"]] - inv_sq[top]) / span).astype(np.int64)
+            else:
+                ndelay = 1
+                sub_delays = upper_delays = offsets = np.zeros(1, dtype=np.int64)
+            parents.append({
+                "top": top,
+                "bottom": bottom,
+                "ndelay": ndelay,
+                "upper": upper,
+                "lower": lower,
+                "upper_delays": np.minimum(upper_delays, upper["ndelay"] - 1),
+                "lower_delays": np.clip(sub_delays - offsets, 0, lower["ndelay"] - 1),
+                "offsets": offsets,
+            })
+        if len(nodes) % 2:
+            parents.append(nodes[-1])
+        levels.append(parents)
+        nodes = parents
+    band = nodes[0]
+
+    # Work out the delays each subband needs from the band down
+    band["rows"] = np.unique(np.minimum(delays, band["ndelay"] - 1))
+    for level in levels[::-1]:
+        for node in level:
+            if "upper" in node:
+                node["upper"]["rows"] = np.unique(node["upper_delays"][node["rows"]])
+                node["lower"]["rows"] = np.unique(node["lower_delays"][node["rows"]])
+
+    # Then combine the subbands from the channels up
+    for level in levels:
+        for node in level:
+            if "state" in node:
+                # Carried up from the level below
+                continue
+            upper, lower = node["upper"], node["lower"]
+            for child in (upper, lower):
+                if "state" not in child:
+                    child["state"] = channels[child["top"]][np.newaxis]
+            rows = node["rows"]
+            state = upper["state"][np.searchsorted(upper["rows"], node["upper_delays"][rows])]
+            lower_state = lower["state"]
+            for row, lower_row, offset in zip(state, np.searchsorted(lower["rows"], node["lower_delays"][rows]),
+                                              node["offsets"][rows]):
+                row[:ntime - offset] += lower_state[lower_row, offset:]
+            node["state"] = state
+            # The children's states are no longer needed
+            del upper["state"], lower["state"]
+    if "state" not in band:
+        # A single channel
+        band["state"] = channels[band["top"]][np.newaxis]
+    return band["state"][np.searchsorted(band["rows"], np.minimum(delays, band["ndelay"] - 1))]
+
+
+def fdmt(samples, freqs, tbin, dms, max_fdmt_delay=FDMT_MAX_DELAY):
+    """
+    Dedisperses with the Fast Dispersion Measure Transform. The channels are shifted to the lowest
+    DM first so the transform only spans the delays of the DM range. The delays of each channel
+    are within a sample or two of dedisperse_brute's.
+
+    Parameters
+    ----------
+    samples: numpy.array
+        The (time, channel) samples
+    freqs: numpy.array
+        The centre frequency of each channel in MHz
+    tbin: float
+        The sampling time in seconds
+    dms: numpy.array
+        The dispersion measures
+    max_fdmt_delay: int
+        OPTIONAL - The largest range of delays across the band (in samples) of one transform. Wider DM
+        ranges are split into several transforms to limit the memory used. Default: FDMT_MAX_DELAY
+
+    Returns
+    -------
+    series: numpy.array
+        The (DM, time) float32 dedispersed time series of the first len(samples) - max_delay samples
+    """
+    dms = np.atleast_1d(np.asarray(dms, dtype=np.float64))
+    channels, freqs = _channels_high_to_low(samples, freqs)
+    nout = channels.shape[1] - max_delay(freqs, tbin, dms)
+    if nout <= 0:
+        raise ValueError("There are fewer samples ({}) than the dispersion delay ({})".format(
+                         channels.shape[1], max_delay(freqs, tbin, dms)))
+    band_sweep = DM_CONST * (freqs[-1]**-2 - freqs[0]**-2) / tbin
+    series = np.empty((len(dms), nout), dtype=np.float32)
+
+    order = np.argsort(dms)
+    while len(order):
+        # The DMs of this transform
+        low_dm = dms[order[0]]
+        ngroup = np.searchsorted((dms[order] - low_dm) * band_sweep, max_fdmt_delay, side="right")
+        group, order = order[:ngroup], order[ngroup:]
+
+        shifts = dm_delays(low_dm, freqs, tbin)
+        ntime = channels.shape[1] - shifts.max()
+        shifted = np.empty((len(freqs), ntime), dtype=np.float32)
+        for chan, shift in enumerate(shifts):
+            shifted[chan] = channels[chan, shift:shift + ntime]
+        delays = np.round((dms[group] - low_dm) * band_sweep).astype(np.int64)
+        series[group] = _fdmt_transform(shifted, freqs, delays)[:, :nout]
+    return series
+
+
+def write_inf(filename, info):
+    """
+    Writes a PRESTO .inf file.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the .inf file
+    info: dict
+        The basename, telescope, instrument, object, ra_str, dec_str, observer, mjd, nsamp, tbin,
+        fov (arcsec), dm, low_freq (MHz), bandwidth (MHz), nchan, chan_bw (MHz), analyser and notes
+    """
+    mjd_int = int(np.floor(info["mjd"]))
+    mjd_frac = "{:.15f}".format(info["mjd"] - mjd_int)
+    if mjd_frac.startswith("1"):
+        # Rounded up to the next day
+        mjd_int += 1
+        mjd_frac = "{:.15f}".format(0.)
+    lines = [
+        " Data file name without suffix          =  {}".format(info["basename"]),
+        " Telescope used                         =  {}".format(info.get("telescope", "MWA")),
+        " Instrument used                        =  {}".format(info.get("instrument", "VCS")),
+        " Object being observed                  =  {}".format(info.get("object", "Unknown")),
+        " J2000 Right Ascension (hh:mm:ss.ssss)  =  {}".format(info.get("ra_str", "00:00:00.0000")),
+        " J2000 Declination     (dd:mm:ss.ssss)  =  {}".format(info.get("dec_str", "00:00:00.0000")),
+        " Data observed by                       =  {}".format(info.get("observer", "Unknown")),
+        " Epoch of observation (MJD)             =  {}.{}".format(mjd_int, mjd_frac.split(".")[1]),
+        " Barycentered?           (1=yes, 0=no)  =  0",
+        " Number of bins in the time series      =  {:<11d}".format(int(info["nsamp"])),
+        " Width of each time series bin (sec)    =  {:.15g}".format(info["tbin"]),
+        " Any breaks in the data? (1=yes, 0=no)  =  0",
+        " Type of observation (EM band)          =  Radio",
+        " Beam diameter (arcsec)                 =  {:.0f}".format(info.get("fov", 0.)),
+        " Dispersion measure (cm-3 pc)           =  {:.12g}".format(info["dm"]),
+        " Central freq of low channel (Mhz)      =  {:.12g}".format(info["low_freq"]),
+        " Total bandwidth (Mhz)                  =  {:.12g}".format(info["bandwidth"]),
+        " Number of channels                     =  {:d}".format(int(info["nchan"])),
+        " Channel bandwidth (Mhz)                =  {:.12g}".format(info["chan_bw"]),
+        " Data analyzed by                       =  {}".format(info.get("analyser", "mwa_search")),
+        " Any additional notes:",
+        "    {}".format(info.get("notes", "")),
+        "",
+    ]
+    with open(filename, "w") as inf_file:
+        inf_file.write("\n".join(lines) + "\n")
+
+
+# The .inf keys of each line description, in the order PRESTO writes them
+_INF_KEYS = [
+    ("Data file name without suffix", "basename", str),
+    ("Telescope used", "telescope", str),
+    ("Instrument used", "instrument", str),
+    ("Object being observed", "object", str),
+    ("J2000 Right Ascension", "ra_str", str),
+    ("J2000 Declination", "dec_str", str),
+    ("Data observed by", "observer", str),
+    ("Epoch of observation", "mjd", float),
+    ("Barycentered?", "barycentred", int),
+    ("Number of bins in the time series", "nsamp", int),
+    ("Width of each time series bin", "tbin", float),
+    ("Any breaks in the data?", "breaks", int),
+    ("Type of observation", "band", str),
+    ("Beam diameter", "fov", float),
+    ("Dispersion measure", "dm", float),
+    ("Central freq of low channel", "low_freq", float),
+    ("Total bandwidth", "bandwidth", float),
+    ("Number of channels", "nchan", int),
+    ("Channel bandwidth", "chan_bw", float),
+    ("Data analyzed by", "analyser", str),
+]
+
+
+def read_inf(filename):
+    """
+    Reads a PRESTO .inf file.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the .inf file
+
+    Returns
+    -------
+    info: dict
+        The values of the lines that write_inf writes (lines it doesn't know are ignored)
+    """
+    info = {}
+    with open(filename, "r") as inf_file:
+        for line in inf_file:
+            if line.strip().startswith("Any additional notes"):
+                break
+            if "  =  " not in line:
+                continue
+            # Some descriptions contain "=" so split on the padded one before the value
+            description, value = line.split("  =  ", 1)
+            description = description.strip()
+            for prefix, key, kind in _INF_KEYS:
+                if description.startswith(prefix):
+                    value = value.strip()
+                    info[key] = kind(float(value)) if kind is int else kind(value)
+                    break
+    return info
+
+
+def read_dat(basename):
+    """
+    Reads a PRESTO time series (.dat file) and its .inf file.
+
+    Parameters
+    ----------
+    basename: str
+        The path of the files without the .dat or .inf
+
+    Returns
+    -------
+    series: numpy.array
+        The float32 time series
+    info: dict
+        The values of the .inf file (see read_inf)
+    """
+    return np.fromfile("{}.dat".format(basename), dtype=np.float32), read_inf("{}.inf".format(basename))
+
+
+def _read_samples(stream, start, nsamp, ds, zerodm):
+    """Reads nsamp downsampled samples from start (see downsample and zero_dm)"""
+    samples = downsample(stream.read(start * ds, nsamp * ds), ds)
+    if zerodm:
+        samples = zero_dm(samples)
+    return samples
+
+
+def _dedisperse_block(fits_files, start, nout, overlap, ds, dms, method, nsub, zerodm, pad_values):
+    """
+    Dedisperses nout (downsampled) samples from start. Samples past the end of the observation
+    are pad_values (like prepsubband's padding).
+    """
+    stream = PsrfitsStream(fits_files)
+    nneed = nout + overlap
+    samples = _read_samples(stream, start, nneed, ds, zerodm)
+    if samples.shape[0] < nneed:
+        padded = np.empty((nneed, len(pad_values)), dtype=np.float32)
+        padded[:samples.shape[0]] = samples
+        padded[samples.shape[0]:] = pad_values
+        samples = padded
+    tbin = stream.tbin * ds
+    if method == "fdmt":
+        series = fdmt(samples, stream.freqs, tbin, dms)
+    else:
+        series = dedisperse_brute(samples, stream.freqs, tbin, dms, nsub=nsub)
+    return series[:, :nout]
+
+
+def dedisperse_files(fits_files, ddplan_line, basename, method="fdmt", numout=None, zerodm=False,
+                     block_size=None, workers=1, dm_precision=2):
+    """
+    Dedisperses a dd_plan line of a PSRFITS observation and writes a PRESTO .dat and .inf file
+    for each DM (named like prepsubband's <basename>_DM<dm>).
+
+    Parameters
+    ----------
+    fits_files: list
+        The PSRFITS files of the observation
+    ddplan_line: list
+        The dd_plan line [low_DM, high_DM, DM_step, nDM_step, timeres, downsample, nsub, ...]
+    basename: str
+        The start of the output file names
+    method: str
+        OPTIONAL - The dedispersion engine, fdmt or brute (which uses the line's subbands). Default: fdmt
+    numout: int
+        OPTIONAL - The number of output samples. The time series are padded with their mean or
+        cut to this length. Default: the number of downsampled samples
+    zerodm: bool
+        OPTIONAL - Remove the zero DM signal (see zero_dm). Default: False
+    block_size: int
+        OPTIONAL - The number of input (not downsampled) samples each worker reads at once, including
+        the dispersion delay past the block. Blocks are at least twice the delay so the largest DMs
+        may need more. Each worker holds about 16 * block_size * nchan bytes (the samples as read, the
+        downsampled and zero DM samples and the FDMT's copies of them) so the memory of a line is
+        about workers times that. Default: DEFAULT_BLOCK_SAMPLES
+    workers: int
+        OPTIONAL - The number of processes dedispersing blocks. Default: 1
+    dm_precision: int
+        OPTIONAL - The number of decimal places of the DMs in the file names. Default: 2
+
+    Returns
+    -------
+    basenames: list
+        The path of each DM's files without the .dat or .inf
+    """
+    if method not in DM_ENGINES:
+        raise ValueError("Unknown dedispersion method {} (use one of {})".format(method, DM_ENGINES))
+    fits_files = [fits_files] if isinstance(fits_files, str) else list(fits_files)
+    stream = PsrfitsStream(fits_files)
+    dms = ddplan_dms(ddplan_line)
+    ds = max(int(ddplan_line[5]), 1)
+    nsub = int(ddplan_line[6])
+    tbin = stream.tbin * ds
+    freqs = stream.freqs
+    nsamp = stream.nsamp // ds
+    overlap = max_delay(freqs, tbin, dms)
+    if block_size is None:
+        block_size = DEFAULT_BLOCK_SAMPLES
+    # The number of output samples of each block so a block reads about block_size input samples
+    nblock = max(block_size // ds - overlap, overlap, 1)
+    blocks = [(start, min(nblock, nsamp - start)) for start in range(0, nsamp, nblock)]
+    # Pad past the end of the observation with the mean of each channel over the last 1024 input
+    # samples (or the delay if that is longer) which is no more than a block reads
+    ntail = min(nsamp, max(overlap, 1024 // ds, 1))
+    pad_values = _read_samples(stream, nsamp - ntail, ntail, ds, zerodm).mean(axis=0)
+    logger.info("Dedispersing {} DMs from {:.2f} to {:.2f} of {} samples in {} blocks with {}".format(
+                len(dms), dms[0], dms[-1], nsamp, len(blocks), method))
+
+    if numout is None:
+        numout = nsamp
+    basenames = ["{}_DM{:.{}f}".format(basename, dm, dm_precision) for dm in dms]
+    sums = np.zeros(len(dms), dtype=np.float64)
+    # A line can have thousands of DMs (more than the open file limit) so the .dat files can't all
+    # be kept open. Blocks are buffered and written to each file in turn, opening each file once
+    # per DAT_BUFFER_BYTES of time series instead of once per block
+    buffered = []
+    written = False
+
+    def write_blocks(series=None, last=False):
+        nonlocal written
+        if series is not None:
+            buffered.append(series)
+            sums[:] += series.sum(axis=1, dtype=np.float64)
+        if not last and sum(block.nbytes for block in buffered) < DAT_BUFFER_BYTES:
+            return
+        means = (sums / nsamp if nsamp else sums).astype(np.float32)
+        for i, (name, mean) in enumerate(zip(basenames, means)):
+            with open("{}.dat".format(name), "ab" if written else "wb") as dat_file:
+                for block in buffered:
+                    block[i].tofile(dat_file)
+                # Pad or cut the time series to numout samples
+                if last and numout > nsamp:
+                    np.full(numout - nsamp, mean, dtype=np.float32).tofile(dat_file)
+                elif last and numout < nsamp:
+                    dat_file.truncate(numout * np.dtype(np.float32).itemsize)
+        buffered[:] = []
+        written = True
+
+    jobs = [(fits_files, start, nout, overlap, ds, dms, method, nsub, zerodm, pad_values) for start, nout in blocks]
+    if workers <= 1 or len(jobs) == 1:
+        for job in jobs:
+            write_blocks(_dedisperse_block(*job))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Submit a few blocks per worker at a time so finished blocks don't pile up in memory
+            window = 2 * workers
+            futures = [executor.submit(_dedisperse_block, *job) for job in jobs[:window]]
+            for i in range(len(jobs)):
+                series = futures[i].result()
+                futures[i] = None
+                if i + window < len(jobs):
+                    futures.append(executor.submit(_dedisperse_block, *jobs[i + window]))
+                write_blocks(series)
+    write_blocks(last=True)
+
+    header = stream.header
+    first = stream.files[0]
+    start_offset = first.nsuboffs * first.nsblk * first.tbin + (header.get("STT_OFFS", 0.) or 0.)
+    chan_bw = abs(float(np.median(np.diff(np.sort(freqs))))) if len(freqs) > 1 else abs(header.get("OBSBW", 0.))
+    for name, dm in zip(basenames, dms):
+        write_inf("{}.inf".format(name), {
+            "basename": os.path.basename(name),
+            "telescope": header.get("TELESCOP", "MWA"),
+            "instrument": header.get("BACKEND", "VCS"),
+            "object": header.get("SRC_NAME", "Unknown"),
+            "ra_str": header.get("RA_STR", "00:00:00.0000"),
+            "dec_str": header.get("DEC_STR", "00:00:00.0000"),
+            "observer": header.get("OBSERVER", "Unknown"),
+            "mjd": header.get("STT_IMJD", 0) + (header.get("STT_SMJD", 0) + start_offset) / 86400.,
+            "nsamp": numout,
+            "tbin": tbin,
+            "dm": dm,
+            "low_freq": float(np.min(freqs)),
+            "bandwidth": chan_bw * len(freqs),
+            "nchan": len(freqs),
+            "chan_bw": chan_bw,
+            "notes": "Dedispersed by mwa_search.dedisperse ({}) from {} input files.".format(method, len(fits_files)),
+        })
+    return basenames
@@ -1,58 +1,103 @@
 import math
+import heapq
 import numpy as np
 from matplotlib import use
 use('Agg')
 import matplotlib.pyplot as plt
 
-def plot_sensitivity(DD_plan_array, time, centrefreq, freqres, bandwidth):
+def sensitivity_curve(plan, periods, widths, centrefreq=150., freqres=0.01, bandwidth=30.72, time=4800.,
+                      subband=False):
+    """
+    Calculates the sensitivity of a dedispersion plan at each DM it searches for pulsars of
+    the given periods and pulse widths.
+
+    Parameters
+    ----------
+    plan: list or numpy.array
+        The dedispersion plan from dd_plan (only the low DM, high DM, DM step and time resolution columns are used)
+    periods: list or numpy.array
+        The pulsar periods in ms
+    widths: list or numpy.array
+        The pulse widths in ms (one for each period)
+    centrefreq: float
+        OPTIONAL - The center frequency of the observation in MHz. Default: 150.
+    freqres: float
+        OPTIONAL - The frequency resolution of the observation in MHz. Default: 0.01
+    bandwidth: float
+        OPTIONAL - The bandwidth of the observation in MHz. Default: 30.72
+    time: float
+        OPTIONAL - The observation time in seconds. Default: 4800.
+    subband: bool
+        OPTIONAL - Include the smearing within the subbands, which prepsubband dedisperses at the
+        centre DM of each plan row (uses the number of DM steps and nsub columns). Default: False
+
+    Returns
+    -------
+    DMs: numpy.array
+        The DMs searched by the plan
+    sensitivity: numpy.array
+        The (period, DM) array of the 10 sigma detection sensitivity in mJy
+        (1000 where the effective width is longer than the period)
+    """
+    plan = np.atleast_2d(np.asarray(plan, dtype=np.float64))
+    # The DMs to search of each row and the row's DM step and time resolution
+    row_DMs = [np.arange(DM_start, D_DM, DM_step) for DM_start, D_DM, DM_step in plan[:, :3]]
+    n_DMs = [len(DMs) for DMs in row_DMs]
+    DMs = np.concatenate(row_DMs)
+    DM_steps = np.repeat(plan[:, 2], n_DMs)
+    timeres = np.repeat(plan[:, 4], n_DMs)
+
+    #Dm smear over a frequency channel
+    dm_smear = DMs * freqres * 8.3 * 10.**6 / centrefreq**3
+    #Dm smear due to maximum incorrect DM
+    dm_step_smear = 8.3 * 10.**6 * DM_steps / 2. * bandwidth / centrefreq**3
+
+    periods = np.asarray(periods, dtype=np.float64)[:, np.newaxis]
+    widths = np.asarray(widths, dtype=np.float64)[:, np.newaxis]
+    if subband:
+        #Dm smear over a subband due to the difference from the row's subband DM
+        subband_DMs = np.repeat(plan[:, 0] + 0.5 * (plan[:, 3] - 1.) * plan[:, 2], n_DMs)
+        nsub = np.repeat(plan[:, 6], n_DMs)
+        subband_smear = np.abs(DMs - subband_DMs) * bandwidth / nsub * 8.3 * 10.**6 / centrefreq**3
+        effective_width = np.sqrt(widths**2 + dm_smear**2 + dm_step_smear**2 + timeres**2 + subband_smear**2)
+    else:
+        effective_width = np.sqrt(widths**2 + dm_smear**2 + dm_step_smear**2 + timeres**2)
+    return DMs, _width_sensitivity(effective_width, periods, widths, time)
+
+
+def _width_sensitivity(effective_width, periods, widths, time):
+    """The 10 sigma detection sensitivity in mJy of pulsars with the (period, DM) effective widths"""
     base_sensitivity = 3 #mJy. This could be done properly but this will for now
     # adjust for time
     base_sensitivity = base_sensitivity * math.sqrt(4800) / math.sqrt(time)
     # adjust for unscattered pulsar
     #base_sensitivity = base_sensitivity / math.sqrt( ( 1. - 0.05) / 0.05 )
 
+    #sensitivity given new effectiv width
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sensitivity = base_sensitivity / np.sqrt((periods - effective_width) / effective_width) *\
+                      np.sqrt((periods - widths) / widths)
+    sensitivity[effective_width >= periods] = 1000.
+    return sensitivity
+
+
+def plot_sensitivity(DD_plan_array, time, centrefreq, freqres, bandwidth):
+    """Plots the sensitivity of a dedispersion plan (see sensitivity_curve) for 1 s to 1 ms pulsars"""
     # period to work with
     periods = np.array([ 1., 0.1, 0.01, 0.001 ])*1000.
     widths = periods*0.05
+    DMs, sensitivity = sensitivity_curve(DD_plan_array, periods, widths, centrefreq=centrefreq,
+                                         freqres=freqres, bandwidth=bandwidth, time=time)
 
-    #fig, ax = plt.subplots(1, 1)
     plt.subplots(1, 1)
-    #ax.set_ylim(0, 100)
-    #plt.ylim(0, 100)
-
-    for period, width in zip(periods, widths):
-        sensitivties = []
-        DMs = []
-        for dm_row in DD_plan_array:
-            DM_start, D_DM, DM_step, _, timeres, _, _ = dm_row
-            for DM in np.arange(DM_start, D_DM, DM_step):
-                # For each DM you're going to search do a sensitivy cal based on how
-                # a pulse will get
-
-                #Dm smear over a frequency channel
-                dm_smear = DM * freqres * 8.3 * 10.**6 / centrefreq**3
-                #Dm smear due to maximum incorrect DM
-                dm_step_smear = 8.3 * 10.**6 * DM_step / 2. * bandwidth / centrefreq**3
-
-                effective_width = math.sqrt(width**2 + dm_smear**2 + dm_step_smear**2 + timeres**2)
-                #print(effective_width)
-                #sensitivity given new effectiv width
-                if effective_width >= period:
-                    sensitivties.append(1000.)
-                else:
-                    sensitivties.append(base_sensitivity /
-                                    math.sqrt( ( period - effective_width) / effective_width ) *
-                                    math.sqrt( ( period - width) / width ))
-                DMs.append(DM)
-        plt.plot(DMs, sensitivties, label="P={0} ms".format(period))
-    #plt.yscale('log')
+    for period, period_sensitivity in zip(periods, sensitivity):
+        plt.plot(DMs, period_sensitivity, label="P={0} ms".format(period))
     plt.legend()
     plt.yscale('log')
     plt.xscale('log')
     plt.ylabel(r"Detection Sensitivity, 10$\sigma$ (mJy)")
     plt.xlabel(r"Dispersion measure (pc cm$^{-3}$ ")
     plt.title("Sensitivy using a minimum DM step size of {0}".format(DD_plan_array[0][2]))
-    #plt.show()
     plt.savefig("DM_step_sens_mDMs_{0}.png".format(DD_plan_array[0][2]))
 
 
@@ -80,6 +125,10 @@ def dd_plan(
         min_DM_step=0.02,
         max_DM_step=500.0,
         max_dms_per_job=5000,
+        as_array=False,
+        dm_step_fact=3.,
+        breakpoint_fact=3.,
+        nsub_fact=1.,
     ):
     """
     Work out the dedisperion plan
@@ -102,21 +151,27 @@ def dd_plan(
         Will overwrite the minimum DM step with this value
     max_dms_per_job: int
         If Nsteps is greater than this value split it into multiple lines
+    as_array: bool
+        OPTIONAL - Return the plan as an (N, 8) numpy array (such as for sensitivity_curve). Default: False
+    dm_step_fact: float
+        OPTIONAL - The number of time samples of smearing a DM step is allowed to cause. Default: 3.
+    breakpoint_fact: float
+        OPTIONAL - The number of time samples of smearing within a frequency channel before
+        downsampling and moving to the next DM step. Default: 3.
+    nsub_fact: float
+        OPTIONAL - The factor the number of subbands from calc_nsub is multiplied by. Default: 1.
 
     Returns
     -------
     DD_plan_array: list list
         dedispersion plan format:
-        [[low_DM, high_DM, DM_step, nDM_step, timeres, downsample, nsub ]]
+        [[low_DM, high_DM, DM_step, nDM_step, timeres, downsample, nsub, total_work_factor ]]
     """
 
     DD_plan_array = []
     freqres = bandwidth / float(nfreqchan)
     previous_DM = lowDM
 
-    #number of time samples smeared over before moving to next D_dm
-    smear_fact = 3.
-
     #Loop until you've made a hit your range max
     D_DM = 0.
     downsample = 1
@@ -129,14 +184,15 @@ def dd_plan(
         total_smear = math.sqrt(timeres**2 + dm_smear**2)
 
 
-        D_DM = smear_fact * timeres * centrefreq**3 /\
+        #number of time samples smeared over before moving to next D_dm
+        D_DM = breakpoint_fact * timeres * centrefreq**3 /\
                (8.3 * 10.**6 * freqres)
 
         #difference in DM that will double the effective width (eq 6.4 of pulsar handbook)
         #TODO make this more robust
         #DM_step = math.sqrt( (2.*timeres)**2 - timeres**2 )/\
         #          (8.3 * 10**6 * bandwidth / centrefreq**3)
-        DM_step = smear_fact * total_smear * centrefreq**3 /\
+        DM_step = dm_step_fact * total_smear * centrefreq**3 /\
                   (8.3 * 10.**6 * 0.5 * bandwidth)
 
 
@@ -158,6 +214,8 @@ def dd_plan(
         total_work_factor = nDM_step / downsample
         if D_DM > lowDM:
             nsub = calc_nsub(centrefreq, D_DM)
+            if nsub_fact != 1.:
+                nsub = int(min(1024, max(1, nsub * nsub_fact)))
             if downsample > 16:
                 DD_plan_array.append([ previous_DM, D_DM, DM_step, nDM_step, timeres, 16, nsub, total_work_factor ])
             else:
@@ -172,11 +230,12 @@ def dd_plan(
     #Check no lines have more Nsteps than max_dms_per_job
     new_DD_plan_array = []
     for dd_line in DD_plan_array:
-        new_dd_lines = []
         dm_min, dm_max, dm_step, ndm, timeres, downsamp, nsub, total_work_factor = dd_line
+        # the work of each DM step of this line
+        step_work_factor = total_work_factor / ndm if ndm else 0.
         while ndm > max_dms_per_job:
             # previous_DM, D_DM, DM_step, nDM_step, timeres, downsample, nsub
-            new_dd_lines.append([
+            new_DD_plan_array.append([
                 dm_min,
                 dm_min + dm_step * max_dms_per_job,
                 dm_step,
@@ -184,20 +243,353 @@ def dd_plan(
                 timeres,
                 downsamp,
                 nsub,
-                total_work_factor
+                step_work_factor * max_dms_per_job
             ])
-            dd_line = [
-                dm_min + dm_step * max_dms_per_job,
-                dm_max,
-                dm_step,
-                ndm - max_dms_per_job,
-                timeres,
-                downsamp,
-                nsub,
-                total_work_factor
-            ]
-        new_dd_lines.append(dd_line)
-        for n_line in new_dd_lines:
-            new_DD_plan_array.append(n_line)
+            # update dd_line for the next part
+            dm_min = dm_min + dm_step * max_dms_per_job
+            ndm -= max_dms_per_job
+            total_work_factor = step_work_factor * ndm
+        new_DD_plan_array.append([dm_min, dm_max, dm_step, ndm, timeres, downsamp, nsub, total_work_factor])
 
+    if as_array:
+        return np.array(new_DD_plan_array, dtype=np.float64).reshape(-1, 8)
     return new_DD_plan_array
+
+
+# The dd_plan factors searched by optimise_plan
+DM_STEP_FACTS = (1., 1.5, 2., 2.5, 3., 4., 5., 6., 8.)
+BREAKPOINT_FACTS = (1., 1.5, 2., 3., 4., 6., 8.)
+NSUB_FACTS = (0.25, 0.5, 1., 2., 4.)
+
+
+def plan_sensitivity_loss(plan, centrefreq, bandwidth, nfreqchan, timeres, periods=None, widths=None, time=4800.,
+                          subband=False):
+    """
+    Calculates the fraction of sensitivity a dedispersion plan loses compared to searching every
+    DM at the full time resolution (so only the unavoidable smearing within the frequency channels).
+
+    Parameters
+    ----------
+    plan: list or numpy.array
+        The dedispersion plan from dd_plan
+    centrefreq: float
+        The center frequency of the observation in MHz
+    bandwidth: float
+        The bandwidth of the observation in MHz
+    nfreqchan: int
+        The number of frequency channels
+    timeres: float
+        The time resolution of the observation in ms
+    periods: list or numpy.array
+        OPTIONAL - The pulsar periods in ms. Default: 1000, 100, 10 and 1 ms
+    widths: list or numpy.array
+        OPTIONAL - The pulse widths in ms (one for each period). Default: 5% of the periods
+    time: float
+        OPTIONAL - The observation time in seconds. Default: 4800.
+    subband: bool
+        OPTIONAL - Include the smearing within prepsubband's subbands (see sensitivity_curve). Default: False
+
+    Returns
+    -------
+    loss: float
+        The largest (of the periods) DM averaged fraction of the sensitivity that is lost
+        (1 - ideal sensitivity / plan sensitivity). DMs that the ideal search can't detect a
+        pulsar of the period at are not included.
+    """
+    if periods is None:
+        periods = np.array([ 1., 0.1, 0.01, 0.001 ])*1000.
+    if widths is None:
+        widths = np.asarray(periods) * 0.05
+    freqres = bandwidth / float(nfreqchan)
+    plan = np.atleast_2d(np.asarray(plan, dtype=np.float64))
+    DMs, sensitivity = sensitivity_curve(plan, periods, widths, centrefreq=centrefreq, freqres=freqres,
+                                         bandwidth=bandwidth, time=time, subband=subband)
+    # Each DM covers a DM step so weight them by it so the average is over the DM range
+    weights = np.repeat(plan[:, 2], [len(np.arange(*row[:3])) for row in plan])
+
+    #Dm smear over a frequency channel is the only smearing of the ideal search
+    dm_smear = DMs * freqres * 8.3 * 10.**6 / centrefreq**3
+    periods = np.asarray(periods, dtype=np.float64)[:, np.newaxis]
+    widths = np.asarray(widths, dtype=np.float64)[:, np.newaxis]
+    ideal = _width_sensitivity(np.sqrt(widths**2 + dm_smear**2 + timeres**2), periods, widths, time)
+
+    loss = 0.
+    for period_ideal, period_sensitivity in zip(ideal, sensitivity):
+        detectable = period_ideal < 1000.
+        if detectable.any():
+            period_loss = 1. - period_ideal[detectable] / period_sensitivity[detectable]
+            loss = max(loss, float(np.average(period_loss, weights=weights[detectable])))
+    return loss
+
+
+def optimise_plan(
+        centrefreq,
+        bandwidth,
+        nfreqchan,
+        timeres,
+        lowDM,
+        highDM,
+        max_loss=0.1,
+        periods=None,
+        widths=None,
+        time=4800.,
+        min_DM_step=0.02,
+        max_DM_step=500.0,
+        max_dms_per_job=5000,
+        dm_step_facts=DM_STEP_FACTS,
+        breakpoint_facts=BREAKPOINT_FACTS,
+        nsub_facts=None,
+        subband=False,
+        line_work=None,
+    ):
+    """
+    Searches the dd_plan DM step, downsample breakpoint and subband factors for the plans with the
+    best trade off of sensitivity (see plan_sensitivity_loss) and compute (the total work).
+
+    Parameters
+    ----------
+    centrefreq: float
+        The center frequency of the observation in MHz
+    bandwidth: float
+        The bandwidth of the observation in MHz
+    nfreqchan: int
+        The number of frequency channels
+    timeres: float
+        The time resolution of the observation in ms
+    lowDM: float
+        The lowest dispersion measure
+    highDM: float
+        The highest dispersion measure
+    max_loss: float
+        OPTIONAL - The largest fraction of sensitivity the recommended plan can lose. Default: 0.1
+    periods: list or numpy.array
+        OPTIONAL - The pulsar periods in ms. Default: 1000, 100, 10 and 1 ms
+    widths: list or numpy.array
+        OPTIONAL - The pulse widths in ms (one for each period). Default: 5% of the periods
+    time: float
+        OPTIONAL - The observation time in seconds. Default: 4800.
+    min_DM_step: float
+        OPTIONAL - The minimum DM step. Default: 0.02
+    max_DM_step: float
+        OPTIONAL - The maximum DM step. Default: 500.0
+    max_dms_per_job: int
+        OPTIONAL - If Nsteps is greater than this value split it into multiple lines. Default: 5000
+    dm_step_facts: list
+        OPTIONAL - The dd_plan dm_step_fact values to search. Default: DM_STEP_FACTS
+    breakpoint_facts: list
+        OPTIONAL - The dd_plan breakpoint_fact values to search. Default: BREAKPOINT_FACTS
+    nsub_facts: list
+        OPTIONAL - The dd_plan nsub_fact values to search. Default: NSUB_FACTS if subband else 1
+    subband: bool
+        OPTIONAL - Include the smearing within prepsubband's subbands in the sensitivity loss.
+        The number of subbands only changes the loss when this is used. Default: False
+    line_work: function
+        OPTIONAL - A function that returns the work of a plan line (such as the line_walltime of a
+        mwa_search.cost_model.CostModel). Default: the plan's work factor
+
+    Returns
+    -------
+    frontier: list
+        The Pareto optimal plans from the least to the most work. Each is a dict of the
+        dm_step_fact, breakpoint_fact, nsub_fact, loss, work, ndm (total DM steps) and plan.
+    recommended: dict
+        The plan of the frontier with the least work that loses less than max_loss
+        (or the plan with the least loss if none do)
+    """
+    if nsub_facts is None:
+        nsub_facts = NSUB_FACTS if subband else (1.,)
+    candidates = []
+    for dm_step_fact in dm_step_facts:
+        for breakpoint_fact in breakpoint_facts:
+            for nsub_fact in nsub_facts:
+                plan = dd_plan(centrefreq, bandwidth, nfreqchan, timeres, lowDM, highDM,
+                               min_DM_step=min_DM_step, max_DM_step=max_DM_step,
+                               max_dms_per_job=max_dms_per_job, dm_step_fact=dm_step_fact,
+                               breakpoint_fact=breakpoint_fact, nsub_fact=nsub_fact)
+                if not plan:
+                    continue
+                candidates.append({
+                    "dm_step_fact": dm_step_fact,
+                    "breakpoint_fact": breakpoint_fact,
+                    "nsub_fact": nsub_fact,
+                    "loss": plan_sensitivity_loss(plan, centrefreq, bandwidth, nfreqchan, timeres,
+                                                  periods=periods, widths=widths, time=time, subband=subband),
+                    "work": sum(dd_line[7] if line_work is None else line_work(dd_line) for dd_line in plan),
+                    "ndm": sum(dd_line[3] for dd_line in plan),
+                    "plan": plan,
+                })
+    if not candidates:
+        raise ValueError("No dedispersion plans found from DM {} to {}".format(lowDM, highDM))
+
+    # Keep the plans that lose less sensitivity than all the plans with less work
+    frontier = []
+    for candidate in sorted(candidates, key=lambda candidate: (candidate["work"], candidate["loss"])):
+        if not frontier or candidate["loss"] < frontier[-1]["loss"]:
+            frontier.append(candidate)
+    recommended = next((candidate for candidate in frontier if candidate["loss"] <= max_loss), frontier[-1])
+    return frontier, recommended
+
+
+def _split_plan(plan, max_work, min_dms=1, line_work=None):
+    """
+    Splits the lines of a dedispersion plan into pieces of at most max_work (as evenly as possible)
+    without making pieces of fewer than min_dms DM steps.
+    Returns the (line index, DM step offset, number of DM steps, work) of each piece.
+    """
+    pieces = []
+    for li, dd_line in enumerate(plan):
+        ndm = int(dd_line[3])
+        work = dd_line[7] if line_work is None else line_work(dd_line)
+        if ndm <= 0:
+            # Nothing to search
+            continue
+        npieces = max(1, int(math.ceil(work / max_work - 1e-9)))
+        npieces = min(npieces, max(1, ndm // max(1, min_dms)))
+        offset = 0
+        for pi in range(npieces):
+            piece_ndm = ndm // npieces + (1 if pi < ndm % npieces else 0)
+            if npieces == 1:
+                piece_work = work
+            elif line_work is None:
+                piece_work = work / ndm * piece_ndm
+            else:
+                # Work functions can have a per line overhead so use the work of the piece itself
+                piece_work = line_work(list(dd_line[:3]) + [piece_ndm] + list(dd_line[4:]))
+            pieces.append((li, offset, piece_ndm, piece_work))
+            offset += piece_ndm
+    return pieces
+
+
+def _pack_lpt(works, njobs):
+    """
+    Longest processing time packing: assigns each piece, from the largest to the smallest,
+    to the least loaded of njobs jobs. Returns the job of each piece and the largest load.
+    """
+    loads = [(0., ji) for ji in range(njobs)]
+    assignment = [None] * len(works)
+    for i in sorted(range(len(works)), key=lambda i: -works[i]):
+        load, ji = heapq.heappop(loads)
+        assignment[i] = ji
+        heapq.heappush(loads, (load + works[i], ji))
+    return assignment, max(load for load, _ in loads)
+
+
+def _pack_ffd(works, max_work):
+    """First fit decreasing packing: each piece, from the largest to the smallest, goes in the first job it fits in"""
+    loads = []
+    assignment = [None] * len(works)
+    for i in sorted(range(len(works)), key=lambda i: -works[i]):
+        for ji, load in enumerate(loads):
+            if load + works[i] <= max_work * (1 + 1e-9):
+                loads[ji] += works[i]
+                assignment[i] = ji
+                break
+        else:
+            loads.append(works[i])
+            assignment[i] = len(loads) - 1
+    return assignment
+
+
+def pack_plan(plan, max_work, strategy="lpt", min_dms=1, line_work=None):
+    """
+    Packs the lines of a dedispersion plan into jobs of at most max_work total work.
+
+    Lines with more work than max_work are split into even pieces (never of fewer than
+    min_dms DM steps), then the pieces are bin packed to minimise the number of jobs and
+    the largest job (the makespan). The pieces are halved until they fit in the fewest jobs the
+    total work allows (or can't be split further). Pieces of the same line that end up in the
+    same job are merged.
+
+    Parameters
+    ----------
+    plan: list
+        The dedispersion plan from dd_plan
+    max_work: float
+        The maximum total work function of a job
+    strategy: str
+        OPTIONAL - 'lpt' (longest processing time, which balances the jobs) or 'ffd' (first fit
+        decreasing, which fills each job before starting the next). Default: 'lpt'
+    min_dms: int
+        OPTIONAL - The minimum number of DM steps of a split line. Default: 1
+    line_work: function
+        OPTIONAL - A function that returns the work of a plan line (such as the line_walltime of a
+        mwa_search.cost_model.CostModel). Default: the plan's work factor
+
+    Returns
+    -------
+    jobs: list
+        The plan lines of each job (in the dd_plan format with the work of each piece),
+        ordered by their lowest DM
+    """
+    if strategy not in ("lpt", "ffd"):
+        raise ValueError("Unknown packing strategy: {}. Use 'lpt' or 'ffd'".format(strategy))
+    pieces = _split_plan(plan, max_work, min_dms=min_dms, line_work=line_work)
+    if not pieces:
+        return []
+    total_work = sum(piece[3] for piece in pieces)
+    min_njobs = max(1, int(math.ceil(total_work / max_work - 1e-9)))
+    if strategy == "lpt":
+        # Start from the fewest possible jobs and split the lines into pieces of the even job load
+        # (or finer) until the pieces can be packed into that many jobs without going over max_work.
+        # LPT's largest job is at most the even load plus the largest piece so halving the pieces
+        # always succeeds unless they can't be split any further.
+        njobs = min_njobs
+        while True:
+            piece_work = total_work / njobs
+            npieces = 0
+            while True:
+                pieces = _split_plan(plan, piece_work, min_dms=min_dms, line_work=line_work)
+                works = [piece[3] for piece in pieces]
+                assignment, makespan = _pack_lpt(works, njobs)
+                # A single piece can be larger than max_work if it couldn't be split further
+                if makespan <= max(max_work, max(works)) * (1 + 1e-9) or len(pieces) == npieces:
+                    break
+                npieces = len(pieces)
+                piece_work /= 2.
+            if makespan <= max(max_work, max(works)) * (1 + 1e-9):
+                break
+            njobs += 1
+    else:
+        # Split the lines finer until first fit decreasing fills the fewest possible jobs
+        piece_work = max_work
+        npieces = 0
+        best = None
+        while len(pieces) != npieces:
+            assignment = _pack_ffd([piece[3] for piece in pieces], max_work)
+            njobs = max(assignment) + 1
+            if best is None or njobs < best[0]:
+                best = (njobs, pieces, assignment)
+            if njobs <= min_njobs:
+                break
+            npieces = len(pieces)
+            piece_work /= 2.
+            pieces = _split_plan(plan, piece_work, min_dms=min_dms, line_work=line_work)
+        njobs, pieces, assignment = best
+
+    job_pieces = {}
+    for piece, ji in zip(pieces, assignment):
+        job_pieces.setdefault(ji, []).append(piece)
+    jobs = []
+    for ji in sorted(job_pieces):
+        # Merge the neighbouring pieces of the same line
+        merged = []
+        for li, offset, ndm, work in sorted(job_pieces[ji]):
+            if merged and merged[-1][0] == li and merged[-1][1] + merged[-1][2] == offset:
+                merged[-1] = (li, merged[-1][1], merged[-1][2] + ndm, merged[-1][3] + work)
+            else:
+                merged.append((li, offset, ndm, work))
+        job = []
+        for li, offset, ndm, work in merged:
+            dm_min, dm_max, dm_step, line_ndm, timeres, downsamp, nsub, total_work_factor = plan[li]
+            if offset == 0 and ndm == line_ndm:
+                job.append(list(plan[li]) if line_work is None else list(plan[li][:7]) + [work])
+                continue
+            low_dm = dm_min + dm_step * offset
+            high_dm = dm_max if offset + ndm == line_ndm else low_dm + dm_step * ndm
+            job_line = [low_dm, high_dm, dm_step, ndm, timeres, downsamp, nsub, work]
+            if line_work is not None:
+                job_line[7] = line_work(job_line)
+            job.append(job_line)
+        jobs.append(job)
+    jobs.sort(key=lambda job: job[0][0])
+    return jobs
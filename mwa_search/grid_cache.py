@@ -0,0 +1,310 @@
+"""
+A content-addressed on-disk cache of computed grids.
+
+Each entry is a directory named after the hash of the parameters used to make the grid
+and contains the arrays as .npy files (so they can be memory mapped) and an info.json.
+The cache is kept under a maximum size by removing the least recently used entries.
+"""
+import os
+import json
+import shutil
+import struct
+import hashlib
+import tempfile
+import numpy as np
+
+from mwa_search.data_load import GRID_CACHE_DIR
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Increase this if the way the grids are calculated changes so old entries are not used
+CACHE_VERSION = 1
+INFO_FILE = "info.json"
+# The bytes kept for an NpyWriter's .npy header (magic string, length and the padded header dict)
+# so the final shape can be written over it once all the rows are appended
+NPY_HEADER_BYTES = 128
+
+
+def grid_cache_key(**params):
+    """
+    Makes the cache key of a grid from the parameters used to make it.
+
+    Parameters
+    ----------
+    **params:
+        The parameters that affect the grid (such as obsid, begin, end, grid type,
+        separation, loop and FWHM). They must be JSON serialisable.
+
+    Returns
+    -------
+    key: str
+        The SHA-256 hash of the canonical JSON of the parameters
+    """
+    params = dict(params, cache_version=CACHE_VERSION)
+    # repr of floats round trips exactly so equal parameters always give the same key
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"),
+                           default=lambda x: repr(x) if isinstance(x, np.generic) else str(x))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class NpyWriter:
+    """
+    Writes an .npy file a block of rows at a time so an array too large to hold in memory can be
+    saved (and memory mapped later) without knowing its length up front. The header is rewritten
+    with the number of rows appended when the writer is closed.
+
+    Parameters
+    ----------
+    file_name: str
+        The .npy file to write
+    row_shape: tuple
+        OPTIONAL - The shape of each row, e.g. (2,) for RAs and Decs. Default: ()
+    dtype: numpy.dtype
+        OPTIONAL - The data type of the array. Default: numpy.float64
+    """
+    def __init__(self, file_name, row_shape=(), dtype=np.float64):
+        self.file_name = file_name
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.nrows = 0
+        self._file = open(file_name, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        header = repr({"descr": np.lib.format.dtype_to_descr(self.dtype),
+                       "fortran_order": False,
+                       "shape": (self.nrows,) + self.row_shape})
+        magic = np.lib.format.magic(1, 0)
+        header_len = NPY_HEADER_BYTES - len(magic) - 2
+        self._file.seek(0)
+        self._file.write(magic + struct.pack("<H", header_len) + header.ljust(header_len - 1).encode("latin1") + b"\n")
+        self._file.seek(0, os.SEEK_END)
+
+    def append(self, rows):
+        """Appends an array of rows (of row_shape) to the file"""
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        self._file.write(rows.tobytes())
+        self.nrows += len(rows)
+
+    def close(self):
+        """Writes the final shape into the header and closes the file"""
+        if not self._file.closed:
+            self._write_header()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GridCache:
+    """
+    A size-bounded least recently used cache of numpy arrays on disk.
+
+    Parameters
+    ----------
+    cache_dir: str
+        OPTIONAL - The directory of the cache. Default: mwa_search.data_load.GRID_CACHE_DIR
+    max_bytes: int
+        OPTIONAL - The maximum total size of the cache in bytes. Default: 2 GB
+    """
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir or GRID_CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, mmap_mode="r"):
+        """
+        Gets the arrays of a cache entry.
+
+        Parameters
+        ----------
+        key: str
+            The cache key from grid_cache_key
+        mmap_mode: str
+            OPTIONAL - The numpy.load mmap_mode of the arrays. Default: 'r'
+
+        Returns
+        -------
+        arrays: dict or None
+            The arrays of the entry by name (memory mapped) or None if the key is not cached
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, INFO_FILE)) as info_file:
+                info = json.load(info_file)
+            arrays = {name: np.load(os.path.join(entry_dir, "{}.npy".format(name)), mmap_mode=mmap_mode)
+                      for name in info["arrays"]}
+        except (OSError, ValueError, KeyError):
+            # Missing or partly removed entries are a miss
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        logger.debug("Grid cache hit {}".format(key))
+        return arrays
+
+    def put(self, key, arrays, params=None):
+        """
+        Stores arrays in the cache then removes the least recently used entries until
+        the cache is smaller than max_bytes.
+
+        Parameters
+        ----------
+        key: str
+            The cache key from grid_cache_key
+        arrays: dict
+            The numpy arrays to store by name
+        params: dict
+            OPTIONAL - The parameters used to make the key, recorded in the entry's info.json
+        """
+        tmp_dir = self._make_tmp_dir(key)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, "{}.npy".format(name)), np.asarray(array))
+        except OSError as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.warning("Unable to write the grid cache entry {}: {}".format(key, e))
+            return
+        self._commit(tmp_dir, key, list(arrays.keys()), params)
+
+    def put_blocks(self, key, name, blocks, row_shape=(), params=None):
+        """
+        Stores an array in the cache a block at a time as the blocks are generated, so the whole
+        array is never held in memory. The entry is only added once the last block is written.
+
+        Parameters
+        ----------
+        key: str
+            The cache key from grid_cache_key
+        name: str
+            The name of the array
+        blocks: iterable
+            The numpy arrays of rows (of row_shape) to store
+        row_shape: tuple
+            OPTIONAL - The shape of each row, e.g. (2,) for pointings. Default: ()
+        params: dict
+            OPTIONAL - The parameters used to make the key, recorded in the entry's info.json
+
+        Yields
+        ------
+        block: numpy.array
+            Each input block once it is written
+        """
+        tmp_dir = self._make_tmp_dir(key)
+        writer = NpyWriter(os.path.join(tmp_dir, "{}.npy".format(name)), row_shape=row_shape)
+        try:
+            for block in blocks:
+                if writer is not None:
+                    try:
+                        writer.append(block)
+                    except OSError as e:
+                        # Carry on passing the blocks through without caching them
+                        logger.warning("Unable to write the grid cache entry {}: {}".format(key, e))
+                        writer.close()
+                        writer = None
+                yield block
+            if writer is not None:
+                writer.close()
+                self._commit(tmp_dir, key, [name], params)
+        finally:
+            # Only left if the blocks couldn't be written or weren't all generated
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _make_tmp_dir(self, key):
+        # Entries are written to a temporary directory then moved into place so they are never half written
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix=".{}.".format(key), dir=self.cache_dir)
+
+    def _commit(self, tmp_dir, key, names, params):
+        """Moves a written temporary entry directory into place then evicts the least recently used entries"""
+        try:
+            with open(os.path.join(tmp_dir, INFO_FILE), "w") as info_file:
+                json.dump({"arrays": names, "params": params or {}},
+                          info_file, indent=4, default=str)
+            entry_dir = self._entry_dir(key)
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.warning("Unable to write the grid cache entry {}: {}".format(key, e))
+            return
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        Lists the cache entries.
+
+        Returns
+        -------
+        entries: list
+            (last_used, size_in_bytes, key) of each entry from the least to the most recently used
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            if key.startswith(".") or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+                entries.append((os.path.getmtime(entry_dir), size, key))
+            except OSError:
+                continue
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache is smaller than max_bytes.
+
+        Parameters
+        ----------
+        keep: str
+            OPTIONAL - A key to never remove (such as the entry that was just added). Default: None
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            logger.debug("Removing grid cache entry {}".format(key))
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Removes all the cache entries"""
+        for _, _, key in self.entries():
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+
+def iter_cached_blocks(pointings, block_size=1000):
+    """
+    Yields a cached (N, 2) pointing array in blocks so they can be streamed like iter_grid.
+
+    Parameters
+    ----------
+    pointings: numpy.array
+        The (memory mapped) (N, 2) array of RAs and Decs in degrees
+    block_size: int
+        OPTIONAL - The number of pointings in each block. Default: 1000
+
+    Yields
+    ------
+    pointings: numpy.array
+        (block_size, 2) arrays of RAs and Decs in degrees
+    """
+    for start in range(0, len(pointings), block_size):
+        yield np.array(pointings[start:start + block_size])
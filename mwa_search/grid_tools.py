@@ -52,6 +52,293 @@ def down_right(ra_in, dec_in, fwhm):
 
 # ------------------------------------------------
 
+# vectorised grid movements all in rad -----------
+# Each direction is a (ra_sign, dec_sign) pair so a whole ring can be moved at once
+LEFT       = (-1,  0)
+RIGHT      = ( 1,  0)
+UP         = ( 0,  1)
+DOWN       = ( 0, -1)
+UP_LEFT    = (-1,  1)
+UP_RIGHT   = ( 1,  1)
+DOWN_LEFT  = (-1, -1)
+DOWN_RIGHT = ( 1, -1)
+
+# The direction each corner of the shape moves in
+HEX_CORNER_MOVES    = [LEFT, UP_LEFT, UP_RIGHT, RIGHT, DOWN_RIGHT, DOWN_LEFT]
+CROSS_CORNER_MOVES  = [LEFT, UP, RIGHT, DOWN]
+
+
+def grid_move(ra_in, dec_in, fwhm, ra_sign, dec_sign):
+    """
+    Array version of the grid movement functions (left, up_left etc.).
+    Uses the same floating point operations so the results are identical.
+
+    Parameters
+    ----------
+    ra_in, dec_in: array_like
+        Right Acension and Declination in radians
+    fwhm: float
+        The seperation between grid pointings in radians
+    ra_sign, dec_sign: array_like
+        The direction of the movement for each pointing as -1, 0 or 1.
+        If both are non-zero the movement is a diagonal hexagonal step.
+
+    Returns
+    -------
+    ra_out, dec_out: numpy.array
+        Right Acension and Declination in radians
+    """
+    ra_in = np.asarray(ra_in, dtype=np.float64)
+    dec_in = np.asarray(dec_in, dtype=np.float64)
+    ra_sign = np.asarray(ra_sign)
+    dec_sign = np.asarray(dec_sign)
+    diagonal = (ra_sign != 0) & (dec_sign != 0)
+
+    half_fwhm_approx = fwhm/2.
+    diag_dec_step = sin(np.radians(60.))*sin(half_fwhm_approx) / sin(np.radians(30.))
+    dec_step = np.where(diagonal, diag_dec_step, fwhm)
+    # float_power uses the same pow as the scalar functions where ** would square
+    # the array, which can differ in the last bit
+    dec_out = dec_in + dec_sign * dec_step / np.float_power(np.cos(dec_in + np.radians(26.7)), 2)
+
+    ra_step = np.where(diagonal, fwhm/2., fwhm)
+    ra_out = ra_in + ra_sign * ra_step / np.cos(np.where(diagonal, dec_out, dec_in))
+    return ra_out, dec_out
+
+
+def _corner_signs(corner_moves, corner_index):
+    """Converts an array of corner indices into the ra and dec signs of that corner's movement"""
+    moves = np.array(corner_moves)
+    return moves[corner_index, 0], moves[corner_index, 1]
+
+
+def hex_ring_sources(ring):
+    """
+    Calculates, in closed form, where each pointing of a hexagonal ring is moved from.
+
+    Pointing n (0 <= n < ring) of corner c of a ring is reached from the centre by moving
+    n steps in the direction of corner c+1 then ring-n steps in the direction of corner c
+    (axial hex coordinates). So each pointing is one corner c step from either the same
+    corner and number of the previous ring or, for the last pointing of the corner, the
+    first pointing of the next corner of the previous ring.
+
+    Parameters
+    ----------
+    ring: int
+        The ring number (loop + 1) which must be greater than 0
+
+    Returns
+    -------
+    corner: numpy.array
+        The corner of each pointing in the ring
+    number: numpy.array
+        The number from the corner of each pointing in the ring
+    source: numpy.array
+        The index of the previous ring's pointing each pointing is moved from
+    """
+    corner, number = np.divmod(np.arange(6 * ring), ring)
+    if ring == 1:
+        # First loop so all move from the centre
+        return corner, number, np.zeros(6, dtype=int)
+    prev_ring = ring - 1
+    source = np.where(number < prev_ring,
+                      corner * prev_ring + number,
+                      (corner + 1) % 6 * prev_ring)
+    return corner, number, source
+
+
+def hex_grid_rings(ra0, dec0, centre_fwhm, loop):
+    """
+    Generates a hexagonal grid one ring at a time, moving the whole ring at once.
+    Only the previous ring is kept in memory.
+
+    Parameters
+    ----------
+    ra0, dec0: float or array_like
+        Right Acension and Declination of the centre pointing in radians.
+        If arrays of S centres are given a grid is made around each centre at once.
+    centre_fwhm: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+
+    Yields
+    ------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians of each ring, starting with the centre.
+        If arrays of centres were given these have a shape of (S, 6*ring).
+    """
+    ra = np.asarray(ra0, dtype=np.float64)[..., np.newaxis]
+    dec = np.asarray(dec0, dtype=np.float64)[..., np.newaxis]
+    yield ra, dec
+    for ring in range(1, loop + 1):
+        corner, _, source = hex_ring_sources(ring)
+        ra_sign, dec_sign = _corner_signs(HEX_CORNER_MOVES, corner)
+        ra, dec = grid_move(ra[..., source], dec[..., source], centre_fwhm, ra_sign, dec_sign)
+        yield ra, dec
+
+
+def cross_grid_rings(ra0, dec0, centre_fwhm, loop):
+    """
+    Generates a cross grid one loop at a time, moving all four arms at once.
+
+    Parameters
+    ----------
+    ra0, dec0: float or array_like
+        Right Acension and Declination of the centre pointing in radians.
+        If arrays of S centres are given a grid is made around each centre at once.
+    centre_fwhm: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+
+    Yields
+    ------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians of each loop, starting with the centre.
+        If arrays of centres were given these have a shape of (S, 4).
+    """
+    ra_sign, dec_sign = _corner_signs(CROSS_CORNER_MOVES, np.arange(4))
+    ra = np.asarray(ra0, dtype=np.float64)[..., np.newaxis]
+    dec = np.asarray(dec0, dtype=np.float64)[..., np.newaxis]
+    yield ra, dec
+    ra = np.repeat(ra, 4, axis=-1)
+    dec = np.repeat(dec, 4, axis=-1)
+    for _ in range(loop):
+        ra, dec = grid_move(ra, dec, centre_fwhm, ra_sign, dec_sign)
+        yield ra, dec
+
+
+def square_grid_rings(ra0, dec0, centre_fwhm, loop):
+    """
+    Generates a square grid one ring at a time.
+
+    Each corner's edge is a chain of movements from the corner's first pointing.
+    The left and right edges keep a constant declination so they are accumulated as arrays.
+    The up and down edges are a recurrence in declination that can't be vectorised
+    without changing the pointings so they are walked with the scalar movement functions.
+
+    Parameters
+    ----------
+    ra0, dec0: float
+        Right Acension and Declination of the centre pointing in radians
+    centre_fwhm: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+
+    Yields
+    ------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians of each ring, starting with the centre
+    """
+    corner_moves = [left, up, right, down]
+    vertical_edge_moves = {0: up, 2: down}
+    yield np.array([ra0], dtype=np.float64), np.array([dec0], dtype=np.float64)
+    # The last pointing of each corner of the previous loop
+    last_pointings = [[ra0, dec0]] * 4
+    for l in range(loop):
+        nedge = (l + 1) * 2
+        ring_ras = []
+        ring_decs = []
+        for c in range(4):
+            # grab from the last pointing of the previous corner
+            ra, dec = corner_moves[c](*last_pointings[(c + 3) % 4], centre_fwhm)
+            if c in vertical_edge_moves:
+                corner_ra = np.full(nedge, ra, dtype=np.float64)
+                corner_dec = np.empty(nedge)
+                corner_dec[0] = dec
+                for n in range(1, nedge):
+                    ra, dec = vertical_edge_moves[c](ra, dec, centre_fwhm)
+                    corner_dec[n] = dec
+            else:
+                # the same step each time as the declination doesn't change
+                ra_step = centre_fwhm/cos(dec)
+                if c == 3:
+                    ra_step = -ra_step
+                corner_ra = np.full(nedge, ra_step)
+                corner_ra[0] = ra
+                corner_ra = np.add.accumulate(corner_ra)
+                corner_dec = np.full(nedge, dec, dtype=np.float64)
+            ring_ras.append(corner_ra)
+            ring_decs.append(corner_dec)
+        last_pointings = [[r[-1], d[-1]] for r, d in zip(ring_ras, ring_decs)]
+        yield np.concatenate(ring_ras), np.concatenate(ring_decs)
+
+
+def _concatenate_rings(rings):
+    """Joins the output of one of the *_grid_rings generators into single ra and dec arrays"""
+    ras, decs = zip(*rings)
+    return np.concatenate(ras, axis=-1), np.concatenate(decs, axis=-1)
+
+
+def hex_grid_array(ra0, dec0, centre_fwhm, loop):
+    """
+    A vectorised version of hex_grid that moves a whole ring at once.
+
+    Parameters
+    ----------
+    ra0, dec0: float or array_like
+        Right Acension and Declination of the centre pointing in radians.
+        If arrays of S centres are given a grid is made around each centre at once.
+    centre_fwhm: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+
+    Returns
+    -------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians in the same order as the flattened hex_grid output.
+        If arrays of centres were given these have a shape of (S, N).
+    """
+    return _concatenate_rings(hex_grid_rings(ra0, dec0, centre_fwhm, loop))
+
+
+def cross_grid_array(ra0, dec0, centre_fwhm, loop):
+    """
+    A vectorised version of cross_grid that moves all four arms at once.
+
+    Parameters
+    ----------
+    ra0, dec0: float or array_like
+        Right Acension and Declination of the centre pointing in radians.
+        If arrays of S centres are given a grid is made around each centre at once.
+    centre_fwhm: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+
+    Returns
+    -------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians in the same order as the flattened cross_grid output.
+        If arrays of centres were given these have a shape of (S, N).
+    """
+    return _concatenate_rings(cross_grid_rings(ra0, dec0, centre_fwhm, loop))
+
+
+def square_grid_array(ra0, dec0, centre_fwhm, loop):
+    """
+    A vectorised version of square_grid. See square_grid_rings.
+
+    Parameters
+    ----------
+    ra0, dec0: float
+        Right Acension and Declination of the centre pointing in radians
+    centre_fwhm: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+
+    Returns
+    -------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians in the same order as the flattened square_grid output
+    """
+    return _concatenate_rings(square_grid_rings(ra0, dec0, centre_fwhm, loop))
+
+
 def cross_grid(ra0,dec0,centre_fwhm, loop):
     #start location list [loop number][shape corner (6 for hexagon 4 for square)][number from corner]
     #each item has [ra,dec,fwhm] in radians
@@ -219,44 +506,324 @@ def square_grid(ra0,dec0,centre_fwhm, loop):
     return pointing_list
 
 
-def get_grid(ra, dec, grid_sep, loop, grid_type='hex', verbose=True):
+def flatten_pointing_list(pointing_list):
+    """
+    Flattens the [loop][corner][number] pointing lists from hex_grid, cross_grid and square_grid
+
+    Returns
+    -------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians
+    """
+    flat = np.array([num[:2] for loop in pointing_list for corner in loop for num in corner],
+                    dtype=np.float64)
+    return flat[:, 0], flat[:, 1]
+
+
+def get_grid(ra, dec, grid_sep, loop, grid_type='hex', verbose=True, engine='numpy'):
     """
     ra: Right Acension in radians
     dec: Declination in radians
     grid_sep: seperation between grid pointings in radians
     loop: number of pointing loops
     grid_type: Possible grid types from ['hex', 'cross', 'squaire']
+    engine: 'numpy' to calculate whole loops at once or 'python' to walk the grid point by point.
+            Both give identical pointings.
 
-    return [rads, decds]
-    RAs and Decs in degrees
+    return pointings
+    An (N, 2) float64 array of the RAs (pointings[:, 0]) and Decs (pointings[:, 1]) in degrees
     """
     #calc grid positions
     if verbose:
         print("Calculating the tile positions")
+    if engine == 'numpy':
+        grid_funcs = {'hex':    hex_grid_array,
+                      'cross':  cross_grid_array,
+                      'square': square_grid_array}
+    elif engine == 'python':
+        grid_funcs = {'hex':    hex_grid,
+                      'cross':  cross_grid,
+                      'square': square_grid}
+    else:
+        print("Unrecognised grid engine. Exiting.")
+        quit()
+    if grid_type not in grid_funcs:
+        print("Unrecognised grid type. Exiting.")
+        quit()
+
+    if engine == 'numpy':
+        ras, decs = grid_funcs[grid_type](ra, dec, grid_sep, loop)
+    else:
+        ras, decs = flatten_pointing_list(grid_funcs[grid_type](ra, dec, grid_sep, loop))
+
+    if verbose:
+        print("Converting ra dec to degrees")
+    pointings = np.degrees(np.column_stack((ras, decs)))
+    # Only include ra and dec within the real decs
+    valid = (pointings[:, 1] < 90.) & (pointings[:, 1] > -90.)
+    return pointings[valid]
+
+
+def get_grids(ras, decs, grid_sep, loop, grid_type='hex', verbose=False):
+    """
+    Makes a grid around each of several centres at once.
+    Equivalent to calling get_grid for each centre and concatenating the results.
+
+    Parameters
+    ----------
+    ras, decs: array_like
+        Right Acensions and Declinations of the S grid centres in radians
+    grid_sep: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+    grid_type: str
+        Possible grid types from ['hex', 'cross', 'square']. Default: 'hex'
+
+    Returns
+    -------
+    pointings: numpy.array
+        An (M, 2) float64 array of the RAs and Decs in degrees of all the grids
+    source_index: numpy.array
+        An (M,) array of the index of the centre each pointing was gridded around
+    """
+    ras = np.atleast_1d(np.asarray(ras, dtype=np.float64))
+    decs = np.atleast_1d(np.asarray(decs, dtype=np.float64))
+    if len(ras) == 0:
+        return np.empty((0, 2)), np.empty(0, dtype=int)
+    if verbose:
+        print("Calculating the tile positions for {} grids".format(len(ras)))
     if grid_type == 'hex':
-        pointing_list = hex_grid(   ra, dec, grid_sep, loop)
+        grid_ras, grid_decs = hex_grid_array(  ras, decs, grid_sep, loop)
     elif grid_type == 'cross':
-        pointing_list = cross_grid( ra, dec, grid_sep, loop)
+        grid_ras, grid_decs = cross_grid_array(ras, decs, grid_sep, loop)
     elif grid_type == 'square':
-        pointing_list = square_grid(ra, dec, grid_sep, loop)
+        # The square edges are walked so make each grid in turn
+        square_grids = [square_grid_array(ra, dec, grid_sep, loop) for ra, dec in zip(ras, decs)]
+        grid_ras  = np.array([g[0] for g in square_grids]).reshape(len(ras), -1)
+        grid_decs = np.array([g[1] for g in square_grids]).reshape(len(ras), -1)
     else:
         print("Unrecognised grid type. Exiting.")
         quit()
-    #TODO add square
 
-    rads = []; decds = []
+    source_index = np.repeat(np.arange(len(ras)), grid_ras.shape[1])
+    pointings = np.degrees(np.column_stack((grid_ras.ravel(), grid_decs.ravel())))
+    # Only include ra and dec within the real decs
+    valid = (pointings[:, 1] < 90.) & (pointings[:, 1] > -90.)
+    return pointings[valid], source_index[valid]
 
-    if verbose:
-        print("Converting ra dec to degrees")
-    for loop in pointing_list:
-        for corner in loop:
-            for num in corner:
-                #format grid pointings
-                rad = np.degrees(num[0])
-                decd = np.degrees(num[1])
-
-                if (decd < 90.) and (decd > -90.):
-                    # Only include ra and dec within the real decs
-                    rads.append(rad)
-                    decds.append(decd)
-    return rads, decds
+
+def iter_grid(ra, dec, grid_sep, loop, grid_type='hex', block_size=1000):
+    """
+    Generates the same pointings as get_grid in blocks of whole rings (ring order)
+    so that a large grid never has to be held in memory.
+
+    Parameters
+    ----------
+    ra, dec: float
+        Right Acension and Declination of the grid centre in radians
+    grid_sep: float
+        The seperation between grid pointings in radians
+    loop: int
+        The number of pointing loops
+    grid_type: str
+        Possible grid types from ['hex', 'cross', 'square']. Default: 'hex'
+    block_size: int
+        The minimum number of pointings (before the declination cut) to collect before yielding a block.
+        The last block may be smaller. Default: 1000
+
+    Yields
+    ------
+    pointings: numpy.array
+        An (N, 2) float64 array of the RAs and Decs in degrees
+    """
+    if grid_type == 'hex':
+        rings = hex_grid_rings(   ra, dec, grid_sep, loop)
+    elif grid_type == 'cross':
+        rings = cross_grid_rings( ra, dec, grid_sep, loop)
+    elif grid_type == 'square':
+        rings = square_grid_rings(ra, dec, grid_sep, loop)
+    else:
+        print("Unrecognised grid type. Exiting.")
+        quit()
+
+    return _ring_blocks(rings, block_size)
+
+
+def _ring_blocks(rings, block_size):
+    """
+    Collects the rings of one of the *_grid_rings generators into blocks of at least block_size
+    pointings and yields them as (N, 2) arrays in degrees without the invalid declinations
+    """
+    block_ras = []
+    block_decs = []
+    nblock = 0
+    for ring_ras, ring_decs in rings:
+        block_ras.append(ring_ras)
+        block_decs.append(ring_decs)
+        nblock += len(ring_ras)
+        if nblock >= block_size:
+            pointings = np.degrees(np.column_stack((np.concatenate(block_ras), np.concatenate(block_decs))))
+            # Only include ra and dec within the real decs
+            yield pointings[(pointings[:, 1] < 90.) & (pointings[:, 1] > -90.)]
+            block_ras = []
+            block_decs = []
+            nblock = 0
+    if nblock > 0:
+        pointings = np.degrees(np.column_stack((np.concatenate(block_ras), np.concatenate(block_decs))))
+        yield pointings[(pointings[:, 1] < 90.) & (pointings[:, 1] > -90.)]
+
+
+def _valid_ring_pointings(ras, decs):
+    """Converts a ring to an (N, 2) array in degrees without the invalid declinations"""
+    pointings = np.degrees(np.column_stack((ras, decs)))
+    return pointings[(pointings[:, 1] < 90.) & (pointings[:, 1] > -90.)]
+
+
+def _stereographic(pointings, ra0, dec0):
+    """Projects an (N, 2) array of RAs and Decs in degrees onto the plane touching the sphere at ra0, dec0 (radians)"""
+    ras, decs = np.radians(pointings[:, 0]) - ra0, np.radians(pointings[:, 1])
+    k = 2. / (1. + np.sin(dec0) * np.sin(decs) + np.cos(dec0) * np.cos(decs) * np.cos(ras))
+    return np.column_stack((k * np.cos(decs) * np.sin(ras),
+                            k * (np.cos(dec0) * np.sin(decs) - np.sin(dec0) * np.cos(decs) * np.cos(ras))))
+
+
+def hex_coverage_rings(ra0, dec0, centre_fwhm, loop, power_func, coarse_factor=4, stats=None):
+    """
+    Generates the rings of a hexagonal grid keeping only the pointings with a power above
+    half of the peak power (e.g. within the half power point of the tile beam) while
+    evaluating the power of as few pointings as possible.
+
+    The power is first evaluated on a hexagonal grid coarse_factor times coarser over the same
+    area, which also gives the peak power (refined around the coarse peak). Each fine pointing is then
+    classified by the corners of the coarse Delaunay triangle it is in: if they and all their
+    neighbouring coarse pointings are above (or all below) half power so is the pointing, otherwise
+    the half power contour may pass within a coarse spacing of it and its power is evaluated. The rings
+    stop at the first ring without any pointings above half power or near the boundary that is
+    further from the centre than every coarse pointing above half power so pointings that can
+    not pass the cut are never generated.
+
+    Parameters
+    ----------
+    ra0, dec0: float
+        Right Acension and Declination of the centre pointing in radians
+    centre_fwhm: float
+        The seperation between grid pointings in radians
+    loop: int
+        The maximum number of pointing loops
+    power_func: function
+        Takes an (N, 2) array of RAs and Decs in degrees and returns the (N,) power of each pointing
+    coarse_factor: int
+        The seperation of the coarse grid in units of centre_fwhm. Default: 4
+    stats: dict
+        OPTIONAL - If given, the number of power evaluations ("coarse_evaluations" and
+        "fine_evaluations") and the half power threshold ("threshold") are recorded in it
+
+    Yields
+    ------
+    ras, decs: numpy.array
+        Right Acension and Declination in radians of each ring's pointings above half power
+    """
+    # Imported here so the rest of grid_tools doesn't require scipy
+    from scipy.spatial import Delaunay
+    from mwa_search.sky_index import radec_to_xyz, chord_to_sep
+    if stats is None:
+        stats = {}
+
+    # Sample the power on a coarse grid that covers the whole search area so any side lobes above
+    # half power are found as well
+    coarse_pointings = []
+    coarse_power = []
+    coarse_loop = int(np.ceil(loop / coarse_factor)) + 1
+    for ring_ras, ring_decs in hex_grid_rings(ra0, dec0, centre_fwhm * coarse_factor, coarse_loop):
+        pointings = _valid_ring_pointings(ring_ras, ring_decs)
+        if len(pointings) == 0:
+            continue
+        power = np.asarray(power_func(pointings), dtype=np.float64)
+        coarse_pointings.append(pointings)
+        coarse_power.append(power)
+    coarse_pointings = np.concatenate(coarse_pointings)
+    coarse_power = np.concatenate(coarse_power)
+    stats["coarse_evaluations"] = len(coarse_power)
+
+    # Refine the peak power with fine resolution pointings around the coarse peak
+    peak_ra, peak_dec = np.radians(coarse_pointings[np.argmax(coarse_power)])
+    peak_pointings = _valid_ring_pointings(*hex_grid_array(peak_ra, peak_dec, centre_fwhm, coarse_factor))
+    peak_power = np.amax(power_func(peak_pointings))
+    threshold = max(np.amax(coarse_power), peak_power) / 2.
+    stats["threshold"] = threshold
+    stats["coarse_evaluations"] += len(peak_pointings)
+
+    # Triangulate the coarse grid in a stereographic projection about the centre, which keeps the
+    # Delaunay triangles of the sphere. The grid moves stretch the declination steps so the nearest
+    # coarse pointings are often all in one row rather than the corners of the triangle around a pointing.
+    coarse_inside = coarse_power > threshold
+    triangles = Delaunay(_stereographic(coarse_pointings, ra0, dec0))
+    # A coarse pointing is next to the half power contour if any of its neighbours is on the other side
+    indptr, neighbours = triangles.vertex_neighbor_vertices
+    owner = np.repeat(np.arange(len(coarse_inside)), np.diff(indptr))
+    coarse_mixed = np.bincount(owner, weights=coarse_inside[neighbours] != coarse_inside[owner],
+                               minlength=len(coarse_inside)) > 0
+
+    # The distance from the grid centre of the furthest coarse pointing above half power.
+    # Fine rings beyond it with no pointings near the boundary can't pass the cut
+    centre_xyz = radec_to_xyz(np.degrees(ra0), np.degrees(dec0))
+    def centre_sep(pointings):
+        return chord_to_sep(np.linalg.norm(radec_to_xyz(pointings[:, 0], pointings[:, 1]) - centre_xyz, axis=1))
+    max_inside_sep = np.amax(centre_sep(coarse_pointings[coarse_inside]), initial=0.)
+
+    stats["fine_evaluations"] = 0
+    for ring_ras, ring_decs in hex_grid_rings(ra0, dec0, centre_fwhm, loop):
+        pointings = np.degrees(np.column_stack((ring_ras, ring_decs)))
+        valid = (pointings[:, 1] < 90.) & (pointings[:, 1] > -90.)
+        if not np.any(valid):
+            continue
+        # Keep the radians to yield so they aren't changed by converting back from degrees
+        ring_ras, ring_decs, pointings = ring_ras[valid], ring_decs[valid], pointings[valid]
+        # A fine pointing is classified by the corners of the coarse triangle it is in unless one
+        # of them is next to the contour, so every fine pointing within a coarse spacing of a coarse
+        # pointing on the other side (or outside the coarse grid) is evaluated
+        simplex = triangles.find_simplex(_stereographic(pointings, ra0, dec0))
+        corners = triangles.simplices[simplex]
+        boundary = (simplex < 0) | np.any(coarse_mixed[corners], axis=1)
+        inside = ~boundary & coarse_inside[corners[:, 0]]
+        if np.any(boundary):
+            inside[boundary] = np.asarray(power_func(pointings[boundary]), dtype=np.float64) > threshold
+            stats["fine_evaluations"] += int(np.sum(boundary))
+        if not np.any(inside):
+            if not np.any(boundary) and np.amin(centre_sep(pointings)) > max_inside_sep:
+                break
+            continue
+        yield ring_ras[inside], ring_decs[inside]
+
+
+def iter_coverage_grid(ra, dec, grid_sep, loop, power_func, coarse_factor=4, block_size=1000, stats=None):
+    """
+    Generates the hexagonal grid pointings with a power above half of the peak power
+    (see hex_coverage_rings) in blocks of whole rings.
+
+    Parameters
+    ----------
+    ra, dec: float
+        Right Acension and Declination of the grid centre in radians
+    grid_sep: float
+        The seperation between grid pointings in radians
+    loop: int
+        The maximum number of pointing loops
+    power_func: function
+        Takes an (N, 2) array of RAs and Decs in degrees and returns the (N,) power of each pointing
+    coarse_factor: int
+        The seperation of the coarse grid in units of grid_sep. Default: 4
+    block_size: int
+        The minimum number of pointings to collect before yielding a block. Default: 1000
+    stats: dict
+        OPTIONAL - Records the number of power evaluations, see hex_coverage_rings
+
+    Yields
+    ------
+    pointings: numpy.array
+        An (N, 2) float64 array of the RAs and Decs in degrees
+    """
+    rings = hex_coverage_rings(ra, dec, grid_sep, loop, power_func,
+                               coarse_factor=coarse_factor, stats=stats)
+    return _ring_blocks(rings, block_size)
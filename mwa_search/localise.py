@@ -0,0 +1,665 @@
+"""
+Localises a source from the signal to noise of detections in several tied-array beams.
+
+The position is found by comparing the SN ratios of each pair of detections to the
+ratios of a Gaussian beam model over a search grid (as bestgridpos.py does).
+localise_many localises many candidates in one process with a process pool and only
+looks up the observation metadata once per obsid.
+"""
+import os
+import re
+import glob
+import math
+from math import cos
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from mwa_search.pointings import parse_ra_dec, format_ra, format_dec
+from mwa_search.bestprof import read_bestprof
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _libm_square(x):
+    """
+    Squares an array in the same way as x**2 on a float, which uses the C library's pow()
+    instead of x*x. pow() is not always correctly rounded so the few values whose square
+    is almost halfway between two floats are squared with math.pow to get identical results.
+    """
+    square = x * x
+    # The rounding error of x*x using Dekker's algorithm
+    split = 134217729. * x
+    x_hi = split - (split - x)
+    x_lo = x - x_hi
+    error = ((x_hi * x_hi - square) + 2. * x_hi * x_lo) + x_lo * x_lo
+    close = np.abs(error) > 0.45 * np.spacing(np.abs(square))
+    square[close] = [math.pow(value, 2.) for value in x[close]]
+    return square
+
+
+# numpy's exp is not always identical to math.exp so use math.exp on each element
+_libm_exp = np.frompyfunc(math.exp, 1, 1)
+
+# _libm_square and _libm_exp are only used so the residuals are bit for bit identical to the
+# original per-position loop of bestgridpos.py. They make the residuals about 7.5 times slower
+# than x*x and np.exp, which differ from them by at most about 1e-13, so the exact=False fast
+# path of the functions below uses those instead when identical results aren't needed.
+
+
+def _square_exp(exact):
+    """The square and exp functions of the exact (libm identical) or fast residuals"""
+    if exact:
+        return _libm_square, _libm_exp
+    return np.square, np.exp
+
+
+def _detection_pairs(detections, initial_pos=None):
+    """
+    The pairs of detections to compare (i < j in the same order as looping over them)
+    as a list of (i, j, SN ratio). If there is an initial_pos only the pairs either side of it are used.
+    """
+    pairs = []
+    for i, j in zip(*np.triu_indices(len(detections), k=1)):
+        if initial_pos is not None:
+            # if there is an initial pos make sure it is between the two beams
+            ras  = sorted([detections[i][0], detections[j][0]])
+            decs = sorted([detections[i][1], detections[j][1]])
+            if not ((ras[0]  < initial_pos[0] < ras[1]) or
+                    (decs[0] < initial_pos[1] < decs[1])):
+                continue
+        pairs.append((i, j, detections[i][2]/detections[j][2]))
+    return pairs
+
+
+def _projected_fwhm(decs, fwhm, given_fwhm_ra=None, given_fwhm_dec=None):
+    """The RA and Dec FWHMs (adjusted for the projected change) at each Dec"""
+    unique_decs, inverse = np.unique(decs, return_inverse=True)
+    fwhm_ras = np.empty(len(unique_decs))
+    fwhm_decs = np.empty(len(unique_decs))
+    for di, dec in enumerate(unique_decs):
+        if given_fwhm_ra is None:
+            fwhm_ras[di] = np.degrees(np.radians(fwhm)/cos(np.radians(dec + 26.7))**2)
+        else:
+            fwhm_ras[di] = given_fwhm_ra
+        if given_fwhm_dec is None:
+            fwhm_decs[di] = np.degrees(np.radians(fwhm)/cos(np.radians(dec)))
+        else:
+            fwhm_decs[di] = given_fwhm_dec
+    return fwhm_ras[inverse], fwhm_decs[inverse]
+
+
+def _residuals(ras, decs, detections, fwhm, given_fwhm_ra=None, given_fwhm_dec=None,
+               initial_pos=None, max_elements=2**22, exact=True):
+    """
+    The residuals of find_pos at arrays of positions (in degrees) calculated as a
+    (position, detection) array in blocks of at most max_elements.
+    """
+    square, exp = _square_exp(exact)
+    ras = np.asarray(ras, dtype=np.float64)
+    decs = np.asarray(decs, dtype=np.float64)
+    det_ras  = np.array([det[0] for det in detections], dtype=np.float64)
+    det_decs = np.array([det[1] for det in detections], dtype=np.float64)
+    pairs = _detection_pairs(detections, initial_pos=initial_pos)
+    fwhm_ras, fwhm_decs = _projected_fwhm(decs, fwhm, given_fwhm_ra=given_fwhm_ra, given_fwhm_dec=given_fwhm_dec)
+
+    residual = np.empty(len(ras))
+    block = max(1, max_elements // max(1, len(detections)))
+    for start in range(0, len(ras), block):
+        stop = start + block
+        # Calculate the guassian response of each detection
+        ra_guass  = (ras[start:stop, np.newaxis]  - det_ras)  / (0.6006*fwhm_ras[start:stop, np.newaxis])
+        dec_guass = (decs[start:stop, np.newaxis] - det_decs) / (0.6006*fwhm_decs[start:stop, np.newaxis])
+        det_gauss = exp(-np.sqrt(square(ra_guass) + square(dec_guass))).astype(np.float64)
+
+        # compare SN ratios to guassian ratios for each beam pair
+        res_sum = np.zeros(len(det_gauss))
+        for i, j, sn_ratio in pairs:
+            res_sum += square(sn_ratio - det_gauss[:, i]/det_gauss[:, j])
+        residual[start:stop] = np.sqrt(res_sum)
+    return residual
+
+
+def find_pos(dec_search_range, ra_search_range, detections, fwhm, given_fwhm_ra=None, given_fwhm_dec=None,
+             initial_pos=None, max_elements=2**22, exact=True, verbose=True):
+    """
+    Calculates the residual between the detections' SN ratios and the ratios of a
+    Gaussian beam model at each position of the search grid.
+
+    The positions are calculated in blocks as a (position, detection) array so the memory
+    used is bounded by max_elements. The residuals are identical to a loop over each position
+    (unless exact is False).
+
+    Parameters
+    ----------
+    dec_search_range, ra_search_range: numpy.array
+        The Decs and RAs of the search grid in degrees
+    detections: numpy.array
+        (N, 3) array of the RA, Dec (in degrees) and SN of each detection
+    fwhm: float
+        The FWHM of the tied-array beam at zenith in degrees
+    given_fwhm_ra, given_fwhm_dec: float
+        OPTIONAL - Use these RA and Dec FWHMs (in degrees) instead of calculating them from fwhm. Default: None
+    initial_pos: list
+        OPTIONAL - An initial [RA, Dec] estimate. If given, only the pairs of detections which
+        are either side of it (in RA or Dec) are compared. Default: None
+    max_elements: int
+        OPTIONAL - The maximum number of (position, detection) elements to calculate at once. Default: 2**22
+    exact: bool
+        OPTIONAL - Calculate the residuals with the C library's pow and exp so they are identical to
+        bestgridpos.py's loop. If False numpy's are used which is about 7.5 times faster and differs
+        by at most about 1e-13. Default: True
+    verbose: bool
+        OPTIONAL - Print the detections used. Default: True
+
+    Returns
+    -------
+    RA, DEC, residual: list
+        The RA, Dec and residual of each position (RA changing fastest)
+    """
+    if verbose:
+        print("Localising with: (ra, dec, sn)")
+        print(detections)
+    RA  = np.tile(np.asarray(ra_search_range, dtype=np.float64), len(dec_search_range))
+    DEC = np.repeat(np.asarray(dec_search_range, dtype=np.float64), len(ra_search_range))
+    residual = _residuals(RA, DEC, detections, fwhm, given_fwhm_ra=given_fwhm_ra, given_fwhm_dec=given_fwhm_dec,
+                          initial_pos=initial_pos, max_elements=max_elements, exact=exact)
+    return RA.tolist(), DEC.tolist(), residual.tolist()
+
+
+def find_pos_multires(dec_search_range, ra_search_range, detections, fwhm, given_fwhm_ra=None, given_fwhm_dec=None,
+                      initial_pos=None, n_best=4, refine=4, coarse_cells=16, max_elements=2**22,
+                      exact=True, verbose=True):
+    """
+    Finds the minimum residual of find_pos with a coarse-to-fine search instead of calculating every position.
+
+    A coarse grid (every refine**L positions of the search grid, with at least coarse_cells positions
+    along the longest axis) is calculated. The n_best positions are then refined by a factor of refine
+    over their neighbouring coarse cells and this repeats until the search grid resolution is reached.
+    All the positions are on the search grid so their residuals are identical to find_pos's (with the same exact).
+
+    Parameters
+    ----------
+    dec_search_range, ra_search_range: numpy.array
+        The Decs and RAs of the search grid in degrees
+    detections: numpy.array
+        (N, 3) array of the RA, Dec (in degrees) and SN of each detection
+    fwhm: float
+        The FWHM of the tied-array beam at zenith in degrees
+    given_fwhm_ra, given_fwhm_dec: float
+        OPTIONAL - Use these RA and Dec FWHMs (in degrees) instead of calculating them from fwhm. Default: None
+    initial_pos: list
+        OPTIONAL - An initial [RA, Dec] estimate (see find_pos). Default: None
+    n_best: int
+        OPTIONAL - The number of best positions to refine at each level. Default: 4
+    refine: int
+        OPTIONAL - The factor the resolution increases by at each level. Default: 4
+    coarse_cells: int
+        OPTIONAL - The minimum number of positions along the longest axis of the coarse grid. Default: 16
+    max_elements: int
+        OPTIONAL - The maximum number of (position, detection) elements to calculate at once. Default: 2**22
+    exact: bool
+        OPTIONAL - Calculate the residuals with the C library's pow and exp so they are identical to
+        bestgridpos.py's loop. If False numpy's are used which is about 7.5 times faster and differs
+        by at most about 1e-13. Default: True
+    verbose: bool
+        OPTIONAL - Print the detections used. Default: True
+
+    Returns
+    -------
+    RA, DEC, residual: list
+        The RA, Dec and residual of each position that was calculated
+    """
+    if verbose:
+        print("Localising with: (ra, dec, sn)")
+        print(detections)
+    ra_search_range = np.asarray(ra_search_range, dtype=np.float64)
+    dec_search_range = np.asarray(dec_search_range, dtype=np.float64)
+    n_ra = len(ra_search_range)
+    n_dec = len(dec_search_range)
+
+    def calc(dec_ids, ra_ids):
+        return _residuals(ra_search_range[ra_ids], dec_search_range[dec_ids], detections, fwhm,
+                          given_fwhm_ra=given_fwhm_ra, given_fwhm_dec=given_fwhm_dec,
+                          initial_pos=initial_pos, max_elements=max_elements, exact=exact)
+
+    # The coarse grid, including the last positions so the whole search area is covered
+    step = 1
+    while max(n_ra, n_dec) // (step * refine) >= coarse_cells:
+        step *= refine
+    ra_ids  = np.unique(np.append(np.arange(0, n_ra,  step), n_ra  - 1))
+    dec_ids = np.unique(np.append(np.arange(0, n_dec, step), n_dec - 1))
+    dec_ids, ra_ids = [ids.ravel() for ids in np.meshgrid(dec_ids, ra_ids, indexing='ij')]
+    residual = calc(dec_ids, ra_ids)
+    level_ids = np.arange(len(residual))
+    n_coarse = len(residual)
+
+    while step > 1:
+        new_step = max(1, step // refine)
+        # Refine the neighbouring cells of the best positions of the last level
+        best = level_ids[np.argsort(residual[level_ids], kind='stable')[:n_best]]
+        offsets = np.arange(-step, step + 1, new_step)
+        new_dec_ids = (dec_ids[best, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]).repeat(len(offsets), axis=2)
+        new_ra_ids  = (ra_ids[best, np.newaxis, np.newaxis]  + offsets[np.newaxis, np.newaxis, :]).repeat(len(offsets), axis=1)
+        new_ids = np.unique(np.column_stack((new_dec_ids.ravel(), new_ra_ids.ravel())), axis=0)
+        new_ids = new_ids[(new_ids[:, 0] >= 0) & (new_ids[:, 0] < n_dec) &
+                          (new_ids[:, 1] >= 0) & (new_ids[:, 1] < n_ra)]
+        # Don't recalculate positions from previous levels
+        done = set(zip(dec_ids.tolist(), ra_ids.tolist()))
+        new_ids = np.array([ids for ids in new_ids.tolist() if tuple(ids) not in done],
+                           dtype=int).reshape(-1, 2)
+        new_residual = calc(new_ids[:, 0], new_ids[:, 1])
+        # The next level chooses from these and the positions refined at this level
+        level_ids = np.append(best, np.arange(len(residual), len(residual) + len(new_residual)))
+        dec_ids  = np.append(dec_ids, new_ids[:, 0])
+        ra_ids   = np.append(ra_ids,  new_ids[:, 1])
+        residual = np.append(residual, new_residual)
+        step = new_step
+    if verbose:
+        print("Calculated {0} positions ({1} coarse) instead of {2}".format(len(residual), n_coarse, n_ra * n_dec))
+    return ra_search_range[ra_ids].tolist(), dec_search_range[dec_ids].tolist(), residual.tolist()
+
+
+def polish_pos(detections, fwhm, initial_pos, given_fwhm_ra=None, given_fwhm_dec=None, pair_pos=None):
+    """
+    Fits the position continuously by minimising the same SN ratio residuals as find_pos
+    with scipy's least squares and estimates the uncertainty from the covariance.
+
+    Parameters
+    ----------
+    detections: numpy.array
+        (N, 3) array of the RA, Dec (in degrees) and SN of each detection
+    fwhm: float
+        The FWHM of the tied-array beam at zenith in degrees
+    initial_pos: list
+        The [RA, Dec] to start the fit from, such as the best position of find_pos
+    given_fwhm_ra, given_fwhm_dec: float
+        OPTIONAL - Use these RA and Dec FWHMs (in degrees) instead of calculating them from fwhm. Default: None
+    pair_pos: list
+        OPTIONAL - The initial_pos used by find_pos to choose the detection pairs. Default: None
+
+    Returns
+    -------
+    ra, dec: float
+        The fitted position in degrees
+    ra_err, dec_err: float
+        The 1 sigma uncertainty of the RA and Dec in degrees
+    covariance: numpy.array
+        The (2, 2) covariance of the RA and Dec
+    """
+    from scipy.optimize import least_squares
+
+    detections = np.asarray(detections, dtype=np.float64)
+    pairs = _detection_pairs(detections, initial_pos=pair_pos)
+    if len(pairs) < 2:
+        raise ValueError("At least two pairs of detections are needed to fit the position")
+    i_ids = np.array([i for i, _, _ in pairs])
+    j_ids = np.array([j for _, j, _ in pairs])
+    sn_ratios = np.array([sn_ratio for _, _, sn_ratio in pairs])
+
+    def pair_residuals(pos):
+        ra, dec = pos
+        if given_fwhm_ra is None:
+            fwhm_ra = np.degrees(np.radians(fwhm)/np.cos(np.radians(dec + 26.7))**2)
+        else:
+            fwhm_ra = given_fwhm_ra
+        if given_fwhm_dec is None:
+            fwhm_dec = np.degrees(np.radians(fwhm)/np.cos(np.radians(dec)))
+        else:
+            fwhm_dec = given_fwhm_dec
+        ra_guass  = (ra  - detections[:, 0]) / (0.6006*fwhm_ra)
+        dec_guass = (dec - detections[:, 1]) / (0.6006*fwhm_dec)
+        det_gauss = np.exp(-np.sqrt(ra_guass**2 + dec_guass**2))
+        return sn_ratios - det_gauss[i_ids]/det_gauss[j_ids]
+
+    fit = least_squares(pair_residuals, np.asarray(initial_pos, dtype=np.float64), x_scale=fwhm/60.)
+    # The pair residuals share the noise of each detection's SN so they are not independent.
+    # Propagate the SN noise (assumed equal for all detections) through the ratios and the fit instead.
+    sns = detections[:, 2]
+    sn_jac = np.zeros((len(pairs), len(detections)))
+    sn_jac[np.arange(len(pairs)), i_ids] = 1. / sns[j_ids]
+    sn_jac[np.arange(len(pairs)), j_ids] = -sns[i_ids] / sns[j_ids]**2
+    fit_matrix = np.linalg.pinv(fit.jac.T @ fit.jac) @ fit.jac.T
+    # Estimate the SN variance from the part of the residuals the position can't fit
+    projector = np.eye(len(pairs)) - fit.jac @ fit_matrix
+    sn_variance = np.sum(fit.fun**2) / max(np.trace(projector @ sn_jac @ sn_jac.T), np.finfo(float).tiny)
+    pos_jac = fit_matrix @ sn_jac
+    covariance = pos_jac @ pos_jac.T * sn_variance
+    ra_err, dec_err = np.sqrt(np.diag(covariance))
+    return fit.x[0], fit.x[1], ra_err, dec_err, covariance
+
+
+
+
+def read_bestprof_detection(bestprof_file):
+    """
+    Reads the pointing and SN of a detection from a prepfold bestprof file.
+
+    Parameters
+    ----------
+    bestprof_file: str
+        The path of the bestprof file
+
+    Returns
+    -------
+    ra, dec: str
+        The RA and Dec of the pointing in the format 'hh:mm:ss.ss' and 'dd:mm:ss.ss'
+    sn: float
+        The SN of the detection
+    """
+    header, _ = read_bestprof(bestprof_file)
+    return header["ra"], header["dec"], header["sn"]
+
+
+def read_posn_detection(posn_file):
+    """
+    Reads the pointing and SN of a detection from a pdmp posn file.
+
+    Parameters
+    ----------
+    posn_file: str
+        The path of the posn file
+
+    Returns
+    -------
+    ra, dec: str
+        The RA and Dec of the pointing in the format 'hh:mm:ss.ss' and 'dd:mm:ss.ss'
+    sn: float
+        The SN of the detection
+    """
+    with open(posn_file, "r") as pdmp:
+        lines = pdmp.readlines()
+    sn = float(lines[0].split()[3])
+    ra, dec = lines[0].split()[9].split("_")[1:3]
+    return ra, dec, sn
+
+
+def read_detections(files, min_posn_sn=3.):
+    """
+    Reads the detections of a candidate from bestprof and/or posn files.
+
+    Parameters
+    ----------
+    files: list
+        The paths of the bestprof or posn files
+    min_posn_sn: float
+        OPTIONAL - Skip posn detections with a lower SN (pdmp's SN of noise can be very low). Default: 3.
+
+    Returns
+    -------
+    detections: list
+        The (RA, Dec, SN) of each detection with the RA and Dec as strings
+    """
+    detections = []
+    for detection_file in files:
+        if detection_file.endswith("posn"):
+            ra, dec, sn = read_posn_detection(detection_file)
+            if min_posn_sn is not None and sn < min_posn_sn:
+                logger.debug("skipping RA: {}   Dec: {}  SN: {}".format(ra, dec, sn))
+                continue
+        else:
+            ra, dec, sn = read_bestprof_detection(detection_file)
+        detections.append((ra, dec, sn))
+    return detections
+
+
+def find_candidate_files(base_dir, file_type=None):
+    """
+    Finds the detection files of each candidate in a directory tree.
+    Each directory that contains bestprof or posn files is a candidate.
+
+    Parameters
+    ----------
+    base_dir: str
+        The base directory of the tree
+    file_type: str
+        OPTIONAL - Use only 'bestprof' or 'posn' files. If None, posn files are used
+        if a directory has any, otherwise bestprof files. Default: None
+
+    Returns
+    -------
+    candidate_files: dict
+        The sorted detection files of each candidate by name (the directory relative to base_dir
+        or the name of base_dir if the files are directly in it)
+    """
+    candidate_files = {}
+    for root, dirs, _ in os.walk(base_dir):
+        dirs.sort()
+        files = {}
+        for ext in ("posn", "bestprof"):
+            files[ext] = sorted(glob.glob(os.path.join(root, "*{}".format(ext))))
+        if file_type is None:
+            files = files["posn"] or files["bestprof"]
+        else:
+            files = files[file_type]
+        if not files:
+            continue
+        name = os.path.relpath(root, base_dir)
+        if name == ".":
+            name = os.path.basename(os.path.abspath(base_dir))
+        candidate_files[name] = files
+    return candidate_files
+
+
+def obsid_from_filename(filename):
+    """
+    Gets the observation ID from the start of a file name such as '<obsid>_<pointing>...bestprof'.
+    Returns None if the file name does not start with an obsid.
+    """
+    match = re.match(r"(\d{10})_", os.path.basename(filename))
+    if match:
+        return match.group(1)
+    return None
+
+
+@lru_cache(maxsize=None)
+def obs_fwhm(obsid):
+    """
+    Calculates the FWHM of the tied-array beam of an observation at its centre frequency.
+    The metadata is cached so it is only looked up once per obsid.
+
+    Parameters
+    ----------
+    obsid: str
+        The observation ID
+
+    Returns
+    -------
+    fwhm: float
+        The FWHM in degrees
+    """
+    from vcstools.metadb_utils import get_common_obs_metadata, get_obs_array_phase
+    from mwa_search.obs_tools import calc_ta_fwhm
+
+    channels = get_common_obs_metadata(obsid)[-1]
+    oap = get_obs_array_phase(obsid)
+    if oap == "OTH":
+        #Assume it's phase 2 extended array
+        oap = "P2E"
+    centrefreq = 1.28 * float(min(channels) + max(channels)) / 2.
+    return calc_ta_fwhm(centrefreq, array_phase=oap)
+
+
+def localise(detections, fwhm, res=None, given_fwhm_ra=None, given_fwhm_dec=None, search="grid",
+             n_best=4, polish=False, exact=True, full_output=False, verbose=False):
+    """
+    Localises a source from its detections in several beams (the method of bestgridpos.py).
+
+    Only the detections within 1.1 times the smallest separation between pointings of the
+    highest SN detection are used. The search grid covers the detections plus one FWHM.
+
+    Parameters
+    ----------
+    detections: list
+        The (RA, Dec, SN) of each detection with the RA and Dec as 'hh:mm:ss.ss' and 'dd:mm:ss.ss'
+    fwhm: float
+        The FWHM of the tied-array beam at zenith in degrees
+    res: float
+        OPTIONAL - The resolution of the search in degrees. Default: fwhm / 60
+    given_fwhm_ra, given_fwhm_dec: float
+        OPTIONAL - Use these RA and Dec FWHMs (in degrees) instead of calculating them from fwhm. Default: None
+    search: str
+        OPTIONAL - 'grid' to calculate every position of the search grid or 'multires'
+        to use find_pos_multires. Default: 'grid'
+    n_best: int
+        OPTIONAL - The number of best positions refined at each level of the multires search. Default: 4
+    polish: bool
+        OPTIONAL - Fit the position continuously from the best search position with polish_pos. Default: False
+    exact: bool
+        OPTIONAL - Calculate the residuals so they are identical to bestgridpos.py's loop. If False they
+        are calculated about 7.5 times faster with numpy (see find_pos). Default: True
+    full_output: bool
+        OPTIONAL - Also return the search grid and residuals (for plotting). Default: False
+    verbose: bool
+        OPTIONAL - Print the detections and the fit. Default: False
+
+    Returns
+    -------
+    result: dict
+        The predicted position ('ra' and 'dec' in degrees, 'raj' and 'decj' as strings and 'pointing'),
+        'predicted_sn', 'ra_err' and 'dec_err' (None if not polished), 'grid_ra' and 'grid_dec'
+        (the best search position), 'best_pointing' and 'best_sn' (the highest SN detection),
+        'n_detections', 'n_fit' and 'fwhm'.
+        If full_output, it also has the 'pointings', 'detections' ((N, 3) RA, Dec in degrees and SN)
+        and 'fit_mask' of the detections sorted by SN, the 'ra_search_range' and 'dec_search_range'
+        and the 'RA', 'DEC' and 'residual' of each position calculated.
+    """
+    if len(detections) < 2:
+        raise ValueError("At least two detections are needed to localise a source")
+    # sort by SN
+    detections = sorted(detections, key=lambda x: x[2], reverse=True)
+    pointings = ["{}_{}".format(raj, decj) for raj, decj, _ in detections]
+    rads, decds = parse_ra_dec([d[0] for d in detections], [d[1] for d in detections])
+    sns = np.array([d[2] for d in detections], dtype=np.float64)
+    if verbose:
+        print("Input detections:")
+        for raj, decj, sn in detections:
+            print("RA: {}  Dec: {}  SN: {}".format(raj, decj, sn))
+    det_array = np.column_stack((rads, decds, sns))
+
+    # Find data max mins
+    ra_max, dec_max, sn_max = np.max(det_array, axis=0)
+    ra_min, dec_min, _ = np.min(det_array, axis=0)
+    i_sn_max = np.nonzero(sns == sn_max)[0][-1]
+    ra_sn_max, dec_sn_max = rads[i_sn_max], decds[i_sn_max]
+
+    # Find the smallest distance between pointings (that differ in both RA and Dec)
+    ra_diff  = rads[:, np.newaxis]  - rads
+    dec_diff = decds[:, np.newaxis] - decds
+    differ = (ra_diff != 0.) & (dec_diff != 0.)
+    if not np.any(differ):
+        raise ValueError("The detections' pointings must differ in both RA and Dec to localise a source")
+    square, _ = _square_exp(exact)
+    min_dist = np.min(np.sqrt(square(ra_diff[differ]) + square(dec_diff[differ])))
+
+    # Only use detections closest to max
+    radinside = 1.1*min_dist
+    if verbose:
+        print("fit radius: {}".format(radinside))
+    fit_mask = np.sqrt(square(rads - ra_sn_max) + square(decds - dec_sn_max)) <= radinside
+    centre_detections = det_array[fit_mask]
+
+    # Make search area
+    if res is None:
+        res = fwhm / 60
+    ra_search_range  = np.arange(ra_min  - fwhm, ra_max  + fwhm, res)
+    dec_search_range = np.arange(dec_min - fwhm, dec_max + fwhm, res)
+
+    if search == "multires":
+        RA, DEC, residual = find_pos_multires(dec_search_range, ra_search_range, centre_detections, fwhm,
+                                              given_fwhm_ra=given_fwhm_ra, given_fwhm_dec=given_fwhm_dec,
+                                              n_best=n_best, exact=exact, verbose=verbose)
+    elif search == "grid":
+        RA, DEC, residual = find_pos(dec_search_range, ra_search_range, centre_detections, fwhm,
+                                     given_fwhm_ra=given_fwhm_ra, given_fwhm_dec=given_fwhm_dec,
+                                     exact=exact, verbose=verbose)
+    else:
+        raise ValueError("Unknown localisation search: {}".format(search))
+    i_best = residual.index(min(residual))
+    ramax = grid_ra = RA[i_best]
+    decmax = grid_dec = DEC[i_best]
+
+    ra_err = dec_err = None
+    if polish:
+        ramax, decmax, ra_err, dec_err, _ = polish_pos(centre_detections, fwhm, [ramax, decmax],
+                                                       given_fwhm_ra=given_fwhm_ra, given_fwhm_dec=given_fwhm_dec)
+        ramax, decmax, ra_err, dec_err = float(ramax), float(decmax), float(ra_err), float(dec_err)
+
+    # Calculated predicted SN
+    fwhm_ra  = np.degrees(np.radians(fwhm)/cos(np.radians(dec_sn_max + 26.7))**2)
+    fwhm_dec = np.degrees(np.radians(fwhm)/cos(np.radians(dec_sn_max)))
+    # Calculate the guassian response
+    ra_guass =  (ra_sn_max  - ramax)  / (0.6006*fwhm_ra)
+    dec_guass = (dec_sn_max - decmax) / (0.6006*fwhm_dec)
+    gauss = math.exp(-(math.sqrt(ra_guass**2 + dec_guass**2)))
+    predicted_sn = float(sn_max / gauss)
+
+    raj = format_ra(ramax)[0]
+    decj = format_dec(decmax)[0]
+    result = {"ra": ramax, "dec": decmax, "raj": raj, "decj": decj, "pointing": "{}_{}".format(raj, decj),
+              "predicted_sn": predicted_sn, "ra_err": ra_err, "dec_err": dec_err,
+              "grid_ra": grid_ra, "grid_dec": grid_dec,
+              "best_pointing": pointings[0], "best_sn": detections[0][2],
+              "n_detections": len(detections), "n_fit": int(np.sum(fit_mask)), "fwhm": fwhm}
+    if full_output:
+        result.update({"pointings": pointings, "detections": det_array, "fit_mask": fit_mask,
+                       "ra_search_range": ra_search_range, "dec_search_range": dec_search_range,
+                       "RA": RA, "DEC": DEC, "residual": residual})
+    return result
+
+
+def _localise_candidate(candidate, detections, fwhm, kwargs):
+    """Localises one candidate, returning the error message instead of raising so a batch continues"""
+    try:
+        return candidate, localise(detections, fwhm, **kwargs), None
+    except Exception as e:
+        return candidate, None, "{}: {}".format(type(e).__name__, e)
+
+
+def localise_many(candidate_detections, fwhm_model, workers=None, **kwargs):
+    """
+    Localises many candidates in parallel with a process pool.
+
+    Parameters
+    ----------
+    candidate_detections: dict
+        The detections of each candidate by name in the format of localise's detections
+    fwhm_model: float, dict or function
+        The FWHM in degrees of all candidates, a dict of each candidate's FWHM or a function
+        that returns the FWHM of a candidate name (such as obs_fwhm of the candidate's obsid).
+        It is evaluated in this process so the metadata is only looked up once per obsid.
+    workers: int
+        OPTIONAL - The number of processes. If 1 the candidates are localised in this process.
+        Default: the number of CPUs
+    **kwargs:
+        Passed to localise (such as res, search, n_best and polish)
+
+    Returns
+    -------
+    results: dict
+        The result of localise of each candidate by name (in the order of candidate_detections).
+        Candidates that could not be localised are logged and left out.
+    """
+    if callable(fwhm_model):
+        fwhms = {cand: fwhm_model(cand) for cand in candidate_detections}
+    elif isinstance(fwhm_model, dict):
+        fwhms = fwhm_model
+    else:
+        fwhms = {cand: fwhm_model for cand in candidate_detections}
+    kwargs = dict(kwargs, full_output=False)
+
+    jobs = [(cand, detections, fwhms[cand], kwargs) for cand, detections in candidate_detections.items()]
+    if workers == 1 or len(jobs) <= 1:
+        outputs = [_localise_candidate(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_localise_candidate, *zip(*jobs)))
+
+    results = {}
+    for cand, result, error in outputs:
+        if error is not None:
+            logger.warning("Unable to localise {}: {}".format(cand, error))
+            continue
+        results[cand] = result
+    return results
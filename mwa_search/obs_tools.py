@@ -1,5 +1,8 @@
 from mwa_pb.mwa_tile import h2e
 
+import numpy as np
+from functools import lru_cache
+
 from astropy.coordinates import SkyCoord, EarthLocation, AltAz
 from astropy.time import Time
 import astropy.units as u
@@ -15,17 +18,60 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def get_earth_location(lat=-26.7033, lon=116.671, height=377.827):
+    """
+    The EarthLocation of the observatory (default is the centre of the MWA).
+    Cached as it is the same for every conversion.
+    """
+    return EarthLocation(lat=lat*u.deg, lon=lon*u.deg, height=height*u.m)
+
+
+@lru_cache(maxsize=64)
+def _cached_altaz_frame(jd1, jd2, scale, shape, lat, lon, height):
+    """Makes the AltAz frame for the hashable representation of the times made by get_altaz_frame"""
+    obstime = Time(np.array(jd1).reshape(shape), np.array(jd2).reshape(shape), format='jd', scale=scale)
+    return AltAz(obstime=obstime, location=get_earth_location(lat, lon, height))
+
+
+def get_altaz_frame(time, lat=-26.7033, lon=116.671, height=377.827):
+    """
+    The AltAz frame of the observatory at the given time(s).
+    The frames are cached per time so repeated conversions at the same times don't remake them.
+
+    Parameters
+    ----------
+    time: str, astropy.time.Time or list
+        The time or times of the observation in UTC (i.e. strings of the form: yyyy-mm-dd hh:mm:ss.ssss)
+    lat, lon, height: float
+        OPTIONAL - observatory latitude (degrees), longitude (degrees) and height (m). Default is the centre of the MWA
+
+    Returns
+    -------
+    frame: astropy.coordinates.AltAz
+        The AltAz frame with an obstime of the same shape as time
+    """
+    obstime = Time(time)
+    jd1 = np.atleast_1d(obstime.jd1)
+    jd2 = np.atleast_1d(obstime.jd2)
+    return _cached_altaz_frame(tuple(jd1.tolist()), tuple(jd2.tolist()), obstime.scale, obstime.shape,
+                               lat, lon, height)
+
+
 def getTargetAZZA(ra,dec,time,lat=-26.7033,lon=116.671,height=377.827):
     """
     Function to get the target position in alt/az at a given EarthLocation and Time.
 
     Default lat,lon,height is the centre of  MWA.
+    Accepts arrays of targets (and times) which are all converted in a single astropy transform
+    using a cached EarthLocation and AltAz frame.
 
     Parameters
     ----------
-      ra - target right ascension in astropy-readable format
-      dec - target declination in astropy-readable format
-      time - time of observation in UTC (i.e. a string on form: yyyy-mm-dd hh:mm:ss.ssss)
+      ra - target right ascension(s) in astropy-readable format
+      dec - target declination(s) in astropy-readable format
+      time - time(s) of observation in UTC (i.e. a string on form: yyyy-mm-dd hh:mm:ss.ssss)
+             If an array of T times is given with N targets each target is converted at each time
       lat - observatory latitude in degrees
       lon - observatory longitude in degrees
 
@@ -36,53 +82,50 @@ def getTargetAZZA(ra,dec,time,lat=-26.7033,lon=116.671,height=377.827):
         list[1] = target zenith angle in radians
         list[2] = target azimuth in degrees
         list[3] = target zenith angle in degrees
+      Each element is a float for a single target and time, an (N,) array for N targets,
+      a (T,) array for T times or an (N, T) array for N targets and T times.
     """
-    #print "Creating EarthLocation for: lat = {0} deg, lon = {1} deg".format(lat,lon)
-    location = EarthLocation(lat=lat*u.deg, lon=lon*u.deg, height=height*u.m)
-
-    #print "Creating SkyCoord for target at (RA,DEC) = ({0},{1})".format(ra,dec)
     coord = SkyCoord(ra,dec,unit=(u.hourangle,u.deg))
-    #print "Target at: ({0},{1}) deg".format(coord.ra.deg,coord.dec.deg)
-
-    obstime = Time(time)
-    #print "Observation time: {0}".format(obstime.iso)
+    frame = get_altaz_frame(time, lat=lat, lon=lon, height=height)
+    if coord.shape and frame.obstime.shape:
+        # Broadcast the targets against the times
+        coord = coord[:, np.newaxis]
 
-    #print "Converting to Alt,Az for given time and observatory location..."
-    altaz = coord.transform_to(AltAz(obstime=obstime,location=location))
-    #print "Target (Alt,Az) = ({0},{1}) deg".format(altaz.alt.deg,altaz.az.deg)
+    altaz = coord.transform_to(frame)
 
-    #print "Converting to (Az,ZA)"
     az = altaz.az.rad
     azdeg = altaz.az.deg
 
     za = np.pi/2 - altaz.alt.rad
     zadeg = 90 - altaz.alt.deg
 
-    #print "Target (Az,ZA) = ({0},{1}) deg".format(azdeg,zadeg)
-
     return [az,za,azdeg,zadeg]
 
 
-def getTargetradec(az,za,time,lst,lat=-26.7033,lon=116.671,height=377.827):
+def getTargetradec(az,za,time,lst=None,lat=-26.7033,lon=116.671,height=377.827):
     """
     Function to get the target position in ra dec at a given EarthLocation and Time.
 
     Default lat,lon,height is the centre of  MWA.
+    Accepts arrays of azimuths and zenith angles (and times or LSTs that broadcast against them).
 
     Parameters
     ----------
       az - target aximuth in radians
       za - target zenith in radians
-      time - time of observation in UTC (i.e. a string on form: yyyy-mm-dd hh:mm:ss.ssss)
+      time - time(s) of observation in UTC (i.e. a string on form: yyyy-mm-dd hh:mm:ss.ssss)
+      lst - local sidereal time(s) in degrees. If None it is calculated from the time
       lat - observatory latitude in degrees
       lon - observatory longitude in degrees
 
     Returns
     -------
-      a list containing four elements in the following order:
+      a list containing two elements in the following order:
         list[0] = target ra in degrees
         list[1] = target dec in degrees
     """
+    if lst is None:
+        lst = Time(time).sidereal_time('apparent', longitude=get_earth_location(lat, lon, height).lon).deg
 
     ha,dec = h2e(az,za,lat) #hour angle and dec in degrees
     ra = lst-ha
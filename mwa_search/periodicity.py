@@ -0,0 +1,483 @@
+"""
+A zero acceleration periodicity search of dedispersed time series that writes the ACCEL files
+that accelsift and prepfold read (in place of realfft and accelsearch -zmax 0).
+
+Batches of DM trials of the same length are memory mapped and Fourier transformed together
+without writing .fft files. The powers are whitened by the median power in blocks that widen
+with frequency (like PRESTO's rednoise), half bins are added by interbinning and the powers
+of up to nharm harmonics are summed incoherently for all the trials at once. The
+significances follow PRESTO's candidate_sigma so the candidates can be sifted the same way.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.special import gammaln, ndtri
+
+from mwa_search.dedisperse import read_inf
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The native layout of PRESTO's fourierprops struct (the records of the binary .cand files)
+FOURIERPROPS_DTYPE = np.dtype([
+    ("r", "f8"), ("rerr", "f4"), ("z", "f8"), ("zerr", "f4"), ("w", "f8"), ("werr", "f4"),
+    ("pow", "f4"), ("powerr", "f4"), ("sig", "f4"), ("rawpow", "f4"), ("phs", "f4"), ("phserr", "f4"),
+    ("cen", "f4"), ("cenerr", "f4"), ("pur", "f4"), ("purerr", "f4"), ("locpow", "f4"),
+], align=True)
+
+# The widths (in bins) of the blocks the median power is found in, which grow from the start to
+# the end width by the end frequency (PRESTO's rednoise defaults)
+REDNOISE_START_WIDTH = 6
+REDNOISE_END_WIDTH = 100
+REDNOISE_END_FREQ = 6.
+
+# The largest error (in bins) of a candidate's r from searching every half bin
+RELATED_R_ERR = 0.25
+
+
+def chi2_logp(power, numharm):
+    """
+    The natural log of the probability of noise with numharm summed (normalised) powers
+    of at least power. It is exact for integer numharm so it works for very large powers.
+
+    Parameters
+    ----------
+    power: numpy.array
+        The summed powers
+    numharm: int
+        The number of summed powers
+
+    Returns
+    -------
+    logp: numpy.array
+        The log probabilities
+    """
+    power = np.maximum(np.asarray(power, dtype=np.float64), 1e-300)
+    k = np.arange(int(numharm))
+    # Q(n, x) = exp(-x) sum_k x^k / k! for integer n
+    log_terms = k * np.log(power)[..., np.newaxis] - gammaln(k + 1.)
+    log_max = log_terms.max(axis=-1)
+    return -power + log_max + np.log(np.exp(log_terms - log_max[..., np.newaxis]).sum(axis=-1))
+
+
+def equivalent_gaussian_sigma(logp):
+    """
+    The one-sided Gaussian significance of log probabilities (with PRESTO's approximation for tiny probabilities).
+
+    Parameters
+    ----------
+    logp: numpy.array
+        The natural log of the probabilities
+
+    Returns
+    -------
+    sigma: numpy.array
+        The significances
+    """
+    logp = np.minimum(np.asarray(logp, dtype=np.float64), 0.)
+    t = np.sqrt(-2. * logp)
+    extended = t - (2.515517 + t * (0.802853 + t * 0.010328)) / (1. + t * (1.432788 + t * (0.189269 + t * 0.001308)))
+    with np.errstate(under="ignore"):
+        direct = -ndtri(np.exp(np.maximum(logp, -30.)))
+    return np.maximum(np.where(logp < -30., extended, direct), 0.)
+
+
+def candidate_sigma(power, numharm, numindep):
+    """
+    The significance of candidates of numharm summed powers corrected for the number of independent trials.
+
+    Parameters
+    ----------
+    power: numpy.array
+        The summed (normalised) powers
+    numharm: int
+        The number of summed powers
+    numindep: float
+        The number of independent frequencies searched
+
+    Returns
+    -------
+    sigma: numpy.array
+        The Gaussian significances
+    """
+    return equivalent_gaussian_sigma(chi2_logp(power, numharm) + np.log(max(numindep, 1.)))
+
+
+def _rednoise_blocks(nbins, tobs):
+    """The start bins of the blocks whose median power whitens the spectrum (the last entry is nbins)"""
+    end_bin = REDNOISE_END_FREQ * tobs
+    starts = [1]
+    width = REDNOISE_START_WIDTH
+    while starts[-1] + width < nbins:
+        starts.append(starts[-1] + width)
+        if starts[-1] >= end_bin:
+            width = REDNOISE_END_WIDTH
+        else:
+            width = int(min(max(REDNOISE_START_WIDTH * np.log(starts[-1]), REDNOISE_START_WIDTH), REDNOISE_END_WIDTH))
+    starts.append(nbins)
+    return np.array(starts)
+
+
+def whiten(spectra, tobs):
+    """
+    Normalises the powers of Fourier spectra by their local mean (from the median of blocks of bins
+    that widen with frequency) so the noise powers have a mean of one, removing red noise.
+
+    Parameters
+    ----------
+    spectra: numpy.array
+        The (trial, bin) complex Fourier amplitudes
+    tobs: float
+        The duration of the time series in seconds
+
+    Returns
+    -------
+    powers: numpy.array
+        The (trial, half bin) float32 normalised powers. The even half bins are the Fourier bins and
+        the odd ones are interbinned (the power between two bins).
+    local_power: numpy.array
+        The (trial, bin) float32 local mean power of each bin
+    """
+    nbins = spectra.shape[1]
+    raw = (spectra.real**2 + spectra.imag**2).astype(np.float32)
+    starts = _rednoise_blocks(nbins, tobs)
+    widths = np.diff(starts)
+    medians = np.empty((spectra.shape[0], len(widths)), dtype=np.float32)
+    # The blocks of each width are consecutive so find their medians together
+    change = np.flatnonzero(np.diff(widths)) + 1
+    for first, last in zip(np.concatenate(([0], change)), np.concatenate((change, [len(widths)]))):
+        blocks = raw[:, starts[first]:starts[last]].reshape(len(raw), last - first, widths[first])
+        medians[:, first:last] = np.median(blocks, axis=2)
+    centres = (starts[:-1] + starts[1:] - 1) / 2.
+    # The median of exponentially distributed noise powers is ln(2) times their mean
+    local_power = np.empty_like(raw)
+    for trial in range(len(raw)):
+        local_power[trial] = np.interp(np.arange(nbins), centres, medians[trial] / np.log(2.))
+    local_power[local_power <= 0] = np.inf
+
+    powers = np.zeros((spectra.shape[0], 2 * nbins), dtype=np.float32)
+    powers[:, 0::2] = raw / local_power
+    # Interbinning (Ransom et al. 2002) approximates the power half way between bins
+    interbin = (np.pi**2 / 16.) * np.abs(spectra[:, :-1] - spectra[:, 1:])**2
+    powers[:, 1:-1:2] = interbin / local_power[:, :-1]
+    powers[:, :2] = 0.
+    return powers, local_power
+
+
+def harmonic_stages(nharm):
+    """The numbers of harmonics summed in each stage (powers of two up to nharm)"""
+    stages = [1]
+    while stages[-1] * 2 <= nharm:
+        stages.append(stages[-1] * 2)
+    return stages
+
+
+def harmonic_search(powers, tobs, nharm=16, flo=1., fhi=None, sigma=2.):
+    """
+    Sums the normalised powers of up to nharm harmonics of every half bin of the highest harmonic
+    and finds the candidates above the significance threshold in each trial.
+
+    Parameters
+    ----------
+    powers: numpy.array
+        The (trial, half bin) normalised powers from whiten
+    tobs: float
+        The duration of the time series in seconds
+    nharm: int
+        OPTIONAL - The largest number of harmonics to sum (rounded down to a power of two). Default: 16
+    flo: float
+        OPTIONAL - The lowest frequency (Hz) of the highest harmonic to search. Default: 1.
+    fhi: float
+        OPTIONAL - The highest frequency (Hz) of the highest harmonic to search. Default: the Nyquist frequency
+    sigma: float
+        OPTIONAL - The smallest significance of a candidate. Default: 2.
+
+    Returns
+    -------
+    candidates: list
+        A (r, sigma, summed power, numharm) array for each trial of its candidates sorted by
+        significance, where r is the fundamental frequency in bins
+    """
+    nhalf = powers.shape[1]
+    rlo = max(flo * tobs, 1.)
+    rhi = min(fhi * tobs, (nhalf - 1) / 2.) if fhi else (nhalf - 1) / 2.
+    found = [[] for _ in range(len(powers))]
+    # Like accelsearch, step over the half bins of the highest harmonic and sum the powers of the
+    # half bins nearest harm / numharm of it, so the harmonics line up with the true ones even when
+    # the fundamental is between half bins. The even fractions were added by the earlier stages.
+    top = np.arange(int(np.ceil(2. * rlo)), int(np.floor(2. * rhi)) + 1)
+    if not len(top):
+        return [np.zeros((0, 4)) for _ in found]
+    summed = powers[:, top]
+    for numharm in harmonic_stages(nharm):
+        for harm in range(1, numharm, 2):
+            summed += powers[:, (top * harm + numharm // 2) // numharm]
+        # The number of independent frequencies searched (PRESTO's numindep for zmax = 0)
+        numindep = (rhi - rlo) / numharm
+        # Only the powers that could pass the threshold need their significance calculated
+        min_power = _min_power(sigma, numharm, numindep)
+        for trial, trial_summed in enumerate(summed):
+            above = np.flatnonzero(trial_summed >= min_power)
+            if not len(above):
+                continue
+            # Keep the most powerful half bin of each run of neighbouring ones
+            run_ids = np.cumsum(np.concatenate(([True], np.diff(above) > 2))) - 1
+            order = np.lexsort((trial_summed[above], run_ids))
+            best = above[order[np.concatenate((run_ids[order][1:] != run_ids[order][:-1], [True]))]]
+            sigmas = candidate_sigma(trial_summed[best], numharm, numindep)
+            keep = sigmas >= sigma
+            found[trial].append(np.column_stack((top[best[keep]] / (2. * numharm), sigmas[keep],
+                                                 trial_summed[best[keep]], np.full(np.count_nonzero(keep), numharm))))
+    return [_remove_related(np.concatenate(trial_found) if trial_found else np.zeros((0, 4)), nharm)
+            for trial_found in found]
+
+
+def _min_power(sigma, numharm, numindep):
+    """The smallest summed power with at least sigma significance (found by bisection)"""
+    low, high = 0., 10. * numharm + 10. * sigma**2 + 100.
+    for _ in range(60):
+        mid = (low + high) / 2.
+        if candidate_sigma(mid, numharm, numindep) >= sigma:
+            high = mid
+        else:
+            low = mid
+    return low
+
+
+def _remove_related(candidates, nharm):
+    """Removes the candidates at (or harmonically related to) the frequency of a more significant one"""
+    if len(candidates) < 2:
+        return candidates
+    candidates = candidates[np.argsort(-candidates[:, 1], kind="stable")]
+    ratios = np.array([[num, den] for num in range(1, nharm + 1) for den in range(1, nharm + 1)], dtype=np.float64)
+    # Related if r is within a bin of other_r * num / den, plus the error of other_r times num / den
+    tolerance = 1.1 * ratios[:, 1] + RELATED_R_ERR * ratios[:, 0]
+    kept = []
+    for cand in candidates:
+        related = False
+        for other in kept:
+            if np.any(np.abs(cand[0] * ratios[:, 1] - other[0] * ratios[:, 0]) < tolerance):
+                related = True
+                break
+        if not related:
+            kept.append(cand)
+    return np.array(kept)
+
+
+def _value_error(value, error):
+    """Formats a value with its uncertainty in the last digits like PRESTO (such as 714.6032(59))"""
+    if not np.isfinite(error) or error <= 0:
+        return "{:.6g}".format(value)
+    decimals = max(0, 1 - int(np.floor(np.log10(error))))
+    if decimals == 0:
+        return "{:.0f}({:.0f})".format(value, error)
+    return "{:.{}f}({:.0f})".format(value, decimals, error * 10**decimals)
+
+
+def _columns(fields):
+    """Joins (value, width) fields into a line of left justified columns that are always separated"""
+    return "".join("{:<{}} ".format(str(value), width) for value, width in fields)
+
+
+def _fourier_props(r, power, raw_power, phase, sigma, local_power):
+    """The fourierprops record of a Fourier bin (with the uncertainties of Ransom et al. 2002)"""
+    props = np.zeros(1, dtype=FOURIERPROPS_DTYPE)[0]
+    amplitude = np.sqrt(max(power, 1e-10))
+    props["r"] = r
+    props["rerr"] = 3. / (np.pi * amplitude * np.sqrt(6.))
+    props["zerr"] = 3. * np.sqrt(10.) / (np.pi * amplitude)
+    props["pow"] = power
+    props["powerr"] = np.sqrt(2. * power + 1.)
+    props["sig"] = sigma
+    props["rawpow"] = raw_power
+    props["phs"] = phase
+    props["phserr"] = 1. / amplitude
+    props["cen"] = 0.5
+    props["cenerr"] = 1. / amplitude
+    props["pur"] = 1.
+    props["purerr"] = 1. / amplitude
+    props["locpow"] = local_power
+    return props
+
+
+def write_accel(basename, candidates, spectrum, powers, local_power, tobs, zmax=0):
+    """
+    Writes the ACCEL text file and binary .cand file of a trial's candidates like accelsearch.
+
+    Parameters
+    ----------
+    basename: str
+        The path of the time series (and its .inf file) without the suffix
+    candidates: numpy.array
+        The (r, sigma, summed power, numharm) of each candidate from harmonic_search
+    spectrum: numpy.array
+        The complex Fourier amplitudes of the trial
+    powers: numpy.array
+        The normalised powers of each half bin of the trial from whiten
+    local_power: numpy.array
+        The local mean power of each bin of the trial from whiten
+    tobs: float
+        The duration of the time series in seconds
+    zmax: int
+        OPTIONAL - The zmax in the file names. Default: 0
+
+    Returns
+    -------
+    accel_file: str
+        The path of the ACCEL file
+    """
+    accel_file = "{}_ACCEL_{}".format(basename, zmax)
+    fund_lines = []
+    harm_lines = []
+    props = np.zeros(len(candidates), dtype=FOURIERPROPS_DTYPE)
+    for candnum, (r, sigma, summed_power, numharm) in enumerate(candidates, start=1):
+        numharm = int(numharm)
+        harm_props = []
+        for harm in range(1, numharm + 1):
+            half_bin = int(round(2 * r * harm))
+            bin_num = min(half_bin // 2, len(spectrum) - 1)
+            power = float(powers[min(half_bin, len(powers) - 1)])
+            harm_props.append(_fourier_props(half_bin / 2., power, power * local_power[bin_num],
+                                             float(np.angle(spectrum[bin_num])),
+                                             float(candidate_sigma(power, 1, 1.)), local_power[bin_num]))
+        fund = harm_props[0]
+        props[candnum - 1] = fund
+        props[candnum - 1]["sig"] = sigma
+        rerr = fund["rerr"] / numharm
+        freq, period = r / tobs, tobs / r
+        fund_lines.append(_columns([
+            (candnum, 5), ("{:.2f}".format(sigma), 6), ("{:.2f}".format(summed_power), 8),
+            ("{:.2f}".format(summed_power), 8), (numharm, 5),
+            (_value_error(1000. * period, 1000. * rerr * period / r), 17), (_value_error(freq, rerr / tobs), 14),
+            (_value_error(r, rerr), 14), ("0.0({:.1g})".format(fund["zerr"] / tobs**2), 15),
+            ("0.0({:.1f})".format(fund["zerr"]), 14), ("0.0", 17)]))
+        for harm, harm_prop in enumerate(harm_props, start=1):
+            # The first harmonic of each candidate starts with " <candnum>" so sifting can find it
+            harm_lines.append(_columns([
+                (" {}".format(candnum) if harm == 1 else "", 5), (harm, 5), ("{:.2f}".format(harm_prop["sig"]), 9),
+                ("{:.2f}".format(harm_prop["pow"]), 11),
+                (_value_error(harm_prop["rawpow"], harm_prop["powerr"] * harm_prop["locpow"]), 15),
+                (_value_error(harm_prop["r"], harm_prop["rerr"]), 15), ("{:.4f}".format(r * harm), 14),
+                ("0.0({:.1f})".format(harm_prop["zerr"]), 11), ("0.0", 11),
+                (_value_error(harm_prop["phs"], harm_prop["phserr"]), 12),
+                (_value_error(harm_prop["cen"], harm_prop["cenerr"]), 12),
+                (_value_error(harm_prop["pur"], harm_prop["purerr"]), 12)]))
+
+    with open(accel_file, "w") as outfile:
+        outfile.write("{:13s}Summed  Coherent  Num        Period          Frequency         FFT 'r'        "
+                      "Freq Deriv       FFT 'z'         Accel\n".format(""))
+        outfile.write("Cand  Sigma  Power    Power    Harm        (ms)              (Hz)             (bin)          "
+                      "(Hz/s)         (bins)          (m/s^2)          Notes\n")
+        outfile.write("-" * 155 + "\n")
+        for line in fund_lines:
+            outfile.write(line.rstrip() + "\n")
+        outfile.write("\n\n")
+        outfile.write("{:18s}Power /          Raw           FFT 'r'          Pred 'r'       FFT 'z'     Pred 'z'      "
+                      "Phase       Centroid     Purity\n".format(""))
+        outfile.write("Cand  Harm.  Sigma     Loc Pow       Power           (bin)            (bin)          (bins)      "
+                      "(bins)       (rad)        (0-1)        <p> = 1\n")
+        outfile.write("-" * 169 + "\n")
+        for line in harm_lines:
+            outfile.write(line.rstrip() + "\n")
+        outfile.write("\n\n")
+        # accelsearch copies the .inf file to the end (sifting reads the number of bins and their width from it)
+        with open("{}.inf".format(basename), "r") as inf_file:
+            outfile.write(inf_file.read())
+    props.tofile("{}.cand".format(accel_file))
+    return accel_file
+
+
+def search_batch(basenames, nharm=16, flo=1., fhi=None, sigma=2., zmax=0):
+    """
+    Searches a batch of time series of the same length together and writes their ACCEL files.
+
+    Parameters
+    ----------
+    basenames: list
+        The paths of the .dat and .inf files without the suffix
+    nharm, flo, fhi, sigma:
+        OPTIONAL - The options of harmonic_search
+    zmax: int
+        OPTIONAL - The zmax in the file names. Default: 0
+
+    Returns
+    -------
+    results: list
+        The (ACCEL file, number of candidates) of each basename
+    """
+    infos = [read_inf("{}.inf".format(basename)) for basename in basenames]
+    nsamp = min(info.get("nsamp", 0) or os.path.getsize("{}.dat".format(basename)) // 4
+                for info, basename in zip(infos, basenames))
+    series = np.empty((len(basenames), nsamp), dtype=np.float32)
+    for row, basename in zip(series, basenames):
+        row[:] = np.memmap("{}.dat".format(basename), dtype=np.float32, mode="r")[:nsamp]
+    series -= series.mean(axis=1, dtype=np.float64)[:, np.newaxis].astype(np.float32)
+    tobs = nsamp * infos[0]["tbin"]
+    # One transform of the batch (the DC bin is ignored)
+    spectra = np.fft.rfft(series, axis=1)
+    del series
+    powers, local_power = whiten(spectra, tobs)
+    candidates = harmonic_search(powers, tobs, nharm=nharm, flo=flo, fhi=fhi, sigma=sigma)
+    results = []
+    for trial, basename in enumerate(basenames):
+        accel_file = write_accel(basename, candidates[trial], spectra[trial], powers[trial], local_power[trial],
+                                 tobs, zmax=zmax)
+        results.append((accel_file, len(candidates[trial])))
+    return results
+
+
+def _search_batch_safe(basenames, kwargs):
+    """search_batch that returns the error message instead of raising so the other batches are still searched"""
+    try:
+        return search_batch(basenames, **kwargs), None
+    except (OSError, ValueError, KeyError) as e:
+        return None, "{}: {}".format(type(e).__name__, e)
+
+
+def search_dats(basenames, batch_samples=2**26, workers=1, **kwargs):
+    """
+    Searches PRESTO time series (such as the DM trials of a search job) in batches of the same length.
+
+    Parameters
+    ----------
+    basenames: list
+        The paths of the .dat and .inf files without the suffix
+    batch_samples: int
+        OPTIONAL - The largest number of samples (of all the time series) transformed at once. Default: 2**26
+    workers: int
+        OPTIONAL - The number of processes searching batches. Default: 1
+    **kwargs:
+        The options of search_batch
+
+    Returns
+    -------
+    results: dict
+        The (ACCEL file, number of candidates) of each basename that could be searched.
+        Basenames that couldn't be searched are logged and left out.
+    """
+    # Batch the time series with the same number of samples
+    lengths = {}
+    for basename in basenames:
+        try:
+            nsamp = read_inf("{}.inf".format(basename)).get("nsamp")
+        except OSError as e:
+            logger.warning("Unable to search {}: {}".format(basename, e))
+            continue
+        lengths.setdefault(nsamp, []).append(basename)
+    batches = []
+    for nsamp, names in lengths.items():
+        batch_size = max(1, batch_samples // max(nsamp or 1, 1))
+        batches += [names[start:start + batch_size] for start in range(0, len(names), batch_size)]
+
+    if workers <= 1 or len(batches) < 2:
+        outputs = [_search_batch_safe(batch, kwargs) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_search_batch_safe, batches, [kwargs] * len(batches)))
+    results = {}
+    for batch, (batch_results, error) in zip(batches, outputs):
+        if error is not None:
+            logger.warning("Unable to search {}: {}".format(", ".join(batch), error))
+            continue
+        results.update(zip(batch, batch_results))
+    return results
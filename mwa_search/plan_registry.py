@@ -0,0 +1,194 @@
+"""
+A registry of dedispersion plans shared by all the pointings of an observation.
+
+A plan (the dd_plan lines and how they are packed into search jobs) only depends on the
+observation's centre frequency and duration and the search parameters so it is stored once
+under the hash of those parameters in a canonical JSON format. Re-runs and new chunks of
+pointings of the same observation read the stored plan instead of making it again.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+from mwa_search.data_load import PLAN_REGISTRY_DIR
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Increase this if the plan format (or how plans are made) changes so old plans are not used
+PLAN_FORMAT_VERSION = 1
+
+
+def _to_json_value(value):
+    """Converts numpy scalars so they are written like the equivalent Python value"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return str(value)
+
+
+def canonical_json(data):
+    """
+    Converts data to canonical JSON (sorted keys, no whitespace and exact floats) so equal data is always the same text.
+
+    Parameters
+    ----------
+    data: dict
+        The data. Numpy scalars are converted to Python ones.
+
+    Returns
+    -------
+    text: str
+        The canonical JSON
+    """
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), default=_to_json_value)
+
+
+def plan_key(**params):
+    """
+    Makes the registry key of a plan from the parameters used to make it.
+
+    Parameters
+    ----------
+    **params:
+        The parameters that affect the plan (such as the centre frequency, duration, DM range,
+        DM step limits and the job packing parameters). They must be JSON serialisable.
+
+    Returns
+    -------
+    key: str
+        The SHA-256 hash of the canonical JSON of the parameters
+    """
+    params = dict(params, format_version=PLAN_FORMAT_VERSION)
+    return hashlib.sha256(canonical_json(params).encode()).hexdigest()
+
+
+def file_digest(filename):
+    """
+    The SHA-256 hash of a file's contents (such as a cost model) to use as a plan parameter.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the file
+
+    Returns
+    -------
+    digest: str
+        The hex digest of the file
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PlanRegistry:
+    """
+    A directory of dedispersion plans in the canonical JSON format keyed by plan_key.
+
+    Each plan is a dict of the format_version, params (used to make the key), plan (the
+    dd_plan lines), jobs (the plan lines of each search job) and costs (the predicted
+    [walltime_s, memory_MB] of each job or None).
+
+    Parameters
+    ----------
+    registry_dir: str
+        OPTIONAL - The directory of the registry. Default: mwa_search.data_load.PLAN_REGISTRY_DIR
+    """
+    def __init__(self, registry_dir=None):
+        self.registry_dir = registry_dir or PLAN_REGISTRY_DIR
+
+    def _plan_file(self, key):
+        return os.path.join(self.registry_dir, "{}.json".format(key))
+
+    def get(self, key):
+        """
+        Gets a plan from the registry.
+
+        Parameters
+        ----------
+        key: str
+            The plan key from plan_key
+
+        Returns
+        -------
+        plan: dict or None
+            The plan or None if it isn't in the registry (or is an old format)
+        """
+        try:
+            with open(self._plan_file(key), "r") as plan_file:
+                plan = json.load(plan_file)
+        except (OSError, ValueError):
+            return None
+        if plan.get("format_version") != PLAN_FORMAT_VERSION:
+            return None
+        logger.debug("Plan registry hit {}".format(key))
+        return plan
+
+    def put(self, key, params, plan, jobs, costs=None):
+        """
+        Stores a plan in the registry.
+
+        Parameters
+        ----------
+        key: str
+            The plan key from plan_key
+        params: dict
+            The parameters used to make the key
+        plan: list
+            The dd_plan lines
+        jobs: list
+            The plan lines of each search job (from pack_plan)
+        costs: list
+            OPTIONAL - The predicted [walltime_s, memory_MB] of each job. Default: None
+
+        Returns
+        -------
+        plan: dict
+            The stored plan (as it will be read back by get)
+        """
+        registered = json.loads(canonical_json({
+            "format_version": PLAN_FORMAT_VERSION,
+            "params": params,
+            "plan": plan,
+            "jobs": jobs,
+            "costs": costs,
+        }))
+        try:
+            os.makedirs(self.registry_dir, exist_ok=True)
+            # Write to a temporary file then move it into place so plans are never half written
+            fd, tmp_file = tempfile.mkstemp(prefix=".{}.".format(key), dir=self.registry_dir)
+            with os.fdopen(fd, "w") as outfile:
+                outfile.write(canonical_json(registered))
+            os.replace(tmp_file, self._plan_file(key))
+        except OSError as e:
+            logger.warning("Unable to write the plan registry entry {}: {}".format(key, e))
+        return registered
+
+    def get_or_make(self, params, make_plan):
+        """
+        Gets a plan from the registry or makes and stores it if it isn't there.
+
+        Parameters
+        ----------
+        params: dict
+            The parameters that affect the plan (see plan_key)
+        make_plan: function
+            A function with no arguments that returns the plan, jobs and costs (or None)
+
+        Returns
+        -------
+        plan: dict
+            The plan (see PlanRegistry)
+        """
+        key = plan_key(**params)
+        registered = self.get(key)
+        if registered is None:
+            plan, jobs, costs = make_plan()
+            registered = self.put(key, params, plan, jobs, costs=costs)
+        return registered
@@ -0,0 +1,319 @@
+"""
+A vectorised codec for pointing strings in the 'hh:mm:ss.ss_dd:mm:ss.ss' format.
+
+The functions give the same results as converting with astropy's SkyCoord and
+vcstools.pointing_utils.format_ra_dec (which is how pointings were made before)
+but work on whole arrays at once instead of one pointing at a time.
+"""
+import numpy as np
+import astropy.units as u
+
+# The unit conversion factors astropy uses so that the results are identical
+HOURANGLE_TO_DEG = u.hourangle.to(u.deg)
+DEG_TO_HOURANGLE = u.deg.to(u.hourangle)
+DEG_TO_RAD = u.deg.to(u.rad)
+RAD_TO_DEG = u.rad.to(u.deg)
+RAD_360 = u.deg.to(u.rad, 360.)
+
+
+def _wrap(angles, a360):
+    """Wraps angles to 0 <= angle < a360 in the same way as astropy's Angle.wrap_at"""
+    angles = angles - (angles // a360) * a360
+    # Rounding errors can cause problems
+    angles[angles >= a360] -= a360
+    angles[angles < 0.] += a360
+    return angles
+
+
+def _split_fields(strings, name):
+    """
+    Splits an array of sexagesimal strings into an (N, 3) float array of the
+    (hours or degrees, minutes, seconds) and a boolean array of which strings are negative.
+    Missing minutes and seconds are treated as zeros.
+    """
+    strings = np.atleast_1d(np.asarray(strings, dtype=str))
+    if strings.size == 0:
+        return np.empty((0, 3)), np.empty(0, dtype=bool)
+    strings = np.char.strip(strings)
+    n_fields = np.char.count(strings, ":") + 1
+    if np.all(n_fields == 3):
+        # Convert all the strings at once
+        fields = np.array(":".join(strings).split(":"), dtype=np.float64).reshape(-1, 3)
+    else:
+        fields = np.zeros((len(strings), 3))
+        for si, string in enumerate(strings):
+            values = string.split(":")
+            if len(values) > 3:
+                raise ValueError("Can not parse the {} '{}'".format(name, string))
+            fields[si, :len(values)] = np.array(values, dtype=np.float64)
+    negative = np.char.startswith(strings, "-")
+    return fields, negative
+
+
+def _sexagesimal_to_decimal(fields, negative):
+    """Converts (N, 3) sexagesimal fields to decimal in the same way as astropy's Angle"""
+    value = np.abs(fields[:, 0]) + fields[:, 1] / 60.
+    value += fields[:, 2] / 3600.
+    return np.where(negative, -value, value)
+
+
+def parse_ra_dec(ras, decs):
+    """
+    Converts arrays of RA and Dec strings into degrees.
+
+    Parameters
+    ----------
+    ras: array_like
+        The RAs in the format 'hh:mm:ss.ss'
+    decs: array_like
+        The Decs in the format 'dd:mm:ss.ss'
+
+    Returns
+    -------
+    rads, decds: numpy.array
+        The RAs (wrapped to 0 <= RA < 360) and Decs in degrees
+    """
+    ra_fields, ra_negative = _split_fields(ras, "RA")
+    dec_fields, dec_negative = _split_fields(decs, "Dec")
+    if np.any(np.abs(dec_fields[:, 0]) > 90.):
+        raise ValueError("Declinations must be within -90 and 90 degrees")
+    rads = _sexagesimal_to_decimal(ra_fields, ra_negative) * HOURANGLE_TO_DEG
+    rads = _wrap(rads, 360.)
+    decds = _sexagesimal_to_decimal(dec_fields, dec_negative)
+    return rads, decds
+
+
+def parse_pointings(pointings):
+    """
+    Converts an array of 'hh:mm:ss.ss_dd:mm:ss.ss' pointing strings into degrees.
+
+    Parameters
+    ----------
+    pointings: array_like
+        The pointing strings. Any label before a comma ('label,hh:mm:ss.ss_dd:mm:ss.ss') is ignored.
+
+    Returns
+    -------
+    rads, decds: numpy.array
+        The RAs and Decs in degrees
+    """
+    pointings = np.atleast_1d(np.asarray(pointings, dtype=str))
+    if pointings.size == 0:
+        return np.empty(0), np.empty(0)
+    # Remove any labels
+    pointings = np.array([p.rsplit(",", 1)[-1] for p in pointings])
+    ra_dec = np.char.partition(pointings, "_")
+    return parse_ra_dec(ra_dec[:, 0], ra_dec[:, 2])
+
+
+def _format_sexagesimal(values):
+    """
+    Formats decimal hours or degrees in the same way as astropy's Angle.to_string (which
+    rounds the seconds to 8 decimal places) followed by vcstools' format_ra_dec (which
+    truncates the seconds to 2 decimal places).
+
+    Returns an (N, 11) uint8 array of the ASCII characters of 'xx:mm:ss.ss' (without a sign)
+    so the strings can be built without formatting each one separately.
+    """
+    abs_values = np.fabs(values)
+    # The same steps as astropy's _decimal_to_sexagesimal
+    frac, lead = np.modf(abs_values)
+    min_frac, minutes = np.modf(frac * 60.)
+    seconds = min_frac * 60.
+
+    # astropy rounds the seconds to 8 decimals and carries the rounding up
+    carry = seconds >= 60. - 1e-8
+    seconds = np.where(carry, 0., seconds)
+    minutes = np.where(carry, minutes + 1., minutes)
+    carry = minutes >= 60.
+    minutes = np.where(carry, 0., minutes)
+    lead = np.where(carry, lead + 1., lead)
+
+    # Round to 8 decimal places then truncate to 2. Python's formatting rounds the exact
+    # binary value so the few values that are too close to a hundredth to be sure of
+    # with floating point arithmetic are formatted with Python
+    seconds_e8 = np.round(seconds * 1e8)
+    centiseconds = (seconds_e8 // 1e6).astype(np.int64)
+    remainder = seconds_e8 - centiseconds * 1e6
+    uncertain = np.flatnonzero((remainder < 1.) | (remainder > 1e6 - 2.))
+    for i in uncertain:
+        centiseconds[i] = int("{:.8f}".format(seconds[i]).replace(".", "")[:-6])
+
+    chars = np.empty((len(values), 11), dtype=np.uint8)
+    chars[:, [2, 5]] = ord(":")
+    chars[:, 8] = ord(".")
+    for column, number in ((0, lead.astype(np.int64)),
+                           (3, minutes.astype(np.int64)),
+                           (6, centiseconds // 100),
+                           (9, centiseconds % 100)):
+        chars[:, column] = number // 10 + ord("0")
+        chars[:, column + 1] = number % 10 + ord("0")
+    return chars
+
+
+def _ra_chars(rads):
+    """The (N, 11) ASCII characters of the 'hh:mm:ss.ss' RAs"""
+    rads = _wrap(np.atleast_1d(np.asarray(rads, dtype=np.float64)), 360.)
+    return _format_sexagesimal(rads * DEG_TO_HOURANGLE)
+
+
+def _dec_chars(decds):
+    """The (N, 12) ASCII characters of the '+dd:mm:ss.ss' Decs"""
+    decds = np.atleast_1d(np.asarray(decds, dtype=np.float64))
+    chars = np.empty((len(decds), 12), dtype=np.uint8)
+    chars[:, 0] = np.where(np.signbit(decds), ord("-"), ord("+"))
+    chars[:, 1:] = _format_sexagesimal(decds)
+    return chars
+
+
+def _chars_to_strings(chars):
+    """Converts an (N, width) uint8 array of ASCII characters into a list of strings"""
+    chars = np.ascontiguousarray(chars)
+    return chars.view("S{}".format(chars.shape[1])).ravel().astype(str).tolist()
+
+
+def format_ra(rads):
+    """
+    Formats RAs in degrees into 'hh:mm:ss.ss' strings.
+
+    Parameters
+    ----------
+    rads: array_like
+        The RAs in degrees
+
+    Returns
+    -------
+    ras: list
+        The RAs in the format 'hh:mm:ss.ss'
+    """
+    return _chars_to_strings(_ra_chars(rads))
+
+
+def format_dec(decds):
+    """
+    Formats Decs in degrees into '+dd:mm:ss.ss' strings.
+
+    Parameters
+    ----------
+    decds: array_like
+        The Decs in degrees
+
+    Returns
+    -------
+    decs: list
+        The Decs in the format '+dd:mm:ss.ss' or '-dd:mm:ss.ss'
+    """
+    return _chars_to_strings(_dec_chars(decds))
+
+
+def format_pointings(rads, decds):
+    """
+    Formats RAs and Decs in degrees into pointing strings.
+
+    Parameters
+    ----------
+    rads, decds: array_like
+        The RAs and Decs in degrees
+
+    Returns
+    -------
+    pointings: list
+        The pointings in the format 'hh:mm:ss.ss_+dd:mm:ss.ss'
+    """
+    ra_chars = _ra_chars(rads)
+    dec_chars = _dec_chars(decds)
+    separator = np.full((len(ra_chars), 1), ord("_"), dtype=np.uint8)
+    return _chars_to_strings(np.hstack([ra_chars, separator, dec_chars]))
+
+
+def offset_by(rads, decds, sep, angle):
+    """
+    Moves positions by a separation at a position angle using the same spherical
+    trigonometry as astropy's SkyCoord.directional_offset_by.
+
+    Parameters
+    ----------
+    rads, decds: array_like
+        The RAs and Decs in degrees
+    sep: float or array_like
+        The separation to move in degrees
+    angle: float or array_like
+        The position angle to move in degrees where zero is north and 90 is east
+
+    Returns
+    -------
+    rads, decds: numpy.array
+        The offset RAs (0 <= RA < 360) and Decs in degrees
+    """
+    lon = _wrap(np.atleast_1d(np.asarray(rads, dtype=np.float64)), 360.) * DEG_TO_RAD
+    lat = np.asarray(decds, dtype=np.float64) * DEG_TO_RAD
+    distance = np.asarray(sep, dtype=np.float64) * DEG_TO_RAD
+    posang = np.asarray(angle, dtype=np.float64) * DEG_TO_RAD
+
+    cos_a = np.cos(distance)
+    sin_a = np.sin(distance)
+    cos_c = np.sin(lat)
+    sin_c = np.cos(lat)
+    cos_B = np.cos(posang)
+    sin_B = np.sin(posang)
+
+    # cosine rule for the final co-latitude then the sine and cosine rules for the change in longitude
+    cos_b = cos_c * cos_a + sin_c * sin_a * cos_B
+    xsin_A = sin_a * sin_B * sin_c
+    xcos_A = cos_a - cos_b * cos_c
+    A = np.arctan2(xsin_A, xcos_A)
+    # Treat the poles as if they are infinitesimally far from pole but at given lon
+    A = np.where(sin_c < 1e-12, np.pi / 2. + cos_c * (np.pi / 2. - posang), A)
+
+    # Wrap in radians before converting to degrees like astropy does
+    out_lon = _wrap(np.atleast_1d(lon + A), RAD_360)
+    return out_lon * RAD_TO_DEG, np.atleast_1d(np.arcsin(cos_b)) * RAD_TO_DEG
+
+
+def benchmark(n_pointings=100000, seed=0):
+    """
+    Times this codec against the SkyCoord and format_ra_dec path it replaces.
+
+    Parameters
+    ----------
+    n_pointings: int
+        OPTIONAL - The number of random pointings to convert. Default: 100000
+    seed: int
+        OPTIONAL - The random seed. Default: 0
+
+    Returns
+    -------
+    timings: dict
+        The seconds each method took to format and to parse the pointings and whether the results are identical
+    """
+    import time
+    from astropy.coordinates import SkyCoord
+    from vcstools.pointing_utils import format_ra_dec
+
+    rng = np.random.RandomState(seed)
+    rads = rng.uniform(0., 360., n_pointings)
+    decds = np.degrees(np.arcsin(rng.uniform(-1., 1., n_pointings)))
+    timings = {}
+
+    start = time.time()
+    coord = SkyCoord(rads, decds, unit=(u.deg, u.deg))
+    rajs = coord.ra.to_string(unit=u.hour, sep=':')
+    decjs = coord.dec.to_string(unit=u.degree, sep=':')
+    old_pointings = ["{0}_{1}".format(ra, dec) for ra, dec in
+                     format_ra_dec([[ra, dec] for ra, dec in zip(rajs, decjs)], ra_col=0, dec_col=1)]
+    timings["skycoord_format"] = time.time() - start
+    start = time.time()
+    new_pointings = format_pointings(rads, decds)
+    timings["codec_format"] = time.time() - start
+    timings["format_identical"] = old_pointings == new_pointings
+
+    start = time.time()
+    coord = SkyCoord([p.split("_")[0] for p in old_pointings], [p.split("_")[1] for p in old_pointings],
+                     unit=(u.hourangle, u.deg))
+    old_rads, old_decds = coord.ra.deg, coord.dec.deg
+    timings["skycoord_parse"] = time.time() - start
+    start = time.time()
+    new_rads, new_decds = parse_pointings(new_pointings)
+    timings["codec_parse"] = time.time() - start
+    timings["parse_identical"] = bool(np.array_equal(old_rads, new_rads) and np.array_equal(old_decds, new_decds))
+    return timings
@@ -0,0 +1,787 @@
+"""
+A memory mapped reader of search mode PSRFITS files (such as the beamformer's output).
+
+The headers are parsed without astropy and only when they are first needed. The SUBINT table
+is memory mapped with a structured dtype so the DATA, DAT_SCL and DAT_OFFS columns are views of
+the file, 1, 2 and 4 bit samples are unpacked with vectorised bit operations and the scales and
+offsets are applied to each block as it is read. PsrfitsStream reads the consecutive files of an
+observation (made by splice) as one stream of samples. scan_headers reads just the headers of
+many files to get their observation parameters.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+# The numpy dtype and size in bytes of the FITS binary table formats
+_TFORM_DTYPES = {
+    "L": ("i1", 1),
+    "B": ("u1", 1),
+    "I": (">i2", 2),
+    "J": (">i4", 4),
+    "K": (">i8", 8),
+    "A": ("S1", 1),
+    "E": (">f4", 4),
+    "D": (">f8", 8),
+    "C": (">c8", 8),
+    "M": (">c16", 16),
+}
+_TFORM_RE = re.compile(r"\s*(\d*)\s*([LXBIJKAEDCM])")
+
+
+def _parse_value(value):
+    """Converts the value of a header card to a str, bool, int or float"""
+    value = value.strip()
+    if value.startswith("'"):
+        # Strings are quoted with '' as an escaped quote and trailing spaces are not significant
+        end = 1
+        while True:
+            end = value.find("'", end)
+            if end == -1 or value[end:end + 2] != "''":
+                break
+            end += 2
+        return value[1:end if end != -1 else None].replace("''", "'").rstrip()
+    # Remove the comment
+    value = value.split("/")[0].strip()
+    if value == "T":
+        return True
+    if value == "F":
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value.replace("D", "E"))
+    except ValueError:
+        return value
+
+
+def read_fits_header(fileobj):
+    """
+    Reads a FITS header from the current position of a file.
+
+    Parameters
+    ----------
+    fileobj: file
+        A file opened in binary mode at the start of a header
+
+    Returns
+    -------
+    header: dict
+        The value of each keyword (COMMENT and HISTORY cards are skipped)
+    header_size: int
+        The size of the header in bytes (a multiple of 2880)
+    """
+    header = {}
+    header_size = 0
+    while True:
+        block = fileobj.read(BLOCK_SIZE)
+        if len(block) < BLOCK_SIZE:
+            raise ValueError("End of file before the END of the FITS header")
+        header_size += BLOCK_SIZE
+        for i in range(0, BLOCK_SIZE, CARD_SIZE):
+            card = block[i:i + CARD_SIZE].decode("ascii", "replace")
+            keyword = card[:8].strip()
+            if keyword == "END":
+                return header, header_size
+            if card[8:10] == "= " and keyword not in ("COMMENT", "HISTORY"):
+                header[keyword] = _parse_value(card[10:])
+
+
+def _data_size(header):
+    """The size in bytes of the data of an HDU (padded to a multiple of 2880)"""
+    naxis = header.get("NAXIS", 0)
+    if naxis == 0:
+        return 0
+    size = 1
+    for i in range(1, naxis + 1):
+        size *= header["NAXIS{}".format(i)]
+    size = abs(header.get("BITPIX", 8)) // 8 * header.get("GCOUNT", 1) * (header.get("PCOUNT", 0) + size)
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+
+def read_hdu_headers(filename, extname=None):
+    """
+    Reads the primary header and the header of an extension without reading any data.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the FITS file
+    extname: str
+        OPTIONAL - The EXTNAME of the extension to find. Default: None (only the primary header)
+
+    Returns
+    -------
+    primary: dict
+        The primary header
+    extension: dict or None
+        The header of the extension (None if extname is None)
+    data_offset: int or None
+        The position in the file of the extension's data
+    """
+    with open(filename, "rb") as fits_file:
+        primary, header_size = read_fits_header(fits_file)
+        if extname is None:
+            return primary, None, None
+        position = header_size + _data_size(primary)
+        file_size = os.fstat(fits_file.fileno()).st_size
+        while position < file_size:
+            fits_file.seek(position)
+            header, header_size = read_fits_header(fits_file)
+            if header.get("EXTNAME") == extname:
+                return primary, header, position + header_size
+            position += header_size + _data_size(header)
+    raise ValueError("No {} extension in {}".format(extname, filename))
+
+
+def _table_dtype(header):
+    """The numpy structured dtype of a row of a FITS binary table"""
+    names = []
+    formats = []
+    offsets = []
+    offset = 0
+    for i in range(1, header["TFIELDS"] + 1):
+        match = _TFORM_RE.match(header["TFORM{}".format(i)])
+        if match is None:
+            raise ValueError("Unsupported binary table format {}".format(header["TFORM{}".format(i)]))
+        repeat = int(match.group(1) or 1)
+        code = match.group(2)
+        if code == "X":
+            # Bits are stored in bytes
+            dtype, size, repeat = "u1", 1, (repeat + 7) // 8
+        else:
+            dtype, size = _TFORM_DTYPES[code]
+        if repeat > 0:
+            names.append(header["TTYPE{}".format(i)])
+            formats.append((dtype, (repeat,)) if repeat > 1 else dtype)
+            offsets.append(offset)
+        offset += size * repeat
+    if offset != header["NAXIS1"]:
+        raise ValueError("The binary table columns are {} bytes but the rows are {} bytes".format(offset, header["NAXIS1"]))
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": header["NAXIS1"]})
+
+
+def unpack_samples(data, nbits):
+    """
+    Unpacks 1, 2, 4 or 8 bit samples (most significant bits first) from bytes.
+
+    Parameters
+    ----------
+    data: numpy.array
+        The uint8 array of packed samples. The last axis is unpacked.
+    nbits: int
+        The number of bits of each sample
+
+    Returns
+    -------
+    samples: numpy.array
+        The uint8 samples with a last axis 8 / nbits times longer (data itself if nbits is 8)
+    """
+    if nbits == 8:
+        return data
+    if nbits == 1:
+        return np.unpackbits(data, axis=-1)
+    if nbits not in (2, 4):
+        raise ValueError("Unable to unpack {} bit samples".format(nbits))
+    per_byte = 8 // nbits
+    shifts = np.arange(8 - nbits, -1, -nbits, dtype=np.uint8)
+    samples = (data[..., np.newaxis] >> shifts) & np.uint8((1 << nbits) - 1)
+    return samples.reshape(data.shape[:-1] + (data.shape[-1] * per_byte,))
+
+
+def pack_samples(samples, nbits):
+    """
+    Packs 1, 2, 4 or 8 bit samples (most significant bits first) into bytes (the inverse of unpack_samples).
+
+    Parameters
+    ----------
+    samples: numpy.array
+        The samples (less than 2**nbits). The length of the last axis must be a multiple of 8 / nbits.
+    nbits: int
+        The number of bits of each sample
+
+    Returns
+    -------
+    data: numpy.array
+        The uint8 packed bytes
+    """
+    samples = np.asarray(samples, dtype=np.uint8)
+    if nbits == 8:
+        return samples
+    if nbits == 1:
+        return np.packbits(samples, axis=-1)
+    if nbits not in (2, 4):
+        raise ValueError("Unable to pack {} bit samples".format(nbits))
+    per_byte = 8 // nbits
+    shifts = np.arange(8 - nbits, -1, -nbits, dtype=np.uint8)
+    grouped = samples.reshape(samples.shape[:-1] + (samples.shape[-1] // per_byte, per_byte))
+    return np.bitwise_or.reduce(grouped << shifts, axis=-1).astype(np.uint8)
+
+
+class PsrfitsFile:
+    """
+    A search mode PSRFITS file. The headers are read when first used and the SUBINT table is memory mapped.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the PSRFITS file
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._primary = None
+        self._subint = None
+        self._data_offset = None
+        self._table = None
+
+    def _read_headers(self):
+        if self._primary is None:
+            self._primary, self._subint, self._data_offset = read_hdu_headers(self.filename, extname="SUBINT")
+
+    @property
+    def header(self):
+        """The primary header"""
+        self._read_headers()
+        return self._primary
+
+    @property
+    def subint_header(self):
+        """The SUBINT table header"""
+        self._read_headers()
+        return self._subint
+
+    @property
+    def table(self):
+        """The memory mapped SUBINT table (a structured array with a row per subint)"""
+        if self._table is None:
+            header = self.subint_header
+            self._table = np.memmap(self.filename, dtype=_table_dtype(header), mode="r",
+                                    offset=self._data_offset, shape=(header["NAXIS2"],))
+        return self._table
+
+    @property
+    def nchan(self):
+        return self.subint_header["NCHAN"]
+
+    @property
+    def npol(self):
+        return self.subint_header["NPOL"]
+
+    @property
+    def nbits(self):
+        return self.subint_header["NBITS"]
+
+    @property
+    def nsblk(self):
+        """The number of samples in each subint"""
+        return self.subint_header["NSBLK"]
+
+    @property
+    def nsubint(self):
+        return self.subint_header["NAXIS2"]
+
+    @property
+    def nsamp(self):
+        """The number of samples in the file"""
+        return self.nsubint * self.nsblk
+
+    @property
+    def tbin(self):
+        """The sampling time in seconds"""
+        return self.subint_header["TBIN"]
+
+    @property
+    def duration(self):
+        """The duration of the file in seconds"""
+        return self.nsamp * self.tbin
+
+    @property
+    def nsuboffs(self):
+        """The number of subints before this file's first subint (for files that continue an observation)"""
+        return self.subint_header.get("NSUBOFFS", 0) or 0
+
+    @property
+    def freqs(self):
+        """The centre frequency of each channel in MHz (from the first subint)"""
+        if "DAT_FREQ" in self.table.dtype.names:
+            return np.array(self.table["DAT_FREQ"][0], dtype=np.float64).reshape(self.nchan)
+        chan_bw = self.subint_header.get("CHAN_BW", self.header["OBSBW"] / self.nchan)
+        return self.header["OBSFREQ"] + (np.arange(self.nchan) - (self.nchan - 1) / 2.) * chan_bw
+
+    def raw_subints(self, start=0, stop=None):
+        """
+        The raw (packed) DATA of subints as a view of the file.
+
+        Parameters
+        ----------
+        start: int
+            OPTIONAL - The first subint. Default: 0
+        stop: int
+            OPTIONAL - The subint after the last. Default: the number of subints
+
+        Returns
+        -------
+        data: numpy.array
+            The uint8 (subint, bytes) array
+        """
+        return self.table["DATA"][start:stop].reshape(-1, self.nsblk * self.npol * self.nchan * self.nbits // 8)
+
+    def read_subints(self, start=0, stop=None, scale=True, pol=0):
+        """
+        Reads the samples of subints.
+
+        Parameters
+        ----------
+        start: int
+            OPTIONAL - The first subint. Default: 0
+        stop: int
+            OPTIONAL - The subint after the last. Default: the number of subints
+        scale: bool
+            OPTIONAL - Apply DAT_SCL, DAT_OFFS and ZERO_OFF to return float32 values. If False the
+            raw samples are returned (as a view of the file for a single subint of 8 bit data). Default: True
+        pol: int or None
+            OPTIONAL - The polarisation to return or None for all of them. Default: 0
+
+        Returns
+        -------
+        samples: numpy.array
+            The (time, channel) array of samples or (time, polarisation, channel) if pol is None
+        """
+        stop = self.nsubint if stop is None else min(stop, self.nsubint)
+        nrows = max(0, stop - start)
+        samples = unpack_samples(self.raw_subints(start, stop), self.nbits)
+        samples = samples.reshape(nrows, self.nsblk, self.npol, self.nchan)
+        if pol is not None:
+            samples = samples[:, :, pol:pol + 1]
+        if scale:
+            npol = samples.shape[2]
+            table = self.table[start:stop]
+            scl = np.ones((nrows, self.npol, self.nchan), dtype=np.float32)
+            offs = np.zeros((nrows, self.npol, self.nchan), dtype=np.float32)
+            if "DAT_SCL" in table.dtype.names:
+                scl = np.asarray(table["DAT_SCL"], dtype=np.float32).reshape(nrows, -1, self.nchan)
+            if "DAT_OFFS" in table.dtype.names:
+                offs = np.asarray(table["DAT_OFFS"], dtype=np.float32).reshape(nrows, -1, self.nchan)
+            if pol is not None:
+                scl = scl[:, pol:pol + 1]
+                offs = offs[:, pol:pol + 1]
+            zero_off = np.float32(self.subint_header.get("ZERO_OFF", 0.) or 0.)
+            values = samples.astype(np.float32)
+            if zero_off:
+                values -= zero_off
+            # Broadcast the (subint, polarisation, channel) scales over the samples of each subint
+            values *= scl[:, np.newaxis, :npol]
+            values += offs[:, np.newaxis, :npol]
+            samples = values
+        if pol is not None:
+            return samples.reshape(nrows * self.nsblk, self.nchan)
+        return samples.reshape(nrows * self.nsblk, self.npol, self.nchan)
+
+    def iter_blocks(self, subints_per_block=1, scale=True, pol=0):
+        """
+        Yields blocks of samples (see read_subints) from the start to the end of the file.
+        Blocks of one subint of unscaled 8 bit data are views of the file.
+
+        Parameters
+        ----------
+        subints_per_block: int
+            OPTIONAL - The number of subints in each block. Default: 1
+        scale: bool
+            OPTIONAL - Apply DAT_SCL, DAT_OFFS and ZERO_OFF (see read_subints). Default: True
+        pol: int or None
+            OPTIONAL - The polarisation to return or None for all of them. Default: 0
+
+        Yields
+        ------
+        samples: numpy.array
+            (subints_per_block * nsblk, channel) arrays (the last may be shorter)
+        """
+        for start in range(0, self.nsubint, subints_per_block):
+            yield self.read_subints(start, start + subints_per_block, scale=scale, pol=pol)
+
+
+class PsrfitsStream:
+    """
+    The consecutive PSRFITS files of an observation (such as those made by splice) as one stream of samples.
+
+    Parameters
+    ----------
+    filenames: list
+        The paths of the PSRFITS files. They are ordered by their NSUBOFFS (then name).
+    """
+    def __init__(self, filenames):
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        if not filenames:
+            raise ValueError("No PSRFITS files given")
+        self.files = sorted((PsrfitsFile(filename) for filename in filenames),
+                            key=lambda psrfits: (psrfits.nsuboffs, psrfits.filename))
+        first = self.files[0]
+        for psrfits in self.files[1:]:
+            for attr in ("nchan", "npol", "nbits", "nsblk", "tbin"):
+                if getattr(psrfits, attr) != getattr(first, attr):
+                    raise ValueError("{} has a different {} ({}) to {} ({})".format(
+                                     psrfits.filename, attr, getattr(psrfits, attr), first.filename, getattr(first, attr)))
+        # The first subint of each file in the stream
+        self._starts = np.cumsum([0] + [psrfits.nsubint for psrfits in self.files])
+
+    @property
+    def header(self):
+        """The primary header of the first file"""
+        return self.files[0].header
+
+    @property
+    def nchan(self):
+        return self.files[0].nchan
+
+    @property
+    def npol(self):
+        return self.files[0].npol
+
+    @property
+    def nbits(self):
+        return self.files[0].nbits
+
+    @property
+    def nsblk(self):
+        return self.files[0].nsblk
+
+    @property
+    def tbin(self):
+        return self.files[0].tbin
+
+    @property
+    def freqs(self):
+        return self.files[0].freqs
+
+    @property
+    def nsubint(self):
+        return int(self._starts[-1])
+
+    @property
+    def nsamp(self):
+        return self.nsubint * self.nsblk
+
+    @property
+    def duration(self):
+        return self.nsamp * self.tbin
+
+    def read_subints(self, start=0, stop=None, scale=True, pol=0):
+        """
+        Reads the samples of subints of the stream (see PsrfitsFile.read_subints), across files if needed.
+
+        Parameters
+        ----------
+        start: int
+            OPTIONAL - The first subint. Default: 0
+        stop: int
+            OPTIONAL - The subint after the last. Default: the number of subints
+        scale: bool
+            OPTIONAL - Apply DAT_SCL, DAT_OFFS and ZERO_OFF. Default: True
+        pol: int or None
+            OPTIONAL - The polarisation to return or None for all of them. Default: 0
+
+        Returns
+        -------
+        samples: numpy.array
+            The (time, channel) array of samples or (time, polarisation, channel) if pol is None
+        """
+        stop = self.nsubint if stop is None else min(stop, self.nsubint)
+        parts = []
+        for psrfits, file_start, file_stop in zip(self.files, self._starts[:-1], self._starts[1:]):
+            if file_stop <= start or file_start >= stop:
+                continue
+            parts.append(psrfits.read_subints(max(start, file_start) - file_start, min(stop, file_stop) - file_start,
+                                              scale=scale, pol=pol))
+        if len(parts) == 1:
+            # A single file's view is returned without a copy
+            return parts[0]
+        if not parts:
+            shape = (0, self.nchan) if pol is not None else (0, self.npol, self.nchan)
+            return np.zeros(shape, dtype=np.float32 if scale else np.uint8)
+        return np.concatenate(parts)
+
+    def read(self, start_sample=0, nsamp=None, scale=True, pol=0):
+        """
+        Reads samples of the stream.
+
+        Parameters
+        ----------
+        start_sample: int
+            OPTIONAL - The first sample. Default: 0
+        nsamp: int
+            OPTIONAL - The number of samples. Default: to the end of the stream
+        scale: bool
+            OPTIONAL - Apply DAT_SCL, DAT_OFFS and ZERO_OFF. Default: True
+        pol: int or None
+            OPTIONAL - The polarisation to return or None for all of them. Default: 0
+
+        Returns
+        -------
+        samples: numpy.array
+            The (time, channel) array of samples or (time, polarisation, channel) if pol is None
+        """
+        stop_sample = self.nsamp if nsamp is None else min(self.nsamp, start_sample + nsamp)
+        first = start_sample // self.nsblk
+        last = (stop_sample + self.nsblk - 1) // self.nsblk
+        samples = self.read_subints(first, last, scale=scale, pol=pol)
+        return samples[start_sample - first * self.nsblk:stop_sample - first * self.nsblk]
+
+    def iter_blocks(self, subints_per_block=1, scale=True, pol=0):
+        """
+        Yields blocks of samples from the start to the end of the stream. Blocks don't span files
+        so blocks of one subint of unscaled 8 bit data are views of the files.
+
+        Parameters
+        ----------
+        subints_per_block: int
+            OPTIONAL - The largest number of subints in each block. Default: 1
+        scale: bool
+            OPTIONAL - Apply DAT_SCL, DAT_OFFS and ZERO_OFF. Default: True
+        pol: int or None
+            OPTIONAL - The polarisation to return or None for all of them. Default: 0
+
+        Yields
+        ------
+        samples: numpy.array
+            (time, channel) arrays of samples or (time, polarisation, channel) if pol is None
+        """
+        for psrfits in self.files:
+            for samples in psrfits.iter_blocks(subints_per_block=subints_per_block, scale=scale, pol=pol):
+                yield samples
+
+
+def _header_card(keyword, value, comment=""):
+    """Formats a FITS header card"""
+    if isinstance(value, bool):
+        value = "{:>20}".format("T" if value else "F")
+    elif isinstance(value, (int, np.integer)):
+        value = "{:>20}".format(int(value))
+    elif isinstance(value, (float, np.floating)):
+        value = "{:>20}".format(repr(float(value)).upper())
+    else:
+        value = "'{:<8}'".format(str(value).replace("'", "''"))
+    card = "{:<8}= {}".format(keyword, value)
+    if comment:
+        card += " / " + comment
+    return "{:<80}".format(card[:80])
+
+
+def _header_bytes(cards):
+    """The bytes of a header made of cards (padded to a multiple of 2880)"""
+    text = "".join(cards) + "{:<80}".format("END")
+    text += " " * (-len(text) % BLOCK_SIZE)
+    return text.encode("ascii")
+
+
+def write_psrfits(filename, samples, freqs, tbin, nbits=8, nsblk=1024, scales=None, offsets=None, nsuboffs=0,
+                  ra_str="00:00:00.00", dec_str="+00:00:00.00", src_name="synthetic", stt_imjd=59000, stt_smjd=0):
+    """
+    Writes a minimal single polarisation search mode PSRFITS file, for example of synthetic data
+    to check readers and searches against.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the output file
+    samples: numpy.array
+        The (time, channel) raw samples (less than 2**nbits). The number of samples must be a multiple of nsblk.
+    freqs: numpy.array
+        The centre frequency of each channel in MHz
+    tbin: float
+        The sampling time in seconds
+    nbits: int
+        OPTIONAL - The number of bits of each sample (1, 2, 4 or 8). Default: 8
+    nsblk: int
+        OPTIONAL - The number of samples in each subint. Default: 1024
+    scales: numpy.array
+        OPTIONAL - The (subint, channel) DAT_SCL. Default: 1
+    offsets: numpy.array
+        OPTIONAL - The (subint, channel) DAT_OFFS. Default: 0
+    nsuboffs: int
+        OPTIONAL - The number of subints before this file (for files that continue an observation). Default: 0
+    ra_str: str
+        OPTIONAL - The RA of the pointing. Default: '00:00:00.00'
+    dec_str: str
+        OPTIONAL - The declination of the pointing. Default: '+00:00:00.00'
+    src_name: str
+        OPTIONAL - The source name. Default: 'synthetic'
+    stt_imjd: int
+        OPTIONAL - The integer MJD of the start of the observation. Default: 59000
+    stt_smjd: int
+        OPTIONAL - The seconds past the start MJD of the start of the observation. Default: 0
+    """
+    samples = np.asarray(samples)
+    freqs = np.asarray(freqs, dtype=np.float64)
+    nsamp, nchan = samples.shape
+    if nsamp % nsblk:
+        raise ValueError("The number of samples ({}) must be a multiple of nsblk ({})".format(nsamp, nsblk))
+    nsubint = nsamp // nsblk
+    scales = np.ones((nsubint, nchan), dtype=np.float32) if scales is None else np.asarray(scales, dtype=np.float32)
+    offsets = np.zeros((nsubint, nchan), dtype=np.float32) if offsets is None else np.asarray(offsets, dtype=np.float32)
+    data = pack_samples(samples.reshape(nsubint, nsblk * nchan), nbits)
+    chan_bw = float(freqs[1] - freqs[0]) if nchan > 1 else 1.
+    columns = [
+        ("TSUBINT", "1D", np.full((nsubint, 1), nsblk * tbin)),
+        ("OFFS_SUB", "1D", ((np.arange(nsubint) + nsuboffs + 0.5) * nsblk * tbin)[:, np.newaxis]),
+        ("DAT_FREQ", "{}D".format(nchan), np.repeat(freqs[np.newaxis], nsubint, axis=0)),
+        ("DAT_WTS", "{}E".format(nchan), np.ones((nsubint, nchan))),
+        ("DAT_OFFS", "{}E".format(nchan), offsets),
+        ("DAT_SCL", "{}E".format(nchan), scales),
+        ("DATA", "{}B".format(data.shape[1]), data),
+    ]
+    row_dtype = np.dtype([(name, _TFORM_DTYPES[tform[-1]][0], (int(tform[:-1]),)) for name, tform, _ in columns])
+    table = np.zeros(nsubint, dtype=row_dtype)
+    for name, _, values in columns:
+        table[name] = values
+
+    primary = [
+        _header_card("SIMPLE", True, "file does conform to FITS standard"),
+        _header_card("BITPIX", 8),
+        _header_card("NAXIS", 0),
+        _header_card("EXTEND", True),
+        _header_card("FITSTYPE", "PSRFITS"),
+        _header_card("OBS_MODE", "SEARCH"),
+        _header_card("TELESCOP", "MWA"),
+        _header_card("SRC_NAME", src_name),
+        _header_card("RA_STR", ra_str),
+        _header_card("DEC_STR", dec_str),
+        _header_card("OBSFREQ", float(freqs.mean())),
+        _header_card("OBSBW", chan_bw * nchan),
+        _header_card("OBSNCHAN", nchan),
+        _header_card("STT_IMJD", stt_imjd),
+        _header_card("STT_SMJD", stt_smjd),
+        _header_card("STT_OFFS", 0.),
+    ]
+    subint = [
+        _header_card("XTENSION", "BINTABLE"),
+        _header_card("BITPIX", 8),
+        _header_card("NAXIS", 2),
+        _header_card("NAXIS1", row_dtype.itemsize),
+        _header_card("NAXIS2", nsubint),
+        _header_card("PCOUNT", 0),
+        _header_card("GCOUNT", 1),
+        _header_card("TFIELDS", len(columns)),
+    ]
+    for i, (name, tform, _) in enumerate(columns, start=1):
+        subint.append(_header_card("TTYPE{}".format(i), name))
+        subint.append(_header_card("TFORM{}".format(i), tform))
+        if name == "DATA":
+            # Packed samples are described in bytes
+            subint.append(_header_card("TDIM{}".format(i), "({},1,{})".format(nchan * nbits // 8 if nbits < 8 else nchan, nsblk)))
+    subint += [
+        _header_card("EXTNAME", "SUBINT"),
+        _header_card("INT_TYPE", "TIME"),
+        _header_card("INT_UNIT", "SEC"),
+        _header_card("NPOL", 1),
+        _header_card("POL_TYPE", "AA+BB"),
+        _header_card("TBIN", float(tbin)),
+        _header_card("NBIN", 1),
+        _header_card("NBITS", nbits),
+        _header_card("NCHAN", nchan),
+        _header_card("CHAN_BW", chan_bw),
+        _header_card("NSBLK", nsblk),
+        _header_card("NSUBOFFS", nsuboffs),
+        _header_card("ZERO_OFF", 0.),
+    ]
+    table_bytes = table.tobytes()
+    with open(filename, "wb") as outfile:
+        outfile.write(_header_bytes(primary))
+        outfile.write(_header_bytes(subint))
+        outfile.write(table_bytes)
+        outfile.write(b"\0" * (-len(table_bytes) % BLOCK_SIZE))
+
+
+SCAN_COLUMNS = ["filename", "obsfreq", "bandwidth", "duration", "nchan", "nbits", "npol", "tbin", "nsblk",
+                "nsubint", "nsuboffs", "src_name", "ra_str", "dec_str", "pointing", "stt_imjd", "stt_smjd"]
+
+
+def scan_header(filename):
+    """
+    Reads the observation parameters of a PSRFITS file from its primary and SUBINT headers
+    without reading or mapping any data.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the PSRFITS file
+
+    Returns
+    -------
+    info: dict
+        The SCAN_COLUMNS of the file. The frequency and bandwidth are in MHz, the duration
+        and tbin in seconds and the pointing is in the RA_DEC format of the file names.
+    """
+    primary, subint, _ = read_hdu_headers(filename, extname="SUBINT")
+    ra_str = str(primary.get("RA_STR", ""))
+    dec_str = str(primary.get("DEC_STR", ""))
+    if dec_str and dec_str[0] not in "+-":
+        dec_str = "+" + dec_str
+    return {
+        "filename": filename,
+        "obsfreq": primary.get("OBSFREQ"),
+        "bandwidth": primary.get("OBSBW"),
+        # In the same order as the pipeline has always calculated it
+        "duration": subint["NAXIS2"] * subint["TBIN"] * subint["NSBLK"],
+        "nchan": subint.get("NCHAN"),
+        "nbits": subint.get("NBITS"),
+        "npol": subint.get("NPOL"),
+        "tbin": subint.get("TBIN"),
+        "nsblk": subint.get("NSBLK"),
+        "nsubint": subint.get("NAXIS2"),
+        "nsuboffs": subint.get("NSUBOFFS", 0) or 0,
+        "src_name": primary.get("SRC_NAME"),
+        "ra_str": ra_str,
+        "dec_str": dec_str,
+        "pointing": "{}_{}".format(ra_str, dec_str) if ra_str and dec_str else None,
+        "stt_imjd": primary.get("STT_IMJD"),
+        "stt_smjd": primary.get("STT_SMJD"),
+    }
+
+
+def _scan_header_safe(filename):
+    """scan_header that returns the error message instead of raising so a scan continues"""
+    try:
+        return scan_header(filename), None
+    except (OSError, ValueError, KeyError) as e:
+        return None, "{}: {}".format(type(e).__name__, e)
+
+
+def scan_headers(filenames, workers=16):
+    """
+    Reads the observation parameters (see scan_header) of many PSRFITS files with a thread pool
+    (reading headers is limited by the file system rather than the CPU).
+
+    Parameters
+    ----------
+    filenames: list
+        The paths of the PSRFITS files
+    workers: int
+        OPTIONAL - The number of threads. Default: 16
+
+    Returns
+    -------
+    infos: list
+        The info of each file that could be read in the order of filenames. Files that couldn't
+        be read are logged and left out.
+    """
+    filenames = list(filenames)
+    if workers <= 1 or len(filenames) < 2:
+        outputs = [_scan_header_safe(filename) for filename in filenames]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_scan_header_safe, filenames))
+    infos = []
+    for filename, (info, error) in zip(filenames, outputs):
+        if error is not None:
+            logger.warning("Unable to read the headers of {}: {}".format(filename, error))
+            continue
+        infos.append(info)
+    return infos
@@ -0,0 +1,294 @@
+"""
+A single pulse search of dedispersed time series that writes PRESTO's .singlepulse format.
+
+Each PRESTO time series (.dat and .inf file) is memory mapped, detrended and normalised in
+blocks (like single_pulse_search.py), then the matched filter of every boxcar width is made
+from one cumulative sum. The samples above the threshold are merged into candidates where
+their boxcars overlap, keeping the most significant. The DM trials are searched in parallel.
+"""
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from mwa_search.dedisperse import read_inf
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The boxcar widths (in samples) that single_pulse_search.py searches
+DEFAULT_WIDTHS = [1, 2, 3, 4, 6, 9, 14, 20, 30, 45, 70, 100, 150, 220, 300, 500, 700, 1000, 1500]
+
+SINGLEPULSE_HEADER = "# DM      Sigma      Time (s)     Sample    Downfact\n"
+
+
+def search_widths(tbin, max_width=0., widths=None):
+    """
+    The boxcar widths to search.
+
+    Parameters
+    ----------
+    tbin: float
+        The sampling time in seconds
+    max_width: float
+        OPTIONAL - The largest width in seconds or 0 for all the widths. Default: 0.
+    widths: list
+        OPTIONAL - The widths in samples. Default: DEFAULT_WIDTHS
+
+    Returns
+    -------
+    widths: list
+        The widths in samples
+    """
+    if widths is None:
+        widths = DEFAULT_WIDTHS
+    if max_width > 0:
+        widths = [width for width in widths if width == 1 or width * tbin <= max_width]
+    return list(widths)
+
+
+def _normalise_blocks(blocks, detrend, bad_block_fact):
+    """Detrends and normalises a (block, sample) array in place, zeroing bad blocks"""
+    if detrend:
+        # Remove the least squares line of each block
+        x = np.arange(blocks.shape[1], dtype=np.float64) - (blocks.shape[1] - 1) / 2.
+        means = blocks.mean(axis=1, dtype=np.float64)
+        slopes = (blocks @ x) / (x @ x) if len(x) > 1 else np.zeros(len(blocks))
+        blocks -= (means[:, np.newaxis] + slopes[:, np.newaxis] * x).astype(np.float32)
+    else:
+        blocks -= np.median(blocks, axis=1)[:, np.newaxis]
+    # The standard deviation of each block from its median absolute deviation so pulses don't inflate it
+    stds = 1.4826 * np.median(np.abs(blocks), axis=1)
+    bad = stds <= 0
+    if bad_block_fact:
+        median_std = np.median(stds[~bad]) if np.any(~bad) else 0.
+        bad |= (stds > bad_block_fact * median_std) | (stds < median_std / bad_block_fact)
+    stds[bad] = 1.
+    blocks /= stds[:, np.newaxis].astype(np.float32)
+    blocks[bad] = 0.
+    return int(np.count_nonzero(bad))
+
+
+def normalise(series, detrend_len=1000, detrend=True, bad_block_fact=0.):
+    """
+    Detrends and normalises a time series to zero mean and unit standard deviation in blocks.
+
+    Parameters
+    ----------
+    series: numpy.array
+        The time series
+    detrend_len: int
+        OPTIONAL - The number of samples in each block. Default: 1000
+    detrend: bool
+        OPTIONAL - Remove a linear fit from each block, otherwise only its median. Default: True
+    bad_block_fact: float
+        OPTIONAL - Zero the blocks with a standard deviation more than this factor from the median
+        of the blocks or 0 to not check for bad blocks. Default: 0.
+
+    Returns
+    -------
+    series: numpy.array
+        The normalised float32 time series
+    nbad: int
+        The number of blocks that were zeroed
+    """
+    series = np.array(series, dtype=np.float32)
+    nfull = len(series) // detrend_len * detrend_len
+    nbad = 0
+    if nfull:
+        nbad += _normalise_blocks(series[:nfull].reshape(-1, detrend_len), detrend, bad_block_fact)
+    if nfull < len(series):
+        # The tail is normalised on its own (it is all that's left if the series is shorter than a block)
+        nbad += _normalise_blocks(series[nfull:].reshape(1, -1), detrend, bad_block_fact)
+    return series, nbad
+
+
+def boxcar_search(series, widths, threshold=5., chunk_len=2**20):
+    """
+    Searches a normalised time series with boxcars of each width (each normalised by the square root
+    of its width) and merges the samples above the threshold into candidates.
+
+    Parameters
+    ----------
+    series: numpy.array
+        The normalised time series
+    widths: list
+        The boxcar widths in samples
+    threshold: float
+        OPTIONAL - The smallest significance of a candidate. Default: 5.
+    chunk_len: int
+        OPTIONAL - The number of samples of each cumulative sum (to limit the memory used). Default: 2**20
+
+    Returns
+    -------
+    candidates: numpy.array
+        The (sample, sigma, width) of each candidate in order of sample. The sample is the centre of the boxcar.
+    """
+    widths = sorted(widths)
+    overlap = max(widths)
+    starts, ends, sigmas, cand_widths = [], [], [], []
+    for chunk_start in range(0, len(series), chunk_len):
+        chunk = series[chunk_start:chunk_start + chunk_len + overlap]
+        cumsum = np.concatenate(([0.], np.cumsum(chunk, dtype=np.float64)))
+        # Only boxcars starting in this chunk so none are found twice
+        nstart = min(chunk_len, len(chunk))
+        for width in widths:
+            nbox = min(nstart, len(chunk) - width + 1)
+            if nbox <= 0:
+                break
+            boxcar = (cumsum[width:width + nbox] - cumsum[:nbox]) / np.sqrt(width)
+            above = np.flatnonzero(boxcar >= threshold)
+            starts.append(above + chunk_start)
+            ends.append(above + chunk_start + width)
+            sigmas.append(boxcar[above])
+            cand_widths.append(np.full(len(above), width, dtype=np.int64))
+    if not starts or not sum(len(start) for start in starts):
+        return np.zeros((0, 3))
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    sigmas = np.concatenate(sigmas)
+    cand_widths = np.concatenate(cand_widths)
+
+    # Merge the boxcars that overlap into one candidate with the largest sigma
+    order = np.argsort(starts, kind="stable")
+    starts, ends, sigmas, cand_widths = starts[order], ends[order], sigmas[order], cand_widths[order]
+    running_end = np.maximum.accumulate(ends)
+    new_cand = np.concatenate(([True], starts[1:] >= running_end[:-1]))
+    cand_ids = np.cumsum(new_cand) - 1
+    # The last of each candidate when sorted by candidate then sigma is its most significant
+    best = np.lexsort((sigmas, cand_ids))
+    best = best[np.concatenate((cand_ids[best][1:] != cand_ids[best][:-1], [True]))]
+    return np.column_stack((starts[best] + cand_widths[best] // 2, sigmas[best], cand_widths[best]))
+
+
+def write_singlepulse(filename, candidates, dm, tbin):
+    """
+    Writes candidates in PRESTO's .singlepulse format.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the .singlepulse file
+    candidates: numpy.array
+        The (sample, sigma, width) of each candidate (see boxcar_search)
+    dm: float
+        The DM of the time series
+    tbin: float
+        The sampling time in seconds
+    """
+    with open(filename, "w") as outfile:
+        outfile.write(SINGLEPULSE_HEADER)
+        for sample, sigma, width in candidates:
+            outfile.write("%7.2f %7.2f %13.6f %10d     %3d\n" % (dm, sigma, sample * tbin, sample, width))
+
+
+def read_singlepulse(filename):
+    """
+    Reads a .singlepulse file.
+
+    Parameters
+    ----------
+    filename: str
+        The path of the .singlepulse file
+
+    Returns
+    -------
+    candidates: numpy.array
+        The (DM, sigma, time, sample, downfact) of each candidate
+    """
+    with warnings.catch_warnings():
+        # Files without candidates only have the header
+        warnings.simplefilter("ignore", UserWarning)
+        candidates = np.loadtxt(filename, comments="#", ndmin=2)
+    return candidates.reshape(-1, 5)
+
+
+def search_dat(basename, threshold=5., max_width=0., widths=None, detrend_len=1000, detrend=True,
+               bad_block_fact=0., out_dir=None):
+    """
+    Searches a PRESTO time series for single pulses and writes its .singlepulse file.
+
+    Parameters
+    ----------
+    basename: str
+        The path of the .dat and .inf files without the suffix
+    threshold: float
+        OPTIONAL - The smallest significance of a candidate. Default: 5.
+    max_width: float
+        OPTIONAL - The largest boxcar width in seconds or 0 for all of them. Default: 0.
+    widths: list
+        OPTIONAL - The boxcar widths in samples. Default: DEFAULT_WIDTHS
+    detrend_len: int
+        OPTIONAL - The number of samples of each block normalised separately. Default: 1000
+    detrend: bool
+        OPTIONAL - Remove a linear fit from each block, otherwise only its median. Default: True
+    bad_block_fact: float
+        OPTIONAL - Zero the blocks with a standard deviation more than this factor from the median
+        or 0 to not check for bad blocks. Default: 0.
+    out_dir: str
+        OPTIONAL - The directory of the .singlepulse file. Default: the directory of the .dat file
+
+    Returns
+    -------
+    filename: str
+        The path of the .singlepulse file
+    ncand: int
+        The number of candidates
+    """
+    info = read_inf("{}.inf".format(basename))
+    series = np.memmap("{}.dat".format(basename), dtype=np.float32, mode="r")
+    # Time series padded by prepsubband are searched up to the number of samples in the .inf file
+    series = series[:info.get("nsamp", len(series))]
+    tbin = info["tbin"]
+    series, nbad = normalise(series, detrend_len=detrend_len, detrend=detrend, bad_block_fact=bad_block_fact)
+    if nbad:
+        logger.debug("{}: zeroed {} bad blocks".format(basename, nbad))
+    candidates = boxcar_search(series, search_widths(tbin, max_width=max_width, widths=widths), threshold=threshold)
+    if out_dir is None:
+        filename = "{}.singlepulse".format(basename)
+    else:
+        filename = os.path.join(out_dir, "{}.singlepulse".format(os.path.basename(basename)))
+    write_singlepulse(filename, candidates, info["dm"], tbin)
+    return filename, len(candidates)
+
+
+def _search_dat_safe(basename, kwargs):
+    """search_dat that returns the error message instead of raising so the other DMs are still searched"""
+    try:
+        return search_dat(basename, **kwargs), None
+    except (OSError, ValueError, KeyError) as e:
+        return None, "{}: {}".format(type(e).__name__, e)
+
+
+def search_dats(basenames, workers=1, **kwargs):
+    """
+    Searches many PRESTO time series (such as the DM trials of a search job) with a process pool.
+
+    Parameters
+    ----------
+    basenames: list
+        The paths of the .dat and .inf files without the suffix
+    workers: int
+        OPTIONAL - The number of processes. Default: 1
+    **kwargs:
+        The options of search_dat
+
+    Returns
+    -------
+    results: dict
+        The (.singlepulse file, number of candidates) of each basename that could be searched.
+        Basenames that couldn't be searched are logged and left out.
+    """
+    basenames = list(basenames)
+    if workers <= 1 or len(basenames) < 2:
+        outputs = [_search_dat_safe(basename, kwargs) for basename in basenames]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_search_dat_safe, basenames, [kwargs] * len(basenames)))
+    results = {}
+    for basename, (result, error) in zip(basenames, outputs):
+        if error is not None:
+            logger.warning("Unable to search {}: {}".format(basename, error))
+            continue
+        results[basename] = result
+    return results
@@ -0,0 +1,318 @@
+"""
+A spatial index over a set of beam pointings for fast sky coverage lookups.
+
+The pointings are stored as 3D unit vectors in a KD-tree so that radius and
+nearest neighbour queries are exact great circle queries without any RA wrapping.
+"""
+import os
+import json
+import numpy as np
+from scipy.spatial import cKDTree
+
+from mwa_search.pointings import parse_pointings
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def radec_to_xyz(ras, decs):
+    """
+    Converts RAs and Decs in degrees into an (N, 3) array of unit vectors
+    """
+    ras  = np.radians(np.atleast_1d(np.asarray(ras,  dtype=np.float64)))
+    decs = np.radians(np.atleast_1d(np.asarray(decs, dtype=np.float64)))
+    cos_dec = np.cos(decs)
+    return np.column_stack((cos_dec * np.cos(ras), cos_dec * np.sin(ras), np.sin(decs)))
+
+
+def sep_to_chord(sep):
+    """Converts an angular separation in degrees to the chord length between unit vectors"""
+    return 2. * np.sin(np.radians(np.minimum(sep, 180.)) / 2.)
+
+
+def chord_to_sep(chord):
+    """Converts the chord length between unit vectors to an angular separation in degrees"""
+    return np.degrees(2. * np.arcsin(np.clip(np.asarray(chord) / 2., 0., 1.)))
+
+
+def _ball_pairs(query_tree, tree, chord):
+    """
+    All the (query, tree point) index pairs within a chord length of each other and their chord lengths.
+    Both sets of points are in trees that are walked together which is much faster than querying
+    each point when there are many queries.
+    """
+    pairs = query_tree.sparse_distance_matrix(tree, chord, output_type='ndarray')
+    return pairs['i'].astype(int), pairs['j'].astype(int), pairs['v']
+
+
+def beam_fwhm_ellipse(decs, fwhm):
+    """
+    The RA and Dec full width half maximums, in degrees of each coordinate,
+    of a tied-array beam at each declination.
+
+    Uses the same projection correction as bestgridpos.py where the beam is
+    elongated by the MWA's latitude (-26.7 degrees).
+
+    Parameters
+    ----------
+    decs: array_like
+        Declination of the beams in degrees
+    fwhm: float
+        The FWHM of the tied-array beam at zenith in degrees
+
+    Returns
+    -------
+    fwhm_ra, fwhm_dec: numpy.array
+        The full width of the ellipse along RA and Dec in degrees
+    """
+    decs = np.radians(np.asarray(decs, dtype=np.float64))
+    fwhm_ra  = np.degrees(np.radians(fwhm) / np.cos(decs + np.radians(26.7))**2)
+    fwhm_dec = np.degrees(np.radians(fwhm) / np.cos(decs))
+    return fwhm_ra, fwhm_dec
+
+
+class SkyIndex:
+    """
+    A KD-tree over the unit vectors of a set of pointings.
+
+    Parameters
+    ----------
+    ras, decs: array_like
+        The RAs and Decs of the N pointings in degrees
+    names: list
+        OPTIONAL - A name (normally "hh:mm:ss.ss_dd:mm:ss.ss") for each pointing. Default: None
+    """
+    def __init__(self, ras, decs, names=None):
+        self.ras  = np.atleast_1d(np.asarray(ras,  dtype=np.float64))
+        self.decs = np.atleast_1d(np.asarray(decs, dtype=np.float64))
+        if len(self.ras) != len(self.decs):
+            raise ValueError("ras and decs must be the same length")
+        if names is not None and len(names) != len(self.ras):
+            raise ValueError("names must be the same length as ras and decs")
+        self.names = names
+        self.tree = cKDTree(radec_to_xyz(self.ras, self.decs))
+
+    def __len__(self):
+        return len(self.ras)
+
+    @classmethod
+    def from_pointings(cls, pointings, names=None):
+        """Makes an index from an (N, 2) array of RAs and Decs in degrees such as get_grid's output"""
+        pointings = np.asarray(pointings, dtype=np.float64).reshape(-1, 2)
+        return cls(pointings[:, 0], pointings[:, 1], names=names)
+
+    def query_radius(self, ras, decs, radius):
+        """
+        Finds all the pointings within a radius of each position.
+
+        Parameters
+        ----------
+        ras, decs: array_like
+            The RAs and Decs of the M positions in degrees
+        radius: float
+            The search radius in degrees
+
+        Returns
+        -------
+        matches: list
+            For each position, an array of the indices of the pointings within the radius
+        """
+        xyz = radec_to_xyz(ras, decs)
+        matches = self.tree.query_ball_point(xyz, sep_to_chord(radius))
+        return [np.array(m, dtype=int) for m in matches]
+
+    def search_around(self, ras, decs, radius):
+        """
+        Finds all the (position, pointing) pairs within a radius.
+        A replacement for astropy's search_around_sky.
+
+        Parameters
+        ----------
+        ras, decs: array_like
+            The RAs and Decs of the M positions in degrees
+        radius: float
+            The search radius in degrees
+
+        Returns
+        -------
+        idx_pos: numpy.array
+            The index of the position of each pair
+        idx_pointing: numpy.array
+            The index of the pointing of each pair
+        sep: numpy.array
+            The separation of each pair in degrees
+        """
+        idx_pos, idx_pointing, chord = _ball_pairs(cKDTree(radec_to_xyz(ras, decs)), self.tree,
+                                                   sep_to_chord(radius))
+        # Sort each position's matches so the output doesn't depend on the tree layout
+        order = np.lexsort((idx_pointing, idx_pos))
+        return idx_pos[order], idx_pointing[order], chord_to_sep(chord[order])
+
+    def query_nearest(self, ras, decs, k=1):
+        """
+        Finds the k nearest pointings to each position.
+
+        Parameters
+        ----------
+        ras, decs: array_like
+            The RAs and Decs of the M positions in degrees
+        k: int
+            The number of neighbours to find. Default: 1
+
+        Returns
+        -------
+        sep: numpy.array
+            The (M, k) separations in degrees (inf if there are fewer than k pointings)
+        idx: numpy.array
+            The (M, k) indices of the pointings (len(self) if there are fewer than k pointings)
+        """
+        chord, idx = self.tree.query(radec_to_xyz(ras, decs), k=k)
+        chord = np.asarray(chord).reshape(-1, k)
+        idx = np.asarray(idx).reshape(-1, k)
+        sep = np.where(np.isinf(chord), np.inf, chord_to_sep(np.where(np.isinf(chord), 0., chord)))
+        return sep, idx
+
+    def covering_beam(self, ras, decs, fwhm, fwhm_ra=None, fwhm_dec=None):
+        """
+        Finds the pointing whose elliptical half power beam covers each position best.
+
+        The beam of each pointing is an ellipse centred on the pointing with the full widths
+        from beam_fwhm_ellipse (or fwhm_ra and fwhm_dec if given). A position is covered if
+        (dra / (fwhm_ra/2))**2 + (ddec / (fwhm_dec/2))**2 <= 1 and the covering beam is the
+        one with the smallest value of that normalised distance.
+
+        Parameters
+        ----------
+        ras, decs: array_like
+            The RAs and Decs of the M positions in degrees
+        fwhm: float
+            The FWHM of the tied-array beam at zenith in degrees
+        fwhm_ra, fwhm_dec: float
+            OPTIONAL - Use a fixed RA and Dec full width in degrees instead of calculating them
+            from fwhm and the declination of each pointing. Default: None
+
+        Returns
+        -------
+        idx: numpy.array
+            The (M,) index of the covering pointing or -1 if no beam covers the position
+        dist: numpy.array
+            The (M,) normalised elliptical distance to that pointing (1 is the half power point)
+            or inf if it is not covered
+        """
+        ras  = np.atleast_1d(np.asarray(ras,  dtype=np.float64))
+        decs = np.atleast_1d(np.asarray(decs, dtype=np.float64))
+        beam_fwhm_ra, beam_fwhm_dec = beam_fwhm_ellipse(self.decs, fwhm)
+        if fwhm_ra is not None:
+            beam_fwhm_ra = np.full(len(self), fwhm_ra, dtype=np.float64)
+        if fwhm_dec is not None:
+            beam_fwhm_dec = np.full(len(self), fwhm_dec, dtype=np.float64)
+
+        idx  = np.full(len(ras), -1, dtype=int)
+        dist = np.full(len(ras), np.inf)
+        if len(self) == 0 or len(ras) == 0:
+            return idx, dist
+
+        # No beam reaches further on the sky than its largest semi-axis. The semi-axes grow
+        # rapidly towards the pole and horizon so the beams are grouped by semi-axis (in
+        # factors of 2) and each group is searched with its own largest semi-axis
+        semi_axis = np.maximum(np.abs(beam_fwhm_ra) * np.cos(np.radians(self.decs)),
+                               np.abs(beam_fwhm_dec)) / 2.
+        semi_axis = np.minimum(semi_axis, 180.)
+        size_group = np.floor(np.log2(semi_axis)).astype(int)
+        query_tree = cKDTree(radec_to_xyz(ras, decs))
+        pair_pos = []
+        pair_pointing = []
+        for group in np.unique(size_group):
+            group_pointings = np.flatnonzero(size_group == group)
+            if len(group_pointings) == len(self):
+                group_tree = self.tree
+            else:
+                group_tree = cKDTree(self.tree.data[group_pointings])
+            group_pos, group_idx, _ = _ball_pairs(query_tree, group_tree,
+                                                  sep_to_chord(np.max(semi_axis[group_pointings])))
+            pair_pos.append(group_pos)
+            pair_pointing.append(group_pointings[group_idx])
+        idx_pos = np.concatenate(pair_pos)
+        idx_pointing = np.concatenate(pair_pointing)
+        if len(idx_pos) == 0:
+            return idx, dist
+
+        dra  = (ras[idx_pos] - self.ras[idx_pointing] + 180.) % 360. - 180.
+        ddec = decs[idx_pos] - self.decs[idx_pointing]
+        pair_dist = np.sqrt((dra  / (beam_fwhm_ra[idx_pointing]  / 2.))**2 +
+                            (ddec / (beam_fwhm_dec[idx_pointing] / 2.))**2)
+        covered = pair_dist <= 1.
+        idx_pos, idx_pointing, pair_dist = idx_pos[covered], idx_pointing[covered], pair_dist[covered]
+
+        # Keep the closest beam of each position
+        order = np.lexsort((pair_dist, idx_pos))
+        idx_pos, idx_pointing, pair_dist = idx_pos[order], idx_pointing[order], pair_dist[order]
+        first = np.ones(len(idx_pos), dtype=bool)
+        first[1:] = idx_pos[1:] != idx_pos[:-1]
+        idx[idx_pos[first]]  = idx_pointing[first]
+        dist[idx_pos[first]] = pair_dist[first]
+        return idx, dist
+
+    def save(self, file_name):
+        """
+        Saves the pointings to a .npz file. The KD-tree is rebuilt on load
+        which takes much less time than any query over the same pointings.
+        """
+        arrays = {"ras": self.ras, "decs": self.decs}
+        if self.names is not None:
+            arrays["names"] = np.array(self.names, dtype=str)
+        with open(file_name, "wb") as outfile:
+            np.savez(outfile, **arrays)
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        Loads an index saved with SkyIndex.save or an .npy file of an (N, 2) array
+        of RAs and Decs in degrees (such as the index grid.py writes as it streams)
+        """
+        if file_name.endswith(".npy"):
+            return cls.from_pointings(np.load(file_name))
+        with np.load(file_name) as data:
+            names = data["names"].tolist() if "names" in data.files else None
+            return cls(data["ras"], data["decs"], names=names)
+
+    @classmethod
+    def from_manifest(cls, manifest_file):
+        """
+        Loads the index of a grid from the grid.py manifest (<out_file_name>_manifest.json).
+
+        Uses the index saved next to the manifest if there is one, otherwise the
+        pointings are read from the grid files listed in the manifest.
+        The index of each pointing is its pointing ID - 1.
+        """
+        with open(manifest_file, "r") as infile:
+            manifest = json.load(infile)
+        manifest_dir = os.path.dirname(manifest_file)
+        if manifest.get("sky_index"):
+            index_file = os.path.join(manifest_dir, manifest["sky_index"])
+            if os.path.isfile(index_file):
+                return cls.load(index_file)
+            logger.warning("Sky index {} not found so reading the grid files".format(index_file))
+
+        names = []
+        for chunk in manifest["chunks"]:
+            # The grid files are written next to the manifest
+            with open(os.path.join(manifest_dir, os.path.basename(chunk["file"])), "r") as infile:
+                for line in infile:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        # Remove any label
+                        line = line.split(",")[-1]
+                        if " " in line:
+                            # A verbose file which starts with the RA and Dec
+                            line = "_".join(line.split()[:2])
+                        names.append(line)
+        return cls.from_pointing_strings(names)
+
+    @classmethod
+    def from_pointing_strings(cls, pointings):
+        """Makes an index from a list of "hh:mm:ss.ss_dd:mm:ss.ss" pointing strings"""
+        if len(pointings) == 0:
+            return cls([], [], names=[])
+        rads, decds = parse_pointings(pointings)
+        return cls(rads, decds, names=list(pointings))
@@ -6,6 +6,7 @@ params.fwhm_deg = null
 params.only_cand_search = false
 params.offset = 0.0
 params.angle_offset = 0.0
+params.merge_fraction = 0.1
 
 
 params.help = false
@@ -23,6 +24,9 @@ if ( params.help ) {
              |  --search_radius
              |              The radius to search (create beams within) in degrees to account for ionosphere.
              |              [default: 0.00001 degrees (doesn't make a grid)]
+             |  --merge_fraction
+             |              Pointings of the same type within this fraction of the FWHM are merged
+             |              into one shared beam [default: ${params.merge_fraction}]
              |  --only_cand_search
              |              Only search for pulsar candidates (no known pulsar processing
              |              [default: False]
@@ -86,7 +90,8 @@ process find_pointings {
 
     """
     pulsars_in_fov.py -o ${params.obsid} -b ${begin} -e ${end} --fwhm ${fwhm} --search_radius ${params.search_radius} \
-${no_known_pulsar_command} --offset ${params.offset} --angle_offset ${params.angle_offset}
+${no_known_pulsar_command} --offset ${params.offset} --angle_offset ${params.angle_offset} \
+--merge_fraction ${params.merge_fraction}
     """
 }
 
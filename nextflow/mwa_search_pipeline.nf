@@ -44,6 +44,15 @@ if ( params.help ) {
              |              Maximum number of DM steps a single job will procces.
              |              Lowering this will reduce memory usage and increase parellelisation.
              |              [default: ${params.max_dms_per_job}]
+             |  --plan_registry
+             |              Directory of the DM plans shared by all pointings of an observation
+             |              [default: ${params.plan_registry}]
+             |  --dedisperse_engine
+             |              Dedisperse with prepsubband or fdmt (faster for narrow DM ranges)
+             |              [default: ${params.dedisperse_engine}]
+             |  --single_pulse_engine
+             |              Single pulse search with presto or boxcar (no Python 2 environment needed)
+             |              [default: ${params.single_pulse_engine}]
              |
              |Pulsar search arguments (optional):
              |  --sp        Perform only a single pulse search [default: ${params.sp }]
@@ -58,6 +67,9 @@ if ( params.help ) {
              |  --zmax      Maximum acceleration to search (0 will do a simpler periodic search).
              |              I recomend you use 200 and set --max_dms_per_job 32
              |              [default: ${params.zmax }]
+             |  --periodicity_engine
+             |              Periodicity search with presto (realfft and accelsearch) or fft
+             |              (in memory, only for --zmax 0) [default: ${params.periodicity_engine}]
              |
              |Other arguments (optional):
              |  --out_dir   Output directory for the candidates files
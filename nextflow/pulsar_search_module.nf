@@ -17,9 +17,15 @@ max_f_harm = max_freq * params.nharm
 
 
 
-def search_time_estimate(dur, ndm) {
+def search_time_estimate(dur, ndm, predicted_time=null, attempt=1) {
     // Estimate the duration of a search job in seconds
-    search_time = params.search_scale * Float.valueOf(dur) * (0.006*Float.valueOf(ndm) + 1)
+    if ( predicted_time ) {
+        // Walltime predicted by the cost model (see params.cost_model)
+        search_time = Float.valueOf(predicted_time) * attempt
+    }
+    else {
+        search_time = params.search_scale * Float.valueOf(dur) * (0.006*Float.valueOf(ndm) + 1)
+    }
     // Max time is 24 hours for many clusters so always use less than that
     if ( search_time < 86400 ) {
         return "${search_time}s"
@@ -29,26 +35,58 @@ def search_time_estimate(dur, ndm) {
     }
 }
 
+def search_memory_estimate(predicted_mem=null, attempt=1) {
+    // Estimate the memory of a search job
+    if ( predicted_mem ) {
+        // Peak memory predicted by the cost model (see params.cost_model)
+        return "${(int) ( Float.valueOf(predicted_mem) * attempt )} MB"
+    }
+    else {
+        return "${attempt * 30} GB"
+    }
+}
+
+def ddplan_file_info(ddplan) {
+    // The DDplan file has the name format DDplan_{i}_a{total_dm_steps}_n{local_dm_steps}.txt
+    // with _t{walltime_s}_m{memory_MB} before the .txt when the cost model is used
+    return ddplan.baseName.tokenize("_").drop(2).collectEntries{ [ (it[0]): it.substring(1) ] }
+}
+
+def plan_group(name, fits) {
+    // All the pointings of a blind search of an observation have the same centre frequency, duration and so DM plan.
+    // The fits files have the name format <obsid>_<pointing>_ch<min_chan>-<max_chan>_00??.fits
+    // Targeted searches (such as pulsars) have their own DM range so they are their own group
+    if ( name.toString().startsWith('Blind') ) {
+        def fits_name = ( fits instanceof List ? fits[0] : fits ).baseName
+        return "Blind_${fits_name.split('_')[0]}_ch${fits_name.split('_ch')[-1].split('_')[0]}".toString()
+    }
+    return name.toString()
+}
+
+def search_cost_tag(dur, ddplans, accel=true) {
+    // The features used by mwa_search.cost_model (see mwa_search.cost_model.search_cost_tag) so they are in the trace
+    def harm_zmax = accel ? "nharm=${params.nharm} zmax=${params.zmax} " : ""
+    return "dur=${dur} ${harm_zmax}plan=${ddplans.collect{ "${it[3]}:${it[5]}:${it[6]}".replace(" ", "") }.join(';')}"
+}
+
 process get_freq_and_dur {
     input:
-    tuple val(name), path(fits_file)
+    tuple val(group), path(fits_file)
 
     output:
-    tuple val(name), path(fits_file), path("freq_dur.csv")
+    tuple val(group), path("freq_dur.csv")
 
     """
     #!/usr/bin/env python
 
-    import os
     import csv
-    from astropy.io import fits
+    from mwa_search.psrfits import scan_header
 
-    # Read in fits file to read its header
-    hdul = fits.open(r"${fits_file}".replace("\\\\", ""))
-    # Grab the centre frequency in MHz
-    freq = hdul[0].header['OBSFREQ']
-    # Calculate the observation duration in seconds
-    dur = hdul[1].header['NAXIS2'] * hdul[1].header['TBIN'] * hdul[1].header['NSBLK']
+    # Read only the primary and SUBINT headers (no data) of the fits file
+    info = scan_header(r"${fits_file}".replace("\\\\", ""))
+    # The centre frequency in MHz and the observation duration in seconds
+    freq = info["obsfreq"]
+    dur = info["duration"]
 
     # Export both values as a CSV for easy output
     with open("freq_dur.csv", "w") as outfile:
@@ -58,117 +96,100 @@ process get_freq_and_dur {
 }
 
 process ddplan {
+    // Makes the DM plan once for each plan group (see plan_group) and stores it in the plan registry
+    // so re-runs and new chunks of pointings of the observation use the same plan.
+    // search_process is the process that searches the plan (search_dd_fft_acc or search_dd) whose cost model is used
     input:
-    tuple val(name), path(fits_file), val(centre_freq), val(dur)
+    tuple val(group), val(centre_freq), val(dur)
+    val(search_process)
 
     output:
-    tuple val(name), path(fits_file), val(centre_freq), val(dur), path('DDplan*.txt')
+    tuple val(group), val(centre_freq), val(dur), path('DDplan*.txt')
 
     """
     #!/usr/bin/env python
 
     import csv
-    import numpy as np
     from vcstools.catalogue_utils import grab_source_alog
-    from mwa_search.dispersion_tools import dd_plan
+    from mwa_search.dispersion_tools import dd_plan, pack_plan
+    from mwa_search.cost_model import load_cost_model
+    from mwa_search.plan_registry import PlanRegistry, file_digest
 
-    if '${name}'.startswith('Blind'):
-        output = dd_plan(${centre_freq}, 30.72, 3072, 0.1, ${params.dm_min}, ${params.dm_max},
-                         min_DM_step=${params.dm_min_step}, max_DM_step=${params.dm_max_step},
-                         max_dms_per_job=${params.max_dms_per_job})
+    if '${group}'.startswith('Blind'):
+        dm_min = ${params.dm_min}
+        dm_max = ${params.dm_max}
     else:
-        if '${name}'.startswith('dm_'):
-            dm = float('${name}'.split('dm_')[-1].split('_')[0])
-        elif '${name}'.startswith('FRB'):
+        if '${group}'.startswith('dm_'):
+            dm = float('${group}'.split('dm_')[-1].split('_')[0])
+        elif '${group}'.startswith('FRB'):
             dm = grab_source_alog(source_type='FRB',
-                 pulsar_list=['${name}'], include_dm=True)[0][-1]
+                 pulsar_list=['${group}'], include_dm=True)[0][-1]
         else:
             # Try RRAT first
             rrat_temp = grab_source_alog(source_type='RRATs',
-                        pulsar_list=['${name}'.split("_")[0]], include_dm=True)
+                        pulsar_list=['${group}'.split("_")[0]], include_dm=True)
             if len(rrat_temp) == 0:
                 #No RRAT so must be pulsar
                 dm = grab_source_alog(source_type='Pulsar',
-                     pulsar_list=['${name}'.split("_")[0]], include_dm=True)[0][-1]
+                     pulsar_list=['${group}'.split("_")[0]], include_dm=True)[0][-1]
             else:
                 dm = rrat_temp[0][-1]
         dm_min = float(dm) - 2.0
         if dm_min < 1.0:
             dm_min = 1.0
         dm_max = float(dm) + 2.0
+
+    # Everything that changes the plan or how it is packed into jobs
+    plan_params = dict(
+        centre_freq=float(${centre_freq}),
+        dur=float(${dur}),
+        dm_min=float(dm_min),
+        dm_max=float(dm_max),
+        dm_min_step=${params.dm_min_step},
+        dm_max_step=${params.dm_max_step},
+        max_dms_per_job=${params.max_dms_per_job},
+        min_dms_per_job=${params.min_dms_per_job},
+    )
+    # Only search_dd_fft_acc runs accelsearch so only its jobs depend on the number of harmonics and zmax
+    accel_params = dict(nharm=${params.nharm}, zmax=${params.zmax}) if '${search_process}' == 'search_dd_fft_acc' else {}
+    if '${params.cost_model}' == 'null':
+        plan_params.update(max_work_function=${params.max_work_function})
+    else:
+        # Each search process has its own cost model so the jobs are packed differently
+        plan_params.update(cost_model=file_digest('${params.cost_model}'), max_search_walltime=${params.max_search_walltime},
+                           search_process='${search_process}', **accel_params)
+
+    def make_plan():
         output = dd_plan(${centre_freq}, 30.72, 3072, 0.1, dm_min, dm_max,
                          min_DM_step=${params.dm_min_step}, max_DM_step=${params.dm_max_step},
                          max_dms_per_job=${params.max_dms_per_job})
-
-    # Make a file for each work function batch
-    work_function_batch = []
-    wfi = 0
-    wf_sum = 0.
-    total_dm_steps = int(np.array(output).sum(axis=0)[3])
-    for dd_line in output:
-        dm_min, dm_max, dm_step, ndm, timeres, downsamp, nsub, total_work_factor = dd_line
-        while total_work_factor > ${params.max_work_function}:
-            # Ouput a file with just the max_work_function worth of DMs
-            wf_dm_step = int(${params.max_work_function} * downsamp)
-            with open(f"DDplan_{wfi:03d}_a{total_dm_steps}_n{wf_dm_step}.txt", "w") as outfile:
-                spamwriter = csv.writer(outfile, delimiter=',')
-                spamwriter.writerow([
-                    dm_min,
-                    dm_min + dm_step * wf_dm_step,
-                    dm_step,
-                    wf_dm_step,
-                    timeres,
-                    downsamp,
-                    nsub,
-                    ${params.max_work_function}
-                ])
-            wfi += 1
-            # update dd_line for next part
-            dm_min = dm_min + dm_step * wf_dm_step
-            ndm -= wf_dm_step
-            total_work_factor -= ${params.max_work_function}
-
-        # Append the leftover to the batch list
-
-        # check if the batch list is ready to output
-        wf_sum += total_work_factor
-        if wf_sum > ${params.max_work_function}:
-            # Ouput file with multiple ddplan lines
-            wf_dm_step = int((wf_sum - ${params.max_work_function}) * downsamp)
-            local_dm_steps = int(wf_dm_step + np.array(work_function_batch).sum(axis=0)[3])
-            with open(f"DDplan_{wfi:03d}_a{total_dm_steps}_n{local_dm_steps}.txt", "w") as outfile:
-                spamwriter = csv.writer(outfile, delimiter=',')
-                for out_line in work_function_batch:
-                    spamwriter.writerow(out_line)
-                # Ouput final new line
-                spamwriter.writerow([
-                    dm_min,
-                    dm_min + dm_step * wf_dm_step,
-                    dm_step,
-                    wf_dm_step,
-                    timeres,
-                    downsamp,
-                    nsub,
-                    wf_sum - ${params.max_work_function}
-                ])
-                wfi += 1
-                work_function_batch = []
-
-            # Prepare new plan for next batch
-            wf_dm_step = int((wf_sum - ${params.max_work_function})  * downsamp)
-            dm_min = dm_min + dm_step * wf_dm_step
-            ndm -= wf_dm_step
-            total_work_factor -= (wf_sum - ${params.max_work_function})
-            wf_sum = 0
-
-        work_function_batch.append([dm_min, dm_max, dm_step, ndm, timeres, downsamp, nsub, total_work_factor])
-
-    # Write final file
-    local_dm_steps = int(np.array(work_function_batch).sum(axis=0)[3])
-    with open(f"DDplan_{wfi:03d}_a{total_dm_steps}_n{local_dm_steps}.txt", "w") as outfile:
-        spamwriter = csv.writer(outfile, delimiter=',')
-        for out_line in work_function_batch:
-            spamwriter.writerow(out_line)
+        if '${params.cost_model}' == 'null':
+            # Pack the plan into jobs of at most max_work_function
+            jobs = pack_plan(output, ${params.max_work_function}, min_dms=${params.min_dms_per_job})
+            return output, jobs, None
+        # Pack the plan into jobs of at most max_search_walltime using the predicted walltimes
+        model = load_cost_model('${params.cost_model}', process='${search_process}')
+        jobs = pack_plan(output, model.line_budget(${params.max_search_walltime}, ${dur}), min_dms=${params.min_dms_per_job},
+                         line_work=lambda dd_line: model.line_walltime(dd_line, ${dur}, **accel_params))
+        costs = [model.predict(job, ${dur}, **accel_params) for job in jobs]
+        return output, jobs, costs
+
+    registry_dir = None if '${params.plan_registry}' == 'null' else '${params.plan_registry}'
+    registered = PlanRegistry(registry_dir).get_or_make(plan_params, make_plan)
+    jobs = registered["jobs"]
+    if registered["costs"] is None:
+        costs = [""] * len(jobs)
+    else:
+        costs = [f"_t{int(walltime) + 1}_m{int(memory) + 1}" for walltime, memory in registered["costs"]]
+
+    # Make a file for each job
+    total_dm_steps = sum(dd_line[3] for job in jobs for dd_line in job)
+    for wfi, (job, cost) in enumerate(zip(jobs, costs)):
+        local_dm_steps = sum(dd_line[3] for dd_line in job)
+        with open(f"DDplan_{wfi:03d}_a{total_dm_steps}_n{local_dm_steps}{cost}.txt", "w") as outfile:
+            spamwriter = csv.writer(outfile, delimiter=',')
+            for dd_line in job:
+                spamwriter.writerow(dd_line)
     """
 }
 
@@ -177,14 +198,15 @@ process search_dd_fft_acc {
     label 'cpu'
     label 'presto_search'
 
-    time { search_time_estimate(dur, params.max_work_function) }
-    memory { "${task.attempt * 30} GB"}
+    tag "${name} ${search_cost_tag(dur, ddplans, true)}"
+    time { search_time_estimate(dur, params.max_work_function, cost.t, task.attempt) }
+    memory { search_memory_estimate(cost.m, task.attempt) }
     maxRetries 2
     errorStrategy 'retry'
     maxForks params.max_search_jobs
 
     input:
-    tuple val(name), path(fits_files), val(freq), val(dur), val(ndms_job), val(ddplans)
+    tuple val(name), path(fits_files), val(freq), val(dur), val(ndms_job), val(ddplans), val(cost)
 
     output:
     tuple val(name), path("*ACCEL_${params.zmax}"), path("*.inf"), path("*.singlepulse"), path('*.cand')
@@ -207,21 +229,34 @@ process search_dd_fft_acc {
         echo "Performing dedispersion with"
         echo "    dm_min: \${dm_min}, dm_max: \${dm_max}, dm_step: \${dm_step}"
         echo "    ndm: \${ndm}, timeres: \${timeres}, downsamp: \${downsamp}, nsub: \${nsub},"
-        prepsubband -ncpus ${task.cpus} -lodm \${dm_min} -dmstep \${dm_step} -numdms \${ndm} -zerodm -nsub \${nsub} \
+        if [ "${params.dedisperse_engine}" == "fdmt" ]; then
+            dedisperse_psrfits.py -m fdmt -j ${task.cpus} -d "\${ddplan}" --zerodm --numout \${numout} -o ${name} *.fits
+        else
+            prepsubband -ncpus ${task.cpus} -lodm \${dm_min} -dmstep \${dm_step} -numdms \${ndm} -zerodm -nsub \${nsub} \
 -downsamp \${downsamp} -numout \${numout} -o ${name} *.fits
+        fi
     done
 
-    printf "\\n#Performing the FFTs at \$(date +"%Y-%m-%d_%H:%m:%S") -----------------------------------------------------\\n"
-    realfft *dat
-    printf "\\n#Performing the periodic search at \$(date +"%Y-%m-%d_%H:%m:%S") ------------------------------------------\\n"
-    for i in \$(ls *.dat); do
-        # Somtimes this has a 255 error code when data.pow == 0 so ignore it
-        accelsearch -ncpus ${task.cpus} -zmax ${params.zmax} -flo ${min_f_harm} -fhi ${max_f_harm} -numharm ${params.nharm} \${i%.dat}.fft || true
-    done
+    if [ "${params.periodicity_engine}" == "fft" ] && [ "${params.zmax}" == "0" ]; then
+        printf "\\n#Performing the periodic search at \$(date +"%Y-%m-%d_%H:%m:%S") ------------------------------------------\\n"
+        periodicity_search.py -j ${task.cpus} --numharm ${params.nharm} --flo ${min_f_harm} --fhi ${max_f_harm} *.dat
+    else
+        printf "\\n#Performing the FFTs at \$(date +"%Y-%m-%d_%H:%m:%S") -----------------------------------------------------\\n"
+        realfft *dat
+        printf "\\n#Performing the periodic search at \$(date +"%Y-%m-%d_%H:%m:%S") ------------------------------------------\\n"
+        for i in \$(ls *.dat); do
+            # Somtimes this has a 255 error code when data.pow == 0 so ignore it
+            accelsearch -ncpus ${task.cpus} -zmax ${params.zmax} -flo ${min_f_harm} -fhi ${max_f_harm} -numharm ${params.nharm} \${i%.dat}.fft || true
+        done
+    fi
 
     printf "\\n#Performing the single pulse search at \$(date +"%Y-%m-%d_%H:%m:%S") ------------------------------------------\\n"
-    ${params.presto_python_load}
-    single_pulse_search.py -p -m 0.5 -b *.dat
+    if [ "${params.single_pulse_engine}" == "boxcar" ]; then
+        single_pulse_boxcar.py -p -m 0.5 -b -j ${task.cpus} *.dat
+    else
+        ${params.presto_python_load}
+        single_pulse_search.py -p -m 0.5 -b *.dat
+    fi
     printf "\\n#Finished at \$(date +"%Y-%m-%d_%H:%m:%S") ----------------------------------------------------------------\\n"
     """
 }
@@ -322,14 +357,15 @@ process search_dd {
     label 'cpu'
     label 'presto_search'
 
-    time { search_time_estimate(dur, params.max_work_function) }
-    memory { "${task.attempt * 30} GB"}
+    tag "${name} ${search_cost_tag(dur, ddplans, false)}"
+    time { search_time_estimate(dur, params.max_work_function, cost.t, task.attempt) }
+    memory { search_memory_estimate(cost.m, task.attempt) }
     maxRetries 2
     errorStrategy 'retry'
     maxForks params.max_search_jobs
 
     input:
-    tuple val(name), path(fits_files), val(freq), val(dur), val(ndms_job), val(ddplans)
+    tuple val(name), path(fits_files), val(freq), val(dur), val(ndms_job), val(ddplans), val(cost)
 
     output:
     tuple val(name), path("*.inf"), path("*.singlepulse")
@@ -352,13 +388,21 @@ process search_dd {
         echo "Performing dedispersion with"
         echo "    dm_min: \${dm_min}, dm_max: \${dm_max}, dm_step: \${dm_step}"
         echo "    ndm: \${ndm}, timeres: \${timeres}, downsamp: \${downsamp}, nsub: \${nsub},"
-        prepsubband -ncpus ${task.cpus} -lodm \${dm_min} -dmstep \${dm_step} -numdms \${ndm} -zerodm -nsub \${nsub} \
+        if [ "${params.dedisperse_engine}" == "fdmt" ]; then
+            dedisperse_psrfits.py -m fdmt -j ${task.cpus} -d "\${ddplan}" --zerodm --numout \${numout} -o ${name} *.fits
+        else
+            prepsubband -ncpus ${task.cpus} -lodm \${dm_min} -dmstep \${dm_step} -numdms \${ndm} -zerodm -nsub \${nsub} \
 -downsamp \${downsamp} -numout \${numout} -o ${name} *.fits
+        fi
     done
 
     printf "\\n#Performing the single pulse search at \$(date +"%Y-%m-%d_%H:%m:%S") ------------------------------------------\\n"
-    ${params.presto_python_load}
-    single_pulse_search.py -p -m 0.5 -b *.dat
+    if [ "${params.single_pulse_engine}" == "boxcar" ]; then
+        single_pulse_boxcar.py -p -m 0.5 -b -j ${task.cpus} *.dat
+    else
+        ${params.presto_python_load}
+        single_pulse_search.py -p -m 0.5 -b *.dat
+    fi
     printf "\\n#Finished at \$(date +"%Y-%m-%d_%H:%m:%S") ----------------------------------------------------------------\\n"
     """
 }
@@ -392,21 +436,27 @@ workflow pulsar_search {
     take:
         name_fits_files // [val(candidateName_obsid_pointing), path(fits_files)]
     main:
-        // Grab meta data from the fits file
-        get_freq_and_dur( name_fits_files ) // [ name, fits_file, freq, dur ]
+        // The pointings of an observation share their meta data and DM plan so only get them
+        // from the first fits file of each plan group (see plan_group)
+        group_name_fits = name_fits_files.map{ name, fits -> [ plan_group(name, fits), name, fits ] }
+        get_freq_and_dur( group_name_fits.unique{ it[0] }.map{ group, name, fits -> [ group, fits ] } ) // [ group, freq_dur.csv ]
 
         // Grab the meta data out of the CSV
-        name_fits_freq_dur = get_freq_and_dur.out.map { name, fits, meta -> [ name, fits, meta.splitCsv()[0][0], meta.splitCsv()[0][1] ] }
-        ddplan( name_fits_freq_dur )
-        // ddplan's output format is [ name, fits_file, centrefreq(MHz), duration(s), DDplan_file ]
+        group_freq_dur = get_freq_and_dur.out.map { group, meta -> [ group, meta.splitCsv()[0][0], meta.splitCsv()[0][1] ] }
+        name_fits_freq_dur = group_name_fits.combine( group_freq_dur, by: 0 ).map{ group, name, fits, freq, dur -> [ name, fits, freq, dur ] }
+        ddplan( group_freq_dur, 'search_dd_fft_acc' )
+        // ddplan's output format is [ group, centrefreq(MHz), duration(s), DDplan_files ]
+        // so give each pointing its group's DDplan files [ name, fits_file, centrefreq(MHz), duration(s), DDplan_files ]
+        name_fits_freq_dur_ddplan = group_name_fits.combine( ddplan.out, by: 0 ).map{ group, name, fits, freq, dur, ddplans -> [ name, fits, freq, dur, ddplans ] }
 
         // Trasponse to get a DM plan file each row/job then split the csv to get the DDplan
         // Also using groupKey so that future groupTuple will have the size of the total number of DMs
-        // The DDplan file has the name format DDplan_{i}_a{total_dm_steps}_n{local_dm_steps}.txt
+        // The DDplan file has the name format DDplan_{i}_a{total_dm_steps}_n{local_dm_steps}.txt (see ddplan_file_info)
         search_dd_fft_acc(
-            ddplan.out.transpose()
+            name_fits_freq_dur_ddplan.transpose( by: 4 )
             .map { name, fits, freq, dur, ddplan ->
-                [ groupKey(name, ddplan.baseName.split("_n")[0].split("_a")[-1].toInteger() ), fits, freq, dur, ddplan.baseName.split("_n")[-1], ddplan.splitCsv() ]
+                def info = ddplan_file_info(ddplan)
+                [ groupKey(name, info.a.toInteger() ), fits, freq, dur, info.n, ddplan.splitCsv(), info ]
             }
         )
         // Output format: [ name,  ACCEL_summary, presto_inf, single_pulse, periodic_candidates ]
@@ -450,19 +500,24 @@ workflow single_pulse_search {
     take:
         name_fits_files // [val(candidateName_obsid_pointing), path(fits_files)]
     main:
-        // Grab meta data from the fits file
-        get_freq_and_dur( name_fits_files ) // [ name, fits_file, freq, dur ]
+        // The pointings of an observation share their meta data and DM plan so only get them
+        // from the first fits file of each plan group (see plan_group)
+        group_name_fits = name_fits_files.map{ name, fits -> [ plan_group(name, fits), name, fits ] }
+        get_freq_and_dur( group_name_fits.unique{ it[0] }.map{ group, name, fits -> [ group, fits ] } ) // [ group, freq_dur.csv ]
 
         // Grab the meta data out of the CSV
-        name_fits_freq_dur = get_freq_and_dur.out.map { name, fits, meta -> [ name, fits, meta.splitCsv()[0][0], meta.splitCsv()[0][1] ] }
-        ddplan( name_fits_freq_dur )
-        // ddplan's output format is [ name, fits_file, centrefreq(MHz), duration(s), DDplan_file ]
+        group_freq_dur = get_freq_and_dur.out.map { group, meta -> [ group, meta.splitCsv()[0][0], meta.splitCsv()[0][1] ] }
+        ddplan( group_freq_dur, 'search_dd' )
+        // ddplan's output format is [ group, centrefreq(MHz), duration(s), DDplan_files ]
+        // so give each pointing its group's DDplan files [ name, fits_file, centrefreq(MHz), duration(s), DDplan_files ]
+        name_fits_freq_dur_ddplan = group_name_fits.combine( ddplan.out, by: 0 ).map{ group, name, fits, freq, dur, ddplans -> [ name, fits, freq, dur, ddplans ] }
 
         // so split the csv to get the DDplan and transpose to make a job for each row of the plan
         search_dd(
-            ddplan.out.transpose()
+            name_fits_freq_dur_ddplan.transpose( by: 4 )
             .map { name, fits, freq, dur, ddplan ->
-                [ groupKey(name, ddplan.baseName.split("_n")[0].split("_a")[-1].toInteger() ), fits, freq, dur, ddplan.baseName.split("_n")[-1], ddplan.splitCsv() ]
+                def info = ddplan_file_info(ddplan)
+                [ groupKey(name, info.a.toInteger() ), fits, freq, dur, info.n, ddplan.splitCsv(), info ]
             }
         )
         // Output format: [ name,  presto_inf, single_pulse ]
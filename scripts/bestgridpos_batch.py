@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import json
+import sys
+
+from mwa_search.localise import localise_many, find_candidate_files, read_detections, obs_fwhm,\
+                                obsid_from_filename
+
+OUTPUT_COLUMNS = ["candidate", "obsid", "pointing", "ra", "dec", "ra_err", "dec_err", "predicted_sn",
+                  "best_pointing", "best_sn", "n_detections", "n_fit", "fwhm"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""
+    Calculate the best position of many candidates from the signal to noise of their detections in one process.
+    Each directory of the tree that contains bestprof or posn files is a candidate.
+    """)
+    parser.add_argument('-d', '--base_dir', type=str, required=True,
+            help='The base directory of the tree of candidate directories of bestprof or posn files.')
+    parser.add_argument('-o', '--obsid', type=str,
+            help='The observation ID of all the candidates. If not given it is read from the start of '
+                 'each candidate\'s file names (<obsid>_...).')
+    parser.add_argument('--type', type=str, choices=['bestprof', 'posn'], default=None,
+            help='Only use bestprof or posn (pdmp) files. Default: posn files if a directory has any, '
+                 'otherwise bestprof files')
+    parser.add_argument('-r', '--res', type=float, default=None,
+            help='The resolution of the search in degrees. Default: FWHM/60')
+    parser.add_argument('-fr', '--fwhm_ra', type=float,
+            help='Manualy give the RA FWHM in degrees instead of it estimating it from the array phase and frequency')
+    parser.add_argument('-fd', '--fwhm_dec', type=float,
+            help='Manualy give the declination FWHM in degrees instead of it estimating it from the array phase and frequency')
+    parser.add_argument('--search', type=str, choices=['grid', 'multires'], default='grid',
+            help='The localisation search (see bestgridpos.py). Default: grid')
+    parser.add_argument('--n_best', type=int, default=4,
+            help='The number of best positions refined at each level of the multires search. Default: 4')
+    parser.add_argument('--polish', action='store_true',
+            help='Fit the positions continuously (with scipy least squares) and output their uncertainty')
+    parser.add_argument('--fast', action='store_true',
+            help='Calculate the residuals with numpy, which is about 7.5 times faster but not bit for bit '
+                 'identical to the original loop (they differ by at most about 1e-13)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+            help='The number of processes. Default: the number of CPUs')
+    parser.add_argument('--out', type=str, default='predicted_positions.csv',
+            help='The output file of the predicted positions and SNs. If it ends in .json it is written '
+                 'as JSON, otherwise as a CSV. Default: predicted_positions.csv')
+    args=parser.parse_args()
+
+    candidate_files = find_candidate_files(args.base_dir, file_type=args.type)
+    if not candidate_files:
+        print("No bestprof or posn files found in {}. Exiting.".format(args.base_dir))
+        sys.exit(1)
+
+    candidate_obsids = {}
+    for cand, files in candidate_files.items():
+        obsid = args.obsid or obsid_from_filename(files[0])
+        if obsid is None:
+            print("Unable to get the obsid of {} from its file names, please use --obsid. Exiting.".format(cand))
+            sys.exit(1)
+        candidate_obsids[cand] = obsid
+    candidate_detections = {cand: read_detections(files) for cand, files in candidate_files.items()}
+    print("Localising {} candidates from {} observations".format(len(candidate_detections),
+                                                                  len(set(candidate_obsids.values()))))
+
+    results = localise_many(candidate_detections, lambda cand: obs_fwhm(candidate_obsids[cand]),
+                            workers=args.workers, res=args.res,
+                            given_fwhm_ra=args.fwhm_ra, given_fwhm_dec=args.fwhm_dec,
+                            search=args.search, n_best=args.n_best, polish=args.polish, exact=not args.fast)
+    rows = [dict(result, candidate=cand, obsid=candidate_obsids[cand]) for cand, result in results.items()]
+
+    if args.out.endswith(".json"):
+        with open(args.out, "w") as outfile:
+            json.dump([{column: row[column] for column in OUTPUT_COLUMNS} for row in rows], outfile, indent=4)
+    else:
+        with open(args.out, "w") as outfile:
+            spamwriter = csv.DictWriter(outfile, fieldnames=OUTPUT_COLUMNS, extrasaction='ignore')
+            spamwriter.writeheader()
+            spamwriter.writerows(rows)
+    print("Localised {} of {} candidates. Written to {}".format(len(rows), len(candidate_detections), args.out))
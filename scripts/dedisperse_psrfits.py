@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import logging
+
+from mwa_search.dedisperse import dedisperse_files, DM_ENGINES
+
+logger = logging.getLogger(__name__)
+
+
+def parse_ddplan_line(text):
+    """Converts a dd_plan line as the pipeline passes it (such as "[1.0,2.0,0.02,50,0.1,1,32,0.5]") to a list"""
+    values = text.strip().strip("[]").replace(" ", "").split(",")
+    if len(values) < 7:
+        raise argparse.ArgumentTypeError("A dd_plan line needs at least 7 values, not {}".format(text))
+    return [float(value) for value in values]
+
+
+if __name__ == "__main__":
+    loglevels = dict(DEBUG=logging.DEBUG,
+                     INFO=logging.INFO,
+                     WARNING=logging.WARNING,
+                     ERROR=logging.ERROR)
+    parser = argparse.ArgumentParser(description="""
+    Dedisperses PSRFITS files with an FDMT (or a brute force reference) and writes PRESTO .dat and .inf files
+    for realfft, accelsearch and prepfold. Use it instead of prepsubband for narrow DM ranges.
+    """)
+    parser.add_argument('fits_files', type=str, nargs='+',
+            help='The PSRFITS files of the observation.')
+    parser.add_argument('-d', '--ddplan', type=parse_ddplan_line, nargs='+', required=True,
+            help='The dd_plan lines "low_DM,high_DM,DM_step,nDM_step,timeres,downsample,nsub" to dedisperse.')
+    parser.add_argument('-o', '--out', type=str, required=True,
+            help='The start of the output file names (like prepsubband\'s -o).')
+    parser.add_argument('--numout', type=int,
+            help='The number of output samples. Default: the number of downsampled samples')
+    parser.add_argument('--zerodm', action='store_true',
+            help='Remove the zero DM signal before dedispersing (like prepsubband\'s -zerodm).')
+    parser.add_argument('-m', '--method', type=str, default='fdmt', choices=DM_ENGINES,
+            help='The dedispersion engine. brute dedisperses through the line\'s subbands like prepsubband. '
+                 'Default: fdmt')
+    parser.add_argument('-j', '--ncpus', type=int, default=1,
+            help='The number of processes dedispersing blocks of time. Default: 1')
+    parser.add_argument('--block_size', type=int,
+            help='The number of input (not downsampled) samples each process reads at once. Each process '
+                 'holds about 16 * block_size * nchan bytes. Default: 65536')
+    parser.add_argument('--dmprec', type=int, default=2,
+            help='The number of decimal places of the DMs in the file names. Default: 2')
+    parser.add_argument("-L", "--loglvl", type=str, default="INFO",
+            help="Logger verbosity level. Default: INFO", choices=loglevels.keys())
+    args = parser.parse_args()
+
+    logger.setLevel(loglevels[args.loglvl])
+    ch = logging.StreamHandler()
+    ch.setLevel(loglevels[args.loglvl])
+    formatter = logging.Formatter('%(asctime)s  %(filename)s  %(name)s  %(lineno)-4d  %(levelname)-9s :: %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+    logger.propagate = False
+
+    for ddplan_line in args.ddplan:
+        try:
+            basenames = dedisperse_files(args.fits_files, ddplan_line, args.out, method=args.method,
+                                         numout=args.numout, zerodm=args.zerodm, block_size=args.block_size,
+                                         workers=args.ncpus, dm_precision=args.dmprec)
+        except (OSError, ValueError) as e:
+            logger.error("Unable to dedisperse {}: {}".format(ddplan_line, e))
+            sys.exit(1)
+        logger.info("Wrote {} time series for the DMs {} to {}".format(len(basenames), ddplan_line[0], ddplan_line[1]))
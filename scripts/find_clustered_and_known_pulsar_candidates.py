@@ -13,8 +13,11 @@ import matplotlib.pyplot as plt
 from matplotlib.colors import LogNorm
 from matplotlib.ticker import ScalarFormatter, LogFormatter
 
-import astropy.units as u
-from astropy.coordinates import SkyCoord, search_around_sky
+from astropy.coordinates import angular_separation
+
+from mwa_search.sky_index import SkyIndex
+from mwa_search.pointings import parse_ra_dec
+from mwa_search.bestprof import read_bestprof, load_many
 
 
 def find_clustered_cands(cand_data,
@@ -53,10 +56,11 @@ def find_clustered_cands(cand_data,
 
     clustered_cands = []
     #print("Making coords")
-    coords = SkyCoord(ra=ra, dec=dec, unit=(u.hourangle,u.deg))
+    rads, decds = parse_ra_dec(ra, dec)
     #print("Searching")
     # Check if they're within a beam width
-    idx1, idx2, sep2d, _ = search_around_sky(coords, coords, mdist*u.arcminute)
+    cand_index = SkyIndex(rads, decds)
+    idx1, idx2, sep2d = cand_index.search_around(rads, decds, mdist / 60.)
 
     # Check if they have the similar period and DM
     period = []
@@ -144,7 +148,10 @@ def find_known_pulsars(cand_data,
 
     query = QueryATNF().pandas
     #query.save('full_query.pkl')
-    coord_kp = SkyCoord(ra=[query["RAJ"]], dec=[query["DECJ"]], unit=(u.hourangle,u.deg))
+    # convert all the known pulsar and candidate positions to radians at once
+    kp_rads, kp_decds = parse_ra_dec(query["RAJ"], query["DECJ"])
+    kp_rars, kp_decrs = np.radians(kp_rads), np.radians(kp_decds)
+    cand_rads, cand_decds = parse_ra_dec([cand[0] for cand in cand_data], [cand[1] for cand in cand_data])
 
     # possible harmonics
     harms = list(range(2,32))
@@ -158,7 +165,7 @@ def find_known_pulsars(cand_data,
 
     known_pulsars = []
     no_known_pulsars = []
-    for cand in cand_data:
+    for ci, cand in enumerate(cand_data):
         RA, Dec, period, DM, SN, file_loc = cand
         period = period / 1000. # convert to s
         kp = False
@@ -190,15 +197,15 @@ def find_known_pulsars(cand_data,
             continue
 
         # Check if it's a harmoinc
-        coord_cand = SkyCoord(ra=RA, dec=Dec, unit=(u.hourangle,u.deg))
+        kp_seps = np.degrees(angular_separation(kp_rars, kp_decrs,
+                                                np.radians(cand_rads[ci]), np.radians(cand_decds[ci])))
         for i in range(len(query)):
             jname = query["PSRJ"][i]
             kp0 = query["P0"][i]
             kdm = query["DM"][i]
 
             # Find pulsars within distance
-            coord_kp = SkyCoord(ra=[query["RAJ"][i]], dec=[query["DECJ"][i]], unit=(u.hourangle,u.deg))
-            if coord_kp.separation(coord_cand) < mdist*u.deg:
+            if kp_seps[i] < mdist:
                 cand_harm = kp0 / period
                 # Check the pulsars that are within the distance if they have a fraction of the candidate period
                 for pf in possible_fractions:
@@ -230,23 +237,31 @@ def get_from_bestprof(file_loc):
     -------
     [ra, dec, period, dm, sigma, file_loc]: list
     """
+    header, _ = read_bestprof(file_loc)
+    return [header["ra"], header["dec"], header["p_topo"], header["dm"], header["sn"], file_loc]
 
-    with open(file_loc,"r") as bestprof:
-        lines = bestprof.readlines()
-
-        # Get a pointing from the input fits file name
-        ra, dec = lines[0].split("_ch")[0].split("_")[-2:]
-
-        # Get period and DM
-        period = lines[15][22:-1]
-        period = float(period.split(' +/- ')[0])
-        dm = float(lines[14][22:-1])
 
-        # Get sigma
-        sigma = float(lines[13].split("~")[-1].split(" sigma")[0])
+def get_from_bestprofs(file_locs, workers=None, index=None):
+    """
+    Get info from many bestprof files in parallel
 
+    Parameters
+    ----------
+    file_locs: list
+        The paths to the bestprof files
+    workers: int
+        OPTIONAL - The number of processes used to read the files. Default: the number of CPUs
+    index: str
+        OPTIONAL - The path of a bestprof index so unchanged files are not read again. Default: None
 
-    return [ra, dec, period, dm, sigma, file_loc]
+    Returns
+    -------
+    cand_data: list
+        [ra, dec, period, dm, sigma, file_loc] of each file that could be read
+    """
+    table = load_many(file_locs, workers=workers, index=index)
+    return [list(row) for row in zip(table["ra"].tolist(), table["dec"].tolist(), table["p_topo"].tolist(),
+                                     table["dm"].tolist(), table["sn"].tolist(), table["path"].tolist())]
 
 
 if __name__ == "__main__":
@@ -260,6 +275,10 @@ if __name__ == "__main__":
                            help='A wilcard expression used to find all the bestprofs files. Should be surround by double quotes.')
     cand_input.add_argument('-c', '--cand_file', type=str,
                            help='Candidate input file (generated by Sammy).')
+    cand_input.add_argument('-j', '--workers', type=int, default=None,
+                           help='The number of processes used to read the bestprof files. Default: the number of CPUs')
+    cand_input.add_argument('--bestprof_index', type=str,
+                           help='An index file of the read bestprof files so unchanged files are not read again on later runs.')
 
     clust_par = parser.add_argument_group('Clustering Parameters')
     clust_par.add_argument('-cd', '--cdist', type=float, default=18.56,
@@ -316,16 +335,10 @@ if __name__ == "__main__":
         if len(bestprof_files) == 0:
             print("No bestprof files found in /data/nswainston/SMART_cand_sorting/{}/positive_detections/*bestprof".format(args.obsid))
             sys.exit(0)
-        cand_data = []
-        for bf in bestprof_files:
-            cand_data.append(get_from_bestprof(bf))
+        cand_data = get_from_bestprofs(bestprof_files, workers=args.workers, index=args.bestprof_index)
     elif args.glob:
         # Read in all wildcard candidates
-        cand_data = []
-        #for bf in args.glob:
-        #print(glob.glob(args.glob))
-        for bf in glob.glob(args.glob):
-            cand_data.append(get_from_bestprof(bf))
+        cand_data = get_from_bestprofs(glob.glob(args.glob), workers=args.workers, index=args.bestprof_index)
     elif args.cand_file:
         with open(args.cand_file) as csvfile:
             spamreader = csv.reader(csvfile, delimiter=' ')
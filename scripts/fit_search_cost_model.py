@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import logging
+
+from mwa_search.cost_model import fit_cost_models, save_cost_models, load_cost_model, make_synthetic_trace, CostModel
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    loglevels = dict(DEBUG=logging.DEBUG,
+                     INFO=logging.INFO,
+                     WARNING=logging.WARNING,
+                     ERROR=logging.ERROR)
+    parser = argparse.ArgumentParser(description="""
+    Fits the walltime and memory models of the search jobs from the Nextflow trace files of a cluster.
+    The output JSON can be given to the pulsar search pipeline with --cost_model.
+    """)
+    parser.add_argument('-t', '--traces', type=str, nargs='*', default=[],
+            help='The Nextflow trace files (made with the trace fields in nextflow.config) from one cluster.')
+    parser.add_argument('-c', '--cluster', type=str,
+            help='The name of the cluster the trace files are from, recorded in the output.')
+    parser.add_argument('-q', '--quantile', type=float, default=0.95,
+            help='The fraction of jobs the predicted walltime and memory should be above. Default: 0.95')
+    parser.add_argument('--min_jobs', type=int, default=10,
+            help='The minimum number of jobs of a process needed to fit its model. Default: 10')
+    parser.add_argument('-o', '--out', type=str, default='search_cost_model.json',
+            help='The output JSON file of the fitted models. Default: search_cost_model.json')
+    parser.add_argument('--synthetic', type=str,
+            help='Instead of fitting, write a synthetic trace file with this name (from the model in --out if it '
+                 'exists or a default model) which can be used to check the fit.')
+    parser.add_argument("-L", "--loglvl", type=str, default="INFO",
+            help="Logger verbosity level. Default: INFO", choices=loglevels.keys())
+    args = parser.parse_args()
+
+    logger.setLevel(loglevels[args.loglvl])
+    ch = logging.StreamHandler()
+    ch.setLevel(loglevels[args.loglvl])
+    formatter = logging.Formatter('%(asctime)s  %(filename)s  %(name)s  %(lineno)-4d  %(levelname)-9s :: %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+    logger.propagate = False
+
+    if args.synthetic:
+        try:
+            model = load_cost_model(args.out)
+        except (OSError, ValueError):
+            model = CostModel({"const": 60., "dur": 0.05, "dur_lines": 0.02, "subband": 2e-5,
+                               "dedisp": 1e-7, "samples": 1e-5, "accel": 2e-9},
+                              {"const": 500., "max_samples": 1., "max_accel": 0.01, "max_dedisp": 0.5})
+        make_synthetic_trace(args.synthetic, model)
+        logger.info("Synthetic trace written to {}".format(args.synthetic))
+        sys.exit(0)
+
+    if not args.traces:
+        logger.error("No trace files given. Exiting.")
+        sys.exit(1)
+    models = fit_cost_models(args.traces, cluster=args.cluster, quantile=args.quantile, min_jobs=args.min_jobs)
+    if not models:
+        logger.error("No search jobs with cost features found in the trace files. Exiting.")
+        sys.exit(1)
+    for process, model in models.items():
+        logger.info("{}: fitted to {} jobs, walltime margin {:.2f}, memory margin {:.2f}".format(
+                    process, model.n_jobs, model.walltime_margin, model.memory_margin))
+    save_cost_models(models, args.out)
+    logger.info("Cost models written to {}".format(args.out))
@@ -1,25 +1,345 @@
 #!/usr/bin/env python3
 import argparse
-from astropy.coordinates import SkyCoord,EarthLocation,AltAz
 from astropy.time import Time
-import astropy.units as u
-from math import cos
 import numpy as np
+import json
+import os
 
 from matplotlib import use
 use('Agg')
 import matplotlib.pyplot as plt
-from matplotlib import patches
+from matplotlib.collections import EllipseCollection, PatchCollection
 
 # vcstools imports
 import vcstools.metadb_utils as meta
 from vcstools.catalogue_utils import get_psrcat_ra_dec
-from vcstools.pointing_utils import sex2deg, format_ra_dec
+from vcstools.pointing_utils import format_ra_dec
 from vcstools.beam_calc import get_beam_power_over_time
 
 # mwa_search imports
 from mwa_search.obs_tools import getTargetAZZA
-from mwa_search.grid_tools import get_grid
+from mwa_search.grid_tools import get_grid, iter_grid, iter_coverage_grid
+from mwa_search.pointings import parse_ra_dec, parse_pointings, format_ra, format_dec
+from mwa_search.grid_cache import GridCache, NpyWriter, grid_cache_key, iter_cached_blocks
+
+
+def format_pointings(rads, decds):
+    """
+    Formats arrays of RAs and Decs in degrees into pointing strings
+
+    Returns
+    -------
+    ras, decs: list
+        Lists of the RAs in the format 'hh:mm:ss.ss' and Decs in the format 'dd:mm:ss.ss'
+    """
+    ras = format_ra(rads)
+    decs = format_dec(decds)
+    return ras, decs
+
+
+def ra_dec_range_cut(pointings, ra_range, dec_range):
+    """Removes the pointings (an (N, 2) array of RAs and Decs in degrees) outside of the RA and Dec ranges"""
+    in_range = (dec_range[0] < pointings[:, 1]) & (pointings[:, 1] < dec_range[1]) & \
+               (ra_range[0]  < pointings[:, 0]) & (pointings[:, 0] < ra_range[1])
+    return pointings[in_range]
+
+
+def tile_beam_power_func(obs_metadata):
+    """
+    Makes a function that calculates the maximum tile beam power over the observation
+    of an (N, 2) array of RAs and Decs in degrees
+
+    Parameters
+    ----------
+    obs_metadata: list
+        The observation metadata in the format of vcstools.metadb_utils.get_common_obs_metadata
+
+    Returns
+    -------
+    power_func: function
+        Returns the (N,) maximum power of each pointing
+    """
+    def power_func(pointings):
+        names_ra_dec = np.column_stack((np.full(len(pointings), "name"), pointings))
+        power = get_beam_power_over_time(
+            names_ra_dec,
+            common_metadata=obs_metadata,
+            degrees=True,
+        )
+        return np.amax(power, axis=1)
+    return power_func
+
+
+def tile_beam_cut(pointing_blocks, obs_metadata):
+    """
+    Removes the pointings of each block that are outside the half power point of the tile beam
+    by calculating the power of every pointing
+
+    The grid is centred on the observation's pointing so the half power is taken from
+    the peak of the first (innermost) block that contains pointings.
+
+    Parameters
+    ----------
+    pointing_blocks: iterable
+        (N, 2) arrays of RAs and Decs in degrees such as the output of iter_grid
+    obs_metadata: list
+        The observation metadata in the format of vcstools.metadb_utils.get_common_obs_metadata
+
+    Yields
+    ------
+    pointings: numpy.array
+        The (N, 2) arrays of RAs and Decs in degrees within the tile beam
+    """
+    power_func = tile_beam_power_func(obs_metadata)
+    tFWHM = None
+    for pointings in pointing_blocks:
+        if len(pointings) == 0:
+            continue
+        power = power_func(pointings)
+        if tFWHM is None:
+            tFWHM = np.amax(power)/2. #assumed half power point of the tile beam
+        yield pointings[power > tFWHM]
+
+
+def cache_grid(pointing_blocks, cache, key, params):
+    """
+    Passes through blocks of pointings, writing each to the grid cache. The entry is added once the last block is done
+
+    Parameters
+    ----------
+    pointing_blocks: iterable
+        (N, 2) arrays of RAs and Decs in degrees
+    cache: mwa_search.grid_cache.GridCache
+        The cache to store the pointings in
+    key: str
+        The cache key from mwa_search.grid_cache.grid_cache_key
+    params: dict
+        The parameters used to make the key
+
+    Returns
+    -------
+    pointing_blocks: generator
+        The input (N, 2) arrays of RAs and Decs in degrees
+    """
+    print("Saving the grid in the cache ({0}) as it is generated".format(key))
+    return cache.put_blocks(key, "pointings", pointing_blocks, row_shape=(2,), params=params)
+
+
+def plot_grid(rads, decds, fwhms, plot_file, aitoff=False, add_text=False,
+              pulsar_pos=None, plot_centre=None, plot_radius=2., plot_budget=20000):
+    """
+    Plots the beams of a grid of pointings.
+
+    All the beams are drawn as a single EllipseCollection (or PatchCollection for aitoff)
+    instead of an artist per beam so large grids plot quickly.
+
+    Parameters
+    ----------
+    rads, decds: numpy.array
+        The RAs and Decs of the pointings in degrees
+    fwhms: list
+        (FWHM at zenith in radians, colour) of each set of beams to draw
+    plot_file: str
+        The output file name
+    aitoff: bool
+        OPTIONAL - Plot in a mollweide projection. Default: False
+    add_text: bool
+        OPTIONAL - Label each beam with its pointing. Default: False
+    pulsar_pos: tuple
+        OPTIONAL - The (RAs, Decs) of pulsars to mark in degrees. Default: None
+    plot_centre: tuple
+        OPTIONAL - Only plot within plot_radius of this (RA, Dec) in degrees. Default: None
+    plot_radius: float
+        OPTIONAL - The radius (in degrees) to plot around plot_centre. Default: 2
+    plot_budget: int
+        OPTIONAL - The maximum number of beams and labels to draw. Above this the beams are
+        decimated and the labels are not drawn. If 0 there is no limit. Default: 20000
+    """
+    plt.rc('axes', labelsize=20)
+    plt.rc('xtick', labelsize=14)
+    plt.rc('ytick', labelsize=14)
+    fig = plt.figure(figsize=(7, 7))
+    if aitoff:
+        ax = fig.add_subplot(111, projection='mollweide')
+        rads = -(np.radians(np.array(rads)))+ np.pi
+        decds = np.radians(np.array(decds))
+    else:
+        ax = fig.add_subplot(111)
+        ax.set_aspect('equal')
+    ax.set_xlabel("Right Acension (degrees)")
+    ax.set_ylabel("Declination (degrees)")
+
+    # Only draw the beams of every nth pointing if there are too many
+    step = 1
+    if plot_budget and len(rads) > plot_budget:
+        step = int(np.ceil(len(rads) / plot_budget))
+        print("Only drawing every {0} beams of the {1} pointings to keep under the plot budget of {2}".format(
+              step, len(rads), plot_budget))
+    beam_rads  = rads[::step]
+    beam_decds = decds[::step]
+    for fwhm, colour in fwhms:
+        if aitoff:
+            fwhm_circles = fwhm/np.cos(beam_decds) / 2.
+            beams = PatchCollection([plt.Circle((r, d), c) for r, d, c in zip(beam_rads, beam_decds, fwhm_circles)],
+                                    edgecolor='r', lw=0.1, facecolor='none')
+        else:
+            fwhm_vert = np.degrees(fwhm/np.cos(np.radians(beam_decds + 26.7))**2)
+            fwhm_horiz = np.degrees(fwhm/np.cos(np.radians(beam_decds)))
+            beams = EllipseCollection(fwhm_horiz, fwhm_vert, np.zeros(len(beam_rads)), units='xy',
+                                      offsets=np.column_stack((beam_rads, beam_decds)),
+                                      transOffset=ax.transData,
+                                      linewidths=0.3, facecolors='none', edgecolors=colour)
+        beams.set_rasterized(True)
+        # The mollweide projection has fixed limits so don't spend time transforming every beam to find them
+        ax.add_collection(beams, autolim=not aitoff)
+    if add_text and not aitoff:
+        if plot_budget and len(rads) > plot_budget:
+            print("Not labelling the {0} pointings as it is above the plot budget of {1}".format(
+                  len(rads), plot_budget))
+        else:
+            ras, decs = format_pointings(rads, decds)
+            for rad, decd, raj, decj in zip(rads, decds, ras, decs):
+                ax.text(rad, decd, raj + "_" + decj, fontsize=4, ha='center', va='center')
+    ax.scatter(rads, decds, s=0.1, c='black', rasterized=True)
+
+    if pulsar_pos is not None:
+        ax.scatter(pulsar_pos[0], pulsar_pos[1], s=15, color ='r', zorder=100)
+
+    if plot_centre is not None:
+        ax.set_xlim([plot_centre[0]-plot_radius, plot_centre[0]+plot_radius])
+        ax.set_ylim([plot_centre[1]-plot_radius, plot_centre[1]+plot_radius])
+    elif not aitoff:
+        ax.autoscale_view()
+    fig.savefig(plot_file, bbox_inches='tight', dpi=300)
+    plt.close(fig)
+
+
+def write_manifest(out_file_name, manifest):
+    """Writes the chunk manifest (replacing the file in one go so it is never read half written)"""
+    manifest_file = "{0}_manifest.json".format(out_file_name)
+    with open(manifest_file + ".tmp", "w") as outfile:
+        json.dump(manifest, outfile, indent=4)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+
+def write_grid_stream(pointing_blocks, out_file_name, n_pointings=None, label=None,
+                      verbose_file=False, time=None, grid_info=None, sky_index=True):
+    """
+    Formats and writes blocks of pointings as they are generated.
+    Each file of n_pointings is written as soon as it is full and recorded in
+    a JSON manifest (<out_file_name>_manifest.json) so it can be used straight away.
+    The RAs and Decs of the pointings are also appended to an index file next to the manifest
+    (<out_file_name>_sky_index.npy) which SkyIndex.from_manifest loads.
+
+    Parameters
+    ----------
+    pointing_blocks: iterable
+        (N, 2) arrays of RAs and Decs in degrees such as the output of iter_grid
+    out_file_name: str
+        The output file name (without .txt)
+    n_pointings: int
+        OPTIONAL - Number of pointings per output file. If None all pointings are written to one file
+    label: str
+        OPTIONAL - A label to put in front of the pointings (only used when n_pointings is None)
+    verbose_file: bool
+        OPTIONAL - Also write the az, za, RA and Dec in degrees (only used when n_pointings is None)
+    time: astropy.time.Time
+        OPTIONAL - The time used to calculate the az and za for the verbose_file
+    grid_info: dict
+        OPTIONAL - Information about the grid to record in the manifest
+    sky_index: bool
+        OPTIONAL - Save the RAs and Decs of the pointings to <out_file_name>_sky_index.npy. Default: True
+
+    Returns
+    -------
+    total: int
+        The total number of pointings written
+    """
+    manifest = {"grid": grid_info or {},
+                "n_pointings": n_pointings,
+                "chunks": [],
+                "total_pointings": 0,
+                "complete": False}
+    total = 0
+    chunk = []
+    index_writer = None
+    if sky_index:
+        index_file = "{0}_sky_index.npy".format(out_file_name)
+        print("Saving the sky index of the pointings in {0}".format(index_file))
+        index_writer = NpyWriter(index_file, row_shape=(2,))
+
+    def write_chunk(lines):
+        first_id = manifest["total_pointings"] + 1
+        last_id  = manifest["total_pointings"] + len(lines)
+        chunk_file = '{0}_{1}_{2}.txt'.format(out_file_name, first_id, last_id)
+        print("Recording the dec limited positons in {0}".format(chunk_file))
+        with open(chunk_file, 'w') as out_file:
+            out_file.writelines(lines)
+        manifest["chunks"].append({"file": chunk_file,
+                                   "first_id": first_id,
+                                   "last_id": last_id,
+                                   "n_pointings": len(lines)})
+        manifest["total_pointings"] = last_id
+        write_manifest(out_file_name, manifest)
+
+    single_file = None
+    if n_pointings is None:
+        print("Recording the dec limited positons in {0}.txt".format(out_file_name))
+        single_file = open('{0}.txt'.format(out_file_name),'w')
+        if verbose_file:
+            single_file.write("#ra   dec    az     za\n")
+        manifest["chunks"].append({"file": '{0}.txt'.format(out_file_name),
+                                   "first_id": 1,
+                                   "last_id": 0,
+                                   "n_pointings": 0})
+
+    for pointings in pointing_blocks:
+        if len(pointings) == 0:
+            continue
+        rads  = pointings[:, 0]
+        decds = pointings[:, 1]
+        ras, decs = format_pointings(rads, decds)
+        total += len(ras)
+        if index_writer is not None:
+            index_writer.append(pointings)
+        if single_file is None:
+            chunk += ["{0}_{1}\n".format(ra, dec) for ra, dec in zip(ras, decs)]
+            while len(chunk) >= n_pointings:
+                write_chunk(chunk[:n_pointings])
+                chunk = chunk[n_pointings:]
+            continue
+
+        if verbose_file:
+            # Convert the whole block at once
+            azs,zas,_,_ = getTargetAZZA(ras,decs,time)
+        for i in range(len(ras)):
+            if verbose_file:
+                out_line = str(ras[i])+" "+str(decs[i])+" "+str(azs[i])+" "\
+                            +str(zas[i])+" "+str(rads[i])+" "\
+                            +str(decds[i])+"\n"
+            elif label:
+                out_line = "{},{}_{}\n".format(label, ras[i], decs[i])
+            else:
+                out_line = str(ras[i])+"_"+str(decs[i])+"\n"
+            single_file.write(out_line)
+        single_file.flush()
+        manifest["chunks"][0]["last_id"] = total
+        manifest["chunks"][0]["n_pointings"] = total
+        manifest["total_pointings"] = total
+
+    if single_file is None:
+        if len(chunk) > 0:
+            write_chunk(chunk)
+    else:
+        single_file.close()
+    if index_writer is not None:
+        index_writer.close()
+        # Recorded relative to the manifest which is in the same directory
+        manifest["sky_index"] = os.path.basename(index_file)
+    manifest["complete"] = True
+    write_manifest(out_file_name, manifest)
+    return total
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="""
@@ -38,6 +358,17 @@ if __name__ == "__main__":
     parser.add_argument('-a','--all_pointings',action="store_true",help='Will calculate all the pointings within the FWHM of the observations tile beam.')
     parser.add_argument('-b', '--begin',type=int,help='Begin time of the obs for the --all_pointings options')
     parser.add_argument('-e', '--end',type=int,help='End time of the obs for the --all_pointings options')
+    parser.add_argument('--exact_tile_beam',action="store_true",
+                        help='For --all_pointings, calculate the tile beam power of every grid pointing instead of solving '
+                             'for the pointings within the tile beam from a coarse grid (only hex grids can be solved).')
+    parser.add_argument('--no_cache', '--no-cache', action="store_true",
+                        help='Do not use or update the grid cache. By default the --all_pointings grid is cached '
+                             '(by obsid, begin, end, grid type, separation, loop and FWHM) so reruns are quick.')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help='The grid cache directory. Default is $MWA_SEARCH_CACHE or ~/.cache/mwa_search/grids')
+    parser.add_argument('--cache_size', type=float, default=2.,
+                        help='The maximum size of the grid cache in GB. The least recently used grids are '
+                             'removed once it is larger. Default: 2')
     parser.add_argument('--dec_range',type=float,nargs='+',help='Dec limits: "decmin decmax". Default -90 90', default=[-90,90])
     parser.add_argument('--ra_range',type=float,nargs='+',help='RA limits: "ramin ramax". Default 0 360', default=[0,360])
     parser.add_argument('-v','--verbose_file',action="store_true",help='Creates a more verbose output file with more information than make_beam.c can handle.')
@@ -47,6 +378,15 @@ if __name__ == "__main__":
     parser.add_argument('--out_file_name', type=str, help='The output file name.')
     parser.add_argument('--add_text', action="store_true", help='Adds the pointing in text for each circle on the output plot')
     parser.add_argument('--plot_max_min', action="store_true", help='Plots the beam size at the maximum and minimum frequency')
+    parser.add_argument('--plot_budget', '--plot-budget', type=int, default=20000,
+                        help='The maximum number of beams to draw on the plot. Above this only every nth beam '
+                             'is drawn and --add_text is ignored. Use 0 for no limit. Default: 20000')
+    parser.add_argument('--no_plot', '--no-plot', action="store_true",
+                        help='Do not make the plot (for batch processing)')
+    parser.add_argument('--stream', action="store_true",
+                        help='Generate, format and write the grid a block of rings at a time so each -n file is written '
+                             'as soon as it is full and memory use stays flat. The files are listed in '
+                             '<out_file_name>_manifest.json. No plot is made.')
 
     args=parser.parse_args()
 
@@ -109,33 +449,31 @@ if __name__ == "__main__":
     elif args.pulsar:
         temp = get_psrcat_ra_dec(pulsar_list=args.pulsar)
         _, raj, decj = format_ra_dec(temp, ra_col = 1, dec_col = 2)[0]
-        coord = SkyCoord(raj, decj, unit=(u.hourangle,u.deg))
-        ra = coord.ra.radian #in radians
-        dec = coord.dec.radian
+        rads, decds = parse_ra_dec([raj], [decj])
+        ra = np.radians(rads[0]) #in radians
+        dec = np.radians(decds[0])
     elif args.pointing:
-        coord = SkyCoord(args.pointing.split("_")[0],args.pointing.split("_")[1],
-                         unit=(u.hourangle,u.deg))
-        ra = coord.ra.radian #in radians
-        dec = coord.dec.radian
+        rads, decds = parse_pointings([args.pointing])
+        ra = np.radians(rads[0]) #in radians
+        dec = np.radians(decds[0])
     else:
         print("Please use either --pointing, --pulsar or --all_pointings. Exiting.")
         quit()
 
-    #calculate grid
-    rads, decds = get_grid(ra, dec, centre_fwhm*args.fraction, args.loop, grid_type=args.type)
-
-    #remove pointings outside of ra or dec range
-    if args.dec_range != [-90,90] or args.ra_range != [0, 360]:
-        print("Removing pointings outside of ra dec ranges")
-        radls = []
-        decdls = []
-        for i in range(len(rads)):
-            if  (args.dec_range[0] < float(decds[i]) < args.dec_range[1] ) and \
-                (args.ra_range[0]  < float(rads[i]) < args.ra_range[1]):
-                    radls.append(rads[i])
-                    decdls.append(decds[i])
-        rads = radls
-        decds = decdls
+    if args.out_file_name:
+        out_file_name = args.out_file_name
+    else:
+        if args.obsid:
+            out_file_name = str(args.obsid)
+        else:
+            out_file_name = ''
+        if args.pulsar:
+            out_file_name = '{0}_{1}'.format(out_file_name, args.pulsar[0])
+        out_file_name += '_grid_positions'
+        if args.dec_range != [-90,90] or args.ra_range != [0, 360]:
+            out_file_name += '_ra_dec_limited'
+        out_file_name = '{0}_f{1}_d{2}_l{3}'.format(out_file_name, args.fraction,
+                                                    args.deg_fwhm, args.loop)
 
     if args.all_pointings:
         #calculate powers
@@ -149,179 +487,116 @@ if __name__ == "__main__":
         elif args.end:
             duration = args.end - obeg
         obs_metadata = [obs, ra, dec, duration, xdelays, centrefreq, channels]
-        names_ra_dec = []
-        for ni in range(len(rads)):
-            if float(decds[ni]) < -90.:
-                continue
-            names_ra_dec.append(["name", rads[ni], decds[ni]])
-        names_ra_dec = np.array(names_ra_dec)
-        power = get_beam_power_over_time(
-            names_ra_dec,
-            common_metadata=obs_metadata,
-            degrees=True,
-        )
-
-        #check each pointing is within the tile beam
-        radls = []
-        decdls = []
-        tFWHM = np.amax(power)/2. #assumed half power point of the tile beam
-        for ni in range(len(names_ra_dec)):
-            if max(power[ni]) > tFWHM:
-                radls.append(rads[ni])
-                decdls.append(decds[ni])
-        rads = radls
-        decds = decdls
-
-    print("Using skycord to convert ra dec")
-    #Use skycoord to get asci
-    coord = SkyCoord(rads,decds,unit=(u.deg,u.deg))
-    #unformated
-    rags_uf = coord.ra.to_string(unit=u.hour, sep=':')
-    decgs_uf = coord.dec.to_string(unit=u.degree, sep=':')
-
-    ras = []; decs = []; theta = []; phi = []
-    time = Time(float(args.obsid),format='gps')
-    print("Formating the outputs")
-    #format the ra dec strings
-    for i in range(len(rags_uf)):
-        rag = rags_uf[i]
-        decg = decgs_uf[i]
-
-        temp = format_ra_dec([[rag,decg]])
-        rag = temp[0][0]
-        decg = temp[0][1]
-
-        if args.verbose_file:
-            az,za,azd,zad = getTargetAZZA(rag,decg,time)
-        else:
-            az,za,azd,zad = [0,0,0,0]
 
-        ras.append(rag)
-        decs.append(decg)
-        theta.append(az)
-        phi.append(za)
-
-    if args.out_file_name:
-        out_file_name = args.out_file_name
+    #calculate grid
+    solve_tile_beam = args.all_pointings and not args.exact_tile_beam and args.type == 'hex'
+    solver_stats = {}
+    cached = None
+    if args.all_pointings and not args.no_cache:
+        cache = GridCache(cache_dir=args.cache_dir, max_bytes=int(args.cache_size * 1024**3))
+        cache_params = {"obsid": str(obs),
+                        "begin": args.begin,
+                        "end": args.end,
+                        "type": args.type,
+                        "grid_sep": args.deg_fwhm*args.fraction,
+                        "loop": args.loop,
+                        "deg_fwhm": args.deg_fwhm,
+                        "ra": np.degrees(ra),
+                        "dec": np.degrees(dec),
+                        "ra_range": args.ra_range,
+                        "dec_range": args.dec_range,
+                        "exact_tile_beam": not solve_tile_beam}
+        cache_key = grid_cache_key(**cache_params)
+        cached = cache.get(cache_key)
+    if cached is not None:
+        print("Using the cached grid ({0})".format(cache_key))
+        solve_tile_beam = False
+        pointing_blocks = iter_cached_blocks(cached["pointings"], block_size=args.n_pointings or 1000)
     else:
-        if args.obsid:
-            out_file_name = str(args.obsid)
+        if solve_tile_beam:
+            # Only the pointings within the tile beam are generated, using args.loop as the maximum
+            print("Solving for the pointings within the tile beam")
+            pointing_blocks = iter_coverage_grid(ra, dec, centre_fwhm*args.fraction, args.loop,
+                                                 tile_beam_power_func(obs_metadata),
+                                                 block_size=args.n_pointings or 1000,
+                                                 stats=solver_stats)
+        elif args.stream:
+            print("Streaming the grid in blocks of rings")
+            pointing_blocks = iter_grid(ra, dec, centre_fwhm*args.fraction, args.loop, grid_type=args.type,
+                                        block_size=args.n_pointings or 1000)
         else:
-            out_file_name = ''
-        if args.pulsar:
-            out_file_name = '{0}_{1}'.format(out_file_name, args.pulsar[0])
-        out_file_name += '_grid_positions'
+            pointing_blocks = [get_grid(ra, dec, centre_fwhm*args.fraction, args.loop, grid_type=args.type)]
+
+        #remove pointings outside of ra or dec range
         if args.dec_range != [-90,90] or args.ra_range != [0, 360]:
-            out_file_name += '_ra_dec_limited'
-        out_file_name = '{0}_f{1}_d{2}_l{3}'.format(out_file_name, args.fraction,
-                                                    args.deg_fwhm, args.loop)
+            print("Removing pointings outside of ra dec ranges")
+            pointing_blocks = (ra_dec_range_cut(pointings, args.ra_range, args.dec_range)
+                               for pointings in pointing_blocks)
+
+        if args.all_pointings and not solve_tile_beam:
+            #check each pointing is within the tile beam
+            pointing_blocks = tile_beam_cut(pointing_blocks, obs_metadata)
+
+        if args.all_pointings and not args.no_cache:
+            pointing_blocks = cache_grid(pointing_blocks, cache, cache_key, cache_params)
+
+    if not args.stream:
+        pointings = np.concatenate(list(pointing_blocks) or [np.empty((0, 2))])
+        pointing_blocks = [pointings]
 
     #Writing file
-    if args.n_pointings is None:
-        print("Recording the dec limited positons in {0}.txt".format(out_file_name))
-        with open('{0}.txt'.format(out_file_name),'w') as out_file:
-            if args.verbose_file:
-                out_line = "#ra   dec    az     za\n"
-                out_file.write(out_line)
-            for i in range(len(rads)):
-                if args.verbose_file:
-                    out_line = str(ras[i])+" "+str(decs[i])+" "+str(theta[i])+" "\
-                                +str(phi[i])+" "+str(rads[i])+" "\
-                                +str(decds[i])+"\n"
-                elif args.label:
-                    out_line = "{},{}_{}\n".format(args.label, ras[i], decs[i])
-                else:
-                    out_line = str(ras[i])+"_"+str(decs[i])+"\n"
-                out_file.write(out_line)
-    else:
-        ra_chunks = [ras[x:x+args.n_pointings] for x in range(0, len(ras), args.n_pointings)]
-        dec_chunks = [decs[x:x+args.n_pointings] for x in range(0, len(decs), args.n_pointings)]
-        for ci in range(len(ra_chunks)):
-            first_id = ci * args.n_pointings + 1
-            last_id  = ci * args.n_pointings + len(ra_chunks[ci])
-            print("Recording the dec limited positons in {0}_{1}_{2}.txt".format(out_file_name, first_id, last_id))
-            with open('{0}_{1}_{2}.txt'.format(out_file_name, first_id, last_id),'w') as out_file:
-                for i in range(len(ra_chunks[ci])):
-                    out_file.write("{0}_{1}\n".format(ra_chunks[ci][i], dec_chunks[ci][i]))
-
-    #matplotlib.use('Agg')
-    print("Plotting")
-    plt.rc('axes', labelsize=20)
-    plt.rc('xtick', labelsize=14)
-    plt.rc('ytick', labelsize=14)
-    fig = plt.figure(figsize=(7, 7))
-    if args.aitoff:
-        fig.add_subplot(111)
-        print("changing axis")
-        ax = plt.axes(projection='mollweide')
-        rads = -(np.radians(np.array(rads)))+ np.pi
-        decds = np.radians(np.array(decds))
+    if args.verbose_file:
+        time = Time(float(args.obsid),format='gps')
     else:
-        plt.axes().set_aspect('equal')
-        ax = plt.gca()
-        #ax.axis([325., 335., -33., -23.])
-        #ax.axis([0., 10., -75., -65.])
-
-    plt.xlabel("Right Acension (degrees)")
-    plt.ylabel("Declination (degrees)")
-
-    for i in range(len(ras)):
-        if args.aitoff:
-            fwhm_circle = centre_fwhm/cos(decds[i]) / 2.
-            circle = plt.Circle((rads[i],decds[i]),fwhm_circle,
-                                color='r', lw=0.1,fill=False)
-            ax.add_artist(circle)
-        else:
-            if args.plot_max_min:
-                # low frequency
-                lf_centre_fwhm = centre_fwhm * centrefreq / (centrefreq - 15.36)
-                fwhm_vert = np.degrees(lf_centre_fwhm/cos(np.radians(decds[i] + 26.7))**2)
-                fwhm_horiz = np.degrees(lf_centre_fwhm/cos(np.radians(decds[i])) )
-                ellipse = patches.Ellipse((rads[i],decds[i]), fwhm_horiz, fwhm_vert,
-                                            linewidth=0.3, fill=False, edgecolor='red')
-                ax.add_patch(ellipse)
-
-                # high frequency
-                hf_centre_fwhm = centre_fwhm * centrefreq / (centrefreq + 15.36)
-                fwhm_vert = np.degrees(hf_centre_fwhm/cos(np.radians(decds[i] + 26.7))**2)
-                fwhm_horiz = np.degrees(hf_centre_fwhm/cos(np.radians(decds[i])) )
-                ellipse = patches.Ellipse((rads[i],decds[i]), fwhm_horiz, fwhm_vert,
-                                            linewidth=0.3, fill=False, edgecolor='blue')
-                ax.add_patch(ellipse)
-            else:
-                fwhm_vert = np.degrees(centre_fwhm/cos(np.radians(decds[i] + 26.7))**2)
-                fwhm_horiz = np.degrees(centre_fwhm/cos(np.radians(decds[i])) )
-
-                ellipse = patches.Ellipse((rads[i],decds[i]), fwhm_horiz, fwhm_vert,
-                                            linewidth=0.3, fill=False, edgecolor='green')
-                ax.add_patch(ellipse)
-            if args.add_text:
-                ax.text(rads[i], decds[i], str(ras[i] + "_" + decs[i]), fontsize=4, ha='center', va='center')
-            #fwhm_circle = centre_fwhm/cos(np.radians(decds[i])) / 2.
-            #circle = plt.Circle((rads[i],decds[i]),np.degrees(fwhm_circle),
-            #                     color='r', lw=0.1,fill=False)
-    plt.scatter(rads,decds,s=0.1,c='black')
+        time = None
+    grid_info = {"obsid": args.obsid,
+                 "type": args.type,
+                 "fraction": args.fraction,
+                 "deg_fwhm": args.deg_fwhm,
+                 "loop": args.loop,
+                 "ra": np.degrees(ra),
+                 "dec": np.degrees(dec)}
+    npointings = write_grid_stream(pointing_blocks, out_file_name,
+                                   n_pointings=args.n_pointings,
+                                   label=args.label,
+                                   verbose_file=args.verbose_file,
+                                   time=time,
+                                   grid_info=grid_info)
+    if solve_tile_beam:
+        print("Calculated the tile beam power of {} coarse and {} boundary pointings".format(
+              solver_stats["coarse_evaluations"], solver_stats["fine_evaluations"]))
+
+    if args.stream:
+        # The full grid was never held in memory so it can't be plotted
+        print("Number of pointings: " + str(npointings))
+        exit()
+
+    rads  = pointings[:, 0]
+    decds = pointings[:, 1]
+    if args.no_plot:
+        print("Number of pointings: " + str(len(rads)))
+        exit()
 
     #add some pulsars
+    pulsar_pos = None
     if args.pulsar:
-        ra_PCAT = []
-        dec_PCAT = []
         pulsar_list = get_psrcat_ra_dec(pulsar_list = args.pulsar)
-        for pulsar in pulsar_list:
-            ra_temp, dec_temp = sex2deg(pulsar[1], pulsar[2])
-            ra_PCAT.append(ra_temp)
-            dec_PCAT.append(dec_temp)
-        ax.scatter(ra_PCAT, dec_PCAT, s=15, color ='r', zorder=100)
-
+        pulsar_pos = parse_ra_dec([pulsar[1] for pulsar in pulsar_list],
+                                  [pulsar[2] for pulsar in pulsar_list])
     if args.plot_max_min:
-        plot_radius = 2 #degrees
-        ax.set_xlim([np.degrees(ra)-plot_radius,  np.degrees(ra)+plot_radius])
-        ax.set_ylim([np.degrees(dec)-plot_radius, np.degrees(dec)+plot_radius])
-    plt.savefig('{0}.png'.format(out_file_name), bbox_inches='tight', dpi=300)
-
-
+        fwhms = [(centre_fwhm * centrefreq / (centrefreq - 15.36), 'red'), # low frequency
+                 (centre_fwhm * centrefreq / (centrefreq + 15.36), 'blue')] # high frequency
+        plot_centre = (np.degrees(ra), np.degrees(dec))
+    else:
+        fwhms = [(centre_fwhm, 'green')]
+        plot_centre = None
 
+    print("Plotting")
+    plot_grid(rads, decds, fwhms, '{0}.png'.format(out_file_name),
+              aitoff=args.aitoff,
+              add_text=args.add_text,
+              pulsar_pos=pulsar_pos,
+              plot_centre=plot_centre,
+              plot_budget=args.plot_budget)
 
     print("Number of pointings: " + str(len(rads)))
-    #times out and segfaults after this so I'm going to exit here
-    exit()
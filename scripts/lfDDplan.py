@@ -1,7 +1,7 @@
 #! /usr/bin/env python3
 
 import argparse
-from mwa_search.dispersion_tools import plot_sensitivity, dd_plan
+from mwa_search.dispersion_tools import plot_sensitivity, dd_plan, optimise_plan, plan_sensitivity_loss
 from vcstools.metadb_utils import get_common_obs_metadata
 
 
@@ -34,6 +34,18 @@ if __name__ == "__main__":
     parser.add_argument('--max_dms_per_job', type=int, default=5000,
                         help='If Nsteps is greater than this value split it into multiple lines. '
                              'This will cause the search pipeline to submit fewer DMs per job')
+    parser.add_argument('--optimise', action='store_true',
+                        help='Search the DM step, downsample breakpoint (and subband) factors for the cheapest plan '
+                             'that loses less than --max_loss of the sensitivity and print the Pareto frontier')
+    parser.add_argument('--max_loss', '--max-loss', type=float, default=0.1,
+                        help='The largest fraction of sensitivity the optimised plan can lose compared to searching '
+                             'every DM at the full time resolution, default 0.1')
+    parser.add_argument('--periods', type=float, nargs='*', default=[1000., 100., 10., 1.],
+                        help='The pulsar periods in ms the sensitivity loss is calculated for (the loss is the '
+                             'largest of them), default 1000 100 10 1')
+    parser.add_argument('--subband', action='store_true',
+                        help='Include the smearing within prepsubband\'s subbands in the sensitivity loss and '
+                             'optimise the number of subbands')
     #parser.add_argument()
     args=parser.parse_args()
 
@@ -56,6 +68,39 @@ if __name__ == "__main__":
         max_DM_step=args.max_DM_step,
         max_dms_per_job=args.max_dms_per_job
     )
+    widths = [period * 0.05 for period in args.periods]
+    if args.optimise:
+        default_loss = plan_sensitivity_loss(DD_plan_array, args.centrefreq, args.bandwidth, args.nfreqchan,
+                                             args.timeres, periods=args.periods, widths=widths, time=args.time,
+                                             subband=args.subband)
+        frontier, recommended = optimise_plan(
+            args.centrefreq,
+            args.bandwidth,
+            args.nfreqchan,
+            args.timeres,
+            args.lowDM,
+            args.highDM,
+            max_loss=args.max_loss,
+            periods=args.periods,
+            widths=widths,
+            time=args.time,
+            min_DM_step=args.min_DM_step,
+            max_DM_step=args.max_DM_step,
+            max_dms_per_job=args.max_dms_per_job,
+            subband=args.subband
+        )
+        print("Pareto frontier of sensitivity loss and work")
+        print(" DM step fact | breakpoint fact | nsub fact | loss  | workfactor | Nsteps ")
+        for plan in frontier:
+            print(f"{plan['dm_step_fact']:13.1f} | {plan['breakpoint_fact']:15.1f} | {plan['nsub_fact']:9.2f} | "
+                  f"{plan['loss']:5.3f} | {plan['work']:10.2f} | {plan['ndm']:6d}")
+        print("Default plan: loss {:.3f}, workfactor {:.2f}, Nsteps {}".format(
+              default_loss, sum(dd_line[7] for dd_line in DD_plan_array), sum(dd_line[3] for dd_line in DD_plan_array)))
+        if recommended["loss"] > args.max_loss:
+            print("No plan loses less than {} of the sensitivity so using the plan with the least loss".format(args.max_loss))
+        print("Recommended plan: loss {:.3f}, workfactor {:.2f}, Nsteps {}\n".format(
+              recommended["loss"], recommended["work"], recommended["ndm"]))
+        DD_plan_array = recommended["plan"]
     print(" low DM | high DM | DeltaDM | Nsteps | Downsamp | nsub | workfactor | Effective time resolution (ms) ")
     total_steps = 0
     for dd_line in DD_plan_array:
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import logging
+
+from mwa_search.periodicity import search_dats
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    loglevels = dict(DEBUG=logging.DEBUG,
+                     INFO=logging.INFO,
+                     WARNING=logging.WARNING,
+                     ERROR=logging.ERROR)
+    parser = argparse.ArgumentParser(description="""
+    Searches PRESTO time series (.dat and .inf files) for periodic signals with harmonic summing (zero acceleration)
+    without writing .fft files, and writes ACCEL files for accelsift and prepfold in place of realfft and accelsearch.
+    """)
+    parser.add_argument('dat_files', type=str, nargs='+',
+            help='The .dat files (their .inf files must be beside them).')
+    parser.add_argument('--numharm', type=int, default=16,
+            help='The largest number of harmonics to sum (a power of two). Default: 16')
+    parser.add_argument('--flo', type=float, default=1.,
+            help='The lowest frequency (Hz) of the highest harmonic to search. Default: 1.0')
+    parser.add_argument('--fhi', type=float,
+            help='The highest frequency (Hz) of the highest harmonic to search. Default: the Nyquist frequency')
+    parser.add_argument('--sigma', type=float, default=2.,
+            help='The smallest significance of a candidate. Default: 2.0')
+    parser.add_argument('--batch_samples', type=int, default=2**26,
+            help='The largest number of samples of the time series Fourier transformed at once. Default: 67108864')
+    parser.add_argument('-j', '--ncpus', type=int, default=1,
+            help='The number of processes searching batches of time series. Default: 1')
+    parser.add_argument("-L", "--loglvl", type=str, default="INFO",
+            help="Logger verbosity level. Default: INFO", choices=loglevels.keys())
+    args = parser.parse_args()
+
+    logger.setLevel(loglevels[args.loglvl])
+    ch = logging.StreamHandler()
+    ch.setLevel(loglevels[args.loglvl])
+    formatter = logging.Formatter('%(asctime)s  %(filename)s  %(name)s  %(lineno)-4d  %(levelname)-9s :: %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+    logger.propagate = False
+
+    basenames = [dat_file[:-4] if dat_file.endswith(".dat") else dat_file for dat_file in args.dat_files]
+    results = search_dats(basenames, batch_samples=args.batch_samples, workers=args.ncpus, nharm=args.numharm,
+                          flo=args.flo, fhi=args.fhi, sigma=args.sigma)
+    logger.info("Found {} candidates in {} of {} time series".format(
+                sum(ncand for _, ncand in results.values()), len(results), len(basenames)))
+    if len(results) < len(basenames):
+        sys.exit(1)
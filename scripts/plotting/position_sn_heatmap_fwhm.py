@@ -13,6 +13,7 @@ from scipy.interpolate import UnivariateSpline
 import glob
 
 from vcstools.config import load_config_file
+from mwa_search.bestprof import read_bestprof
 
 def find_fwhm_and_plot(obsid, pointing):
     pointing_list = []
@@ -22,11 +23,8 @@ def find_fwhm_and_plot(obsid, pointing):
                                 obsid)):
         bestprof_file = glob.glob("{0}/{1}*_PSR_2330-2005.pfd.bestprof".format(d, obsid))
         if len(bestprof_file) == 1:
-            with open(bestprof_file[0]) as bestfile:
-                for i in bestfile.readlines():
-                    if i.startswith("# Prob(Noise)"):
-                        pointing_list.append(d.split("/")[-1])
-                        sn.append(float(i.split("(")[-1][1:-7]))
+            pointing_list.append(d.split("/")[-1])
+            sn.append(read_bestprof(bestprof_file[0])[0]["sn"])
 
     #find max for a FWHM test
     #max_index = sn.index(max(sn))
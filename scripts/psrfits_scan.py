@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import glob
+import json
+import sys
+import logging
+
+from mwa_search.psrfits import scan_headers, SCAN_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+def write_table(infos, outfile, fmt):
+    """Writes the scanned header infos as a CSV or JSON table to an open file"""
+    if fmt == "json":
+        json.dump(infos, outfile, indent=1)
+        outfile.write("\n")
+    else:
+        writer = csv.DictWriter(outfile, fieldnames=SCAN_COLUMNS)
+        writer.writeheader()
+        writer.writerows(infos)
+
+
+if __name__ == "__main__":
+    loglevels = dict(DEBUG=logging.DEBUG,
+                     INFO=logging.INFO,
+                     WARNING=logging.WARNING,
+                     ERROR=logging.ERROR)
+    parser = argparse.ArgumentParser(description="""
+    Reads only the primary and SUBINT headers of many PSRFITS files and outputs a table of their frequency,
+    duration, number of channels, bits per sample and pointing.
+    """)
+    parser.add_argument('files', type=str, nargs='+',
+            help='The PSRFITS files or glob patterns (quoted) of them.')
+    parser.add_argument('-o', '--out', type=str,
+            help='The output table. The format is JSON if it ends in .json, otherwise CSV. Default: CSV to stdout')
+    parser.add_argument('-j', '--workers', type=int, default=16,
+            help='The number of threads reading the headers. Default: 16')
+    parser.add_argument("-L", "--loglvl", type=str, default="INFO",
+            help="Logger verbosity level. Default: INFO", choices=loglevels.keys())
+    args = parser.parse_args()
+
+    logger.setLevel(loglevels[args.loglvl])
+    ch = logging.StreamHandler()
+    ch.setLevel(loglevels[args.loglvl])
+    formatter = logging.Formatter('%(asctime)s  %(filename)s  %(name)s  %(lineno)-4d  %(levelname)-9s :: %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+    logger.propagate = False
+
+    filenames = []
+    for pattern in args.files:
+        matches = sorted(glob.glob(pattern))
+        filenames += matches if matches else [pattern]
+    infos = scan_headers(filenames, workers=args.workers)
+    logger.info("Read the headers of {} of {} files".format(len(infos), len(filenames)))
+    if not infos:
+        logger.error("No PSRFITS headers could be read. Exiting.")
+        sys.exit(1)
+
+    fmt = "json" if args.out and args.out.endswith(".json") else "csv"
+    if args.out:
+        with open(args.out, "w", newline="") as outfile:
+            write_table(infos, outfile, fmt)
+    else:
+        write_table(infos, sys.stdout, fmt)
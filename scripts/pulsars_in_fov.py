@@ -32,6 +32,9 @@ if __name__ == "__main__":
             help="The offset to apply to all pointings in arcseconds")
     parser.add_argument("--angle_offset", type=float, default=0,
             help="The angle of the offset to apply to all pointings in degrees where zero is north")
+    parser.add_argument("-m", "--merge_fraction", type=float, default=0.1,
+            help="Pointings of the same type within this fraction of the FWHM are merged into one shared pointing. "
+                 "Use 0 to only merge identical pointings. Default: 0.1")
     parser.add_argument("-k", "--no_known_pulsars", action="store_true", default=False,
             help="Do no include known pulsars. Default: False")
     parser.add_argument("-c", "--no_search_cands", action="store_true", default=False,
@@ -36,16 +36,34 @@ else
     END=${end}
 fi
 
-grid.py -o $OBSID -a -b $BEGIN -e $END -d 0.3 -f 0.9 -n 1080 --out_file_name SMART_${NAME}_grid
+MANIFEST=SMART_${NAME}_grid_manifest.json
+# grid.py rewrites the manifest as it writes each grid file so remove any from an earlier run
+rm -f $MANIFEST
+grid.py -o $OBSID -a -b $BEGIN -e $END -d 0.3 -f 0.9 -n 1080 --stream --out_file_name SMART_${NAME}_grid &
+GRID_PID=$!
 
 if [[ $HOSTNAME == garrawarla* ]] ; then
     # If on garrwarla set up striping to help with I/O
     lfs setstripe -E 1M -c 1 -E 256M -c 4 -E -1 -c -1 $PWD
 fi
 
-for SMART_job in $(ls SMART_${NAME}_grid*txt); do
+list_grid_files() {
+    # Prints whether the grid is complete followed by the grid files listed in the manifest so far
+    python -c 'import json, sys
+try:
+    with open(sys.argv[1]) as manifest_file:
+        manifest = json.load(manifest_file)
+except (OSError, ValueError):
+    print(False)
+    sys.exit()
+print(manifest["complete"], " ".join(chunk["file"] for chunk in manifest["chunks"]))' $MANIFEST
+}
+
+search_grid_file() {
+    SMART_job=$1
     mkdir -p ${SMART_job%.txt}
     cd ${SMART_job%.txt}
+    errorcode=0
     if [ ! -f "${SMART_job%.txt}_done" ]; then
         echo mwa_search_pipeline.nf --obsid $OBSID --calid $CALID --pointing_file ../${SMART_job} --begin $BEGIN --end $END -resume \
             --vcstools_version devel --mwa_search_version devel --summed -with-report ${SMART_job%.txt}.html -w ${SMART_job%.txt}_work --out_dir ${SMART_job%.txt}_cands
@@ -55,7 +73,6 @@ for SMART_job in $(ls SMART_${NAME}_grid*txt); do
         echo "Errorcode: $errorcode"
         if [ "$errorcode" != "0" ]; then
             echo "Error in ${SMART_job%.txt}, exiting"
-            break
         else
             echo "${SMART_job%.txt} done"
             touch ${SMART_job%.txt}_done
@@ -65,4 +82,26 @@ for SMART_job in $(ls SMART_${NAME}_grid*txt); do
         echo "${SMART_job%.txt} already finished so skipping"
     fi
     cd ..
-done
\ No newline at end of file
+    return $errorcode
+}
+
+# Search each grid file as soon as grid.py has written it and listed it in the manifest
+searched=0
+while true; do
+    read -r complete grid_files <<< "$(list_grid_files)"
+    grid_files=($grid_files)
+    if [ $searched -lt ${#grid_files[@]} ]; then
+        search_grid_file ${grid_files[$searched]} || break
+        searched=$((searched + 1))
+    elif [ "$complete" == "True" ]; then
+        break
+    elif ! kill -0 $GRID_PID 2> /dev/null; then
+        # grid.py has finished so the manifest is either complete or it failed
+        if ! wait $GRID_PID; then
+            echo "grid.py failed, exiting"
+            break
+        fi
+    else
+        sleep 30
+    fi
+done
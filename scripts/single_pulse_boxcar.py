@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import logging
+
+from mwa_search.single_pulse import search_dats
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    loglevels = dict(DEBUG=logging.DEBUG,
+                     INFO=logging.INFO,
+                     WARNING=logging.WARNING,
+                     ERROR=logging.ERROR)
+    parser = argparse.ArgumentParser(description="""
+    Searches PRESTO time series (.dat and .inf files) for single pulses with boxcar filters and writes
+    .singlepulse files. It takes the same main options as PRESTO's single_pulse_search.py.
+    """)
+    parser.add_argument('dat_files', type=str, nargs='+',
+            help='The .dat files (their .inf files must be beside them).')
+    parser.add_argument('-t', '--threshold', type=float, default=5.,
+            help='The smallest significance (sigma) of a candidate. Default: 5.0')
+    parser.add_argument('-m', '--maxwidth', type=float, default=0.,
+            help='The largest boxcar width in seconds (0 for all of them). Default: 0.0')
+    parser.add_argument('-b', '--nobadblocks', action='store_true',
+            help='Don\'t check for and zero bad blocks of data.')
+    parser.add_argument('--badblock_fact', type=float, default=4.,
+            help='Blocks with a standard deviation more than this factor from the median are bad. Default: 4.0')
+    parser.add_argument('-f', '--fast', action='store_true',
+            help='Only remove the median of each block instead of a linear fit.')
+    parser.add_argument('-d', '--detrendlen', type=int, default=1000,
+            help='The number of samples in each block that is detrended and normalised. Default: 1000')
+    parser.add_argument('-p', '--noplot', action='store_true',
+            help='Accepted for compatibility with single_pulse_search.py (no plots are made).')
+    parser.add_argument('-j', '--ncpus', type=int, default=1,
+            help='The number of processes searching the DM trials. Default: 1')
+    parser.add_argument("-L", "--loglvl", type=str, default="INFO",
+            help="Logger verbosity level. Default: INFO", choices=loglevels.keys())
+    args = parser.parse_args()
+
+    logger.setLevel(loglevels[args.loglvl])
+    ch = logging.StreamHandler()
+    ch.setLevel(loglevels[args.loglvl])
+    formatter = logging.Formatter('%(asctime)s  %(filename)s  %(name)s  %(lineno)-4d  %(levelname)-9s :: %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+    logger.propagate = False
+
+    basenames = [dat_file[:-4] if dat_file.endswith(".dat") else dat_file for dat_file in args.dat_files]
+    results = search_dats(basenames, workers=args.ncpus, threshold=args.threshold, max_width=args.maxwidth,
+                          detrend_len=args.detrendlen, detrend=not args.fast,
+                          bad_block_fact=0. if args.nobadblocks else args.badblock_fact)
+    logger.info("Found {} candidates in {} of {} time series".format(
+                sum(ncand for _, ncand in results.values()), len(results), len(basenames)))
+    if len(results) < len(basenames):
+        sys.exit(1)
@@ -68,10 +68,16 @@ setup(
         'scripts/cold_storage_mover.py',
         'scripts/grid.py',
         'scripts/lfDDplan.py',
+        'scripts/fit_search_cost_model.py',
+        'scripts/psrfits_scan.py',
+        'scripts/dedisperse_psrfits.py',
+        'scripts/single_pulse_boxcar.py',
+        'scripts/periodicity_search.py',
         'scripts/LOTAAS_wrapper.py',
         'scripts/search_launch_loop.sh',
         'scripts/rsync_rm_loop.sh',
         'scripts/bestgridpos.py',
+        'scripts/bestgridpos_batch.py',
         'scripts/find_clustered_and_known_pulsar_candidates.py',
         # dpp
         'scripts/pulsars_in_fov.py',
@@ -0,0 +1,27 @@
+"""
+Shared pytest fixtures
+"""
+import pytest
+
+from mwa_search.cost_model import CostModel, make_synthetic_trace
+
+
+@pytest.fixture
+def cost_model():
+    """A search job cost model with realistic coefficients"""
+    return CostModel({"const": 60., "dur": 0.05, "dur_lines": 0.02, "subband": 2e-5,
+                      "dedisp": 1e-7, "samples": 1e-5, "accel": 2e-9},
+                     {"const": 500., "max_samples": 1., "max_accel": 0.01, "max_dedisp": 0.5})
+
+
+@pytest.fixture
+def synthetic_trace(tmp_path, cost_model):
+    """
+    A function that writes a Nextflow trace file of synthetic search jobs that follow cost_model
+    (see mwa_search.cost_model.make_synthetic_trace) and returns its path
+    """
+    def write(name="trace.txt", **kwargs):
+        filename = str(tmp_path / name)
+        make_synthetic_trace(filename, cost_model, **kwargs)
+        return filename
+    return write
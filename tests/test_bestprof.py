@@ -0,0 +1,124 @@
+"""
+Tests the single pass bestprof parser and the bulk loader and its on-disk index
+"""
+import os
+import numpy as np
+import pytest
+
+from mwa_search import bestprof
+from mwa_search.bestprof import read_bestprof, BestprofIndex, load_many, FIELDS
+
+BESTPROF = """# Input file       =  1234567890_12:34:56.78_-45:12:34.56_DM10.00.dat
+# Candidate        =  ACCEL_Cand_{candidate}
+# Telescope        =  MWA
+# Epoch_topo       =  58000.123456789012
+# Epoch_bary (MJD) =  58000.125
+# T_sample         =  0.0001
+# Data Folded      =  6000000
+# Data Avg         =  -0.00012
+# Data StdDev      =  1.5
+# Profile Bins     =  {nbins}
+# Profile Avg      =  100.5
+# Profile StdDev   =  2.25
+# Reduced chi-sqr  =  {chi}
+# Prob(Noise)      <  0   (~32.5 sigma)
+# Best DM          =  10.01
+# P_topo (ms)      =  {period}  +/- 1.2e-05
+# P'_topo (s/s)    =  1.5e-12  +/- 3e-13
+# P''_topo (s/s^2) =  0  +/- 0
+# P_bary (ms)      =  N/A
+# P'_bary (s/s)    =  N/A
+# P''_bary (s/s^2) =  N/A
+# P_orb (s)        =  N/A
+# asin(i)/c (s)    =  N/A
+# eccentricity     =  N/A
+# w (rad)          =  N/A
+# T_peri           =  N/A
+######################################################
+{profile}
+"""
+
+
+def write_bestprof(filename, candidate=1, nbins=8, chi=12.5, period=33.3):
+    """Writes a bestprof file with a profile of 10 * the bin number and returns its path"""
+    profile = "\n".join("{:6d}  {:.4f}".format(i, 10. * i) for i in range(nbins))
+    with open(filename, "w") as outfile:
+        outfile.write(BESTPROF.format(candidate=candidate, nbins=nbins, chi=chi, period=period, profile=profile))
+    return filename
+
+
+def test_read_bestprof(tmp_path):
+    header, profile = read_bestprof(write_bestprof(str(tmp_path / "cand.bestprof")))
+    assert set(header) == set(FIELDS)
+    assert header["candidate"] == "ACCEL_Cand_1"
+    assert (header["ra"], header["dec"]) == ("12:34:56.78", "-45:12:34.56")
+    assert header["nbins"] == 8
+    assert header["chi"] == 12.5
+    assert header["dm"] == 10.01
+    assert header["prob_noise"] == 0.
+    assert header["sn"] == 32.5
+    assert (header["p_topo"], header["p_topo_err"]) == (33.3, 1.2e-05)
+    assert (header["pd_topo"], header["pd_topo_err"]) == (1.5e-12, 3e-13)
+    assert header["epoch_topo"] == 58000.123456789012
+    assert np.isnan(header["p_bary"]) and np.isnan(header["p_bary_err"]) and np.isnan(header["t_peri"])
+    np.testing.assert_array_equal(profile, 10. * np.arange(8))
+
+
+def test_read_bestprof_missing_fields(tmp_path):
+    filename = str(tmp_path / "short.bestprof")
+    lines = [line for line in BESTPROF.split("\n") if not line.startswith(("# Profile Bins", "# Input file"))]
+    with open(filename, "w") as outfile:
+        outfile.write("\n".join(lines).format(candidate=2, chi=1., period=2., profile="0 1.5\n1 2.5"))
+    header, profile = read_bestprof(filename)
+    # The number of bins is the length of the profile and strings that aren't there are None
+    assert header["nbins"] == 2
+    assert header["input_file"] is None and header["ra"] is None
+    np.testing.assert_array_equal(profile, [1.5, 2.5])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_load_many(tmp_path, workers):
+    paths = [write_bestprof(str(tmp_path / "cand{}.bestprof".format(i)), candidate=i, chi=float(i))
+             for i in range(6)]
+    missing = str(tmp_path / "missing.bestprof")
+    table = load_many(paths[3:] + [missing] + paths[:3] + paths[:1], workers=workers)
+    # Unreadable files are left out and duplicates are only loaded once, in the order of the paths
+    order = [3, 4, 5, 0, 1, 2]
+    assert table["path"].tolist() == [paths[i] for i in order]
+    np.testing.assert_array_equal(table["chi"], order)
+    assert table["candidate"].tolist() == ["ACCEL_Cand_{}".format(i) for i in order]
+    assert table["nbins"].dtype.kind == "i"
+    assert np.all(np.isnan(table["p_bary"]))
+    assert all(np.array_equal(profile, 10. * np.arange(8)) for profile in table["profile"])
+
+
+def test_load_many_index(tmp_path, monkeypatch):
+    paths = [write_bestprof(str(tmp_path / "cand{}.bestprof".format(i)), candidate=i) for i in range(3)]
+    index_file = str(tmp_path / "index" / "bestprof.sqlite")
+    first = load_many(paths, workers=1, index=index_file)
+
+    parsed = []
+
+    def counting_read(filename):
+        parsed.append(filename)
+        return read_bestprof(filename)
+
+    monkeypatch.setattr(bestprof, "read_bestprof", counting_read)
+    # Nothing is parsed again while the files are unchanged
+    second = load_many(paths, workers=1, index=BestprofIndex(index_file))
+    assert parsed == []
+    for field in FIELDS + ["path"]:
+        np.testing.assert_array_equal(second[field], first[field])
+    assert all(np.array_equal(a, b) for a, b in zip(first["profile"], second["profile"]))
+
+    # Changed files are parsed again and the index is updated
+    write_bestprof(paths[1], candidate=1, nbins=16)
+    stat = os.stat(paths[1])
+    os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    third = load_many(paths, workers=1, index=index_file)
+    assert parsed == [paths[1]]
+    assert third["nbins"].tolist() == [8, 16, 8]
+    assert len(third["profile"][1]) == 16
+    parsed[:] = []
+    load_many(paths, workers=1, index=index_file)
+    assert parsed == []
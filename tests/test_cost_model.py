@@ -0,0 +1,87 @@
+"""
+Tests fitting the search job cost models to synthetic Nextflow traces
+"""
+import csv
+import numpy as np
+import pytest
+
+from mwa_search.cost_model import fit_cost_models, read_trace, save_cost_models, load_cost_model
+
+
+def trace_statuses(trace_file):
+    with open(trace_file, "r", newline="") as trace:
+        return [row["status"] for row in csv.DictReader(trace, delimiter="\t")]
+
+
+def test_fit_recovers_model(synthetic_trace, cost_model):
+    trace_file = synthetic_trace(n_jobs=300, noise=0.01)
+    models = fit_cost_models([trace_file], cluster="test")
+    assert list(models) == ["search_dd_fft_acc"]
+    model = models["search_dd_fft_acc"]
+    np.testing.assert_allclose(model.walltime, cost_model.walltime, rtol=0.2)
+    np.testing.assert_allclose(model.memory, cost_model.memory, rtol=0.2)
+    assert model.cluster == "test"
+
+
+def test_failed_jobs_skipped(synthetic_trace):
+    trace_file = synthetic_trace(n_jobs=300)
+    statuses = trace_statuses(trace_file)
+    assert "FAILED" in statuses
+    jobs = read_trace(trace_file)
+    assert len(jobs) == statuses.count("COMPLETED")
+    assert fit_cost_models([trace_file])["search_dd_fft_acc"].n_jobs == len(jobs)
+
+
+def test_predictions_cover_quantile(synthetic_trace):
+    trace_file = synthetic_trace(n_jobs=300, noise=0.1)
+    model = fit_cost_models([trace_file], quantile=0.9)["search_dd_fft_acc"]
+    jobs = read_trace(trace_file)
+    predictions = np.array([model.predict(job["plan"], job["dur"], job["nharm"], job["zmax"]) for job in jobs])
+    walltimes = np.array([job["walltime"] for job in jobs])
+    memories = np.array([job["memory"] for job in jobs])
+    assert model.walltime_margin > 1. and model.memory_margin > 1.
+    assert np.mean(predictions[:, 0] >= walltimes) == pytest.approx(0.9, abs=0.02)
+    assert np.mean(predictions[:, 1] >= memories) == pytest.approx(0.9, abs=0.02)
+
+
+def test_too_few_jobs(synthetic_trace):
+    trace_file = synthetic_trace(n_jobs=5)
+    assert fit_cost_models([trace_file]) == {}
+
+
+def test_save_load_round_trip(synthetic_trace, tmp_path):
+    trace_file = synthetic_trace(n_jobs=100)
+    models = fit_cost_models([trace_file], cluster="test")
+    filename = str(tmp_path / "cost_model.json")
+    save_cost_models(models, filename)
+    model = models["search_dd_fft_acc"]
+    loaded = load_cost_model(filename)
+    np.testing.assert_array_equal(loaded.walltime, model.walltime)
+    np.testing.assert_array_equal(loaded.memory, model.memory)
+    assert loaded.to_dict() == model.to_dict()
+    plan_chunk = [(0, 0, 0, 500, 0, 2, 64, 0)]
+    assert loaded.predict(plan_chunk, 4800., 16, 200) == model.predict(plan_chunk, 4800., 16, 200)
+    with pytest.raises(ValueError):
+        load_cost_model(filename, process="missing_process")
+
+
+def test_model_per_process(synthetic_trace, cost_model, tmp_path):
+    accel_trace = synthetic_trace("accel_trace.txt", n_jobs=300, noise=0.01)
+    dd_trace = synthetic_trace("dd_trace.txt", n_jobs=300, noise=0.01, seed=1, process="search_dd")
+    filename = str(tmp_path / "cost_model.json")
+    save_cost_models(fit_cost_models([accel_trace, dd_trace]), filename)
+    accel_model = load_cost_model(filename, process="search_dd_fft_acc")
+    dd_model = load_cost_model(filename, process="search_dd")
+    assert (accel_model.process, dd_model.process) == ("search_dd_fft_acc", "search_dd")
+    assert all(job["nharm"] == 0 and job["zmax"] == 0 for job in read_trace(dd_trace))
+
+    # search_dd doesn't run accelsearch so its jobs are predicted without any accelsearch time
+    plan_chunk = [(0, 0, 0, 500, 0, 2, 64, 0)]
+    dd_walltime, dd_memory = dd_model.predict(plan_chunk, 4800.)
+    accel_walltime, _ = accel_model.predict(plan_chunk, 4800., nharm=16, zmax=200)
+    expected_walltime, expected_memory = cost_model.predict(plan_chunk, 4800.)
+    assert dd_walltime / dd_model.walltime_margin == pytest.approx(expected_walltime, rel=0.05)
+    assert dd_memory / dd_model.memory_margin == pytest.approx(expected_memory, rel=0.05)
+    assert accel_walltime > dd_walltime
+    # The accelsearch coefficient is the last one
+    assert dd_model.walltime[-1] == 0. and accel_model.walltime[-1] > 0.
@@ -0,0 +1,137 @@
+"""
+Tests the FDMT dedispersion against the brute force reference on synthetic PSRFITS files
+"""
+import resource
+import tracemalloc
+import numpy as np
+import pytest
+
+from mwa_search.psrfits import write_psrfits
+from mwa_search.dedisperse import dm_delays, fdmt, dedisperse_brute, dedisperse_files, read_dat
+
+TBIN = 1e-3
+PULSE_DM = 10.
+PULSE_SAMPLE = 2000
+PULSE_WIDTH = 4
+
+
+def dispersed_pulse(nchan, nsamp, seed=0):
+    """Noise with a PULSE_WIDTH sample pulse at PULSE_DM starting at PULSE_SAMPLE at the top of the band"""
+    rng = np.random.RandomState(seed)
+    freqs = 140. + 30.72 / nchan * (np.arange(nchan) + 0.5)
+    samples = rng.normal(64., 8., size=(nsamp, nchan))
+    delays = dm_delays(PULSE_DM, freqs, TBIN, ref_freq=freqs.max())
+    for offset in range(PULSE_WIDTH):
+        samples[PULSE_SAMPLE + offset + np.round(delays).astype(int), np.arange(nchan)] += 20.
+    return np.clip(np.round(samples), 0, 255).astype(np.uint8), freqs
+
+
+@pytest.fixture(scope="module")
+def fits_3072(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("fits") / "pulse.fits")
+    samples, freqs = dispersed_pulse(3072, 4096)
+    write_psrfits(filename, samples, freqs, TBIN, nsblk=512)
+    return filename
+
+
+def test_fdmt_matches_brute():
+    samples, freqs = dispersed_pulse(256, 4096)
+    dms = np.arange(8., 12., 0.05)
+    brute = dedisperse_brute(samples.astype(np.float32), freqs, TBIN, dms)
+    fast = fdmt(samples.astype(np.float32), freqs, TBIN, dms)
+    assert fast.shape == brute.shape
+    brute_peak = np.unravel_index(np.argmax(brute), brute.shape)
+    fast_peak = np.unravel_index(np.argmax(fast), fast.shape)
+    assert dms[fast_peak[0]] == pytest.approx(PULSE_DM, abs=0.1)
+    assert abs(fast_peak[0] - brute_peak[0]) <= 1
+    assert abs(fast_peak[1] - brute_peak[1]) <= 1
+    # The FDMT delays are within a sample or two of the brute force ones so little S/N is lost
+    def peak_sn(series):
+        return (series.max() - np.median(series)) / np.std(series[:, :PULSE_SAMPLE - 100])
+    assert peak_sn(fast) == pytest.approx(peak_sn(brute), rel=0.1)
+
+
+def test_dedisperse_files(fits_3072, tmp_path):
+    ddplan_line = [9.5, 10.5, 0.05, 20, 0.1, 1, 64, 0.]
+    outputs = {}
+    for method in ("fdmt", "brute"):
+        basenames = dedisperse_files([fits_3072], ddplan_line, str(tmp_path / method), method=method)
+        series = np.array([read_dat(basename)[0] for basename in basenames])
+        infos = [read_dat(basename)[1] for basename in basenames]
+        assert series.shape == (20, 4096)
+        assert [info["dm"] for info in infos] == pytest.approx(9.5 + 0.05 * np.arange(20))
+        outputs[method] = series
+    for method, series in outputs.items():
+        dm_index, sample = np.unravel_index(np.argmax(series), series.shape)
+        assert 9.5 + 0.05 * dm_index == pytest.approx(PULSE_DM, abs=0.06), method
+        assert 0 <= sample - PULSE_SAMPLE < PULSE_WIDTH, method
+
+
+def test_dedisperse_files_blocks_and_workers(fits_3072, tmp_path):
+    ddplan_line = [9.8, 10.2, 0.1, 4, 0.1, 1, 64, 0.]
+    reference = dedisperse_files([fits_3072], ddplan_line, str(tmp_path / "reference"))
+    for name, kwargs in (("blocks", dict(block_size=1000)), ("workers", dict(block_size=1500, workers=3))):
+        basenames = dedisperse_files([fits_3072], ddplan_line, str(tmp_path / name), **kwargs)
+        for reference_name, basename in zip(reference, basenames):
+            np.testing.assert_array_equal(read_dat(basename)[0], read_dat(reference_name)[0])
+
+
+def test_dedisperse_files_numout(fits_3072, tmp_path):
+    ddplan_line = [10., 10.1, 0.1, 1, 0.1, 1, 64, 0.]
+    short = dedisperse_files([fits_3072], ddplan_line, str(tmp_path / "short"), numout=3000)
+    long = dedisperse_files([fits_3072], ddplan_line, str(tmp_path / "long"), numout=5000)
+    short_series, short_info = read_dat(short[0])
+    long_series, long_info = read_dat(long[0])
+    assert (len(short_series), short_info["nsamp"]) == (3000, 3000)
+    assert (len(long_series), long_info["nsamp"]) == (5000, 5000)
+    np.testing.assert_array_equal(long_series[:3000], short_series)
+    # Padded with the mean
+    assert np.all(long_series[4096:] == long_series[4096])
+
+
+def test_more_dms_than_open_files(tmp_path):
+    filename = str(tmp_path / "small.fits")
+    samples, freqs = dispersed_pulse(32, 4096)
+    write_psrfits(filename, samples, freqs, TBIN, nsblk=512)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, hard))
+    try:
+        basenames = dedisperse_files([filename], [0., 30., 0.1, 300, 0.1, 1, 32, 0.], str(tmp_path / "many"),
+                                     block_size=512)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert len(basenames) == 300
+    assert all(len(read_dat(basename)[0]) == 4096 for basename in basenames)
+
+
+@pytest.mark.parametrize("downsample", [1, 4])
+def test_dedisperse_files_block_memory(fits_3072, tmp_path, downsample):
+    ddplan_line = [9.8, 10.2, 0.1, 4, 0.1, downsample, 64, 0.]
+    block_size = 2048
+    tracemalloc.start()
+    try:
+        blocks = dedisperse_files([fits_3072], ddplan_line, str(tmp_path / "blocks"), zerodm=True,
+                                  block_size=block_size)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # A worker holds about 16 * block_size * nchan bytes whatever the downsampling
+    assert peak < 16 * block_size * 3072
+    whole = dedisperse_files([fits_3072], ddplan_line, str(tmp_path / "whole"), zerodm=True, block_size=2**20)
+    for block_name, whole_name in zip(blocks, whole):
+        np.testing.assert_array_equal(read_dat(block_name)[0], read_dat(whole_name)[0])
+
+
+def test_dedisperse_files_opens_each_file_once(fits_3072, tmp_path, monkeypatch):
+    opened = []
+
+    def counting_open(filename, *args, **kwargs):
+        opened.append(filename)
+        return open(filename, *args, **kwargs)
+
+    monkeypatch.setattr("mwa_search.dedisperse.open", counting_open, raising=False)
+    basenames = dedisperse_files([fits_3072], [9.8, 10.2, 0.1, 4, 0.1, 1, 64, 0.], str(tmp_path / "once"),
+                                 numout=5000, block_size=1024)
+    dat_opens = [filename for filename in opened if filename.endswith(".dat")]
+    assert sorted(dat_opens) == sorted("{}.dat".format(basename) for basename in basenames)
+    assert all(len(read_dat(basename)[0]) == 5000 for basename in basenames)
@@ -0,0 +1,99 @@
+"""
+Tests packing dedispersion plan lines into jobs with pack_plan
+"""
+import numpy as np
+import pytest
+
+from mwa_search.dispersion_tools import dd_plan, pack_plan
+
+
+def old_splitter_njobs(plan, max_work):
+    """The number of DDplan files the greedy batching that was inline in pulsar_search_module.nf made"""
+    wfi = 0
+    wf_sum = 0.
+    for dd_line in plan:
+        dm_min, dm_max, dm_step, ndm, timeres, downsamp, nsub, total_work_factor = dd_line
+        while total_work_factor > max_work:
+            wfi += 1
+            total_work_factor -= max_work
+        wf_sum += total_work_factor
+        if wf_sum > max_work:
+            wfi += 1
+            total_work_factor -= (wf_sum - max_work)
+            wf_sum = 0
+    return wfi + 1
+
+
+PLANS = {
+    "blind": dd_plan(150., 30.72, 3072, 0.1, 1., 250.),
+    "targeted": dd_plan(150., 30.72, 3072, 0.1, 10., 30.),
+    "split_lines": dd_plan(150., 30.72, 3072, 0.1, 1., 250., max_dms_per_job=512),
+    "high_freq": dd_plan(185., 30.72, 3072, 0.1, 1., 100.),
+}
+
+
+def flatten_dms(plan):
+    """The sorted DMs of every DM step of a plan"""
+    dms = []
+    for dm_min, dm_max, dm_step, ndm, timeres, downsamp, nsub, work in plan:
+        dms.extend(np.round(dm_min + dm_step * np.arange(int(ndm)), 6).tolist())
+    return sorted(dms)
+
+
+@pytest.mark.parametrize("plan_name", sorted(PLANS))
+@pytest.mark.parametrize("max_work", [50., 300., 1000.])
+@pytest.mark.parametrize("strategy", ["lpt", "ffd"])
+@pytest.mark.parametrize("min_dms", [1, 32])
+def test_pack_plan(plan_name, max_work, strategy, min_dms):
+    plan = PLANS[plan_name]
+    jobs = pack_plan(plan, max_work, strategy=strategy, min_dms=min_dms)
+    pieces = [dd_line for job in jobs for dd_line in job]
+
+    for job in jobs:
+        job_work = sum(dd_line[7] for dd_line in job)
+        # Only a single line that couldn't be split any further can go over max_work
+        if job_work > max_work * (1 + 1e-9):
+            assert len(job) == 1
+            assert job[0][3] < 2 * min_dms or job[0][3] == 1
+
+    # No split piece is smaller than min_dms unless its whole line was
+    line_ndms = {(dd_line[2], dd_line[4], dd_line[5], dd_line[6]): dd_line[3] for dd_line in plan}
+    for dd_line in pieces:
+        assert dd_line[3] >= min(min_dms, line_ndms[(dd_line[2], dd_line[4], dd_line[5], dd_line[6])])
+
+    # Every DM step and all the work is searched once
+    assert sum(dd_line[3] for dd_line in pieces) == sum(dd_line[3] for dd_line in plan)
+    assert flatten_dms(pieces) == flatten_dms(plan)
+    assert sum(dd_line[7] for dd_line in pieces) == pytest.approx(sum(dd_line[7] for dd_line in plan))
+
+    if min_dms == 1:
+        # The old batching went over max_work in some jobs, so where it made fewer jobs than
+        # the total work allows, pack_plan only has to reach that lower bound
+        lower_bound = int(np.ceil(sum(dd_line[7] for dd_line in plan) / max_work))
+        assert len(jobs) <= max(old_splitter_njobs(plan, max_work), lower_bound)
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        pack_plan(PLANS["targeted"], 300., strategy="random")
+
+
+@pytest.mark.parametrize("strategy", ["lpt", "ffd"])
+def test_line_work(strategy):
+    plan = PLANS["blind"]
+    max_work = 200.
+
+    def line_work(dd_line):
+        # A per line overhead plus a cost per DM step that grows with the number of subbands
+        return 5. + dd_line[3] * dd_line[6] / 1000.
+
+    jobs = pack_plan(plan, max_work, strategy=strategy, line_work=line_work)
+    for job in jobs:
+        for dd_line in job:
+            # The work of each line is the line_work of the piece, not the plan's work factor
+            assert dd_line[7] == pytest.approx(line_work(dd_line))
+        assert sum(dd_line[7] for dd_line in job) <= max_work * (1 + 1e-9) or len(job) == 1
+    assert sum(dd_line[3] for job in jobs for dd_line in job) == sum(dd_line[3] for dd_line in plan)
+    # The jobs are packed by line_work, not by the plan's work factor
+    assert len(jobs) >= np.ceil(sum(line_work(dd_line) for dd_line in plan) / max_work)
+    assert max(sum(dd_line[7] for dd_line in job) for job in pack_plan(plan, max_work, strategy=strategy)) <= max_work
@@ -0,0 +1,105 @@
+"""
+Tests the on-disk grid cache and the .npy writer it streams arrays with
+"""
+import os
+import numpy as np
+import pytest
+
+from mwa_search.grid_cache import GridCache, NpyWriter, grid_cache_key
+
+
+@pytest.mark.parametrize("row_shape, dtype", [((2,), np.float64), ((), np.int32), ((3, 4), np.float32)])
+def test_npy_writer(tmp_path, row_shape, dtype):
+    file_name = str(tmp_path / "array.npy")
+    blocks = [np.random.RandomState(i).uniform(size=(n,) + row_shape).astype(dtype) for i, n in enumerate([5, 0, 7])]
+    with NpyWriter(file_name, row_shape=row_shape, dtype=dtype) as writer:
+        for block in blocks:
+            writer.append(block)
+    array = np.load(file_name, mmap_mode="r")
+    assert array.shape == (12,) + row_shape
+    assert array.dtype == dtype
+    np.testing.assert_array_equal(array, np.concatenate(blocks))
+
+
+def test_npy_writer_empty(tmp_path):
+    file_name = str(tmp_path / "empty.npy")
+    NpyWriter(file_name, row_shape=(2,)).close()
+    assert np.load(file_name).shape == (0, 2)
+
+
+def test_put_blocks(tmp_path):
+    cache = GridCache(cache_dir=str(tmp_path))
+    blocks = [np.full((4, 2), i, dtype=np.float64) for i in range(3)]
+    stream = cache.put_blocks("key", "pointings", iter(blocks), row_shape=(2,), params={"loop": 3})
+    first = next(stream)
+    np.testing.assert_array_equal(first, blocks[0])
+    # The entry isn't added until the last block is written
+    assert cache.get("key") is None
+    assert len(list(stream)) == 2
+    np.testing.assert_array_equal(cache.get("key")["pointings"], np.concatenate(blocks))
+
+
+def test_put_blocks_not_finished(tmp_path):
+    cache = GridCache(cache_dir=str(tmp_path))
+    stream = cache.put_blocks("key", "pointings", (np.zeros((4, 2)) for _ in range(3)), row_shape=(2,))
+    next(stream)
+    stream.close()
+    assert cache.get("key") is None
+    # The temporary entry is removed as well
+    assert os.listdir(str(tmp_path)) == []
+
+
+def put_entry(cache, key, last_used, nbytes=8000):
+    """Puts an entry of about nbytes and sets when it was last used"""
+    cache.put(key, {"pointings": np.zeros(nbytes // 8)})
+    os.utime(os.path.join(cache.cache_dir, key), (last_used, last_used))
+
+
+def entry_size(tmp_path):
+    """The size of an entry made by put_entry"""
+    cache = GridCache(cache_dir=str(tmp_path / "size"))
+    cache.put("size", {"pointings": np.zeros(1000)})
+    return cache.entries()[0][1]
+
+
+def test_lru_eviction(tmp_path):
+    size = entry_size(tmp_path)
+    cache = GridCache(cache_dir=str(tmp_path / "cache"), max_bytes=3 * size)
+    for i, key in enumerate(["a", "b", "c"]):
+        put_entry(cache, key, 1000. + i)
+    assert [key for _, _, key in cache.entries()] == ["a", "b", "c"]
+    # Using a makes b the least recently used so it is the one removed for d
+    assert cache.get("a") is not None
+    put_entry(cache, "d", 2000.)
+    assert [key for _, _, key in cache.entries()] == ["c", "d", "a"]
+    assert cache.get("b") is None
+    assert sum(nbytes for _, nbytes, _ in cache.entries()) <= cache.max_bytes
+
+
+def test_evict_keeps_new_entry(tmp_path):
+    size = entry_size(tmp_path)
+    cache = GridCache(cache_dir=str(tmp_path / "cache"), max_bytes=size)
+    put_entry(cache, "small", 1000.)
+    # An entry larger than the whole cache removes everything else but is kept itself
+    cache.put("large", {"pointings": np.zeros(10000)})
+    assert [key for _, _, key in cache.entries()] == ["large"]
+    assert len(cache.get("large")["pointings"]) == 10000
+
+
+def test_get_missing_or_partial(tmp_path):
+    cache = GridCache(cache_dir=str(tmp_path))
+    assert cache.entries() == []
+    assert cache.get("missing") is None
+    cache.put("partial", {"pointings": np.zeros(10), "names": np.arange(10)})
+    os.remove(str(tmp_path / "partial" / "names.npy"))
+    assert cache.get("partial") is None
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_grid_cache_key():
+    key = grid_cache_key(obsid=1234567890, begin=10, loop=3, fwhm=0.02)
+    assert key == grid_cache_key(fwhm=0.02, loop=3, begin=10, obsid=1234567890)
+    assert key == grid_cache_key(obsid=1234567890, begin=10, loop=3, fwhm=np.float64(0.02))
+    assert key != grid_cache_key(obsid=1234567890, begin=10, loop=3, fwhm=0.020000000000000004)
+    assert key != grid_cache_key(obsid=1234567890, begin=10, loop=4, fwhm=0.02)
@@ -0,0 +1,66 @@
+"""
+Tests that the numpy grid engine gives exactly the same pointings as the original list walking functions
+and that the coverage solver keeps exactly the pointings the exhaustive half power cut does
+"""
+import numpy as np
+import pytest
+
+from mwa_search.grid_tools import get_grid, iter_coverage_grid
+from mwa_search.sky_index import radec_to_xyz, chord_to_sep
+
+
+@pytest.mark.parametrize("grid_type", ["hex", "cross", "square"])
+@pytest.mark.parametrize("loop", [1, 2, 5])
+@pytest.mark.parametrize("grid_sep", [0.3, 1.2, 4.])
+@pytest.mark.parametrize("dec", [-89.5, -72., -26.7, 0., 15.3, 60., 88.7])
+def test_numpy_engine_parity(grid_type, loop, grid_sep, dec):
+    ra = np.radians(123.45)
+    args = (ra, np.radians(dec), np.radians(grid_sep), loop)
+    numpy_pointings = get_grid(*args, grid_type=grid_type, verbose=False, engine="numpy")
+    python_pointings = get_grid(*args, grid_type=grid_type, verbose=False, engine="python")
+    assert numpy_pointings.shape == python_pointings.shape
+    assert numpy_pointings.dtype == python_pointings.dtype
+    np.testing.assert_array_equal(numpy_pointings, python_pointings)
+
+
+def test_near_pole_drops_invalid_decs():
+    # Near the pole the steps in declination grow quickly so some pointings pass the pole and are removed
+    args = (0., np.radians(89.5), np.radians(1.), 3)
+    numpy_pointings = get_grid(*args, verbose=False, engine="numpy")
+    python_pointings = get_grid(*args, verbose=False, engine="python")
+    assert len(numpy_pointings) < 1 + 6 * (1 + 2 + 3)
+    assert np.all(np.abs(numpy_pointings[:, 1]) < 90.)
+    np.testing.assert_array_equal(numpy_pointings, python_pointings)
+
+
+def tile_beam_model(ra, dec, fwhm=20., sidelobe_sep=28., sidelobe_width=6., sidelobe_power=0.6):
+    """A Gaussian main lobe around ra, dec (degrees) with a ring shaped side lobe above half power"""
+    centre = radec_to_xyz(ra, dec)
+    sigma = fwhm / np.sqrt(8. * np.log(2.))
+    def power_func(pointings):
+        sep = chord_to_sep(np.linalg.norm(radec_to_xyz(pointings[:, 0], pointings[:, 1]) - centre, axis=1))
+        return np.exp(-sep**2 / (2. * sigma**2)) + \
+               sidelobe_power * np.exp(-(sep - sidelobe_sep)**2 / (2. * sidelobe_width**2))
+    return power_func
+
+
+def sort_pointings(pointings):
+    return pointings[np.lexsort((pointings[:, 0], pointings[:, 1]))]
+
+
+@pytest.mark.parametrize("dec", [-89., -80., -60., -26.7, 10., 60., 88.])
+@pytest.mark.parametrize("grid_sep, loop", [(1., 45), (0.5, 60)])
+def test_coverage_matches_exhaustive_cut(dec, grid_sep, loop):
+    ra = 30.
+    # The beam is off the grid centre so the contour isn't symmetric about it
+    power_func = tile_beam_model(ra + 3., dec + 2.)
+    stats = {}
+    args = (np.radians(ra), np.radians(dec), np.radians(grid_sep), loop)
+    blocks = list(iter_coverage_grid(*args, power_func, stats=stats))
+    solved = np.concatenate(blocks) if blocks else np.empty((0, 2))
+
+    grid = get_grid(*args, verbose=False)
+    grid = grid[(grid[:, 1] < 90.) & (grid[:, 1] > -90.)]
+    cut = grid[power_func(grid) > stats["threshold"]]
+    np.testing.assert_array_equal(sort_pointings(solved), sort_pointings(cut))
+    assert stats["fine_evaluations"] <= len(grid)
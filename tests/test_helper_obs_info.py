@@ -0,0 +1,65 @@
+"""
+Tests merging the overlapping pointings of known sources
+"""
+import numpy as np
+import pytest
+
+# helper_obs_info needs psrqpy and vcstools to look up sources
+helper_obs_info = pytest.importorskip("dpp.helper_obs_info")
+from mwa_search.pointings import format_pointings, parse_pointings, offset_by
+from mwa_search.sky_index import SkyIndex
+
+FWHM = 0.02
+
+
+def cluster_pointings(ra, dec, offsets):
+    """Pointings offset from ra and dec by each offset (in units of FWHM) to the north"""
+    ras, decs = offset_by(np.full(len(offsets), ra), np.full(len(offsets), dec),
+                          np.asarray(offsets) * FWHM, 0.)
+    return format_pointings(ras, decs)
+
+
+def test_merge_cluster():
+    # Three sources within a tenth of the FWHM of the first and one further away
+    pointing_list = cluster_pointings(250., -40., [0., 0.05, 0.09, 0.5])
+    name_list = [["A"], ["B"], ["C"], ["D"]]
+    merged_names, merged_pointings = helper_obs_info.merge_pointings(name_list, pointing_list, FWHM, 0.1)
+    assert merged_names == [["A", "B", "C"], ["D"]]
+    assert merged_pointings == [pointing_list[0], pointing_list[3]]
+
+
+def test_merge_in_order():
+    # B is within the radius of A and C but C isn't within the radius of A so C keeps its own pointing
+    pointing_list = cluster_pointings(10., 20., [0., 0.08, 0.16])
+    merged_names, merged_pointings = helper_obs_info.merge_pointings([["A"], ["B"], ["C"]], pointing_list,
+                                                                     FWHM, 0.1)
+    assert merged_names == [["A", "B"], ["C"]]
+    assert merged_pointings == [pointing_list[0], pointing_list[2]]
+
+
+def test_merge_identical_only():
+    pointing_list = cluster_pointings(100., 5., [0., 0., 0.01])
+    merged_names, merged_pointings = helper_obs_info.merge_pointings([["A"], ["B", "A"], ["C"]], pointing_list,
+                                                                     FWHM, 0.)
+    # Names are only listed once
+    assert merged_names == [["A", "B"], ["C"]]
+    assert merged_pointings == [pointing_list[0], pointing_list[2]]
+    assert helper_obs_info.merge_pointings([], [], FWHM, 0.1) == ([], [])
+
+
+def test_merged_sources_within_radius():
+    rng = np.random.RandomState(0)
+    ras = 120. + rng.uniform(-0.05, 0.05, 300)
+    decs = -60. + rng.uniform(-0.05, 0.05, 300)
+    pointing_list = format_pointings(ras, decs)
+    name_list = [["src{}".format(i)] for i in range(len(pointing_list))]
+    merged_names, merged_pointings = helper_obs_info.merge_pointings(name_list, pointing_list, FWHM, 0.2)
+    assert len(merged_pointings) < len(pointing_list)
+    # Every source is served by exactly one pointing within the merge radius
+    assert sorted(name for names in merged_names for name in names) == sorted(n[0] for n in name_list)
+    rads, decds = parse_pointings(pointing_list)
+    for names, pointing in zip(merged_names, merged_pointings):
+        members = [int(name[3:]) for name in names]
+        beam = SkyIndex.from_pointing_strings([pointing])
+        sep, _ = beam.query_nearest(rads[members], decds[members])
+        assert np.all(sep <= 0.2 * FWHM + 1e-9)
@@ -0,0 +1,70 @@
+"""
+Tests the coarse-to-fine and least squares localisation against the brute-force find_pos grid
+"""
+import numpy as np
+import pytest
+
+from mwa_search.localise import find_pos, find_pos_multires, polish_pos
+
+FWHM = 0.02
+
+
+def beam_model(ra, dec, det_ras, det_decs):
+    """The Gaussian beam response of find_pos"""
+    fwhm_ra = np.degrees(np.radians(FWHM) / np.cos(np.radians(dec + 26.7))**2)
+    fwhm_dec = np.degrees(np.radians(FWHM) / np.cos(np.radians(dec)))
+    return np.exp(-np.sqrt(((ra - det_ras) / (0.6006 * fwhm_ra))**2 + ((dec - det_decs) / (0.6006 * fwhm_dec))**2))
+
+
+def synthetic_detections(ra, dec, seed, peak_sn=50.):
+    """A 3x3 grid of beams near (ra, dec) with the modelled SN plus unit Gaussian noise"""
+    rng = np.random.RandomState(seed)
+    offsets = np.array([(x, y) for x in (-1, 0, 1) for y in (-1, 0, 1)]) * FWHM * 0.8
+    det_ras = ra + offsets[:, 0] + 0.003
+    det_decs = dec + offsets[:, 1] - 0.002
+    sns = peak_sn * beam_model(ra, dec, det_ras, det_decs) + rng.randn(len(det_ras))
+    return np.column_stack((det_ras, det_decs, sns))
+
+
+@pytest.mark.parametrize("ra, dec", [(150.123, -30.456), (20.01, -60.2), (300., 10.)])
+def test_multires_matches_brute_force(ra, dec):
+    detections = synthetic_detections(ra, dec, seed=1)
+    ras = np.linspace(ra - 0.03, ra + 0.03, 121)
+    decs = np.linspace(dec - 0.03, dec + 0.03, 121)
+    grid_ras, grid_decs, residual = find_pos(decs, ras, detections, FWHM, verbose=False)
+    multi_ras, multi_decs, multi_residual = find_pos_multires(decs, ras, detections, FWHM, verbose=False)
+    best = np.argmin(residual)
+    multi_best = np.argmin(multi_residual)
+    assert len(multi_residual) < len(residual)
+    assert abs(multi_ras[multi_best] - grid_ras[best]) <= ras[1] - ras[0] + 1e-9
+    assert abs(multi_decs[multi_best] - grid_decs[best]) <= decs[1] - decs[0] + 1e-9
+    # The positions it calculated are on the search grid so their residuals are the same as find_pos's
+    assert min(multi_residual) >= min(residual)
+
+
+def test_polish_recovers_position():
+    ra, dec = 150.123, -30.456
+    distances = []
+    for seed in range(50):
+        detections = synthetic_detections(ra, dec, seed=seed)
+        fit_ra, fit_dec, ra_err, dec_err, covariance = polish_pos(detections, FWHM, [ra + 0.001, dec - 0.001])
+        assert ra_err > 0 and dec_err > 0
+        offset = np.array([fit_ra - ra, fit_dec - dec])
+        distances.append(offset @ np.linalg.inv(covariance) @ offset)
+    # Most fits are within the 99% region of a 2D Gaussian with their reported covariance
+    # (the SN variance is estimated from only a few detections) and none are far outside it
+    assert np.mean(np.array(distances) < 9.21) >= 0.9
+    assert max(distances) < 30.
+
+
+@pytest.mark.parametrize("ra, dec", [(150.123, -30.456), (20.01, -60.2)])
+def test_fast_matches_exact(ra, dec):
+    detections = synthetic_detections(ra, dec, seed=2)
+    ras = np.linspace(ra - 0.03, ra + 0.03, 101)
+    decs = np.linspace(dec - 0.03, dec + 0.03, 101)
+    _, _, exact = find_pos(decs, ras, detections, FWHM, verbose=False)
+    _, _, fast = find_pos(decs, ras, detections, FWHM, exact=False, verbose=False)
+    np.testing.assert_allclose(fast, exact, rtol=1e-12, atol=1e-12)
+    assert np.argmin(fast) == np.argmin(exact)
+    _, _, multi_fast = find_pos_multires(decs, ras, detections, FWHM, exact=False, verbose=False)
+    assert min(multi_fast) == pytest.approx(min(exact), rel=1e-12)
@@ -0,0 +1,85 @@
+"""
+Tests the zero acceleration periodicity search on synthetic pulse trains
+"""
+import os
+import numpy as np
+import pytest
+from scipy.stats import norm, chi2
+
+from mwa_search.dedisperse import write_inf
+from mwa_search.periodicity import (FOURIERPROPS_DTYPE, chi2_logp, equivalent_gaussian_sigma, whiten,
+                                    harmonic_search, _remove_related, search_dats)
+
+TBIN = 1e-3
+NSAMP = 2097233
+
+
+def pulse_train(freq, amplitude=0.3, width=0.01, seed=0):
+    """Unit Gaussian noise and Gaussian pulses of width (in phase) at freq Hz"""
+    phase = (np.arange(NSAMP) * TBIN * freq) % 1.
+    rng = np.random.RandomState(seed)
+    return (rng.normal(0., 1., NSAMP) + amplitude * np.exp(-0.5 * ((phase - 0.5) / width)**2)).astype(np.float32)
+
+
+def related(r, fund_r, nharm=16):
+    """If r is within the error of a harmonic ratio (up to nharm / nharm) of fund_r"""
+    return any(abs(r * den - fund_r * num) < 1.1 * den + 0.25 * num
+               for num in range(1, nharm + 1) for den in range(1, nharm + 1))
+
+
+def test_significance():
+    # One summed power is exponentially distributed and numharm are chi-squared with 2 numharm dof
+    np.testing.assert_allclose(chi2_logp(np.array([1., 5., 20.]), 1), [-1., -5., -20.])
+    np.testing.assert_allclose(chi2_logp(np.array([10., 40.]), 8), chi2.logsf(np.array([20., 80.]), 16), rtol=1e-10)
+    np.testing.assert_allclose(equivalent_gaussian_sigma(norm.logsf([1., 3., 6.])), [1., 3., 6.], rtol=1e-6)
+    # Very small probabilities don't overflow
+    assert 40. < equivalent_gaussian_sigma(chi2_logp(2000., 16)) < 70.
+
+
+def test_remove_related():
+    candidates = np.array([[2804.0, 50.97, 1395.5, 16],
+                           # The 12th harmonic 1.5 bins from 12 * 2804
+                           [33646.5, 15.9, 90., 1],
+                           # The 3/2 harmonic
+                           [4206.25, 8.1, 50., 4],
+                           [3001.3, 7.2, 45., 2]])
+    kept = _remove_related(candidates, 16)
+    np.testing.assert_array_equal(kept[:, 0], [2804.0, 3001.3])
+
+
+@pytest.mark.parametrize("freq", [1.337, 1.33714, 1.33737])
+def test_harmonic_search_pulse_train(freq):
+    tobs = NSAMP * TBIN
+    series = pulse_train(freq)
+    powers, _ = whiten(np.fft.rfft(series - series.mean())[np.newaxis], tobs)
+    candidates = harmonic_search(powers, tobs, nharm=16)[0]
+    r, sigma, power, numharm = candidates[0]
+    # The fundamental is found (not a harmonic) even when it is between half bins
+    assert r == pytest.approx(freq * tobs, abs=0.1)
+    assert numharm == 16
+    assert sigma > 30.
+    assert not any(related(other[0], r) for other in candidates[1:])
+
+
+def test_search_dats(tmp_path):
+    basenames = []
+    for dm, freq in ((10., 1.337), (20., 2.5)):
+        basename = str(tmp_path / "pulsar_DM{:.2f}".format(dm))
+        pulse_train(freq, seed=int(dm)).tofile("{}.dat".format(basename))
+        write_inf("{}.inf".format(basename), {"basename": os.path.basename(basename), "mjd": 59000.,
+                                              "nsamp": NSAMP, "tbin": TBIN, "dm": dm, "low_freq": 140.,
+                                              "bandwidth": 30.72, "nchan": 3072, "chan_bw": 0.01})
+        basenames.append(basename)
+    results = search_dats(basenames + [str(tmp_path / "missing_DM30.00")])
+    assert sorted(results) == basenames
+    for basename, freq in zip(basenames, (1.337, 2.5)):
+        accel_file, ncand = results[basename]
+        assert accel_file == "{}_ACCEL_0".format(basename)
+        with open(accel_file) as accel:
+            lines = accel.read().splitlines()
+        first = lines[3].split()
+        assert first[0] == "1"
+        assert float(first[7].split("(")[0]) == pytest.approx(freq * NSAMP * TBIN, abs=0.1)
+        props = np.fromfile("{}.cand".format(accel_file), dtype=FOURIERPROPS_DTYPE)
+        assert len(props) == ncand
+        assert props[0]["r"] == pytest.approx(freq * NSAMP * TBIN, abs=0.1)
@@ -0,0 +1,91 @@
+"""
+Tests the registry of dedispersion plans shared by the pointings of an observation
+"""
+import os
+import json
+import numpy as np
+
+from mwa_search.plan_registry import PlanRegistry, plan_key, canonical_json, file_digest, PLAN_FORMAT_VERSION
+
+PARAMS = {"centrefreq": 154.24, "dur": 4800, "min_dm": 1., "max_dm": 250., "max_dms_per_job": 5000}
+PLAN = [[1.0, 12.3, 0.01, 1130, 0.1, 1, 16, 0.31], [12.3, 25.4, 0.02, 655, 0.1, 2, 32, 0.29]]
+JOBS = [[PLAN[0]], [PLAN[1]]]
+
+
+def test_canonical_json():
+    assert canonical_json({"b": 1, "a": [0.1, np.float64(0.1), np.int64(3)]}) == '{"a":[0.1,0.1,3],"b":1}'
+    # Floats round trip exactly
+    value = 0.1 + 0.2
+    assert json.loads(canonical_json({"value": value}))["value"] == value
+
+
+def test_plan_key():
+    key = plan_key(**PARAMS)
+    assert key == plan_key(**dict(reversed(list(PARAMS.items()))))
+    assert key == plan_key(**dict(PARAMS, dur=np.int64(4800), centrefreq=np.float64(154.24)))
+    assert key != plan_key(**dict(PARAMS, max_dm=250.0000001))
+    assert key != plan_key(**dict(PARAMS, search_process="search_dd"))
+
+
+def test_file_digest(tmp_path):
+    filename = str(tmp_path / "model.json")
+    with open(filename, "w") as outfile:
+        outfile.write("{}")
+    digest = file_digest(filename)
+    assert digest == "44136fa355b3678a1146ad16f7e8649e94fb4fc21fe77e8310c060f61caaff8a"
+    with open(filename, "w") as outfile:
+        outfile.write("{ }")
+    assert file_digest(filename) != digest
+
+
+def test_put_get(tmp_path):
+    registry = PlanRegistry(str(tmp_path / "plans"))
+    key = plan_key(**PARAMS)
+    assert registry.get(key) is None
+    costs = [[np.float64(3600.5), np.int64(2048)], [1800., 1024]]
+    registered = registry.put(key, PARAMS, PLAN, JOBS, costs=costs)
+    assert registered == {"format_version": PLAN_FORMAT_VERSION, "params": PARAMS, "plan": PLAN, "jobs": JOBS,
+                          "costs": [[3600.5, 2048], [1800., 1024]]}
+    assert registry.get(key) == registered
+    # Only the plan is left in the directory
+    assert os.listdir(str(tmp_path / "plans")) == ["{}.json".format(key)]
+
+
+def test_get_old_or_corrupt(tmp_path):
+    registry = PlanRegistry(str(tmp_path))
+    registry.put("old", PARAMS, PLAN, JOBS)
+    with open(str(tmp_path / "old.json")) as infile:
+        plan = json.load(infile)
+    plan["format_version"] = PLAN_FORMAT_VERSION - 1
+    with open(str(tmp_path / "old.json"), "w") as outfile:
+        json.dump(plan, outfile)
+    assert registry.get("old") is None
+    with open(str(tmp_path / "corrupt.json"), "w") as outfile:
+        outfile.write('{"format_version": ')
+    assert registry.get("corrupt") is None
+
+
+def test_put_unwritable(tmp_path):
+    # A file where the registry directory should be
+    registry_dir = str(tmp_path / "plans")
+    open(registry_dir, "w").close()
+    registered = PlanRegistry(registry_dir).put("key", PARAMS, PLAN, JOBS)
+    assert registered["plan"] == PLAN
+
+
+def test_get_or_make(tmp_path):
+    calls = []
+
+    def make_plan():
+        calls.append(1)
+        return PLAN, JOBS, None
+
+    registry = PlanRegistry(str(tmp_path))
+    first = registry.get_or_make(PARAMS, make_plan)
+    # A new registry (such as another pointing's job) reads the stored plan
+    second = PlanRegistry(str(tmp_path)).get_or_make(dict(PARAMS), make_plan)
+    assert len(calls) == 1
+    assert first == second
+    assert second["plan"] == PLAN and second["jobs"] == JOBS and second["costs"] is None
+    PlanRegistry(str(tmp_path)).get_or_make(dict(PARAMS, dur=600), make_plan)
+    assert len(calls) == 2
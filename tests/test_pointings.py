@@ -0,0 +1,76 @@
+"""
+Tests the pointing string codec against astropy (and the truncation of vcstools' format_ra_dec)
+"""
+import numpy as np
+import pytest
+import astropy.units as u
+from astropy.coordinates import Angle, SkyCoord
+
+from mwa_search.pointings import parse_ra_dec, parse_pointings, format_ra, format_dec, format_pointings, offset_by
+
+
+def astropy_pointings(rads, decds):
+    """Pointing strings made the way they were before the codec (the seconds truncated to 2 decimals)"""
+    ras = Angle(rads, u.deg).wrap_at(360. * u.deg).to_string(unit=u.hour, sep=":", precision=8, pad=True)
+    decs = Angle(decds, u.deg).to_string(unit=u.deg, sep=":", precision=8, pad=True, alwayssign=True)
+    return ["{}_{}".format(ra[:-6], dec[:-6]) for ra, dec in zip(ras, decs)]
+
+
+def random_sky(npoint, seed=0):
+    rng = np.random.RandomState(seed)
+    return rng.uniform(0., 360., npoint), np.degrees(np.arcsin(rng.uniform(-1., 1., npoint)))
+
+
+def test_format_matches_astropy():
+    rads, decds = random_sky(20000)
+    # Values on and either side of hundredths of a second and of minute and degree carries
+    edges = np.concatenate([np.arange(0., 1., 0.01) / 3600., [59.999999999 / 3600., 1. - 1e-12, 1e-5]])
+    edges = np.concatenate([edges, np.nextafter(edges, 1.), np.nextafter(edges, 0.)])
+    rads = np.concatenate([rads, 15. * edges, 15. * (23. + edges), [359.9999999999, 360., -10.]])
+    decds = np.concatenate([decds, edges, -(45. + edges), [89.9999999999, -90., 0.]])
+    assert format_pointings(rads, decds) == astropy_pointings(rads, decds)
+    assert format_ra(rads) == [p.split("_")[0] for p in astropy_pointings(rads, decds)]
+    assert format_dec(decds) == [p.split("_")[1] for p in astropy_pointings(rads, decds)]
+
+
+def test_parse_matches_astropy():
+    pointings = format_pointings(*random_sky(5000, seed=1))
+    rads, decds = parse_pointings(pointings)
+    coord = SkyCoord([p.split("_")[0] for p in pointings], [p.split("_")[1] for p in pointings],
+                     unit=(u.hourangle, u.deg))
+    np.testing.assert_array_equal(rads, coord.ra.deg)
+    np.testing.assert_array_equal(decds, coord.dec.deg)
+
+
+def test_parse_formats():
+    # Labels, missing minutes and seconds and negative RAs
+    rads, decds = parse_pointings(["J1234,12:30_-30:30", "00:00:00.00_+00:00:00.00"])
+    np.testing.assert_allclose(rads, [187.5, 0.])
+    np.testing.assert_allclose(decds, [-30.5, 0.])
+    rads, decds = parse_ra_dec(["-01:00:00", "25"], ["-00:30:00", "10:00:36"])
+    np.testing.assert_allclose(rads, [345., 15.])
+    np.testing.assert_allclose(decds, [-0.5, 10.01])
+    rads, decds = parse_pointings([])
+    assert len(rads) == len(decds) == 0
+    with pytest.raises(ValueError):
+        parse_ra_dec(["00:00:00"], ["91:00:00"])
+    with pytest.raises(ValueError):
+        parse_ra_dec(["00:00:00:00", "00:00"], ["00:00:00", "00:00"])
+
+
+def test_round_trip():
+    pointings = format_pointings(*random_sky(1000, seed=2))
+    assert format_pointings(*parse_pointings(pointings)) == pointings
+
+
+def test_offset_by_matches_astropy():
+    rads, decds = random_sky(2000, seed=3)
+    rng = np.random.RandomState(4)
+    seps = rng.uniform(0., 10., len(rads))
+    angles = rng.uniform(-180., 360., len(rads))
+    # Include the poles
+    decds[:2] = [90., -90.]
+    new_rads, new_decds = offset_by(rads, decds, seps, angles)
+    expected = SkyCoord(rads, decds, unit=u.deg).directional_offset_by(angles * u.deg, seps * u.deg)
+    np.testing.assert_allclose(new_rads, expected.ra.deg, rtol=0., atol=1e-9)
+    np.testing.assert_allclose(new_decds, expected.dec.deg, rtol=0., atol=1e-9)
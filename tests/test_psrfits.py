@@ -0,0 +1,115 @@
+"""
+Tests the search mode PSRFITS reader and header scanner on small synthetic files
+"""
+import numpy as np
+import pytest
+
+from mwa_search.psrfits import (PsrfitsFile, PsrfitsStream, write_psrfits, scan_header, scan_headers,
+                                pack_samples, unpack_samples)
+
+NCHAN = 16
+NSBLK = 64
+TBIN = 1e-4
+FREQS = 140. + 1.28 * np.arange(NCHAN)
+
+
+def synthetic_file(filename, nbits, nsubint=4, nsuboffs=0, seed=0, ra_str="05:34:31.97", dec_str="+22:00:52.06"):
+    """Writes a PSRFITS file of random samples, scales and offsets and returns them"""
+    rng = np.random.RandomState(seed)
+    raw = rng.randint(0, 2**nbits, size=(nsubint * NSBLK, NCHAN)).astype(np.uint8)
+    scales = rng.uniform(0.5, 2., size=(nsubint, NCHAN)).astype(np.float32)
+    offsets = rng.uniform(-10., 10., size=(nsubint, NCHAN)).astype(np.float32)
+    write_psrfits(filename, raw, FREQS, TBIN, nbits=nbits, nsblk=NSBLK, scales=scales, offsets=offsets,
+                  nsuboffs=nsuboffs, ra_str=ra_str, dec_str=dec_str)
+    return raw, scales, offsets
+
+
+def expected_values(raw, scales, offsets):
+    """raw*scl+offs with the scales and offsets of each subint repeated over its samples"""
+    return raw.astype(np.float32) * np.repeat(scales, NSBLK, axis=0) + np.repeat(offsets, NSBLK, axis=0)
+
+
+@pytest.mark.parametrize("nbits", [1, 2, 4, 8])
+def test_pack_round_trip(nbits):
+    raw = np.random.RandomState(nbits).randint(0, 2**nbits, size=(3, 8 * NCHAN)).astype(np.uint8)
+    np.testing.assert_array_equal(unpack_samples(pack_samples(raw, nbits), nbits), raw)
+
+
+@pytest.mark.parametrize("nbits", [1, 2, 4, 8])
+def test_read_scaled(tmp_path, nbits):
+    filename = str(tmp_path / "test_{}bit.fits".format(nbits))
+    raw, scales, offsets = synthetic_file(filename, nbits)
+    psrfits = PsrfitsFile(filename)
+    assert (psrfits.nbits, psrfits.nchan, psrfits.nsblk, psrfits.nsubint) == (nbits, NCHAN, NSBLK, 4)
+    np.testing.assert_allclose(psrfits.freqs, FREQS)
+    np.testing.assert_array_equal(psrfits.read_subints(scale=False), raw)
+    stream = PsrfitsStream([filename])
+    np.testing.assert_allclose(stream.read(), expected_values(raw, scales, offsets), rtol=1e-6)
+    # A read that doesn't start or end on a subint
+    np.testing.assert_allclose(stream.read(NSBLK // 2 + 3, 2 * NSBLK),
+                               expected_values(raw, scales, offsets)[NSBLK // 2 + 3:NSBLK // 2 + 3 + 2 * NSBLK],
+                               rtol=1e-6)
+    blocks = list(stream.iter_blocks(subints_per_block=3))
+    assert [len(block) for block in blocks] == [3 * NSBLK, NSBLK]
+    np.testing.assert_allclose(np.concatenate(blocks), expected_values(raw, scales, offsets), rtol=1e-6)
+
+
+@pytest.mark.parametrize("nbits", [2, 8])
+def test_stream_nsuboffs_order(tmp_path, nbits):
+    # The second file is named so it sorts first and is given first, so only NSUBOFFS orders them
+    first = str(tmp_path / "b_first.fits")
+    second = str(tmp_path / "a_second.fits")
+    raw1, scales1, offsets1 = synthetic_file(first, nbits, nsubint=3, nsuboffs=0, seed=1)
+    raw2, scales2, offsets2 = synthetic_file(second, nbits, nsubint=2, nsuboffs=3, seed=2)
+    expected = np.concatenate((expected_values(raw1, scales1, offsets1), expected_values(raw2, scales2, offsets2)))
+
+    stream = PsrfitsStream([second, first])
+    assert [psrfits.filename for psrfits in stream.files] == [first, second]
+    assert stream.nsubint == 5
+    assert stream.nsamp == 5 * NSBLK
+    assert stream.duration == pytest.approx(5 * NSBLK * TBIN)
+    np.testing.assert_allclose(stream.read(), expected, rtol=1e-6)
+    # A read that crosses the file boundary
+    start = 3 * NSBLK - 10
+    np.testing.assert_allclose(stream.read(start, 25), expected[start:start + 25], rtol=1e-6)
+    np.testing.assert_array_equal(stream.read(start, 25, scale=False),
+                                  np.concatenate((raw1, raw2))[start:start + 25])
+
+
+def test_stream_mismatched_files(tmp_path):
+    first = str(tmp_path / "first.fits")
+    second = str(tmp_path / "second.fits")
+    synthetic_file(first, 8)
+    synthetic_file(second, 4, nsuboffs=4)
+    with pytest.raises(ValueError):
+        PsrfitsStream([first, second])
+
+
+@pytest.mark.parametrize("nbits", [1, 2, 4, 8])
+def test_scan_header(tmp_path, nbits):
+    filename = str(tmp_path / "test_{}bit.fits".format(nbits))
+    synthetic_file(filename, nbits, nsubint=3, nsuboffs=7, dec_str="-26:42:00.00")
+    info = scan_header(filename)
+    assert info["filename"] == filename
+    assert info["obsfreq"] == pytest.approx(FREQS.mean())
+    assert info["bandwidth"] == pytest.approx(1.28 * NCHAN)
+    assert info["duration"] == pytest.approx(3 * NSBLK * TBIN)
+    assert (info["nchan"], info["nbits"], info["npol"], info["nsblk"]) == (NCHAN, nbits, 1, NSBLK)
+    assert (info["nsubint"], info["nsuboffs"]) == (3, 7)
+    assert info["tbin"] == pytest.approx(TBIN)
+    assert info["pointing"] == "05:34:31.97_-26:42:00.00"
+
+
+def test_scan_headers_skips_bad_files(tmp_path):
+    filenames = []
+    for i, nbits in enumerate([1, 2, 4, 8]):
+        filenames.append(str(tmp_path / "test_{}.fits".format(i)))
+        synthetic_file(filenames[-1], nbits, dec_str="22:00:52.06")
+    bad = str(tmp_path / "bad.fits")
+    with open(bad, "wb") as outfile:
+        outfile.write(b"not a fits file")
+    infos = scan_headers(filenames[:2] + [bad, str(tmp_path / "missing.fits")] + filenames[2:], workers=4)
+    assert [info["filename"] for info in infos] == filenames
+    assert [info["nbits"] for info in infos] == [1, 2, 4, 8]
+    # Declinations without a sign are given one like the pointing names
+    assert all(info["pointing"] == "05:34:31.97_+22:00:52.06" for info in infos)
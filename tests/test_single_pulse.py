@@ -0,0 +1,111 @@
+"""
+Tests the boxcar single pulse search on synthetic PRESTO time series
+"""
+import os
+import numpy as np
+import pytest
+
+from mwa_search.dedisperse import write_inf
+from mwa_search.single_pulse import boxcar_search, normalise, search_dat, search_dats, read_singlepulse
+
+TBIN = 1e-3
+NSAMP = 100000
+
+
+def write_series(basename, series, dm=10.):
+    """Writes a PRESTO .dat and .inf file of a time series"""
+    np.asarray(series, dtype=np.float32).tofile("{}.dat".format(basename))
+    write_inf("{}.inf".format(basename), {"basename": os.path.basename(basename), "mjd": 59000., "nsamp": len(series),
+                                          "tbin": TBIN, "dm": dm, "low_freq": 140., "bandwidth": 30.72,
+                                          "nchan": 3072, "chan_bw": 0.01})
+
+
+def pulse_series(start, width, amplitude, seed=0):
+    """Unit Gaussian noise (with an offset and slope to detrend) and a boxcar pulse"""
+    rng = np.random.RandomState(seed)
+    series = rng.normal(0., 1., NSAMP) + 100. + 1e-4 * np.arange(NSAMP)
+    series[start:start + width] += amplitude
+    return series
+
+
+@pytest.mark.parametrize("width", [1, 20, 150])
+def test_search_dat_finds_pulse(tmp_path, width):
+    start = 43210
+    amplitude = 12. / np.sqrt(width)
+    basename = str(tmp_path / "pulse_DM10.00")
+    series = pulse_series(start, width, amplitude)
+    write_series(basename, series)
+    filename, ncand = search_dat(basename, threshold=6.)
+    assert filename == "{}.singlepulse".format(basename)
+    candidates = read_singlepulse(filename)
+    assert ncand == len(candidates) == 1
+    dm, sigma, time, sample, downfact = candidates[0]
+    assert dm == 10.
+    # The sample is the centre of the boxcar
+    assert sample == start + width // 2
+    assert time == pytest.approx(sample * TBIN, abs=1e-6)
+    assert downfact == width
+    # The S/N of the matched boxcar of the normalised series, which is the injected S/N (12) plus
+    # the noise, less what the linear detrend of the pulse's block absorbs for wide pulses
+    normalised = normalise(series)[0]
+    assert sigma == pytest.approx(normalised[start:start + width].sum() / np.sqrt(width), abs=0.01)
+    assert sigma > 9.
+
+
+def test_search_dat_no_candidates(tmp_path):
+    basename = str(tmp_path / "noise_DM0.00")
+    write_series(basename, pulse_series(0, 0, 0.), dm=0.)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    filename, ncand = search_dat(basename, threshold=6., out_dir=str(out_dir))
+    assert ncand == 0
+    assert filename == os.path.join(str(out_dir), "noise_DM0.00.singlepulse")
+    assert read_singlepulse(filename).shape == (0, 5)
+
+
+def test_boxcar_overlap_merge():
+    series = np.zeros(10000, dtype=np.float32)
+    # Two pulses that overlap at some widths and one on its own
+    series[1000:1010] = 3.
+    series[1012:1014] = 8.
+    series[5000] = 9.
+    candidates = boxcar_search(series, [1, 2, 4, 8, 16, 32], threshold=5.)
+    assert len(candidates) == 2
+    np.testing.assert_array_equal(candidates[:, 0], np.sort(candidates[:, 0]))
+    # The overlapping boxcars are merged into the most significant one
+    sample, sigma, width = candidates[0]
+    best = max((series[i:i + w].sum() / np.sqrt(w), i, w) for w in [1, 2, 4, 8, 16, 32] for i in range(950, 1050))
+    assert sigma == pytest.approx(best[0], rel=1e-6)
+    assert (sample, width) == (best[1] + best[2] // 2, best[2])
+    assert tuple(candidates[1]) == (5000, pytest.approx(9.), 1)
+
+
+def test_boxcar_chunks():
+    series = np.random.RandomState(1).normal(0., 1., 50000).astype(np.float32)
+    series[[4095, 4096, 30000]] += 10.
+    widths = [1, 2, 3, 4, 6, 9, 14, 20, 30]
+    np.testing.assert_array_equal(boxcar_search(series, widths, threshold=4., chunk_len=4096),
+                                  boxcar_search(series, widths, threshold=4.))
+
+
+def test_normalise():
+    series, nbad = normalise(pulse_series(0, 0, 0.), detrend_len=1000)
+    assert nbad == 0
+    assert abs(np.mean(series)) < 0.02
+    assert np.std(series) == pytest.approx(1., abs=0.03)
+    bad = pulse_series(0, 0, 0.)
+    bad[5000:6000] *= 100.
+    series, nbad = normalise(bad, detrend_len=1000, bad_block_fact=4.)
+    assert nbad == 1
+    assert np.all(series[5000:6000] == 0.)
+
+
+def test_search_dats_skips_missing(tmp_path):
+    basenames = []
+    for i, dm in enumerate([1., 2.]):
+        basenames.append(str(tmp_path / "series_DM{:.2f}".format(dm)))
+        write_series(basenames[-1], pulse_series(20000, 4, 6., seed=i), dm=dm)
+    results = search_dats(basenames + [str(tmp_path / "missing_DM3.00")], workers=2, threshold=6.)
+    assert sorted(results) == basenames
+    for basename in basenames:
+        assert results[basename][1] == 1
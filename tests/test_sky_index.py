@@ -0,0 +1,154 @@
+"""
+Tests the sky spatial index of beam pointings
+"""
+import json
+import numpy as np
+import pytest
+
+from mwa_search.grid_cache import NpyWriter
+from mwa_search.pointings import format_ra, format_dec
+from mwa_search.sky_index import SkyIndex, beam_fwhm_ellipse
+
+
+def angular_sep(ra1, dec1, ra2, dec2):
+    """The great circle separation in degrees (haversine) broadcast over the inputs"""
+    ra1, dec1, ra2, dec2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (ra1, dec1, ra2, dec2))
+    hav = np.sin((dec2 - dec1) / 2.)**2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2.)**2
+    return np.degrees(2. * np.arcsin(np.sqrt(np.clip(hav, 0., 1.))))
+
+
+def random_sky(npoint, seed=0, dec_range=(-90., 90.)):
+    """Uniformly distributed RAs and Decs in degrees"""
+    rng = np.random.RandomState(seed)
+    sin_dec = rng.uniform(np.sin(np.radians(dec_range[0])), np.sin(np.radians(dec_range[1])), npoint)
+    return rng.uniform(0., 360., npoint), np.degrees(np.arcsin(sin_dec))
+
+
+def write_grid(tmp_path, pointings, sky_index=True):
+    """Writes grid files and a manifest like grid.py --stream and returns the manifest file name"""
+    chunks = []
+    for first in range(0, len(pointings), 4):
+        chunk = pointings[first:first + 4]
+        chunk_file = "grid_{}_{}.txt".format(first + 1, first + len(chunk))
+        with open(str(tmp_path / chunk_file), "w") as outfile:
+            for ra, dec in zip(format_ra(chunk[:, 0]), format_dec(chunk[:, 1])):
+                outfile.write("{}_{}\n".format(ra, dec))
+        chunks.append({"file": chunk_file, "first_id": first + 1, "last_id": first + len(chunk)})
+    manifest = {"chunks": chunks, "total_pointings": len(pointings), "complete": True}
+    if sky_index:
+        with NpyWriter(str(tmp_path / "grid_sky_index.npy"), row_shape=(2,)) as writer:
+            writer.append(pointings)
+        manifest["sky_index"] = "grid_sky_index.npy"
+    manifest_file = str(tmp_path / "grid_manifest.json")
+    with open(manifest_file, "w") as outfile:
+        json.dump(manifest, outfile)
+    return manifest_file
+
+
+def test_from_manifest(tmp_path):
+    pointings = np.column_stack((np.linspace(10., 20., 10), np.linspace(-30., -25., 10)))
+    index = SkyIndex.from_manifest(write_grid(tmp_path, pointings))
+    np.testing.assert_array_equal(index.ras, pointings[:, 0])
+    np.testing.assert_array_equal(index.decs, pointings[:, 1])
+    # Without the index file the pointings are read from the grid files (to the precision of the strings)
+    index = SkyIndex.from_manifest(write_grid(tmp_path, pointings, sky_index=False))
+    np.testing.assert_allclose(index.ras, pointings[:, 0], atol=1e-4)
+    np.testing.assert_allclose(index.decs, pointings[:, 1], atol=1e-4)
+    assert len(index.names) == len(pointings)
+
+
+def test_mismatched_lengths():
+    with pytest.raises(ValueError):
+        SkyIndex([1., 2.], [3.])
+    with pytest.raises(ValueError):
+        SkyIndex([1., 2.], [3., 4.], names=["a"])
+
+
+def test_query_radius_matches_brute_force():
+    ras, decs = random_sky(2000)
+    index = SkyIndex(ras, decs)
+    # Include positions either side of RA 0 and at the poles
+    query_ras = np.array([0., 359.9, 0.1, 180., 45., 270.])
+    query_decs = np.array([0., -10., 10., 89.9, -89.9, -26.7])
+    matches = index.query_radius(query_ras, query_decs, 5.)
+    for ra, dec, match in zip(query_ras, query_decs, matches):
+        expected = np.flatnonzero(angular_sep(ra, dec, ras, decs) <= 5.)
+        np.testing.assert_array_equal(np.sort(match), expected)
+
+
+def test_search_around_matches_brute_force():
+    ras, decs = random_sky(1000, seed=1)
+    query_ras, query_decs = random_sky(300, seed=2)
+    index = SkyIndex(ras, decs)
+    idx_pos, idx_pointing, sep = index.search_around(query_ras, query_decs, 3.)
+    all_sep = angular_sep(query_ras[:, np.newaxis], query_decs[:, np.newaxis], ras, decs)
+    expected_pos, expected_pointing = np.nonzero(all_sep <= 3.)
+    np.testing.assert_array_equal(idx_pos, expected_pos)
+    np.testing.assert_array_equal(idx_pointing, expected_pointing)
+    np.testing.assert_allclose(sep, all_sep[expected_pos, expected_pointing], atol=1e-9)
+
+
+def test_query_nearest():
+    ras, decs = random_sky(500, seed=3)
+    query_ras, query_decs = random_sky(50, seed=4)
+    index = SkyIndex(ras, decs)
+    sep, idx = index.query_nearest(query_ras, query_decs, k=3)
+    all_sep = angular_sep(query_ras[:, np.newaxis], query_decs[:, np.newaxis], ras, decs)
+    np.testing.assert_array_equal(idx, np.argsort(all_sep, axis=1)[:, :3])
+    np.testing.assert_allclose(sep, np.sort(all_sep, axis=1)[:, :3], atol=1e-9)
+    # Missing neighbours are inf and len(index)
+    sep, idx = SkyIndex([10.], [-20.]).query_nearest([10.], [-20.], k=2)
+    assert sep[0, 0] == pytest.approx(0.)
+    assert np.isinf(sep[0, 1]) and idx[0, 1] == 1
+
+
+@pytest.mark.parametrize("dec_range", [(-40., -10.), (-88., -70.), (60., 88.)])
+def test_covering_beam_matches_brute_force(dec_range):
+    ras, decs = random_sky(400, seed=5, dec_range=dec_range)
+    query_ras, query_decs = random_sky(2000, seed=6, dec_range=dec_range)
+    fwhm = 2.
+    idx, dist = SkyIndex(ras, decs).covering_beam(query_ras, query_decs, fwhm)
+
+    fwhm_ra, fwhm_dec = beam_fwhm_ellipse(decs, fwhm)
+    dra = (query_ras[:, np.newaxis] - ras + 180.) % 360. - 180.
+    ddec = query_decs[:, np.newaxis] - decs
+    all_dist = np.sqrt((dra / (fwhm_ra / 2.))**2 + (ddec / (fwhm_dec / 2.))**2)
+    covered = all_dist.min(axis=1) <= 1.
+    assert covered.any() and not covered.all()
+    np.testing.assert_array_equal(idx[~covered], -1)
+    assert np.all(np.isinf(dist[~covered]))
+    np.testing.assert_array_equal(idx[covered], np.argmin(all_dist, axis=1)[covered])
+    np.testing.assert_allclose(dist[covered], all_dist.min(axis=1)[covered])
+
+
+def test_covering_beam_fixed_width():
+    index = SkyIndex([0., 10.], [0., 0.])
+    idx, dist = index.covering_beam([0.9, 5., 359.5], [0., 0., 0.], 100., fwhm_ra=2., fwhm_dec=2.)
+    np.testing.assert_array_equal(idx, [0, -1, 0])
+    np.testing.assert_allclose(dist[[0, 2]], [0.9, 0.5])
+    # Nothing to search
+    idx, dist = SkyIndex([], []).covering_beam([1.], [2.], 1.)
+    assert idx.tolist() == [-1] and np.isinf(dist[0])
+
+
+def test_save_load(tmp_path):
+    ras, decs = random_sky(20, seed=7)
+    names = ["{}_{}".format(ra, dec) for ra, dec in zip(format_ra(ras), format_dec(decs))]
+    index = SkyIndex(ras, decs, names=names)
+    index.save(str(tmp_path / "index.npz"))
+    loaded = SkyIndex.load(str(tmp_path / "index.npz"))
+    np.testing.assert_array_equal(loaded.ras, ras)
+    np.testing.assert_array_equal(loaded.decs, decs)
+    assert loaded.names == names
+    # An (N, 2) .npy file of RAs and Decs
+    np.save(str(tmp_path / "index.npy"), np.column_stack((ras, decs)))
+    loaded = SkyIndex.load(str(tmp_path / "index.npy"))
+    np.testing.assert_array_equal(loaded.ras, ras)
+    assert loaded.names is None
+
+
+def test_from_pointing_strings():
+    index = SkyIndex.from_pointing_strings(["12:00:00.00_-30:00:00.00", "06:30:00.00_+10:30:00.00"])
+    np.testing.assert_allclose(index.ras, [180., 97.5])
+    np.testing.assert_allclose(index.decs, [-30., 10.5])
+    assert len(SkyIndex.from_pointing_strings([])) == 0